@@ -72,6 +72,10 @@
 #----------------------------------
 #      initialize_d8_vars()          ########
 #      initialize_computed_vars()
+#      initialize_scratch_grids()       # (10/14)
+#      initialize_geometry_grids()      # (10/14)
+#      get_scratch_grids()              # (10/14)
+#      initialize_substep_vars()        # (10/14)
 #      initialize_diversion_vars()      # (9/22/14)
 #      initialize_outlet_values()
 #      initialize_peak_values()
@@ -79,10 +83,17 @@
 #-------------------------------------
 #      update_R()
 #      update_R_integral()
+#      get_n_substeps()             # (10/14)
+#      update_courant_limit()       # (10/14)
+#      update_active_set()          # (10/14)
+#      use_active_grids()           # (10/14)
+#      use_full_grids()             # (10/14)
 #      update_discharge()
 #      update_diversions()          # (9/22/14)
 #      update_flow_volume()
 #      update_flow_depth()
+#      update_bankfull_geometry()   # (10/14)
+#      update_geometry_grids()      # (10/14)
 #      update_free_surface_slope()
 #      update_shear_stress()        # (9/9/14, depth-slope product)
 #      update_shear_speed()         # (9/9/14)
@@ -127,6 +138,7 @@
 import numpy as np
 import os, os.path
 
+from topoflow.utils import active_set
 from topoflow.utils import BMI_base
 
 # from topoflow.utils import d8_base
@@ -144,6 +156,35 @@ from topoflow.utils import tf_utils
 #-----------------------------------------------------------------------
 class channels_component( BMI_base.BMI_component ):
 
+    PACKED_OK = True   # (see BMI_base.enable_packed_domain())
+
+    #-----------------------------------------------------------
+    # Scratch grids, see initialize_scratch_grids(). (10/14)
+    #-----------------------------------------------------------
+    scratch_names = ['grid1', 'grid2', 'grid3']
+
+    #-------------------------------------------------------------
+    # Active-set mode, see update_active_set().  Set ACTIVE_SET
+    # to True (e.g. c.ACTIVE_SET = True) before initialize().
+    # The update methods see these grids for the active pixels
+    # only, as 1D grids.  (10/14)
+    #-------------------------------------------------------------
+    ACTIVE_SET   = False
+    active_names = ['d', 'u', 'Q', 'vol', 'R', 'f', 'Rh', 'A_wet', 'P_wet',
+                    'tau', 'u_star', 'froude', 'S_free', 'S_bed',
+                    'width', 'angle', 'sin_angle', 'tan_angle', 'cos_angle',
+                    'ds_inv', 'width_sq', 'nval', 'z0val', 'da',
+                    'd_is_pos', 'd_is_neg']
+
+    #-------------------------------------------------------------
+    # Adaptive sub-steps, see get_n_substeps().  The CFG file
+    # for diffusive or dynamic wave may set "dt_method" to
+    # "Adaptive" and "cfl_number".  (10/14)
+    #-------------------------------------------------------------
+    ADAPTIVE_DT  = False
+    cfl_number   = 0.5
+    max_substeps = 1000
+
     #-----------------------------------------------------------
     # Note: rainfall_volume_flux *must* be liquid-only precip.
     #-----------------------------------------------------------        
@@ -339,7 +380,7 @@ class channels_component( BMI_base.BMI_component ):
         'basin_outlet_water_x-section__time_max_of_mean_depth':            'm',
         'basin_outlet_water_x-section__time_max_of_volume_flow_rate':      'm3 s-1',
         'basin_outlet_water_x-section__time_max_of_volume_flux':           'm s-1',
-        'basin_outlet_water_x-section__volume_flow_rate':                  'm3',
+        'basin_outlet_water_x-section__volume_flow_rate':                  'm3 s-1',
         'basin_outlet_water_x-section__volume_flux':                       'm s-1',
         #---------------------------------------------------------------------------
         'canals_entrance_water__volume_flow_rate':                 'm3 s-1', 
@@ -565,40 +606,97 @@ class channels_component( BMI_base.BMI_component ):
         self.update_R()
         if (DEBUG): print '#### Calling update_R_integral()...'
         self.update_R_integral()
-        if (DEBUG): print '#### Calling update_discharge()...'
-        self.update_discharge()
-        if (DEBUG): print '#### Calling update_diversions()...'
-        self.update_diversions()
-        if (DEBUG): print '#### Calling update_flow_volume()...'
-        self.update_flow_volume()
-        if (DEBUG): print '#### Calling update_flow_depth()...'
-        self.update_flow_depth()
         #-----------------------------------------------------------------
-        if not(self.DYNAMIC_WAVE):
-            if (DEBUG): print '#### Calling update_trapezoid_Rh()...'
-            self.update_trapezoid_Rh()
-            # print 'Rhmin, Rhmax =', self.Rh.min(), self.Rh.max()a
+        # (10/14) In active-set mode, the methods below only see the
+        # active pixels, until use_full_grids().  The first time step
+        # uses the full grids.
         #-----------------------------------------------------------------
-        # (9/9/14) Moved this here from update_velocity() methods.
-        #-----------------------------------------------------------------        
-        if not(self.KINEMATIC_WAVE):
-            if (DEBUG): print '#### Calling update_free_surface_slope()...' 
-            self.update_free_surface_slope()
-        if (DEBUG): print '#### Calling update_shear_stress()...'
-        self.update_shear_stress()
-        if (DEBUG): print '#### Calling update_shear_speed()...'
-        self.update_shear_speed()  
+        ACTIVE = (self.ACTIVE_SET and (self.active is not None))
         #-----------------------------------------------------------------
-        # Must update friction factor before velocity for DYNAMIC_WAVE.
-        #-----------------------------------------------------------------        
-        if (DEBUG): print '#### Calling update_friction_factor()...'
-        self.update_friction_factor()      
-        #-----------------------------------------------------------------          
-        if (DEBUG): print '#### Calling update_velocity()...'
-        self.update_velocity()
-        self.update_velocity_on_edges()     # (set to zero)
-        if (DEBUG): print '#### Calling update_froude_number()...'
-        self.update_froude_number()
+        # (10/14) With ADAPTIVE_DT, the methods below run in as many
+        # sub-steps as the Courant condition needs (see
+        # get_n_substeps()), with self.dt set to the sub-step and
+        # self.time_min to the time at the start of the sub-step.
+        # Outlet values, peak values and vol_Q are updated after
+        # every sub-step.
+        #-----------------------------------------------------------------
+        dt_step   = self.dt
+        time_min  = self.time_min
+        time_left = dt_step
+        n_substeps = 0
+        try:
+            while (time_left > 0):
+                self.time_min = time_min + (dt_step - time_left) / 60.0
+                n = self.get_n_substeps( time_left, n_substeps )
+                self.dt = (time_left / n)
+                if (n == 1):
+                    time_left = 0
+                else:
+                    time_left -= self.dt
+                n_substeps += 1
+                #---------------------------------------------------------
+                if (ACTIVE):
+                    if (DEBUG): print '#### Calling update_active_set()...'
+                    self.update_active_set()
+                    self.use_active_grids()
+                if (DEBUG): print '#### Calling update_discharge()...'
+                self.update_discharge()
+                if (DEBUG): print '#### Calling update_diversions()...'
+                self.update_diversions()
+                if (DEBUG): print '#### Calling update_flow_volume()...'
+                self.update_flow_volume()
+                if (DEBUG): print '#### Calling update_flow_depth()...'
+                self.update_flow_depth()
+                #---------------------------------------------------------
+                if not(self.DYNAMIC_WAVE):
+                    if (DEBUG): print '#### Calling update_trapezoid_Rh()...'
+                    self.update_trapezoid_Rh()
+                    # print 'Rhmin, Rhmax =', self.Rh.min(), self.Rh.max()a
+                #---------------------------------------------------------
+                # (9/9/14) Moved this here from update_velocity() methods.
+                #---------------------------------------------------------
+                if not(self.KINEMATIC_WAVE):
+                    if (DEBUG): print '#### Calling update_free_surface_slope()...' 
+                    self.update_free_surface_slope()
+                if (DEBUG): print '#### Calling update_shear_stress()...'
+                self.update_shear_stress()
+                if (DEBUG): print '#### Calling update_shear_speed()...'
+                self.update_shear_speed()  
+                #---------------------------------------------------------
+                # Must update friction factor before velocity for
+                # DYNAMIC_WAVE.
+                #---------------------------------------------------------
+                if (DEBUG): print '#### Calling update_friction_factor()...'
+                self.update_friction_factor()      
+                #---------------------------------------------------------
+                if (DEBUG): print '#### Calling update_velocity()...'
+                self.update_velocity()
+                self.update_velocity_on_edges()     # (set to zero)
+                if (DEBUG): print '#### Calling update_froude_number()...'
+                self.update_froude_number()
+                if (self.ADAPTIVE_DT):
+                    self.update_courant_limit()
+                if (ACTIVE):
+                    self.use_full_grids()
+                elif (self.ACTIVE_SET):
+                    self.update_active_set()   # (first set, after a full step)
+                    ACTIVE = True
+                #---------------------------------------------------------
+                if (DEBUG): print '#### Calling update_outlet_values()...'
+                self.update_outlet_values()
+                if (DEBUG): print '#### Calling update peak values()...'
+                self.update_peak_values()
+                if (DEBUG): print '#### Calling update_Q_out_integral()...'
+                self.update_Q_out_integral()
+        finally:
+            self.dt       = dt_step
+            self.time_min = time_min
+        self.n_substeps = n_substeps
+        counts = self.profile_counts
+        counts['steps']    += 1
+        counts['substeps'] += n_substeps
+        counts['max_substeps_per_step'] = max( n_substeps,
+                                        counts['max_substeps_per_step'] )
         #-----------------------------------------------------------------
 ##        print 'Rmin, Rmax =', self.R.min(), self.R.max()
 ##        print 'Qmin,  Qmax =',  self.Q.min(), self.Q.max()
@@ -607,12 +705,6 @@ class channels_component( BMI_base.BMI_component ):
 ##        print 'nmin,  nmax =',  self.nval.min(), self.nval.max()
 ##        print 'Rhmin, Rhmax =', self.Rh.min(), self.Rh.max()
 ##        print 'Smin,  Smax =',  self.S_bed.min(), self.S_bed.max()
-        if (DEBUG): print '#### Calling update_outlet_values()...'
-        self.update_outlet_values()
-        if (DEBUG): print '#### Calling update peak values()...'
-        self.update_peak_values()
-        if (DEBUG): print '#### Calling update_Q_out_integral()...'
-        self.update_Q_out_integral()
 
         #---------------------------------------------
         # This takes extra time and is now done
@@ -742,6 +834,21 @@ class channels_component( BMI_base.BMI_component ):
         #---------------------------------------------------------
         self.save_grid_dt   = np.maximum(self.save_grid_dt,   self.dt)
         self.save_pixels_dt = np.maximum(self.save_pixels_dt, self.dt)
+
+        #------------------------------------------------------
+        # (10/14) Optional in the CFG file:  "dt_method" is
+        # "Fixed" (default) or "Adaptive", for sub-steps that
+        # keep the Courant number <= cfl_number.  Only for
+        # the diffusive and dynamic wave components.
+        #------------------------------------------------------
+        self.dt_method   = getattr(self, 'dt_method', 'Fixed')
+        self.ADAPTIVE_DT = (self.dt_method.lower() == 'adaptive')
+        self.cfl_number  = np.float64( self.cfl_number )
+        if (self.ADAPTIVE_DT and self.KINEMATIC_WAVE):
+            print 'NOTE: Adaptive sub-steps are only used with the'
+            print '      diffusive and dynamic wave components.'
+            print ' '
+            self.ADAPTIVE_DT = False
         
         #---------------------------------------------------
         # This is now done in CSDMS_base.read_config_gui()
@@ -773,6 +880,9 @@ class channels_component( BMI_base.BMI_component ):
         #--------------------------------------------------      
         self.d8.site_prefix  = self.site_prefix
         self.d8.in_directory = self.in_directory
+        self.d8.PACKED       = self.PACKED   # (10/14)
+        self.d8.domain       = getattr(self, 'domain', None)
+        self.d8.topology_dir = getattr(self, 'topology_dir', None)
         self.d8.initialize( cfg_file=None,
                             SILENT=self.SILENT,
                             REPORT=self.REPORT )
@@ -845,6 +955,13 @@ class channels_component( BMI_base.BMI_component ):
         self.tau    = np.zeros([self.ny, self.nx], dtype='Float64')
         self.u_star = np.zeros([self.ny, self.nx], dtype='Float64')
         self.froude = np.zeros([self.ny, self.nx], dtype='Float64')
+
+        #-------------------------------------------------------
+        # Free-surface slope is updated in place by
+        # update_free_surface_slope() for diffusive and
+        # dynamic wave.  (10/14)
+        #-------------------------------------------------------
+        self.S_free = np.zeros([self.ny, self.nx], dtype='Float64')
                         
         #---------------------------------------
         # These are used to check mass balance
@@ -864,9 +981,10 @@ class channels_component( BMI_base.BMI_component ):
         #-----------------------------------------------------------
         # Note: angles were read as degrees & converted to radians
         #-----------------------------------------------------------
-        L2         = self.d * np.tan(self.angle)
+        self.initialize_geometry_grids()      # (10/14)
+        L2         = self.d * self.tan_angle
         self.A_wet = self.d * (self.width + L2)
-        self.P_wet = self.width + (np.float64(2) * self.d / np.cos(self.angle) )
+        self.P_wet = self.width + (np.float64(2) * self.d / self.cos_angle )
         self.vol   = self.A_wet * self.d8.ds   # [m3]
 
         #-------------------------------------------------------        
@@ -880,6 +998,8 @@ class channels_component( BMI_base.BMI_component ):
         ## print 'width.min() =', self.width.min()
        
         ## self.initialize_diversion_vars()    # (9/22/14)
+        self.initialize_scratch_grids()       # (10/14)
+        self.initialize_substep_vars()        # (10/14)
         self.initialize_outlet_values()
         self.initialize_peak_values()
         self.initialize_min_and_max_values()  ## (2/3/13)
@@ -902,6 +1022,81 @@ class channels_component( BMI_base.BMI_component ):
 
     #   initialize_computed_vars()
     #-------------------------------------------------------------
+    def initialize_scratch_grids(self):
+
+        #------------------------------------------------------------
+        # Notes: The update_*() methods compute their intermediate
+        #        grids in these preallocated grids, with in-place
+        #        numpy ufuncs (out=), so that a time step does not
+        #        allocate any new grids.  A scratch grid is only
+        #        used within one method call.  Components that need
+        #        more (e.g. channels_dynamic_wave.py) add names to
+        #        "scratch_names".  (10/14)
+
+        #        d_is_pos and d_is_neg are set in update_flow_depth().
+        #------------------------------------------------------------
+        self.scratch = self.get_scratch_grids( [self.ny, self.nx] )
+
+        self.d_is_pos = np.zeros([self.ny, self.nx], dtype='bool')
+        self.d_is_neg = np.ones([self.ny, self.nx], dtype='bool')
+        self.active   = None   # (see update_active_set())
+
+    #   initialize_scratch_grids()
+    #-------------------------------------------------------------
+    def get_scratch_grids(self, shape):
+
+        #------------------------------------------------------
+        # Note: Also used for the 1D grids of the active set.
+        #------------------------------------------------------
+        scratch = dict()
+        for name in self.scratch_names:
+            scratch[ name ] = np.zeros(shape, dtype='Float64')
+        for name in ['mask1', 'mask2']:
+            scratch[ name ] = np.zeros(shape, dtype='bool')
+        return scratch
+
+    #   get_scratch_grids()
+    #-------------------------------------------------------------
+    def initialize_substep_vars(self):
+
+        #------------------------------------------------------------
+        # Notes: dt_max is the largest stable (sub-)step, from
+        #        update_courant_limit().  profile_counts has the
+        #        number of calls to update() ("steps") and of
+        #        sub-steps, which are reported by get_profile()
+        #        (in BMI_base.py) when profiling is on.  (10/14)
+        #------------------------------------------------------------
+        self.dt_max     = np.float64( np.inf )
+        self.n_substeps = 0
+        self.profile_counts = {'steps': 0, 'substeps': 0,
+                               'max_substeps_per_step': 0}
+        if (self.ADAPTIVE_DT):
+            self.update_courant_limit()
+
+    #   initialize_substep_vars()
+    #-------------------------------------------------------------
+    def initialize_geometry_grids(self):
+
+        #------------------------------------------------------------
+        # Notes: The channel geometry (width, angle and ds) only
+        #        changes where update_flow_depth() switches a pixel
+        #        to "bankfull" geometry, so sin, tan and cos of the
+        #        bank angles, 1/ds and width^2 are computed once,
+        #        here, and then only updated at those pixels by
+        #        update_geometry_grids().  If angle is a scalar,
+        #        then so are sin_angle, tan_angle and cos_angle.
+        #        Depths and slopes still divide by ds, so results
+        #        are the same as before; 1/ds is only used for the
+        #        Courant limit.  (10/14)
+        #------------------------------------------------------------
+        self.sin_angle = np.sin( self.angle )
+        self.tan_angle = np.tan( self.angle )
+        self.cos_angle = np.cos( self.angle )
+        self.ds_inv    = np.float64(1) / self.d8.ds
+        self.width_sq  = self.width * self.width
+
+    #   initialize_geometry_grids()
+    #-------------------------------------------------------------
     def initialize_diversion_vars(self):
 
         #-----------------------------------------
@@ -1037,7 +1232,17 @@ class channels_component( BMI_base.BMI_component ):
 ##        # print '(Hmin,  Hmax)  =', H.min(), H.max()
 ##        print ' '
         
-        self.R = (P + SM + GW + MR) - (ET + IN)
+        ## self.R = (P + SM + GW + MR) - (ET + IN)
+        
+        #--------------------------------------------------
+        # In place, so refs to R see the change. (10/14)
+        #--------------------------------------------------
+        loss = self.scratch['grid1']
+        np.add( P, SM, self.R )
+        self.R += GW
+        self.R += MR
+        np.add( ET, IN, loss )
+        self.R -= loss
             
     #   update_R()
     #-------------------------------------------------------------------
@@ -1046,14 +1251,124 @@ class channels_component( BMI_base.BMI_component ):
         #-----------------------------------------------
         # Update mass total for R, sum over all pixels
         #-----------------------------------------------   
-        volume = np.double(self.R * self.da * self.dt)  # [m^3]
-        if (np.size(volume) == 1):
-            self.vol_R += (volume * self.rti.n_pixels)
-        else:
-            self.vol_R += np.sum(volume)
+        ## volume = np.double(self.R * self.da * self.dt)  # [m^3]
+        volume = self.scratch['grid1']
+        np.multiply( self.R, self.da, volume )
+        volume *= self.dt   # [m^3]
+        self.vol_R += np.sum(volume)
 
     #   update_R_integral()           
     #-------------------------------------------------------------------  
+    def get_n_substeps(self, time_left, n_done=0):
+
+        #------------------------------------------------------------
+        # Notes: Returns the number of equal sub-steps needed to
+        #        cover time_left (the rest of this update() step)
+        #        with steps no larger than dt_max.  update() calls
+        #        this again after every sub-step, since dt_max
+        #        changes with u.  With a fixed dt (ADAPTIVE_DT =
+        #        False) it is always 1.
+        #
+        #        No more than max_substeps are taken in one step.
+        #        If u blows up anyway, check_flow_velocity() stops
+        #        the run as before.  (10/14)
+        #------------------------------------------------------------
+        if not(self.ADAPTIVE_DT) or (time_left <= self.dt_max):
+            return 1
+        n = int( np.ceil( time_left / self.dt_max ) )
+        return max( min( n, self.max_substeps - n_done ), 1 )
+
+    #   get_n_substeps()
+    #-------------------------------------------------------------------
+    def update_courant_limit(self):
+
+        #------------------------------------------------------------
+        # Notes: dt_max = cfl_number * min(ds / u), the largest
+        #        step for which flow moves less than cfl_number
+        #        pixels.  It uses the current u, so it is called
+        #        at the end of every sub-step.  Where u = 0 (e.g.
+        #        dry pixels), there is no limit.  (10/14)
+        #------------------------------------------------------------
+        u_over_ds = self.scratch['grid1']
+        np.absolute( self.u, u_over_ds )
+        u_over_ds *= self.ds_inv
+        rate = u_over_ds.max()
+        if (rate > 0) and np.isfinite( rate ):
+            self.dt_max = (self.cfl_number / rate)
+        else:
+            self.dt_max = np.float64( np.inf )
+
+    #   update_courant_limit()
+    #-------------------------------------------------------------------
+    def update_active_set(self):
+
+        #------------------------------------------------------------
+        # Notes: In active-set mode (ACTIVE_SET = True), update()
+        #        only computes new values at wet pixels and the
+        #        two pixels below each one (see utils/active_set.py).
+        #        Dry pixels keep the values from the last step in
+        #        which they were active, which are the same as the
+        #        full grid update would give, except for S_free,
+        #        which is not updated at dry pixels.
+        #
+        #        The set is only rebuilt when it must grow: if a
+        #        pixel outside of it gets rain (R > 0), or if a
+        #        pixel near its downstream "frontier" got wet in
+        #        the last step.  This is called after update_R(),
+        #        with the full grids.  (10/14)
+        #------------------------------------------------------------
+        wet = self.scratch['mask1']
+        if (self.active is not None) and not(self.active.GROW):
+            np.greater( self.R, 0, wet )
+            wet &= self.active.inactive
+            if not(wet.any()):
+                return
+
+        active_set.get_wet_grid( self.vol, self.u, self.R, wet )
+        active = active_set.active_set( wet, self.d8 )
+        active.scratch = self.get_scratch_grids( active.n_pixels )
+        self.active = active
+
+    #   update_active_set()
+    #-------------------------------------------------------------------
+    def use_active_grids(self):
+
+        #------------------------------------------------------------
+        # Notes: Replaces the grids in "active_names", d8 and the
+        #        scratch grids with 1D grids for the active pixels,
+        #        so the update methods only work on those.  Grids
+        #        that are scalars (e.g. nval) are not changed.
+        #        use_full_grids() puts the new values back into the
+        #        same full grids, so references to them (e.g. from
+        #        other components) stay valid.  (10/14)
+        #------------------------------------------------------------
+        active = self.active
+        self.full_grids = dict()
+        for name in self.active_names:
+            grid = getattr(self, name, None)
+            if (grid is None) or (np.size(grid) == 1):
+                continue
+            self.full_grids[ name ] = grid
+            setattr(self, name, active.gather( name, grid ))
+        self.full_d8      = self.d8
+        self.full_scratch = self.scratch
+        self.d8      = active.d8
+        self.scratch = active.scratch
+
+    #   use_active_grids()
+    #-------------------------------------------------------------------
+    def use_full_grids(self):
+
+        active = self.active
+        active.GROW = active.get_frontier_wet( self.vol, self.u )
+        for name, grid in self.full_grids.items():
+            active.scatter( getattr(self, name), grid )
+            setattr(self, name, grid)
+        self.d8      = self.full_d8
+        self.scratch = self.full_scratch
+
+    #   use_full_grids()
+    #-------------------------------------------------------------------
     def update_discharge(self):
 
         #---------------------------------------------------------
@@ -1078,7 +1393,8 @@ class channels_component( BMI_base.BMI_component ):
         # A_wet is updated in update_trapezoid_Rh().
         #------------------------------------------------------     
         ### self.Q = np.float64(self.u * A_wet)
-        self.Q[:] = self.u * self.A_wet   ## (2/19/13, in place)
+        ## self.Q[:] = self.u * self.A_wet   ## (2/19/13, in place)
+        np.multiply( self.u, self.A_wet, self.Q )   # (10/14, no temp)
 
         #--------------
         # For testing
@@ -1229,7 +1545,11 @@ class channels_component( BMI_base.BMI_component ):
         # into the channel within the grid cell.
         # Note that R is allowed to be negative.
         #----------------------------------------------------        
-        self.vol += (self.R * self.da) * dt   # (in place)
+        ## self.vol += (self.R * self.da) * dt   # (in place)
+        dvol = self.scratch['grid1']
+        np.multiply( self.R, self.da, dvol )
+        dvol *= dt
+        self.vol += dvol   # (in place)
     
         #-----------------------------------------
         # Add contributions from neighbor pixels
@@ -1240,28 +1560,18 @@ class channels_component( BMI_base.BMI_component ):
         #-------------------------------------------------------------
         # (2/16/10)  RETEST THIS.  Before, a copy called "v2" was
         # used but this doesn't seem to be necessary.
-        #-------------------------------------------------------------        
-        if (self.d8.p1_OK):    
-            self.vol[ self.d8.p1 ] += (dt * self.Q[self.d8.w1])
-        if (self.d8.p2_OK):    
-            self.vol[ self.d8.p2 ] += (dt * self.Q[self.d8.w2])
-        if (self.d8.p3_OK):    
-            self.vol[ self.d8.p3 ] += (dt * self.Q[self.d8.w3])
-        if (self.d8.p4_OK):    
-            self.vol[ self.d8.p4 ] += (dt * self.Q[self.d8.w4])
-        if (self.d8.p5_OK):    
-            self.vol[ self.d8.p5 ] += (dt * self.Q[self.d8.w5])
-        if (self.d8.p6_OK):    
-            self.vol[ self.d8.p6 ] += (dt * self.Q[self.d8.w6])
-        if (self.d8.p7_OK):    
-            self.vol[ self.d8.p7 ] += (dt * self.Q[self.d8.w7])
-        if (self.d8.p8_OK):    
-            self.vol[ self.d8.p8 ] += (dt * self.Q[self.d8.w8])
+        #-------------------------------------------------------------
+        # (10/14)  One bincount over d8.downstream_index replaces
+        # eight scatters with d8.p1, d8.w1, etc.
+        #-------------------------------------------------------------
+        Q_dt = self.scratch['grid1']
+        np.multiply( self.Q, dt, Q_dt )
+        self.d8.route_to_parents( Q_dt, self.vol )
 
         #----------------------------------------------------
         # Subtract the amount that flows out to D8 neighbor
         #----------------------------------------------------
-        self.vol -= (self.Q * dt)  # (in place)
+        self.vol -= Q_dt  # (in place)
    
         #--------------------------------------------------------
         # While R can be positive or negative, the surface flow
@@ -1312,6 +1622,14 @@ class channels_component( BMI_base.BMI_component ):
         width = self.width  ###
         angle = self.angle
         SCALAR_ANGLES = (np.size(angle) == 1)
+
+        #--------------------------------------------------
+        # Scratch grids and masks (10/14).  Masks replace
+        # the boolean arrays and fancy indexing below.
+        #--------------------------------------------------
+        tmp   = self.scratch['grid1']
+        denom = self.scratch['grid2']
+        wb    = self.scratch['mask1']
         
         #------------------------------------------------------
         # (2/18/10) New code to deal with case where the flow
@@ -1322,77 +1640,69 @@ class channels_component( BMI_base.BMI_component ):
         #------------------------------------------------------
         d_bankfull = 4.0  # [meters]
         ################################
-        wb = (self.d > d_bankfull)  # (array of True or False)
-        self.width[ wb ]  = self.d8.dw[ wb ]
-        if not(SCALAR_ANGLES):
-            self.angle[ wb ] = 0.0
+        ## wb = (self.d > d_bankfull)  # (array of True or False)
+        ## self.width[ wb ]  = self.d8.dw[ wb ]
+        np.greater( self.d, d_bankfull, wb )
+        self.update_bankfull_geometry( wb )
      
-#         w_overbank = np.where( d > d_bankfull )
-#         n_overbank = np.size( w_overbank[0] )
-#         if (n_overbank != 0):
-#             width[ w_overbank ] = self.d8.dw[ w_overbank ]
-#             if not(SCALAR_ANGLES): angle[w_overbank] = 0.0
-
         #------------------------------------------------------
         # (2/18/10) New code to deal with case where the top
         #           width exceeds the grid cell width, dw.
-        #------------------------------------------------------            
-        top_width = width + (2.0 * d * np.sin(self.angle))
-        wb = (top_width > self.d8.dw)  # (array of True or False)
-        self.width[ wb ] = self.d8.dw[ wb ]
-        if not(SCALAR_ANGLES):
-            self.angle[ wb ] = 0.0
-                    
-#         wb = np.where(top_width > self.d8.dw)
-#         nb = np.size(w_bad[0])
-#         if (nb != 0):
-#             width[ wb ] = self.d8.dw[ wb ]
-#             if not(SCALAR_ANGLES): angle[ wb ] = 0.0
+        #------------------------------------------------------
+        ## top_width = width + (2.0 * d * np.sin(self.angle))
+        top_width = tmp
+        np.multiply( d, self.sin_angle, top_width )
+        top_width *= 2.0
+        top_width += width
+        np.greater( top_width, self.d8.dw, wb )
+        self.update_bankfull_geometry( wb )
 
         #----------------------------------
         # Is "angle" a scalar or a grid ?
         #----------------------------------
         if (SCALAR_ANGLES):
             if (angle == 0.0):    
-                d = self.vol / (width * self.d8.ds)
+                ## d = self.vol / (width * self.d8.ds)
+                np.multiply( width, self.d8.ds, tmp )
+                np.divide( self.vol, tmp, d )
             else:
-                denom = 2.0 * np.tan(angle)
-                arg   = 2.0 * denom * self.vol / self.d8.ds
-                arg  += width**(2.0)
-                d     = (np.sqrt(arg) - width) / denom
+                ## denom = 2.0 * np.tan(angle)
+                ## arg   = 2.0 * denom * self.vol / self.d8.ds
+                ## arg  += width**(2.0)
+                ## d     = (np.sqrt(arg) - width) / denom
+                denom = 2.0 * self.tan_angle
+                arg   = tmp
+                np.multiply( self.vol, 2.0 * denom, arg )
+                np.divide( arg, self.d8.ds, arg )
+                arg += self.width_sq
+                np.sqrt( arg, arg )
+                arg -= width
+                np.divide( arg, denom, d )
         else:
             #-----------------------------------------------------
             # Pixels where angle is 0 must be handled separately
             #-----------------------------------------------------
-            w1 = ( angle == 0 )  # (arrays of True or False)
-            w2 = np.invert( w1 )
-            #-----------------------------------
-            A_top = width[w1] * self.d8.ds[w1]          
-            d[w1] = self.vol[w1] / A_top
-            #-----------------------------------               
-            denom  = 2.0 * np.tan(angle[w2])
-            arg    = 2.0 * denom * self.vol[w2] / self.d8.ds[w2]
-            arg   += width[w2]**(2.0)
-            d[w2] = (np.sqrt(arg) - width[w2]) / denom
-
-            #-----------------------------------------------------
-            # Pixels where angle is 0 must be handled separately
+            # (10/14) Both formulas are evaluated for all pixels
+            # and then written to d with "where=", to avoid the
+            # temporary arrays made by fancy indexing.
             #-----------------------------------------------------
-#             wz   = np.where( angle == 0 )
-#             nwz  = np.size( wz[0] )
-#             wzc  = np.where( angle != 0 )
-#             nwzc = np.size( wzc[0] )
-#             
-#             if (nwz != 0):
-#                 A_top = width[wz] * self.d8.ds[wz]
-#                 ## A_top = self.width[wz] * self.d8.ds_chan[wz]            
-#                 d[wz] = self.vol[wz] / A_top
-#             
-#             if (nwzc != 0):    
-#                 term1  = 2.0 * np.tan(angle[wzc])
-#                 arg    = 2.0 * term1 * self.vol[wzc] / self.d8.ds[wzc]
-#                 arg   += width[wzc]**(2.0)
-#                 d[wzc] = (np.sqrt(arg) - width[wzc]) / term1
+            w1 = self.scratch['mask2']
+            np.equal( angle, 0, w1 )
+            np.logical_not( w1, wb )
+            #-----------------------------------
+            A_top = tmp
+            np.multiply( width, self.d8.ds, A_top )
+            np.divide( self.vol, A_top, d, where=w1 )
+            #-----------------------------------
+            np.multiply( self.tan_angle, 2.0, denom )
+            arg = tmp
+            np.multiply( denom, 2.0, arg )
+            arg *= self.vol
+            np.divide( arg, self.d8.ds, arg )
+            arg += self.width_sq
+            np.sqrt( arg, arg )
+            arg -= width
+            np.divide( arg, denom, d, where=wb )
 
         #------------------------------------------
         # Set depth values on edges to zero since
@@ -1418,19 +1728,73 @@ class channels_component( BMI_base.BMI_component ):
         #-------------------------------------------------        
         # Find where d <= 0 and save for later (9/23/14)
         #-------------------------------------------------
-        self.d_is_pos = (self.d > 0)
-        self.d_is_neg = np.invert( self.d_is_pos )
+        np.greater( self.d, 0, self.d_is_pos )
+        np.logical_not( self.d_is_pos, self.d_is_neg )
         
     #   update_flow_depth
     #-------------------------------------------------------------------
+    def update_bankfull_geometry(self, wb):
+
+        #------------------------------------------------------------
+        # Notes: Called by update_flow_depth().  Sets width to the
+        #        grid cell width, dw, and (if angle is a grid) angle
+        #        to zero, where wb is True.  Only pixels where this
+        #        changes width or angle are passed to
+        #        update_geometry_grids(), and that is usually none.
+        #        wb is changed to those pixels.  (10/14)
+        #------------------------------------------------------------
+        if not(wb.any()):
+            return
+        changed = self.scratch['mask2']
+        np.not_equal( self.width, self.d8.dw, changed )
+        if (np.size(self.angle) > 1):
+            np.logical_or( changed, self.angle, changed )  # (angle != 0)
+        np.logical_and( wb, changed, wb )
+        if not(wb.any()):
+            return
+
+        np.copyto( self.width, self.d8.dw, where=wb )
+        if (np.size(self.angle) > 1):
+            np.copyto( self.angle, 0.0, where=wb )
+        self.update_geometry_grids( wb )
+
+    #   update_bankfull_geometry()
+    #-------------------------------------------------------------------
+    def update_geometry_grids(self, w):
+
+        #------------------------------------------------------------
+        # Notes: Recompute the grids from initialize_geometry_grids()
+        #        for pixels where the boolean grid, w, is True, after
+        #        width or angle has changed there.  (ds doesn't
+        #        change.)  (10/14)
+        #------------------------------------------------------------
+        np.multiply( self.width, self.width, self.width_sq, where=w )
+        if (np.size(self.angle) > 1):
+            np.sin( self.angle, self.sin_angle, where=w )
+            np.tan( self.angle, self.tan_angle, where=w )
+            np.cos( self.angle, self.cos_angle, where=w )
+
+    #   update_geometry_grids()
+    #-------------------------------------------------------------------
     def update_free_surface_slope(self):
 
         #-----------------------------------------------------------
         # Notes:  It is assumed that the flow directions don't
         #         change even though the free surface is changing.
         #-----------------------------------------------------------
-        delta_d     = (self.d - self.d[self.d8.parent_IDs])
-        self.S_free[:] = self.S_bed + (delta_d / self.d8.ds)
+        ## delta_d     = (self.d - self.d[self.d8.parent_IDs])
+        ## self.S_free[:] = self.S_bed + (delta_d / self.d8.ds)
+        
+        #------------------------------------------------------
+        # (10/14) parent_ID_grid has the same (calendar) IDs
+        # as parent_IDs, so np.take() can write to a scratch
+        # grid instead of making a new one.
+        #------------------------------------------------------
+        delta_d = self.scratch['grid1']
+        np.take( self.d, self.d8.parent_ID_grid, out=delta_d, mode='clip' )
+        np.subtract( self.d, delta_d, delta_d )
+        np.divide( delta_d, self.d8.ds, delta_d )
+        np.add( self.S_bed, delta_d, self.S_free )
         
         #--------------------------------------------
         # Don't do this; negative slopes are needed
@@ -1453,7 +1817,9 @@ class channels_component( BMI_base.BMI_component ):
         	slope = self.S_bed
         else:
             slope = self.S_free
-        self.tau[:] = self.rho_H2O * self.g * self.d * slope
+        ## self.tau[:] = self.rho_H2O * self.g * self.d * slope
+        np.multiply( self.d, self.rho_H2O * self.g, self.tau )
+        self.tau *= slope
                
     #   update_shear_stress()
     #-------------------------------------------------------------------
@@ -1462,7 +1828,9 @@ class channels_component( BMI_base.BMI_component ):
         #--------------------------------------------------------
         # Notes: 9/9/14.  Added so shear speed could be shared.
         #--------------------------------------------------------
-        self.u_star[:] = np.sqrt( self.tau / self.rho_H2O )
+        ## self.u_star[:] = np.sqrt( self.tau / self.rho_H2O )
+        np.divide( self.tau, self.rho_H2O, self.u_star )
+        np.sqrt( self.u_star, self.u_star )
                
     #   update_shear_speed()
     #-------------------------------------------------------------------
@@ -1493,16 +1861,32 @@ class channels_component( BMI_base.BMI_component ):
         #-----------------------------------------------------------
         d     = self.d        # (local synonyms)
         wb    = self.width    # (trapezoid bottom width)
-        L2    = d * np.tan( self.angle )          
-        A_wet = d * (wb + L2)      
-        P_wet = wb + (np.float64(2) * d / np.cos(self.angle) )
+        ## L2    = d * np.tan( self.angle )          
+        ## A_wet = d * (wb + L2)      
+        ## P_wet = wb + (np.float64(2) * d / np.cos(self.angle) )
+
+        #---------------------------------------------------
+        # (10/14) Compute A_wet, P_wet and Rh in place,
+        # since they are shared.
+        #---------------------------------------------------
+        A_wet = self.A_wet
+        P_wet = self.P_wet
+        Rh    = self.Rh
+        L2    = self.scratch['grid1']
+        np.multiply( d, self.tan_angle, L2 )
+        L2 += wb
+        np.multiply( d, L2, A_wet )
+        #---------------------------------------------------
+        np.multiply( d, np.float64(2), P_wet )
+        P_wet /= self.cos_angle
+        P_wet += wb
 
         #---------------------------------------------------
         # At noflow_IDs (e.g. edges) P_wet may be zero
         # so do this to avoid "divide by zero". (10/29/11)
         #---------------------------------------------------
         P_wet[ self.d8.noflow_IDs ] = np.float64(1)
-        Rh = (A_wet / P_wet)
+        np.divide( A_wet, P_wet, Rh )
         #--------------------------------
         # w = np.where(P_wet == 0)
         # print 'In update_trapezoid_Rh():'
@@ -1517,9 +1901,9 @@ class channels_component( BMI_base.BMI_component ):
 ##        nw = np.size(w[0])
 ##        if (nw > 0): Rh[w] = np.float64(0)
         
-        self.Rh[:]    = Rh
-        self.A_wet[:] = A_wet   ## (Now shared: 9/9/14)
-        self.P_wet[:] = P_wet   ## (Now shared: 9/9/14)
+        ## self.Rh[:]    = Rh
+        ## self.A_wet[:] = A_wet   ## (Now shared: 9/9/14)
+        ## self.P_wet[:] = P_wet   ## (Now shared: 9/9/14)
 
         #---------------
         # For testing
@@ -1578,10 +1962,20 @@ class channels_component( BMI_base.BMI_component ):
         #-----------------------------------------
 		# This makes f=0 and du=0 where (d <= 0)
 		#-----------------------------------------
+        #-----------------------------------------
+        # (10/14) Use scratch grids and "where="
+        # instead of fancy indexing.
+        #-----------------------------------------
+        tmp = self.scratch['grid1']
         if (self.MANNING):
-            n2 = self.nval ** np.float64(2)  
-            self.f[ wg ] = self.g * (n2[wg] / (self.d[wg] ** self.one_third))
-            self.f[ wb ] = np.float64(0)
+            ## n2 = self.nval ** np.float64(2)  
+            ## self.f[ wg ] = self.g * (n2[wg] / (self.d[wg] ** self.one_third))
+            n2 = self.scratch['grid2']
+            np.multiply( self.nval, self.nval, n2 )
+            np.power( self.d, self.one_third, tmp, where=wg )
+            np.divide( n2, tmp, tmp, where=wg )
+            np.multiply( tmp, self.g, self.f, where=wg )
+            np.copyto( self.f, np.float64(0), where=wb )
  
         #---------------------------------
         # Compute f for Law of Wall case
@@ -1591,10 +1985,16 @@ class channels_component( BMI_base.BMI_component ):
             # Make sure (smoothness > 1) before taking log.
             # Should issue a warning if this is used.
             #------------------------------------------------
-            smoothness = (self.aval / self.z0val) * self.d
+            ## smoothness = (self.aval / self.z0val) * self.d
+            smoothness = tmp
+            np.divide( self.aval, self.z0val, smoothness )
+            smoothness *= self.d
             np.maximum(smoothness, np.float64(1.1), smoothness)  # (in place)
-            self.f[wg] = (self.kappa / np.log(smoothness[wg])) ** np.float64(2)
-            self.f[wb] = np.float64(0)
+            ## self.f[wg] = (self.kappa / np.log(smoothness[wg])) ** np.float64(2)
+            np.log( smoothness, tmp, where=wg )
+            np.divide( self.kappa, tmp, tmp, where=wg )
+            np.multiply( tmp, tmp, self.f, where=wg )
+            np.copyto( self.f, np.float64(0), where=wb )
 
         ##############################################################
         # cProfile:  This method took: 0.93 secs for topoflow_test()
@@ -1680,8 +2080,13 @@ class channels_component( BMI_base.BMI_component ):
         wg = self.d_is_pos
         wb = self.d_is_neg
 
-        self.froude[ wg ] = self.u[wg] / np.sqrt( self.g * self.d[wg] )       
-        self.froude[ wb ] = np.float64(0)
+        ## self.froude[ wg ] = self.u[wg] / np.sqrt( self.g * self.d[wg] )       
+        ## self.froude[ wb ] = np.float64(0)
+        c = self.scratch['grid1']   # (wave celerity, 10/14)
+        np.multiply( self.d, self.g, c )
+        np.sqrt( c, c )
+        np.divide( self.u, c, self.froude, where=wg )
+        np.copyto( self.froude, np.float64(0), where=wb )
                
     #   update_froude_number()
     #-------------------------------------------------------------
@@ -1779,17 +2184,22 @@ class channels_component( BMI_base.BMI_component ):
         
         #--------------------------------------------
         # Exclude edges where mins are always zero.
+        # For a packed domain, these are the pixels
+        # on the edges of the full grid. (10/14)
         #--------------------------------------------
         nx = self.nx
         ny = self.ny
-        Q_min = self.Q[1:(ny - 2)+1,1:(nx - 2)+1].min()
-        Q_max = self.Q[1:(ny - 2)+1,1:(nx - 2)+1].max()
+        w  = (slice(1, (ny - 2)+1), slice(1, (nx - 2)+1))
+        if (self.PACKED):
+            w = self.rti.domain.interior_IDs
+        Q_min = self.Q[w].min()
+        Q_max = self.Q[w].max()
         #-------------------------------------------------
-        u_min = self.u[1:(ny - 2)+1,1:(nx - 2)+1].min()
-        u_max = self.u[1:(ny - 2)+1,1:(nx - 2)+1].max()        
+        u_min = self.u[w].min()
+        u_max = self.u[w].max()        
         #-------------------------------------------------
-        d_min = self.d[1:(ny - 2)+1,1:(nx - 2)+1].min()
-        d_max = self.d[1:(ny - 2)+1,1:(nx - 2)+1].max()
+        d_min = self.d[w].min()
+        d_max = self.d[w].max()
 
         #-------------------------------------------------
         # (2/6/13) This preserves "mutable scalars" that
@@ -1913,8 +2323,15 @@ class channels_component( BMI_base.BMI_component ):
         
         #--------------------------------
         # Are all velocities positive ?
-        #--------------------------------
-        wbad = np.where( np.logical_or( u < 0.0, np.logical_not(np.isfinite(u)) ))
+        #-----------------------------------------------------
+        # (10/14) With ADAPTIVE_DT, the Courant limit uses |u|
+        # and the sub-steps keep a negative u stable, so only
+        # NaN or infinite velocities stop the run.
+        #-----------------------------------------------------
+        if (self.ADAPTIVE_DT):
+            wbad = np.where( np.logical_not(np.isfinite(u)) )
+        else:
+            wbad = np.where( np.logical_or( u < 0.0, np.logical_not(np.isfinite(u)) ))
         nbad = np.size( wbad[0] )
         if (nbad == 0):    
             return OK
@@ -1927,6 +2344,9 @@ class channels_component( BMI_base.BMI_component ):
                'Negative or NaN velocity found: ' + str(umin), \
                'Time step may be too large.', \
                'Time step:      ' + str(dt) + ' [s]', ' ']
+        if (self.ADAPTIVE_DT):
+            msg[4] = 'Sub-steps:      ' + str(self.n_substeps) + \
+                     ' (max_substeps = ' + str(self.max_substeps) + ')'
         for k in xrange(len(msg)):
             print msg[k]
 
@@ -2057,6 +2477,14 @@ class channels_component( BMI_base.BMI_component ):
             self.angle = angle * self.deg_to_rad  # [radians]
             ### self.angle = angle  # (before 9/9/14)
 
+        #-------------------------------------------------
+        # New width or angle values need new geometry
+        # grids, once they exist.  (10/14)
+        #-------------------------------------------------
+        if hasattr(self, 'width_sq'):
+            if (width is not None) or (angle is not None):
+                self.initialize_geometry_grids()
+
         sinu = model_input.read_next(self.sinu_unit, self.sinu_type, rti)
         if (sinu != None): self.sinu = sinu
         
@@ -2338,7 +2766,7 @@ class channels_component( BMI_base.BMI_component ):
         
     #   save_pixel_values()
     #-------------------------------------------------------------------
-    def manning_formula(self):
+    def manning_formula(self, out=None):
 
         #---------------------------------------------------------
         # Notes: R = (A/P) = hydraulic radius [m]
@@ -2354,13 +2782,24 @@ class channels_component( BMI_base.BMI_component ):
 
         #        Note that Q = Ac * u, where Ac is cross-section
         #        area.  For a trapezoid, Ac does not equal w*d.
+
+        #        If "out" is given, u is computed in place there,
+        #        as in update_velocity(). (10/14)
         #---------------------------------------------------------
         if (self.KINEMATIC_WAVE):
             S = self.S_bed
         else:
         	S = self.S_free
 
-        u = (self.Rh ** self.two_thirds) * np.sqrt(S) / self.nval
+        if (out is None):
+            return (self.Rh ** self.two_thirds) * np.sqrt(S) / self.nval
+
+        u      = out
+        sqrt_S = self.scratch['grid3']
+        np.power( self.Rh, self.two_thirds, u )
+        np.sqrt( S, sqrt_S )
+        u *= sqrt_S
+        u /= self.nval
         
         #--------------------------------------------------------
         # Add a hydraulic jump option for when u gets too big ?
@@ -2370,7 +2809,7 @@ class channels_component( BMI_base.BMI_component ):
     
     #   manning_formula()
     #-------------------------------------------------------------------
-    def law_of_the_wall(self):
+    def law_of_the_wall(self, out=None):
 
         #---------------------------------------------------------
         # Notes: u  = flow velocity  [m/s]
@@ -2397,21 +2836,37 @@ class channels_component( BMI_base.BMI_component ):
         #        However, for n=0.3, it gives: z0 = 11417.413
         #        which is 11.4 km!  So the approximation only
         #        holds within some range of values.
+
+        #        If "out" is given, u is computed in place there,
+        #        as in update_velocity(). (10/14)
         #--------------------------------------------------------
         if (self.KINEMATIC_WAVE):
             S = self.S_bed
         else:
         	S = self.S_free
 
-        smoothness = (self.aval / self.z0val) * self.d
+        if (out is None):
+            smoothness = (self.aval / self.z0val) * self.d
+        else:
+            smoothness = self.scratch['grid3']
+            np.divide( self.aval, self.z0val, smoothness )
+            smoothness *= self.d
           
         #------------------------------------------------
         # Make sure (smoothness > 1) before taking log.
         # Should issue a warning if this is used.
         #------------------------------------------------
-        smoothness = np.maximum(smoothness, np.float64(1.1))
+        np.maximum(smoothness, np.float64(1.1), smoothness)  # (in place)
 
-        u = self.law_const * np.sqrt(self.Rh * S) * np.log(smoothness)
+        if (out is None):
+            return self.law_const * np.sqrt(self.Rh * S) * np.log(smoothness)
+
+        u = out
+        np.multiply( self.Rh, S, u )
+        np.sqrt( u, u )
+        u *= self.law_const
+        np.log( smoothness, smoothness )
+        u *= smoothness
         
         #--------------------------------------------------------
         # Add a hydraulic jump option for when u gets too big ?
@@ -2504,6 +2959,22 @@ class channels_component( BMI_base.BMI_component ):
         print '         Use "Profile smoothing tool" instead.'
         S_min = self.slope[wg].min()
         S_max = self.slope[wg].max()
+
+        #----------------------------------------------------
+        # For a packed domain, use the smallest slope in the
+        # full grid, as for the full grid.  (10/14)
+        #----------------------------------------------------
+        domain = getattr(self.rti, 'domain', None)
+        if (domain is not None) and (self.slope_type.lower() == 'grid'):
+            S = np.float64( rtg_files.read_grid( self.slope_file,
+                                                 domain.full_rti ) )
+            if (np.size(self.sinu) > 1):
+                S /= rtg_files.read_grid( self.sinu_file, domain.full_rti )
+            else:
+                S /= self.sinu
+            S = S[ np.logical_and( S > 0, np.isfinite(S) ) ]
+            if (S.size > 0):
+                S_min = S.min()
         print '         min(S) = ' + str(S_min)
         print '         max(S) = ' + str(S_max)
         print '-------------------------------------------------'
@@ -108,19 +108,22 @@ class channels_component(channels_base.channels_component):
         # NB! This involves computing sqrt(S_free)
         # so disallow "backflow" this way ?
         #-------------------------------------------
-        self.S_free = np.maximum(self.S_free, 0.0)        ############
+        ## self.S_free = np.maximum(self.S_free, 0.0)        ############
+        np.maximum(self.S_free, 0.0, self.S_free)   # (10/14, in place)
         
         #------------------------
         # Use Manning's formula
         #------------------------
         if (self.MANNING):    
-            self.u = self.manning_formula()
+            ## self.u = self.manning_formula()
+            self.manning_formula( out=self.u )   # (10/14, in place)
         
         #--------------------------------------
         # Use the Logarithmic Law of the Wall
         #--------------------------------------
         if (self.LAW_OF_WALL):    
-            self.u = self.law_of_the_wall()
+            ## self.u = self.law_of_the_wall()
+            self.law_of_the_wall( out=self.u )   # (10/14, in place)
 
         #----------------------------------------
         # Allow negative velocity (backflow) ??
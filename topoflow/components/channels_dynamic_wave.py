@@ -35,6 +35,12 @@ from topoflow.components import channels_base
 #-----------------------------------------------------------------------
 class channels_component(channels_base.channels_component):
 
+    #-------------------------------------------------------------------
+    # Extra scratch grids for update_velocity(). (10/14)
+    #-------------------------------------------------------------------
+    scratch_names = (channels_base.channels_component.scratch_names +
+                     ['acc', 'wtop', 'Atop', 'Pw', 'A2', 'uQ_in', 'Q_in'])
+    
     #-------------------------------------------------------------------
     _att_map = {
         'model_name':         'Channels_Dynamic_Wave',
@@ -123,61 +129,103 @@ class channels_component(channels_base.channels_component):
         # Note:  u, d and Q are always grids
         # Note:  (Pw / wtop) = (A2 / Atop)
         #------------------------------------------
-        grav = self.g * (self.S_free * self.d)
-        fric = self.f * (self.u ** np.float64(2))
-        #---------------------------------------
-        #####################################################
+        # (10/14) All grids below are computed in
+        # scratch grids, with in-place ufuncs.
+        # See channels_base.initialize_scratch_grids().
+        #------------------------------------------
         angle  = self.angle
         width  = self.width
         d      = self.d
         u      = self.u
         Q      = self.Q
+        tmp    = self.scratch['grid1']
+        tmp2   = self.scratch['grid2']
+        acc    = self.scratch['acc']
+        wtop   = self.scratch['wtop']
+        Atop   = self.scratch['Atop']
+        Pw     = self.scratch['Pw']
+        A2     = self.scratch['A2']
+        uQ_in  = self.scratch['uQ_in']
+        Q_in   = self.scratch['Q_in']
         #---------------------------------------
-        p1     = self.d8.p1   ; w1 = self.d8.w1
-        p2     = self.d8.p2   ; w2 = self.d8.w2
-        p3     = self.d8.p3   ; w3 = self.d8.w3
-        p4     = self.d8.p4   ; w4 = self.d8.w4
-        p5     = self.d8.p5   ; w5 = self.d8.w5
-        p6     = self.d8.p6   ; w6 = self.d8.w6
-        p7     = self.d8.p7   ; w7 = self.d8.w7
-        p8     = self.d8.p8   ; w8 = self.d8.w8
-        #####################################################
+        ## grav = self.g * (self.S_free * self.d)
+        grav = acc
+        np.multiply( self.S_free, d, grav )
+        grav *= self.g
         #---------------------------------------
-        wtop = width + (2 * d * np.tan(angle))    #(top width)
-        Atop = self.d8.ds * wtop                    #(top area)
+        ## wtop = width + (2 * d * np.tan(angle))    #(top width)
+        ## Atop = self.d8.ds * wtop                    #(top area)
+        np.multiply( d, 2, wtop )
+        wtop *= self.tan_angle    # (see initialize_geometry_grids())
+        wtop += width
+        np.multiply( self.d8.ds, wtop, Atop )
 ##        Atop = ds_chan * wtop                     #(top area)
-        Rtrm = (u * self.R) * (self.da / Atop)      #(da = pixel area)
         #---------------------------------------
-        Pw = width + (np.float64(2) * d / np.cos(angle))  #(wetted perimeter)
-        A2 = self.d8.ds * Pw                          #(wetted surf. area)
+        ## Pw = width + (np.float64(2) * d / np.cos(angle))  #(wetted perimeter)
+        ## A2 = self.d8.ds * Pw                          #(wetted surf. area)
+        np.multiply( d, np.float64(2), Pw )
+        Pw /= self.cos_angle
+        Pw += width
+        np.multiply( self.d8.ds, Pw, A2 )
 ##        A2 = ds_chan * Pw                           #(wetted surf. area)
-        Atrm = (u * Q) * ((np.float64(1) / Atop) - (np.float64(1) / A2))
         #---------------------------------------
-        acc = (grav + Atrm - fric - Rtrm)          #(positive or negative)
-        u2  = u + (self.dt * dinv * acc)           #(before next part)
+        ## Atrm = (u * Q) * ((np.float64(1) / Atop) - (np.float64(1) / A2))
+        Atrm = tmp
+        np.divide( np.float64(1), Atop, Atrm )
+        np.divide( np.float64(1), A2, tmp2 )
+        Atrm -= tmp2
+        np.multiply( u, Q, tmp2 )
+        Atrm *= tmp2
+        #---------------------------------------
+        ## fric = self.f * (self.u ** np.float64(2))
+        ## Rtrm = (u * self.R) * (self.da / Atop)      #(da = pixel area)
+        ## acc = (grav + Atrm - fric - Rtrm)          #(positive or negative)
+        acc += Atrm
+        fric = tmp
+        np.multiply( u, u, fric )
+        fric *= self.f
+        acc -= fric
+        Rtrm = tmp
+        np.divide( self.da, Atop, Rtrm )
+        np.multiply( u, self.R, tmp2 )
+        Rtrm *= tmp2
+        acc -= Rtrm
+        #---------------------------------------
+        ## u2  = u + (self.dt * dinv * acc)           #(before next part)
+        u2 = acc
+        u2 *= (self.dt * dinv)
+        u2 += u
         #----------------------------------
-        fac = (self.dt / A2) * dinv                #(always grid)
-        uu  = u * (Pw / wtop)                      #(always grid)
+        ## fac = (self.dt / A2) * dinv                #(always grid)
+        ## uu  = u * (Pw / wtop)                      #(always grid)
+        fac = A2
+        np.divide( self.dt, A2, fac )
+        fac *= dinv
+        uu = Pw
+        uu /= wtop
+        uu *= u
             
         #-------------------------------------------
         # Add momentum fluxes from D8 child pixels
-        #-------------------------------------------
-        if (self.d8.p1_OK):    
-            u2[p1] += (u[w1] - uu[p1]) * Q[w1] * fac[p1]
-        if (self.d8.p2_OK):    
-            u2[p2] += (u[w2] - uu[p2]) * Q[w2] * fac[p2]
-        if (self.d8.p3_OK):    
-            u2[p3] += (u[w3] - uu[p3]) * Q[w3] * fac[p3]
-        if (self.d8.p4_OK):    
-            u2[p4] += (u[w4] - uu[p4]) * Q[w4] * fac[p4]
-        if (self.d8.p5_OK):    
-            u2[p5] += (u[w5] - uu[p5]) * Q[w5] * fac[p5]
-        if (self.d8.p6_OK):    
-            u2[p6] += (u[w6] - uu[p6]) * Q[w6] * fac[p6]
-        if (self.d8.p7_OK):    
-            u2[p7] += (u[w7] - uu[p7]) * Q[w7] * fac[p7]
-        if (self.d8.p8_OK):    
-            u2[p8] += (u[w8] - uu[p8]) * Q[w8] * fac[p8]
+        #-----------------------------------------------------
+        # (10/14)  For each parent pixel, p, the sum over its
+        # children, w, of (u[w] - uu[p]) * Q[w] * fac[p] is:
+        #   fac[p] * (sum(u[w] * Q[w]) - uu[p] * sum(Q[w]))
+        # so two calls to route_to_parents() replace eight
+        # scatters with d8.p1, d8.w1, etc.
+        #-----------------------------------------------------
+        ## uQ_in = self.d8.route_to_parents( u * Q )
+        ## Q_in  = self.d8.route_to_parents( Q )
+        ## u2 += (uQ_in - (uu * Q_in)) * fac
+        uQ_in.fill( 0 )
+        Q_in.fill( 0 )
+        np.multiply( u, Q, tmp2 )
+        self.d8.route_to_parents( tmp2, uQ_in )
+        self.d8.route_to_parents( Q, Q_in )
+        uu *= Q_in
+        uQ_in -= uu
+        uQ_in *= fac
+        u2 += uQ_in
         
         #--------------------------------
         # Don't allow u2 to be negative
@@ -185,12 +233,13 @@ class channels_component(channels_base.channels_component):
         # If uphill flow is allowed, to which pixel ?
         # This worked when d0 grid was used.
         #----------------------------------------------
-        u2 = np.maximum(u2, np.float64(0))
+        ## u2 = np.maximum(u2, np.float64(0))
         
         #---------------
         # Copy u2 to u
         #---------------
-        self.u = u2
+        ## self.u = u2
+        np.maximum( u2, np.float64(0), self.u )   # (10/14, in place)
         
     #    update_velocity()                       
     #-------------------------------------------------------------------
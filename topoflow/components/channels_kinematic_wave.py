@@ -23,14 +23,24 @@
 #      get_output_var_names()    # (defined in channels_base.py)
 #      get_var_name()            # (defined in channels_base.py)
 #      get_var_units()           # (defined in channels_base.py)
+#      set_computed_input_vars() # (10/14)
 #      ------------------------
+#      update_flow_volume()      # (10/14, explicit or implicit)
+#      update_flow_volume_implicit()   # (10/14)
+#      get_implicit_layers()     # (10/14)
 #      update_velocity()
 #
+#  Functions:
+#      implicit_depth()          # (10/14)
+#      kinematic_discharge()     # (10/14)
+#
 #-----------------------------------------------------------------------
 
 import numpy
+import numpy as np
 
 from topoflow.components import channels_base
+from topoflow.components import d8_global
 
 #-----------------------------------------------------------------------
 class channels_component(channels_base.channels_component):
@@ -73,6 +83,189 @@ class channels_component(channels_base.channels_component):
 
     #   get_attribute()
     #-------------------------------------------------------------------
+    def set_computed_input_vars(self):
+
+        #------------------------------------------------------------
+        # Notes: The CFG file may set "solver_method" to "Explicit"
+        #        (the default, if not in the file) or "Implicit".
+        #        See update_flow_volume_implicit().  (10/14)
+        #------------------------------------------------------------
+        channels_base.channels_component.set_computed_input_vars(self)
+
+        self.solver_method = getattr(self, 'solver_method', 'Explicit')
+        self.IMPLICIT = (self.solver_method.lower() == 'implicit')
+
+        #------------------------------------------------------
+        # Flow can cross many pixels in one implicit step, so
+        # the active set can't be used.  (See channels_base.)
+        #------------------------------------------------------
+        if (self.IMPLICIT and self.ACTIVE_SET):
+            print 'NOTE: Active-set mode is not used with the'
+            print '      implicit kinematic wave solver.'
+            print ' '
+            self.ACTIVE_SET = False
+
+    #   set_computed_input_vars()
+    #-------------------------------------------------------------------
+    def update_flow_volume(self):
+
+        if (getattr(self, 'IMPLICIT', False)):
+            self.update_flow_volume_implicit()
+        else:
+            channels_base.channels_component.update_flow_volume(self)
+
+    #   update_flow_volume()
+    #-------------------------------------------------------------------
+    def update_flow_volume_implicit(self):
+
+        #------------------------------------------------------------
+        # Notes: Implicit (backward Euler) kinematic wave.  For each
+        #        pixel, the new flow volume, vol, and the new
+        #        outflow, Q(d), where d is the depth for vol, solve:
+        #
+        #           vol = vol_last + dt * (Q_in + R*da - Q(d))
+        #
+        #        where Q_in is the new outflow of the pixel's D8
+        #        children.  Pixels are solved in topological order
+        #        (children first), one "layer" at a time, with a
+        #        Newton iteration for d (see implicit_depth()).
+        #        Q(d) is from Manning's formula or the law of the
+        #        wall with S = S_bed, as in update_velocity().
+
+        #        Since there is no Courant condition for this
+        #        solver, dt can be much larger than for the
+        #        explicit one (e.g. minutes instead of seconds).
+        #        The volume is exactly conserved, and vol >= 0.
+
+        #        The new Q is saved in self.Q, and vol in self.vol.
+        #        update_flow_depth() then computes d from vol, so
+        #        the rest of update() is the same as before.
+        #        Pixels with no parent (including noflow_IDs)
+        #        keep all of their inflow, as in the explicit
+        #        solver.  (10/14)
+        #------------------------------------------------------------
+        if (getattr(self, 'implicit_order', None) is None):
+            self.get_implicit_layers()
+        order = self.implicit_order
+        n  = order.size
+        dt = self.dt
+
+        def ordered( grid ):
+            if (np.size( grid ) == 1):
+                return np.zeros( n, dtype='Float64' ) + grid
+            return np.take( grid, order )
+
+        #--------------------------------------------
+        # Volume before inflow from children, and
+        # conveyance (u = k * function of d)
+        #--------------------------------------------
+        b = ordered( self.R )
+        b *= ordered( self.da )
+        b *= dt
+        b += ordered( self.vol )
+        #-------------------------
+        if (self.MANNING):
+            k = np.sqrt( ordered( self.S_bed ) ) / ordered( self.nval )
+            a_z0 = None
+        else:
+            k = self.law_const * np.sqrt( ordered( self.S_bed ) )
+            a_z0 = self.aval / ordered( self.z0val )
+        k[ self.implicit_sinks ] = 0.0
+        #-------------------------
+        ds  = ordered( self.d8.ds )
+        w   = ordered( self.width )
+        tan = ordered( self.tan_angle )
+        cos = ordered( self.cos_angle )
+
+        #-------------------------------------
+        # Solve one layer at a time, and add
+        # its outflow to the next layers
+        #-------------------------------------
+        Q_in  = np.zeros( n, dtype='Float64' )
+        Q_out = np.zeros( n, dtype='Float64' )
+        for (i1, i2, child_pos, parent_pos, starts) in self.implicit_layers:
+            s  = slice( i1, i2 )
+            bs = b[s] + (dt * Q_in[s])
+            if (a_z0 is None):
+                Q_out[s] = implicit_depth( bs, dt, ds[s], w[s], tan[s],
+                                           cos[s], k[s] )[1]
+            else:
+                Q_out[s] = implicit_depth( bs, dt, ds[s], w[s], tan[s],
+                                           cos[s], k[s], a_z0[s] )[1]
+            if (child_pos.size > 0):
+                Q_in[ parent_pos ] += np.add.reduceat( Q_out[ child_pos ],
+                                                       starts )
+
+        #-------------------------------
+        # New volumes and outflows, in
+        # place in the full grids
+        #-------------------------------
+        Q_in *= dt
+        b += Q_in
+        np.multiply( Q_out, dt, Q_in )
+        b -= Q_in
+        np.maximum( b, 0.0, b )
+        np.put( self.vol, order, b )
+        np.put( self.Q, order, Q_out )
+
+    #   update_flow_volume_implicit()
+    #-------------------------------------------------------------------
+    def get_implicit_layers(self):
+
+        #------------------------------------------------------------
+        # Notes: implicit_order has every pixel ID, children before
+        #        parents, in layers from d8_global.get_topo_layers().
+        #        For each layer, implicit_layers has its slice
+        #        (i1, i2) in implicit_order, and for its links to
+        #        parents, the positions of the children and parents
+        #        in implicit_order, grouped by parent for reduceat.
+        #        Pixels in flow cycles (if any) are put last, and
+        #        they don't route flow (implicit_sinks).  (10/14)
+        #------------------------------------------------------------
+        down = self.d8.downstream_index
+        (order, layers, unresolved) = d8_global.get_topo_layers( down )
+        n = down.size
+
+        #------------------------------------------------
+        # Layer of each pixel = 1 + max of its children
+        # (the order of get_topo_layers(), by layer)
+        #------------------------------------------------
+        n_layers = len( layers ) + 1
+        level = np.zeros( n, dtype='Int32' )
+        for j in xrange( len( layers ) ):
+            level[ layers[j][1] ] = (j + 1)
+        level[ unresolved ] = n_layers
+        order = np.int32( np.argsort( level, kind='mergesort' ) )
+        pos = np.zeros( n, dtype='Int32' )
+        pos[ order ] = np.arange( n, dtype='Int32' )
+        bounds = np.searchsorted( level[ order ], np.arange( n_layers + 2 ) )
+
+        self.implicit_layers = []
+        empty = np.zeros( 0, dtype='Int32' )
+        for j in xrange( n_layers + 1 ):
+            (i1, i2) = (bounds[j], bounds[j + 1])
+            if (i2 == i1):
+                continue
+            if (j < len( layers )):
+                (IDs, pIDs, starts) = layers[j]
+                links = (pos[ IDs ], pos[ pIDs ], np.int32( starts ))
+            else:
+                links = (empty, empty, empty)
+            self.implicit_layers.append( (i1, i2) + links )
+
+        #-------------------------------------------
+        # Pixels that don't route flow to a parent
+        #-------------------------------------------
+        sinks = np.zeros( np.shape( self.d ), dtype='bool' )
+        sinks[ self.d8.noflow_IDs ] = True
+        sinks = sinks.ravel()
+        sinks[ down < 0 ] = True
+        sinks[ unresolved ] = True
+        self.implicit_sinks = np.where( sinks[ order ] )[0]
+        self.implicit_order = order
+
+    #   get_implicit_layers()
+    #-------------------------------------------------------------------
     def update_velocity(self):
 
         #---------------------------------------------------------
@@ -97,18 +290,104 @@ class channels_component(channels_base.channels_component):
         # Use Manning's formula
         #------------------------
         if (self.MANNING):    
-            self.u = self.manning_formula()
+            ## self.u = self.manning_formula()
+            self.manning_formula( out=self.u )   # (10/14, in place)
         
         #--------------------------------------
         # Use the Logarithmic Law of the Wall
         #--------------------------------------
         if (self.LAW_OF_WALL):    
-            self.u = self.law_of_the_wall()
+            ## self.u = self.law_of_the_wall()
+            self.law_of_the_wall( out=self.u )   # (10/14, in place)
 
         # print '(umin, umax) =', self.u.min(), self.u.max()
         
     #   update_velocity()                       
     #-------------------------------------------------------------------
 
+#-----------------------------------------------------------------------
+def implicit_depth( b, dt, ds, w, tan, cos, k, a_z0=None,
+                    tol=1e-10, max_iter=50 ):
+
+    #---------------------------------------------------------------
+    # Notes: Solves F(d) = ds * A(d) + dt * Q(d) - b = 0 for the
+    #        flow depth, d, of each pixel in a trapezoid channel
+    #        with bottom width w and bank angle theta, where:
+    #           A = d * (w + d * tan(theta))     (x-section area)
+    #           P = w + 2 * d / cos(theta)       (wetted perimeter)
+    #           Q = u * A,  with
+    #           u = k * (A/P)^(2/3)                  (Manning), or
+    #           u = k * (A/P)^(1/2) * log(a_z0 * d)  (law of wall)
+    #        Returns d and Q(d) as 1D arrays.  Where (b <= 0),
+    #        d = Q = 0.  Other args are 1D arrays or scalars.
+    #        Tiny b (below the smallest normal float) is taken as
+    #        dry, since (tol * d) underflows to 0 for it.
+
+    #        F is increasing in d, with F(0) < 0 and F(d0) >= 0,
+    #        where ds * A(d0) = b.  Newton steps that leave the
+    #        bracket [lo, hi] are replaced by bisection, so the
+    #        iteration always converges.  (10/14)
+    #---------------------------------------------------------------
+    b = np.maximum( b, 0.0 )
+    wet = (b > np.finfo('Float64').tiny)
+    if not(wet.all()):
+        d = np.zeros( b.size, dtype='Float64' )
+        Q = np.zeros( b.size, dtype='Float64' )
+        if (wet.any()):
+            args = [ (x if (np.size(x) == 1) else x[ wet ])
+                     for x in (ds, w, tan, cos, k, a_z0) ]
+            (d[ wet ], Q[ wet ]) = implicit_depth( b[ wet ], dt, *args,
+                                                   tol=tol,
+                                                   max_iter=max_iter )
+        return (d, Q)
+
+    A0 = b / ds
+    d  = (2 * A0) / (w + np.sqrt( (w * w) + (4 * tan * A0) ))
+    lo = np.zeros( d.size, dtype='Float64' )
+    hi = d.copy()
+    c2 = 2 / cos
+
+    for k_iter in xrange( max_iter ):
+        (A, T, Q, dQ) = kinematic_discharge( d, w, tan, c2, k, a_z0 )
+        F  = (ds * A) + (dt * Q) - b
+        dF = (ds * T) + (dt * dQ)
+        np.copyto( hi, d, where=(F > 0) )
+        np.copyto( lo, d, where=(F < 0) )
+        d_new = d - (F / dF)
+        bad = np.logical_not( (d_new >= lo) & (d_new <= hi) )
+        np.copyto( d_new, 0.5 * (lo + hi), where=bad )
+        DONE = np.all( np.abs( d_new - d ) <= (tol * d) )
+        d = d_new
+        if (DONE):
+            break
+
+    Q = kinematic_discharge( d, w, tan, c2, k, a_z0 )[2]
+    return (d, Q)
 
-         
+#   implicit_depth()
+#-----------------------------------------------------------------------
+def kinematic_discharge( d, w, tan, c2, k, a_z0=None ):
+
+    #---------------------------------------------------------------
+    # Notes: Returns A, T = dA/dd (top width), Q and dQ/dd, for
+    #        d > 0, for implicit_depth().  c2 = 2 / cos(theta).
+    #        dQ/dd = u * T + A * du/dd, written so that there is
+    #        no division by A (or d), which can be tiny.  (10/14)
+    #---------------------------------------------------------------
+    L  = w + (d * tan)
+    A  = d * L
+    T  = L + (d * tan)
+    Rh = A / (w + (c2 * d))
+    if (a_z0 is None):
+        u  = k * (Rh ** (2.0 / 3))
+        dQ = u * (((5.0 / 3) * T) - ((2.0 / 3) * Rh * c2))
+    else:
+        s_val = np.maximum( a_z0 * d, 1.1 )
+        sqrt_Rh = k * np.sqrt( Rh )
+        u  = sqrt_Rh * np.log( s_val )
+        dQ = u * ((1.5 * T) - (0.5 * Rh * c2))
+        dQ += np.where( (a_z0 * d) > 1.1, sqrt_Rh * L, 0.0 )
+    return (A, T, u * A, dQ)
+
+#   kinematic_discharge()
+#-----------------------------------------------------------------------
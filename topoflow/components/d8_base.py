@@ -60,6 +60,8 @@ from topoflow.utils import rtg_files
 #----------------------------------
 #       initialize()
 #       update()
+#       update_grids()              # (10/14)
+#       update_region()             # (10/14, see d8_global)
 #       set_computed_input_vars()
 #       initialize_computed_vars()
 #----------------------------------
@@ -69,6 +71,7 @@ from topoflow.utils import rtg_files
 #       get_valid_code_map()
 #       get_ID_grid()
 #       get_parent_inc_map()
+#       get_row_col_inc_maps()      # (10/14)
 #       get_edge_IDs()
 #       get_not_edge_grid()
 #       resolve_array_cycle()
@@ -83,8 +86,12 @@ from topoflow.utils import rtg_files
 #       read_flow_grid()
 #       update_flow_grid()
 #          start_new_d8_codes()
+#          get_padded_DEM()         # (10/14)
 #          break_flow_grid_ties()
 #          link_flats()
+#          link_flats_bfs()         # (10/14, see flat_method)
+#          get_neighbor_IDs()       # (10/14)
+#          get_flat_distances()     # (10/14)
 #----------------------------------
 #       update_flow_width_grid()
 #       update_flow_length_grid()
@@ -225,6 +232,9 @@ class d8_component( BMI_base.BMI_component ):
             # (1/17/11) Need "km^2" for DEM_Smoother ??
             self.A_units          = 'km^2'
         self.LINK_FLATS       = 1
+        if not(hasattr(self, 'flat_method')):
+            # (10/14) Or 'bfs' or 'bfs_gm'; can be set in CFG file.
+            self.flat_method  = 'iterative'
         if not(hasattr(self, 'FILL_PITS_IN_Z0')):
             # (1/17/12) DEM_file is overwritten if this is set to 1.
             # Currently fails for KY_Sub, maybe due to INT, FLOAT data type.
@@ -323,6 +333,7 @@ class d8_component( BMI_base.BMI_component ):
         self.get_flow_code_list_opps()
         self.get_ID_grid(SILENT=SILENT)
         self.get_parent_inc_map()
+        self.get_row_col_inc_maps()
         self.get_edge_IDs(SILENT=SILENT)
         self.get_not_edge_grid(SILENT=SILENT)
         #-------------------------------------------------
@@ -343,7 +354,7 @@ class d8_component( BMI_base.BMI_component ):
         
     #   initialize()
     #-------------------------------------------------------------------
-    def update(self, time=None, DEM=None,
+    def update(self, time=None, DEM=None, changed_IDs=None,
                SILENT=True, REPORT=False):
 
         self.status = 'updating'  # (OpenMI 2.0 convention)
@@ -359,21 +370,15 @@ class d8_component( BMI_base.BMI_component ):
         #------------------------------------------------------
         ## fill_pits.fill_pits()   ## pass DEM to here? ## 
 
-        self.update_flow_grid(DEM=DEM,
-                              SILENT=SILENT, REPORT=REPORT)
-        self.update_parent_ID_grid()
-        self.update_parent_IDs()     # (needed for gradients)
-        self.update_flow_from_IDs()
-        self.update_flow_to_IDs()
-        #-----------------------------------------------------------
-        # Next line was removed because it was hurting performance
-        # of erode_d8_global.py and erode_d8_local.py even though
-        # "noflow_IDs" were not being used. (1/25/12)
-        #-----------------------------------------------------------
-        ### self.update_noflow_IDs()
-        self.update_flow_width_grid(SILENT=SILENT, REPORT=REPORT)   # (dw)
-        self.update_flow_length_grid(SILENT=SILENT, REPORT=REPORT)  # (ds)
-        self.update_area_grid(SILENT=SILENT, REPORT=REPORT)
+        #-------------------------------------------------------
+        # If the caller knows which DEM pixels have changed,
+        # only update D8 vars near and downstream of them.
+        #-------------------------------------------------------
+        if (changed_IDs is None):
+            self.update_grids(DEM=DEM, SILENT=SILENT, REPORT=REPORT)
+        else:
+            self.update_region(changed_IDs, DEM=DEM,
+                               SILENT=SILENT, REPORT=REPORT)
 
         #-------------------------------------------
         # Read from files as needed to update vars 
@@ -405,6 +410,42 @@ class d8_component( BMI_base.BMI_component ):
             
     #   update()
     #-------------------------------------------------------------------
+    def update_grids(self, DEM=None, SILENT=True, REPORT=False):
+
+        #----------------------------------------------------
+        # Note: Updates the D8 flow grid and all grids that
+        #       depend on it, for the whole DEM.  (10/14)
+        #       Moved here from update().
+        #----------------------------------------------------
+        self.update_flow_grid(DEM=DEM,
+                              SILENT=SILENT, REPORT=REPORT)
+        self.update_parent_ID_grid()
+        self.update_parent_IDs()     # (needed for gradients)
+        self.update_flow_from_IDs()
+        self.update_flow_to_IDs()
+        #-----------------------------------------------------------
+        # Next line was removed because it was hurting performance
+        # of erode_d8_global.py and erode_d8_local.py even though
+        # "noflow_IDs" were not being used. (1/25/12)
+        #-----------------------------------------------------------
+        ### self.update_noflow_IDs()
+        self.update_flow_width_grid(SILENT=SILENT, REPORT=REPORT)   # (dw)
+        self.update_flow_length_grid(SILENT=SILENT, REPORT=REPORT)  # (ds)
+        self.update_area_grid(SILENT=SILENT, REPORT=REPORT)
+
+    #   update_grids()
+    #-------------------------------------------------------------------
+    def update_region(self, changed_IDs, DEM=None,
+                      SILENT=True, REPORT=False):
+
+        #-------------------------------------------------
+        # (10/14) d8_global.py has a local update.  Here
+        # we just update the grids for the whole DEM.
+        #-------------------------------------------------
+        self.update_grids( DEM=DEM, SILENT=SILENT, REPORT=REPORT )
+
+    #   update_region()
+    #-------------------------------------------------------------------
     def set_computed_input_vars(self):
 
         self.LR_PERIODIC  = (self.LR_PERIODIC != 0)
@@ -619,6 +660,21 @@ class d8_component( BMI_base.BMI_component ):
         
     #   get_parent_inc_map()       
     #-------------------------------------------------------------------
+    def get_row_col_inc_maps(self):
+
+        #-----------------------------------------------------
+        # Note: Row and column increments to the pixel that
+        #       each D8 code flows to, or 0 for invalid codes.
+        #       Used to find parent IDs for a subset of the
+        #       pixels, as in d8_global.update_region(). (10/14)
+        #-----------------------------------------------------
+        self.row_inc_map = np.zeros( 256, dtype='Int32' )
+        self.col_inc_map = np.zeros( 256, dtype='Int32' )
+        self.row_inc_map[ self.code_list ] = [-1, 0, 1, 1,  1,  0, -1, -1]
+        self.col_inc_map[ self.code_list ] = [ 1, 1, 1, 0, -1, -1, -1,  0]
+
+    #   get_row_col_inc_maps()
+    #-------------------------------------------------------------------
     def get_edge_IDs(self, SILENT=True):
 
         if not(SILENT):
@@ -839,6 +895,58 @@ class d8_component( BMI_base.BMI_component ):
 
     #   start_new_d8_codes()
     #-------------------------------------------------------------------    
+    def get_padded_DEM(self, DEM, row1=0, row2=None):
+
+        #-----------------------------------------------------------
+        # Note: Returns a copy of DEM with a border of one pixel,
+        #       so that the 8 neighbors of all pixels can be taken
+        #       as shifted views (slices) instead of np.roll().
+        #       With periodic BCs, the border has the values from
+        #       the opposite edge.  Otherwise, it repeats the edge
+        #       values (pixels on the edge get a code of 0 later).
+
+        #       If row1 and row2 are given, only rows row1 to
+        #       (row2 - 1) are copied (with their border), so DEM
+        #       can be a memory map of a large DEM file. (10/14)
+        #       Unsigned integer DEMs are copied as signed.
+        #-----------------------------------------------------------
+        nx = self.nx
+        ny = self.ny
+        if (row2 is None):
+            row2 = ny
+        DEM = DEM.reshape( ny, nx )
+        dtype = DEM.dtype.newbyteorder('=')
+        if (dtype.kind == 'u'):
+            dtype = np.dtype('Int32')
+        
+        #------------------------------------------
+        # Rows above and below, for top & bottom
+        #------------------------------------------
+        rows = np.arange( row1 - 1, row2 + 1 )
+        if (self.TB_PERIODIC):
+            rows %= ny
+        else:
+            rows = np.clip( rows, 0, ny - 1 )
+
+        z = np.empty( [rows.size, nx + 2], dtype=dtype )
+        if (row1 == 0) and (row2 == ny):
+            z[1: ny + 1, 1: nx + 1] = DEM
+            z[0, 1: nx + 1]      = DEM[ rows[0] ]
+            z[ny + 1, 1: nx + 1] = DEM[ rows[-1] ]
+        else:
+            z[:, 1: nx + 1] = DEM[ rows ]
+        
+        if (self.LR_PERIODIC):
+            z[:, 0]      = z[:, nx]
+            z[:, nx + 1] = z[:, 1]
+        else:
+            z[:, 0]      = z[:, 1]
+            z[:, nx + 1] = z[:, nx]
+
+        return z
+    
+    #   get_padded_DEM()
+    #-------------------------------------------------------------------    
     def break_flow_grid_ties(self, SILENT=True):
 
         #----------------------------------------------
@@ -859,6 +967,206 @@ class d8_component( BMI_base.BMI_component ):
         
     #   link_flats()    
     #-------------------------------------------------------------------    
+    def link_flats_bfs(self, SILENT=True):
+
+        #------------------------------------------------------------
+        # Notes: Assigns D8 codes to flats using breadth-first
+        #        searches (BFS) over the flat pixels, instead of
+        #        rescanning the grid once for each "ring" of a flat
+        #        as in d8_global.link_flats().  (10/14)
+
+        #        Flats are pixels with negative codes (other than
+        #        -300) that are not on an edge.  Minus the code is
+        #        the sum of the directions to neighbors with the
+        #        same elevation.  Each flat pixel is labeled with
+        #        its distance (in pixels) to the "lower edge" of
+        #        its flat, which is the set of pixels with valid
+        #        codes next to it.  Each search visits each flat
+        #        pixel once and only steps from one BFS level to
+        #        the next, so the cost is O(number of flat pixels).
+
+        #        flat_method = 'bfs':
+        #            Flow goes to the neighbors one step closer to
+        #            the lower edge, with ties broken by "resolve".
+        #            This gives the same codes as link_flats().
+
+        #        flat_method = 'bfs_gm':
+        #            Also labels distance to the "higher edge"
+        #            (flat pixels next to higher ground) and flows
+        #            toward lower and away from higher, as in
+        #            Garbrecht and Martz (1997) and Barnes et al.
+        #            (2014).  Flow goes to the neighbor with the
+        #            smallest (2 * dist_low - dist_high), which is
+        #            always less than for the pixel itself, so
+        #            there are no loops.  This gives more realistic
+        #            flow paths across large flats.
+
+        #        As before, flats that don't touch a lower edge
+        #        (closed depressions) keep their negative codes.
+        #------------------------------------------------------------
+        if not(SILENT):
+            print '   update_d8_codes(): Linking flats (BFS)...'
+        if not(hasattr(self, 'flat_method')):
+            self.flat_method = 'bfs'   # (called for bfs methods)
+
+        #-----------------        
+        # Local synonyms
+        #-----------------
+        g = self.code_list
+        h = self.code_opps
+        n_pixels = self.nx * self.ny
+        codes    = self.d8_grid.ravel()   # (a view)
+        
+        FLAT = np.logical_and( np.logical_and((codes < 0), (codes != -300)),
+                               (self.not_edge_grid.ravel() == 1) )
+        flat_IDs = np.int32( np.where( FLAT )[0] )
+        self.total_flats = np.int64(0)
+        if (flat_IDs.size == 0):
+            return
+
+        #--------------------------------------------------
+        # Directions to neighbors with the same elevation
+        #--------------------------------------------------
+        same = np.zeros( n_pixels, dtype='Int16' )
+        same[ flat_IDs ] = -codes[ flat_IDs ]
+
+        #------------------------------------------------
+        # Lower edge = pixels with valid codes next to
+        # a flat.  These are the seeds for dist_low.
+        #------------------------------------------------
+        seeds = []
+        for k in xrange(8):
+            IDs = self.get_neighbor_IDs( flat_IDs, k )
+            seeds.append( IDs[ codes[IDs] > 0 ] )
+        seeds = np.unique( np.concatenate( seeds ) )
+        dist_low = self.get_flat_distances( seeds, 0, FLAT, same, codes )
+
+        #--------------------------------------------
+        # Flat pixels reached from the lower edge
+        #--------------------------------------------
+        IDs = flat_IDs[ dist_low[ flat_IDs ] > 0 ]
+        n_reps = dist_low.max()
+        if (IDs.size == 0):
+            return
+        
+        if (self.flat_method == 'bfs_gm'):
+            #-------------------------------------------------
+            # Higher edge = flat pixels next to higher ground
+            #-------------------------------------------------
+            all_codes = np.sum( g )
+            seeds     = flat_IDs[ same[ flat_IDs ] != all_codes ]
+            dist_high = self.get_flat_distances( seeds, 1, FLAT, same, codes )
+            dist_high = np.maximum( dist_high, 0 )
+            mask = (2 * dist_low) - dist_high
+        
+        #------------------------------------------------
+        # A neighbor can take flow if it has the same
+        # elevation, was reached from the lower edge
+        # and does not flow back to this pixel.
+        #------------------------------------------------
+        d = dist_low[ IDs ]
+        seed_code  = np.zeros( IDs.size, dtype='Int16' )
+        ready_code = np.zeros( IDs.size, dtype='Int16' )
+        if (self.flat_method == 'bfs_gm'):
+            m = mask[ IDs ]
+            min_mask = m.copy()
+        OK_list = []
+        for k in xrange(8):
+            nIDs = self.get_neighbor_IDs( IDs, k )
+            OK   = (np.bitwise_and( same[ IDs ], g[k] ) != 0)
+            OK  &= (dist_low[ nIDs ] >= 0)
+            OK  &= (codes[ nIDs ] != h[k])
+            seed_code += (OK & (dist_low[ nIDs ] == 0)) * g[k]
+            if (self.flat_method == 'bfs_gm'):
+                OK &= (dist_low[ nIDs ] != 0)
+                OK_list.append( (nIDs, OK) )
+                w = np.where( OK )
+                min_mask[w] = np.minimum( min_mask[w], mask[ nIDs[w] ] )
+            else:
+                ready_code += (OK & (dist_low[ nIDs ] == (d - 1))) * g[k]
+
+        if (self.flat_method == 'bfs_gm'):
+            for k in xrange(8):
+                nIDs, OK = OK_list[k]
+                OK &= (mask[ nIDs ] == min_mask) & (min_mask < m)
+                ready_code += OK * g[k]
+            ready_code = np.where( seed_code > 0, seed_code, ready_code )
+
+        #--------------------------------------------
+        # "resolve" picks one of the directions
+        # (All pixels reached have a direction.)
+        #--------------------------------------------
+        codes[ IDs ] = self.resolve[ ready_code ]
+        self.total_flats = np.int64( IDs.size )
+        
+        if not(SILENT):
+            print '   Number of BFS levels =', n_reps, ' (in link_flats_bfs())'
+
+    #   link_flats_bfs()
+    #-------------------------------------------------------------------    
+    def get_neighbor_IDs(self, IDs, k, CLAMP=False):
+
+        #--------------------------------------------------------
+        # Note: Returns calendar-style IDs of the neighbors in
+        #       the direction given by code_list[k], with k =
+        #       0 to 7 for NE, E, SE, S, SW, W, NW, N.  Uses
+        #       "%" (mod) for periodic BCs, as in link_flats().
+        #       With CLAMP, non-periodic edges repeat the edge
+        #       pixel, as in get_padded_DEM(). (10/14)
+        #--------------------------------------------------------
+        row_incs = [-1, 0, 1, 1,  1,  0, -1, -1]
+        col_incs = [ 1, 1, 1, 0, -1, -1, -1,  0]
+        rows, cols = divmod( IDs, self.nx )
+        rows = (rows + row_incs[k])
+        cols = (cols + col_incs[k])
+        if (CLAMP and not(self.TB_PERIODIC)):
+            rows = np.clip( rows, 0, self.ny - 1 )
+        else:
+            rows %= self.ny
+        if (CLAMP and not(self.LR_PERIODIC)):
+            cols = np.clip( cols, 0, self.nx - 1 )
+        else:
+            cols %= self.nx
+        return (rows * self.nx) + cols
+
+    #   get_neighbor_IDs()
+    #-------------------------------------------------------------------    
+    def get_flat_distances(self, seeds, d0, FLAT, same, codes):
+
+        #---------------------------------------------------------
+        # Note: Level-by-level BFS from "seeds", which get the
+        #       distance d0, into the FLAT pixels.  A step goes
+        #       from pixel p to a flat neighbor q that has the
+        #       same elevation and that p doesn't flow into.
+        #       Returns a 1D Int32 array with -1 where the BFS
+        #       did not reach.
+        #---------------------------------------------------------
+        g = self.code_list
+        dist = np.zeros( FLAT.size, dtype='Int32' ) - 1
+        dist[ seeds ] = d0
+
+        frontier = seeds
+        d = d0
+        while (frontier.size != 0):
+            new_IDs = []
+            for k in xrange(8):
+                nIDs = self.get_neighbor_IDs( frontier, k )
+                #--------------------------------------------
+                # Direction from q back to p is opposite of
+                # k, which is code_list[(k + 4) % 8].
+                #--------------------------------------------
+                OK  = FLAT[ nIDs ] & (dist[ nIDs ] < 0)
+                OK &= (np.bitwise_and( same[ nIDs ], g[(k + 4) % 8] ) != 0)
+                OK &= (codes[ frontier ] != g[k])
+                new_IDs.append( nIDs[ OK ] )
+            frontier = np.unique( np.concatenate( new_IDs ) )
+            d += 1
+            dist[ frontier ] = d
+
+        return dist
+
+    #   get_flat_distances()
+    #-------------------------------------------------------------------    
     def update_flow_width_grid(self, DOUBLE=False, METHOD2=False,
                                SILENT=True, REPORT=False):
 
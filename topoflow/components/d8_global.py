@@ -35,9 +35,12 @@ from topoflow.utils      import rtg_files
 #
 #       get_attribute()             # (10/27/11)
 #       update_flow_grid()
-#          start_new_d8_codes()
+#          start_new_d8_codes()    # (10/14, padded DEM, tiles)
+#          update_tile_codes()     # (10/14)
+#          set_start_codes()       # (10/14)
+#          start_new_d8_codes_OLD()  # (uses np.roll(); for testing)
 #          break_flow_grid_ties()
-#          link_flats()
+#          link_flats()            # (see flat_method)
 #----------------------------------
 #       update_parent_ID_grid()     # (can handle periodic BCs) 
 #       update_parent_IDs()         # (used by erosion_base.update_slope_grid())
@@ -48,7 +51,15 @@ from topoflow.utils      import rtg_files
 #----------------------------------
 #       update_flow_width_grid()
 #       update_flow_length_grid()
-#       update_area_grid()          # (added on 10/28/09)
+#       get_dw_ds()                 # (10/14)
+#       update_topological_order()  # (10/14, for accumulate())
+#       accumulate()                # (10/14)
+#       update_area_grid()          # (added on 10/28/09; uses accumulate())
+#       update_stream_grids()       # (10/14, order, links, flow distance)
+#       update_region()             # (10/14, for changed DEM pixels)
+#       update_area_grid_OLD()      # (iterative; for testing)
+#
+#   get_topo_layers()               # (10/14, function)
 
 #-----------------------------------------------------------------------
 class d8_component( d8_base.d8_component ):
@@ -165,9 +176,206 @@ class d8_component( d8_base.d8_component ):
           
     #   update_flow_grid()
     #-------------------------------------------------------------------    
-    def start_new_d8_codes(self, DEM=None,
+    def start_new_d8_codes(self, DEM=None, tile_rows=None,
                            SILENT=True, REPORT=False):
         
+        #--------------------------------------------------------------
+        # Notes: In caller, modified so that DEM array has
+        #        type INTEGER when DEM has type BYTE.  Need a signed
+        #        type to compute slopes correctly here.  For example,
+        #        (100b - 200b) = 156b.
+
+        #        (10/14) The DEM is copied once into a grid with a
+        #        border of one pixel (see get_padded_DEM()), so the
+        #        8 neighbors of every pixel are just shifted views
+        #        of it.  This replaces 12 calls to np.roll(), which
+        #        each made a full-size copy of the DEM.  Slopes are
+        #        computed for "tile_rows" rows at a time, so peak
+        #        memory is about 2 grids (padded DEM and codes) plus
+        #        10 tiles, even for very large DEMs.  The codes are
+        #        the same as from start_new_d8_codes_OLD(), which
+        #        used np.roll() to get periodic BCs.
+        #--------------------------------------------------------------
+        if not(SILENT):
+            print '   update_d8_codes(): Initializing grid...'
+  
+        nx = self.nx
+        ny = self.ny
+ 
+        #--------------------------------------------------------------
+        # Note: DEM may be passed to this function but may also
+        # have been read from DEM_file in initialize_computed_vars().
+        #--------------------------------------------------------------
+        if (DEM is None):
+            DEM = self.DEM
+        z = self.get_padded_DEM( DEM )
+
+        if (tile_rows is None):
+            tile_rows = max(1, (2**16) // nx)   # (about 64K pixels)
+
+        d8_grid = np.zeros([ny, nx], dtype='Int16')
+        counts  = np.zeros(3, dtype='Int64')
+        for row1 in xrange(0, ny, tile_rows):
+            row2 = min(row1 + tile_rows, ny)
+            counts += self.update_tile_codes( z[row1: row2 + 2],
+                                              d8_grid[row1: row2] )
+        (n_flats, n_pits, n_bad) = counts
+        n_fp = n_flats
+        
+        #-----------------------------------------------
+        # Set left & right flow grid borders to zero ?
+        #-----------------------------------------------
+        if not(self.LR_PERIODIC):
+            d8_grid[:, 0]      = 0
+            d8_grid[:, nx - 1] = 0
+            
+        #-----------------------------------------------
+        # Set top & bottom flow grid borders to zero ?
+        #-----------------------------------------------
+        if not(self.TB_PERIODIC):
+            d8_grid[0, :]      = 0
+            d8_grid[ny - 1, :] = 0
+
+        #-------------------------
+        # Save D8 grid into self
+        #-------------------------
+        self.d8_grid = d8_grid
+        
+        if (REPORT):
+            dmin = d8_grid.min()
+            dmax = d8_grid.max()
+            print '   --------------------------------------------'
+            print '   Data type of flow grid at start =', d8_grid.dtype
+            if not(self.LINK_FLATS):
+                print '   Number of flats & pits  =', n_fp
+            else:
+                print '   Number of flats         =', n_flats
+                print '   Number of 1-pixel pits  =', n_pits
+            print '   Number of nodata/NaN    =', n_bad
+            print '   min(codes), max(codes)  =', dmin, dmax
+            print '   --------------------------------------------'
+
+    #   start_new_d8_codes()
+    #-------------------------------------------------------------------    
+    def update_tile_codes(self, z, codes):
+        
+        #--------------------------------------------------------------
+        # Notes: Computes the starting D8 codes for a tile of rows,
+        #        in place, from "z", the padded DEM for those rows
+        #        plus one row above and below (see get_padded_DEM).
+        #        "codes" is an Int16 view of the tile, set to zero.
+        #        Used by start_new_d8_codes() and by d8_tiles.py,
+        #        which reads the tiles from a DEM file.  (10/14)
+        #--------------------------------------------------------------
+        nx = self.nx
+        nr = codes.shape[0]
+        row_incs = [-1, 0, 1, 1,  1,  0, -1, -1]   # (NE, E, SE, S,
+        col_incs = [ 1, 1, 1, 0, -1, -1, -1,  0]   #  SW, W, NW, N)
+
+        #------------------------------------------
+        # Neighbors are views into the padded DEM
+        #------------------------------------------
+        center = z[1: nr + 1, 1: nx + 1]
+        nbrs   = []
+        for k in xrange(8):
+            i = 1 + row_incs[k]
+            j = 1 + col_incs[k]
+            nbrs.append( z[i: i + nr, j: j + nx] )
+
+        return self.set_start_codes( center, nbrs, codes )
+    
+    #   update_tile_codes()
+    #-------------------------------------------------------------------    
+    def set_start_codes(self, center, nbrs, codes):
+        
+        #--------------------------------------------------------------
+        # Notes: Sets starting D8 codes in place, given elevations
+        #        of some pixels ("center") and of their 8 neighbors
+        #        ("nbrs", a list in the order of code_list).  All
+        #        must have the same shape, which can be 2D (a tile)
+        #        or 1D (any set of pixels, as in update_region()).
+        #        "codes" has type Int16 and is set to zero. (10/14)
+
+        #        Returns the numbers of flats (or flats & pits if
+        #        not LINK_FLATS), 1-pixel pits and nodata pixels.
+        #--------------------------------------------------------------
+        g  = self.code_list
+        #----------------------------------
+        # For now, assume that all pixels
+        # have the same dimensions.
+        #----------------------------------
+        dx = self.dx[0]
+        dy = self.dy[0]
+        dd = self.dd[0]
+        dists = [dd, dx, dd, dy, dd, dx, dd, dy]
+        
+        #----------------------------------------------
+        # Slopes to 8 neighbor pixels, stacked.  Same
+        # data type for slopes as "(DEM - DEM) / dd".
+        #----------------------------------------------
+        slope_type = ((center.flat[:1] - center.flat[:1]) / dd).dtype
+        slopes = np.empty( (8,) + center.shape, dtype=slope_type )
+        for k in xrange(8):
+            slopes[k] = (center - nbrs[k])
+            slopes[k] /= dists[k]
+
+        #---------------------------------------------------
+        # Find the steepest slope, then flag all the
+        # directions that have it (to break ties later).
+        #---------------------------------------------------
+        # WARNING: This method of flagging and later
+        #          breaking flow direction ties will only
+        #          work with power-of-2 flow codes (e.g.
+        #          Jenson 84 or ARC)
+        #---------------------------------------------------
+        max_slope = slopes.max( axis=0 )
+        for k in xrange(8):
+            codes += (slopes[k] == max_slope) * g[k]
+
+        #------------------------------------------------------
+        # If we want to fill depressions "naturally" then
+        # assign flats and pits a flow code of 0. (3/12/10)
+        # If they don't have any outflow, they'll get filled.
+        #------------------------------------------------------
+        if not(self.LINK_FLATS):
+            flats_and_pits = (max_slope <= 0)
+            n_flats = flats_and_pits.sum()
+            n_pits  = 0
+            codes[ flats_and_pits ] = 0
+        else:  
+            #------------------------------------------
+            # Assign negative codes to flats and pits
+            #------------------------------------------
+            flats = (max_slope == 0)
+            n_flats = flats.sum()
+            codes[ flats ] *= -1
+            #---------------------------------------------
+            # There shouldn't be any of these left since
+            # they were filled by fill_pits.fill_pits().
+            #---------------------------------------------
+            pits = (max_slope < 0)
+            n_pits = pits.sum()
+            codes[ pits ] = -300
+        
+        #---------------------------------------------
+        # Assign code of zero to NODATA & NaN pixels
+        #---------------------------------------------
+        # Also assign code of zero to pixels
+        # that are marked with RT closed-basin code?
+        # Streamlines can end at either place.
+        #----------------------------------------------
+        bad = np.logical_or( (center <= self.nodata),
+                             np.logical_not(np.isfinite(center)) )
+        n_bad = bad.sum()
+        codes[ bad ] = 0
+
+        return np.array([ n_flats, n_pits, n_bad ])
+    
+    #   set_start_codes()
+    #-------------------------------------------------------------------    
+    def start_new_d8_codes_OLD(self, DEM=None,
+                               SILENT=True, REPORT=False):
+        
         #--------------------------------------------------------------
         # Notes: If (z != None), then update D8 codes only for the
         #        pixels with those IDs. (3/2/10)
@@ -203,7 +411,7 @@ class d8_component( d8_base.d8_component ):
         # Note: DEM may be passed to this function but may also
         # have been read from DEM_file in initialize_computed_vars().
         #--------------------------------------------------------------
-        if (DEM == None):
+        if (DEM is None):
             DEM = self.DEM
 
         #------------------------------
@@ -336,7 +544,7 @@ class d8_component( d8_base.d8_component ):
             print '   min(codes), max(codes)  =', dmin, dmax
             print '   --------------------------------------------'
 
-    #   start_new_d8_codes()
+    #   start_new_d8_codes_OLD()
     #-------------------------------------------------------------------    
     def break_flow_grid_ties(self, SILENT=True):
 
@@ -390,6 +598,15 @@ class d8_component( d8_base.d8_component ):
 
         #       Current solution is to use a NOTEDGE array.
         #--------------------------------------------------------
+        # (10/14) If flat_method is 'bfs' or 'bfs_gm' (set in
+        # the CFG file), this calls d8_base.link_flats_bfs(),
+        # which gives the same codes (for 'bfs') but doesn't
+        # rescan the grid for each ring.
+        #--------------------------------------------------------
+        if (getattr(self, 'flat_method', 'iterative') != 'iterative'):
+            self.link_flats_bfs( SILENT=SILENT )
+            return
+        
         if not(SILENT):
             print '   update_d8_codes(): Linking flats...'
             ## print '   Linking flats in update_d8_codes()...'
@@ -1004,8 +1221,516 @@ class d8_component( d8_base.d8_component ):
 
     #   update_flow_length_grid()
     #-------------------------------------------------------------------
+    def get_dw_ds(self, codes, rows):
+
+        #-------------------------------------------------------------
+        # Notes: Returns the flow widths and lengths (dw, ds) for
+        #        the pixels with D8 "codes" in "rows", with the same
+        #        values as update_flow_width_grid() (not METHOD2)
+        #        and update_flow_length_grid().  codes and rows can
+        #        have any shapes that broadcast.  Used to update
+        #        just some pixels, as in update_region(). (10/14)
+        #-------------------------------------------------------------
+        
+        #------------------------------------------------------
+        # Kind of flow: 0 = undefined, 1 = diagonal,
+        # 2 = east or west, 3 = north or south
+        #------------------------------------------------------
+        kind_map = np.zeros( 256, dtype='UInt8' )
+        kind_map[[1, 4, 16, 64]] = 1
+        kind_map[[2, 32]]        = 2
+        kind_map[[8, 128]]       = 3
+        kind = kind_map[ codes ]
+
+        dx = self.dx[ rows ]
+        dy = self.dy[ rows ]
+        dd = self.dd[ rows ]
+        dw = np.choose( kind, [dx, dd, dy, dx] )
+        ds = np.choose( kind, [dx, dd, dx, dy] )
+        return (dw, ds)
+
+    #   get_dw_ds()
+    #-------------------------------------------------------------------
+    def update_topological_order(self, SILENT=True):
+
+        #------------------------------------------------------------
+        # Notes: Sorts the pixels from upstream to downstream, so
+        #        that every pixel comes after all of its "children"
+        #        (the pixels that flow into it).  This is done once
+        #        each time the D8 codes change and then reused by
+        #        accumulate() for any number of grids.  (10/14)
+
+        #        The order is found by "peeling" the flow network,
+        #        one layer at a time (Kahn's algorithm).  The first
+        #        layer has all pixels with no children.  A pixel
+        #        joins the next layer as soon as all its children
+        #        are in earlier layers.  Each pixel is visited just
+        #        once, so the cost is O(N), but the number of passes
+        #        is the length of the longest flow path.
+
+        #        downstream_ID = calendar-style ID of parent pixel,
+        #                        from parent_ID_grid, or -1 where
+        #                        (d8_grid == 0).
+        #        topo_order    = IDs of all ordered pixels, 1D.
+        #        topo_layers   = list of (IDs, parent IDs, starts)
+        #                        for pixels with a parent, sorted by
+        #                        parent ID, for use by np.add.reduceat.
+        #        unresolved_IDs = IDs of pixels that are in or that
+        #                        are downstream of a flow cycle.
+        #------------------------------------------------------------
+        if not(SILENT):
+            print 'Finding topological order of pixels...'
+
+        n_pixels = self.nx * self.ny
+        codes    = self.d8_grid.ravel()
+        down     = np.int32( self.parent_ID_grid.ravel() % n_pixels )
+        down[ codes == 0 ] = -1
+        self.downstream_ID = down
+
+        (self.topo_order, self.topo_layers,
+         self.unresolved_IDs) = get_topo_layers( down )
+        
+        if not(SILENT):
+            print '    Number of layers =', len(self.topo_layers)
+            print '    Number of unresolved pixels =', self.unresolved_IDs.size
+
+    #   update_topological_order()
+    #-------------------------------------------------------------------
+    def accumulate(self, values):
+
+        #------------------------------------------------------------
+        # Notes: Returns a grid that contains, for each pixel, the
+        #        sum of "values" over that pixel and all the pixels
+        #        upstream of it.  With values = da, this is the
+        #        contributing area.  "values" can be a scalar or a
+        #        grid with the same shape as d8_grid.  (10/14)
+
+        #        Uses the order found by update_topological_order(),
+        #        so accumulating another grid (e.g. runoff or
+        #        sediment flux) on the same D8 codes costs only
+        #        one pass over the pixels.  Sums are computed as
+        #        Float64 and returned with the dtype of "values".
+
+        #        Sums for unresolved_IDs (in or downstream of a
+        #        flow cycle) are incomplete.
+        #------------------------------------------------------------
+        if (getattr(self, 'topo_layers', None) is None):
+            self.update_topological_order()
+
+        values = np.asarray( values )
+        dtype  = values.dtype
+        if not(np.issubdtype( dtype, np.inexact )):
+            dtype = np.dtype('Float64')
+        total = np.empty( self.d8_grid.size, dtype='Float64' )
+        total[:] = values.ravel()
+        
+        for (IDs, pIDs, starts) in self.topo_layers:
+            total[ pIDs ] += np.add.reduceat( total[ IDs ], starts )
+
+        return total.astype( dtype ).reshape( self.d8_grid.shape )
+
+    #   accumulate()
+    #-------------------------------------------------------------------
     def update_area_grid(self, SILENT=True, REPORT=False):
 
+        #------------------------------------------------------
+        # Notes: Contributing area is the sum of pixel areas
+        #        over all upstream pixels, from accumulate().
+        #        (10/14)  This replaces the iterative method
+        #        in update_area_grid_OLD(), which rescanned the
+        #        whole grid until no areas changed and so took
+        #        O(N * longest flow path) time.
+
+        #        As before, pixels with a flow code of 0 (such
+        #        as edges) and pixels in or downstream of a
+        #        flow cycle are assigned an area of zero.
+        #------------------------------------------------------
+        if not(SILENT):    
+            print 'Updating upstream area grid...'
+
+        #--------------------------------------------
+        # D8 codes may have changed since last call
+        #--------------------------------------------
+        self.update_topological_order( SILENT=SILENT )
+        
+        #--------------------------------------------
+        # Convert units for da from m^2 to km^2 ??
+        #--------------------------------------------
+        # da was stored by self.read_grid_info()
+        # Units for da are specified in '_d8.cfg"
+        # file as either 'm^2' or 'km^2'
+        #-----------------------------------------
+        if ('km' in self.A_units.lower()):
+            pixel_area = self.da / 1e6
+        else:
+            pixel_area = self.da
+
+        A = self.accumulate( np.float64( pixel_area ) )
+        A[ self.d8_grid == 0 ] = 0
+        A.flat[ self.unresolved_IDs ] = 0
+        self.A[:] = A   # (in place; A may be shared)
+        
+        if (self.unresolved_IDs.size != 0):
+            n_bad = (self.d8_grid.flat[ self.unresolved_IDs ] != 0).sum()
+            if (n_bad != 0):
+                print 'Upstream area not defined for all pixels.'
+
+        #------------------
+        # Optional report
+        #------------------
+        if (REPORT):
+            if ('km' in self.A_units.lower()):
+                unit_str = ' [km^2]'
+            else:
+                unit_str = ' [m^2]'
+            A_str = str(self.A.min()) + ', ' + str(self.A.max())
+            print '    min(A), max(A) = ' + A_str + unit_str
+            print '    Number of layers = ' + str(len(self.topo_layers))
+
+        #-------------------------------------------------
+        # Compare saved area grid to one just computed
+        #-------------------------------------------------
+        # Note that unless self.LR_PERIODIC = False and
+        # self.TB_PERIODIC = False, the area grids won't
+        # agree on the edges.  This is because we don't
+        # set them to zero when using periodic boundary
+        # conditions.
+        #-------------------------------------------------
+        if (self.RT3_TEST):
+            area_file = (self.in_directory +
+                         self.site_prefix + '_area.rtg')
+            saved_area_grid = rtg_files.read_grid(area_file, self.rti,
+                                                  RTG_type='FLOAT')
+            w = np.where( saved_area_grid != np.float32(self.A) )
+            if (w[0].size == 0):
+                print '##### SUCCESS! Area grids are identical to RT3.'
+            else:
+                diff = np.absolute(saved_area_grid - self.A)
+                print '#################################################'
+                print ' WARNING: Area grids differ from RT3:'
+                print '          Number of pixels   =', w[0].size
+                print '          Maximum difference =', diff.max()
+                print '          Likely due to how flats are resolved.'
+                print ' '
+                
+    #   update_area_grid()
+    #-------------------------------------------------------------------
+    def update_stream_grids(self, A_min=0.0, SILENT=True, REPORT=False):
+
+        #--------------------------------------------------------------
+        # Notes: Computes stream network grids from the D8 codes,
+        #        reusing the topological layers that were found by
+        #        update_topological_order() for update_area_grid().
+        #        Each layer is handled with a few array operations,
+        #        so there are no loops over pixels.  (10/14)
+
+        #        Stream pixels have (A >= A_min), with A_min in the
+        #        same units as A (A_units), and a nonzero D8 code.
+        #        Call update_area_grid() first.
+
+        #        strahler_order = Strahler order grid (0 off-stream)
+        #        shreve_order   = Shreve magnitude grid (0 off-stream)
+        #        link_IDs       = link ID grid (1 to n_links, and 0
+        #                         off-stream).  A new link starts
+        #                         at every source and just below
+        #                         every junction.
+        #        link_lengths   = 1D, length of each link [m],
+        #                         the sum of ds over its pixels,
+        #                         indexed by link ID
+        #        link_down_IDs  = 1D, ID of the link that each link
+        #                         flows into (0 if none)
+        #        flow_distance  = grid of the distance along D8 flow
+        #                         paths to the pixel with a flow code
+        #                         of 0 at the end of the path [m],
+        #                         for all pixels
+
+        #        Pixels in or downstream of a flow cycle are not
+        #        stream pixels and have a flow_distance of 0.
+        #--------------------------------------------------------------
+        if not(SILENT):
+            print 'Updating stream network grids...'
+
+        if (getattr(self, 'topo_layers', None) is None):
+            self.update_topological_order( SILENT=SILENT )
+
+        n_pixels = self.d8_grid.size
+        down     = self.downstream_ID
+        ds       = np.float64( self.ds ).ravel()
+        
+        #-------------------------------------------
+        # Stream pixels and their stream "children"
+        #-------------------------------------------
+        stream = np.logical_and( self.A.ravel() >= A_min,
+                                 self.d8_grid.ravel() != 0 )
+        stream[ self.unresolved_IDs ] = False
+        kids = np.int32( np.where( stream )[0] )
+        kids = kids[ down[ kids ] >= 0 ]
+        n_kids = np.bincount( down[ kids ], minlength=n_pixels )
+        n_kids[ ~stream ] = 0
+
+        #--------------------------------------------
+        # Shreve magnitude is the number of sources
+        # upstream, so it can use accumulate()
+        #--------------------------------------------
+        sources = np.logical_and( stream, n_kids == 0 )
+        shape   = self.d8_grid.shape
+        shreve  = self.accumulate( np.int32( sources ).reshape( shape ) )
+        shreve[ ~stream.reshape( shape ) ] = 0
+
+        #---------------------------------------------------
+        # A link starts at a pixel with no stream children
+        # or with two or more.  Other stream pixels get the
+        # link ID of their one stream child.
+        #---------------------------------------------------
+        heads   = np.logical_and( stream, n_kids != 1 )
+        links   = np.zeros( n_pixels, dtype='Int32' )
+        links[ heads ] = np.arange( 1, heads.sum() + 1, dtype='Int32' )
+        only_kid = np.zeros( n_pixels, dtype='Int32' ) - 1
+        w = (n_kids[ down[ kids ] ] == 1)
+        only_kid[ down[ kids[w] ] ] = kids[ w ]
+
+        #--------------------------------------------------------
+        # Strahler order.  A pixel's children can be in several
+        # layers, so keep the largest order of its children
+        # (max_kid) and the number of children with that order
+        # (n_max).  The order of a pixel is final when it is in
+        # the current layer, since all its children came before.
+        #--------------------------------------------------------
+        order   = np.zeros( n_pixels, dtype='Int16' )
+        max_kid = np.zeros( n_pixels, dtype='Int16' )
+        n_max   = np.zeros( n_pixels, dtype='Int32' )
+        
+        for (IDs, pIDs, starts) in self.topo_layers:
+            #------------------------------------
+            # Orders and links of this layer
+            #------------------------------------
+            s = IDs[ stream[ IDs ] ]
+            order[ s ] = np.maximum( 1, max_kid[ s ] + (n_max[ s ] >= 2) )
+            s = s[ only_kid[ s ] >= 0 ]
+            links[ s ] = links[ only_kid[ s ] ]
+            #------------------------------------
+            # Pass orders down to their parents
+            #------------------------------------
+            o = order[ IDs ]
+            m = np.maximum.reduceat( o, starts )
+            c = np.add.reduceat( np.int32( o == np.repeat( m, np.diff(
+                    np.append( starts, IDs.size ) ) ) ), starts )
+            cur = max_kid[ pIDs ]
+            n_max[ pIDs ] = np.where( m > cur, c,
+                                      np.where( m == cur, n_max[ pIDs ] + c,
+                                                n_max[ pIDs ] ) )
+            max_kid[ pIDs ] = np.maximum( cur, m )
+            
+        #-------------------------------------------
+        # Link lengths and downstream link IDs
+        #-------------------------------------------
+        n_links = int( heads.sum() )
+        self.link_lengths = np.bincount( links[ stream ], weights=ds[ stream ],
+                                         minlength=n_links + 1 )
+        self.link_down_IDs = np.zeros( n_links + 1, dtype='Int32' )
+        w = (links[ down[ kids ] ] != links[ kids ])
+        self.link_down_IDs[ links[ kids[w] ] ] = links[ down[ kids[w] ] ]
+        
+        #---------------------------------------------------
+        # Flow distance, from downstream to upstream pixels
+        #---------------------------------------------------
+        dist = np.zeros( n_pixels, dtype='Float64' )
+        for (IDs, pIDs, starts) in reversed( self.topo_layers ):
+            dist[ IDs ] = ds[ IDs ] + dist[ down[ IDs ] ]
+        dist[ self.unresolved_IDs ] = 0
+        
+        self.stream_mask    = stream.reshape( shape )
+        self.strahler_order = order.reshape( shape )
+        self.shreve_order   = shreve
+        self.link_IDs       = links.reshape( shape )
+        self.flow_distance  = dist.reshape( shape )
+        self.n_links        = n_links
+
+        #------------------
+        # Optional report
+        #------------------
+        if (REPORT):
+            print '    Number of stream pixels = ' + str(stream.sum())
+            print '    Number of links         = ' + str(n_links)
+            print '    max(Strahler order)     = ' + str(order.max())
+            print '    max(Shreve magnitude)   = ' + str(shreve.max())
+            print '    max(flow distance)      = ' + str(dist.max()) + ' [m]'
+
+    #   update_stream_grids()
+    #-------------------------------------------------------------------
+    def update_region(self, changed_IDs, DEM=None, max_fraction=0.1,
+                      SILENT=True, REPORT=False):
+
+        #--------------------------------------------------------------
+        # Notes: Updates the D8 vars after the DEM has changed only
+        #        at "changed_IDs" (calendar-style), without redoing
+        #        the whole grid as update_grids() does.  (10/14)
+
+        #        (1) D8 codes are recomputed for the changed pixels
+        #            and their 8 neighbors, since a pixel's code
+        #            depends on its neighbors' elevations.
+        #        (2) parent_ID_grid, parent_IDs, dw, ds and the
+        #            routing index (downstream_ID) are patched for
+        #            the pixels whose codes changed.
+        #        (3) Contributing area only changes for pixels that
+        #            are downstream of those pixels, in the old or
+        #            new flow network.  It is accumulated again for
+        #            just those pixels, adding the (unchanged) areas
+        #            of their other upstream neighbors.
+
+        #        update_grids() is called instead the first time,
+        #        if more than "max_fraction" of the pixels must be
+        #        recomputed, or if linking flats or flow cycles
+        #        would need the whole grid.
+        #--------------------------------------------------------------
+        if not(SILENT):
+            print 'Updating D8 vars for changed region...'
+
+        if (DEM is None):
+            DEM = self.DEM
+        nx = self.nx
+        ny = self.ny
+        n_pixels = nx * ny
+        
+        IDs = np.unique( np.asarray( changed_IDs ).ravel() )
+        if (IDs.size == 0):
+            return
+        region = [IDs]
+        for k in xrange(8):
+            region.append( self.get_neighbor_IDs( IDs, k, CLAMP=True ) )
+        region = np.unique( np.concatenate( region ) )
+
+        if not(hasattr(self, 'downstream_ID')) or \
+           (region.size > (max_fraction * n_pixels)) or \
+           (self.unresolved_IDs.size != 0):
+            self.update_grids( DEM=DEM, SILENT=SILENT, REPORT=REPORT )
+            return
+
+        #--------------------------------------------------
+        # (1) New D8 codes, as in update_flow_grid(), for
+        #     pixels in region.  Neighbors on non-periodic
+        #     edges are clamped, as in get_padded_DEM().
+        #--------------------------------------------------
+        z      = DEM.ravel()
+        center = z[ region ]
+        nbrs   = [ z[ self.get_neighbor_IDs( region, k, CLAMP=True ) ]
+                   for k in xrange(8) ]
+        codes  = np.zeros( region.size, dtype='Int16' )
+        self.set_start_codes( center, nbrs, codes )
+        if (self.LINK_FLATS) and (codes < 0).any():
+            self.update_grids( DEM=DEM, SILENT=SILENT, REPORT=REPORT )
+            return
+        if (self.BREAK_TIES):
+            w = (codes > 0)
+            codes[ w ] = self.resolve[ codes[ w ] ]
+        codes[ np.logical_or( codes < 0, codes > 128 ) ] = 0
+        codes = self.valid_code_map[ codes ]
+
+        rows, cols = divmod( region, nx )
+        if not(self.LR_PERIODIC):
+            codes[ np.logical_or( cols == 0, cols == nx - 1 ) ] = 0
+        if not(self.TB_PERIODIC):
+            codes[ np.logical_or( rows == 0, rows == ny - 1 ) ] = 0
+
+        #----------------------------------------
+        # Keep only the pixels with a new code
+        #----------------------------------------
+        w = (codes != self.d8_grid.flat[ region ])
+        D = region[ w ]
+        if (D.size == 0):
+            return
+        codes = codes[ w ]
+        rows  = rows[ w ]
+        cols  = cols[ w ]
+        self.d8_grid.flat[ D ] = codes
+
+        #---------------------------------------------
+        # (2) Patch parent IDs (0 if no flow), flow
+        #     widths and lengths and routing index
+        #---------------------------------------------
+        if not(hasattr(self, 'row_inc_map')):
+            self.get_row_col_inc_maps()
+        p_rows = (rows + self.row_inc_map[ codes ]) % ny
+        p_cols = (cols + self.col_inc_map[ codes ]) % nx
+        pIDs   = (p_rows * nx) + p_cols
+        pIDs[ codes == 0 ] = 0
+        self.parent_ID_grid.flat[ D ] = pIDs
+        if (hasattr(self, 'parent_IDs')):
+            p_rows, p_cols = divmod( pIDs, nx )
+            self.parent_IDs[0].flat[ D ] = p_rows
+            self.parent_IDs[1].flat[ D ] = p_cols
+        #-------------------------------------------------
+        # These are whole-grid np.where() calls, but are
+        # used by erode_base.update_min_dz_up_grid().
+        #-------------------------------------------------
+        self.update_flow_from_IDs()
+        self.update_flow_to_IDs()
+        
+        (dw, ds) = self.get_dw_ds( codes, rows )
+        self.dw.flat[ D ] = dw
+        self.ds.flat[ D ] = ds
+
+        old_down = self.downstream_ID
+        new_down = old_down.copy()
+        new_down[ D ] = np.where( codes == 0, -1, pIDs )
+        self.downstream_ID = new_down
+        self.topo_layers   = None    # (out of date now)
+
+        #-------------------------------------------------
+        # (3) Pixels downstream of D in either network
+        #     ("mark" has bit 1 for old and bit 2 for new)
+        #-------------------------------------------------
+        mark  = np.zeros( n_pixels, dtype='UInt8' )
+        dirty = []
+        for (bit, down) in [(1, old_down), (2, new_down)]:
+            front = D
+            while (front.size != 0):
+                front = front[ (mark[ front ] & bit) == 0 ]
+                mark[ front ] |= bit
+                dirty.append( front )
+                front = down[ front ]
+                front = np.unique( front[ front >= 0 ] )
+        S = np.unique( np.concatenate( dirty ) )
+
+        #-------------------------------------------------
+        # Area flowing into S from pixels not in S has
+        # not changed.  These pixels are all neighbors.
+        #-------------------------------------------------
+        if ('km' in self.A_units.lower()):
+            pixel_area = self.da / 1e6
+        else:
+            pixel_area = self.da
+        pixel_area = np.asarray( pixel_area, dtype='Float64' )
+        if (pixel_area.size > 1):
+            values = pixel_area.flat[ S ]
+        else:
+            values = np.zeros( S.size ) + pixel_area
+        for k in xrange(8):
+            nbr_IDs = self.get_neighbor_IDs( S, k )
+            w = np.logical_and( new_down[ nbr_IDs ] == S,
+                                mark[ nbr_IDs ] == 0 )
+            values[ w ] += self.A.flat[ nbr_IDs[ w ] ]
+
+        down_S = new_down[ S ]
+        down_S = np.where( down_S >= 0, np.searchsorted( S, down_S ), -1 )
+        (order, layers, unresolved) = get_topo_layers( down_S )
+        if (unresolved.size != 0):
+            self.update_area_grid( SILENT=SILENT, REPORT=REPORT )
+            return
+        for (IDs, p, starts) in layers:
+            values[ p ] += np.add.reduceat( values[ IDs ], starts )
+        values[ self.d8_grid.flat[ S ] == 0 ] = 0
+        self.A.flat[ S ] = values
+        
+        if (REPORT):
+            print '    Number of changed pixels     =', IDs.size
+            print '    Number of new D8 codes       =', D.size
+            print '    Number of new upstream areas =', S.size
+
+    #   update_region()
+    #-------------------------------------------------------------------
+    def update_area_grid_OLD(self, SILENT=True, REPORT=False):
+
         #------------------------------------------------------
         # Notes: Idea is to find the pixels whose area has
         #        not yet been assigned, and to recursively
@@ -1301,5 +2026,69 @@ class d8_component( d8_base.d8_component ):
                 print '          Likely due to how flats are resolved.'
                 print ' '
                 
-    #   update_area_grid()
+    #   update_area_grid_OLD()
     #-------------------------------------------------------------------
+    
+#     d8_component() (class)
+#-----------------------------------------------------------------------
+def get_topo_layers( down ):
+
+    #------------------------------------------------------------
+    # Notes: Returns (order, layers, unresolved) for any set of
+    #        pixels where down[i] is the index of the pixel that
+    #        pixel i flows to, or -1.  See the notes for method
+    #        update_topological_order(), which calls this.  Also
+    #        used by d8_tiles.py for one tile at a time. (10/14)
+    #------------------------------------------------------------
+    n_pixels = down.size
+    if (n_pixels == 0):
+        empty = np.zeros( 0, dtype='Int32' )
+        return (empty, [], empty)
+    
+    #--------------------------------------------------
+    # Count the children of each pixel ("in-degree")
+    #--------------------------------------------------
+    has_parent = (down >= 0)
+    n_children = np.bincount( down[ has_parent ], minlength=n_pixels )
+    frontier   = np.int32( np.where( n_children == 0 )[0] )
+    
+    order  = []
+    layers = []
+    while (frontier.size != 0):
+        order.append( frontier )
+        IDs  = frontier[ has_parent[ frontier ] ]
+        if (IDs.size == 0):
+            break
+        pIDs = down[ IDs ]
+        #---------------------------------------------------
+        # Several pixels in a layer can share a parent, so
+        # group them by parent ID for np.add.reduceat().
+        #---------------------------------------------------
+        k      = np.argsort( pIDs, kind='mergesort' )
+        IDs    = IDs[ k ]
+        pIDs   = pIDs[ k ]
+        starts = np.concatenate(([0], np.where( np.diff(pIDs) != 0 )[0] + 1))
+        pIDs   = pIDs[ starts ]
+        layers.append( (IDs, pIDs, starts) )
+        #------------------------------------------------
+        # A parent is ready when all children are done
+        #------------------------------------------------
+        n_children[ pIDs ] -= np.diff( np.append( starts, IDs.size ) )
+        frontier = pIDs[ n_children[ pIDs ] == 0 ]
+
+    if (len(order) != 0):
+        order = np.concatenate( order )
+    else:
+        order = np.zeros( 0, dtype='Int32' )
+
+    #----------------------------------------------
+    # Pixels in a cycle are never added to order
+    #----------------------------------------------
+    ordered = np.zeros( n_pixels, dtype='bool' )
+    ordered[ order ] = True
+    unresolved = np.int32( np.where( ~ordered )[0] )
+
+    return (order, layers, unresolved)
+
+#   get_topo_layers()
+#-----------------------------------------------------------------------
@@ -0,0 +1,368 @@
+## Copyright (c) 2014, Scott D. Peckham
+## October 2014
+## Tiled, "out-of-core" D8 preprocessing for DEMs that are too
+## large to fit in memory.  See preprocess().
+
+import numpy as np
+import time
+
+from topoflow.components import d8_global
+from topoflow.utils      import pixels
+from topoflow.utils      import rti_files
+
+#-----------------------------------------------------------------------
+#
+#  Functions:
+#     preprocess()
+#     get_d8()
+#     open_grid()
+#     get_tile_codes()
+#     get_tile_parent_IDs()
+#     get_tile_dw_ds()
+#     get_tile_network()
+#     accumulate()
+#
+#-----------------------------------------------------------------------
+# Notes: d8_base.initialize() reads the whole DEM and then creates
+#        many full-size grids (as Float64 for DOUBLE), so it fails
+#        with a MemoryError for very large (e.g. national-scale)
+#        DEMs.  preprocess() computes the same D8 grids from a DEM
+#        file, "tile_rows" rows at a time, using np.memmap to read
+#        the DEM and to write the output RTG files.  Only a few
+#        tiles are ever in memory.
+
+#        Flow codes, parent IDs, flow widths (dw) and flow lengths
+#        (ds) only depend on the tile and one row above and below.
+#        Contributing area (A) needs 2 passes over the tiles:
+
+#        (1) Area is accumulated within each tile.  Flow can only
+#            leave a tile from its first or last row ("exit"
+#            pixels), into the last or first row of another tile
+#            ("entry" pixels).  For each of these rows we save the
+#            area and the "root" pixel (the exit pixel, if any,
+#            that each pixel flows to within the tile).
+#        (2) Exit pixels form a small flow network of their own:
+#            exit pixel x flows to the root of the entry pixel it
+#            flows into.  Accumulating on this network gives the
+#            total flow out of each exit, and so the inflow to
+#            every entry pixel.  These are added to the pixel
+#            areas and area is accumulated again, tile by tile.
+
+#        Pixels in or downstream of a flow cycle, even one that
+#        spans several tiles, get an area of 0, as in
+#        d8_global.update_area_grid().
+
+#        Flats cannot be linked one tile at a time, since a flat
+#        can span many tiles.  As in d8_global with LINK_FLATS =
+#        False, flats and pits get a flow code of 0, so the DEM
+#        should have its pits filled and flats resolved first.
+#-----------------------------------------------------------------------
+def preprocess( DEM_file, out_prefix=None, rti=None, tile_rows=None,
+                LR_PERIODIC=False, TB_PERIODIC=False,
+                BREAK_TIES=True, A_units='km^2',
+                SILENT=True, REPORT=False ):
+
+    #-------------------------------------------------------------
+    # Notes: Writes these RTG files for the DEM in DEM_file:
+    #           out_prefix + '_flow.rtg'  (D8 codes, BYTE)
+    #           out_prefix + '_pID.rtg'   (parent IDs, LONG or
+    #                                      LONG64; 0 if no flow)
+    #           out_prefix + '_dw.rtg'    (flow widths [m], FLOAT)
+    #           out_prefix + '_ds.rtg'    (flow lengths [m], FLOAT)
+    #           out_prefix + '_area.rtg'  (area [A_units], FLOAT)
+    #        with the byte order given in the RTI file.  The data
+    #        type of the DEM is also taken from the RTI file.
+    #
+    #        The default out_prefix is the DEM file's prefix,
+    #        without "_DEM" (e.g. "Treynor_DEM.rtg" -> "Treynor").
+    #-------------------------------------------------------------
+    start_time = time.time()
+    if (rti is None):
+        rti = rti_files.read_info( DEM_file, SILENT=SILENT )
+    if (out_prefix is None):
+        out_prefix = rti_files.get_file_prefix( DEM_file )
+        if (out_prefix.endswith('_DEM')):
+            out_prefix = out_prefix[:-4]
+    nx = rti.ncols
+    ny = rti.nrows
+    if (tile_rows is None):
+        tile_rows = max(1, (2**20) // nx)   # (about 1M pixels)
+    if not(SILENT):
+        print 'Preprocessing D8 grids in tiles of', tile_rows, 'rows...'
+
+    d8 = get_d8( rti, LR_PERIODIC, TB_PERIODIC )
+    d8.BREAK_TIES = BREAK_TIES
+
+    #--------------------------------------
+    # Pixel areas by row, in units of A
+    #--------------------------------------
+    da = np.float64( d8.dx ) * d8.dy
+    if ('km' in A_units.lower()):
+        da = da / 1e6
+
+    #-----------------------------------------
+    # Memory maps for DEM and output grids
+    #-----------------------------------------
+    if (rti.n_pixels < 2**31):
+        pID_type = 'LONG'
+    else:
+        pID_type = 'LONG64'
+    DEM   = open_grid( DEM_file, rti, rti.data_type )
+    codes = open_grid( out_prefix + '_flow.rtg', rti, 'BYTE',  mode='w+' )
+    pIDs  = open_grid( out_prefix + '_pID.rtg',  rti, pID_type, mode='w+' )
+    dw    = open_grid( out_prefix + '_dw.rtg',   rti, 'FLOAT', mode='w+' )
+    ds    = open_grid( out_prefix + '_ds.rtg',   rti, 'FLOAT', mode='w+' )
+    A     = open_grid( out_prefix + '_area.rtg', rti, 'FLOAT', mode='w+' )
+    tiles = [ (row1, min(row1 + tile_rows, ny))
+              for row1 in xrange(0, ny, tile_rows) ]
+
+    #--------------------------------------------------------
+    # Pass 1: Codes, parent IDs, dw and ds for each tile,
+    # then area within the tile.  Save info for the exits
+    # and for the first and last rows of every tile.
+    #--------------------------------------------------------
+    exit_IDs   = []
+    exit_recv  = []
+    exit_A     = []
+    exit_bad   = []
+    bound_IDs  = []
+    bound_root = []
+    for (row1, row2) in tiles:
+        tile_codes = get_tile_codes( d8, DEM, row1, row2 )
+        pID = get_tile_parent_IDs( d8, tile_codes, row1 )
+        codes[ row1: row2 ] = tile_codes
+        pIDs[ row1: row2 ]  = np.maximum( pID, 0 )
+        (dw[ row1: row2 ], ds[ row1: row2 ]) = \
+             get_tile_dw_ds( d8, tile_codes, row1 )
+
+        (down, recv) = get_tile_network( pID, row1 * nx )
+        (order, layers, unresolved) = d8_global.get_topo_layers( down )
+        values   = np.repeat( da[ row1: row2 ], nx )
+        tile_A   = accumulate( layers, values )
+        bad      = np.zeros( down.size, dtype='bool' )
+        bad[ unresolved ] = True
+        #--------------------------------------------
+        # Root of each pixel within the tile, from
+        # downstream to upstream (reversed layers)
+        #--------------------------------------------
+        root = np.arange( down.size )
+        for (IDs, p, starts) in reversed( layers ):
+            root[ IDs ] = root[ down[ IDs ] ]
+
+        w = np.where( recv >= 0 )[0]
+        exit_IDs.append( w + row1 * nx )
+        exit_recv.append( recv[ w ] )
+        exit_A.append( tile_A[ w ] )
+        exit_bad.append( bad[ w ] )
+        #--------------------------------------------
+        # First and last rows of tile; root is -1
+        # unless pixel flows to an exit of the tile
+        #--------------------------------------------
+        b = np.unique( np.concatenate(( np.arange( nx ),
+                                        down.size - nx + np.arange( nx ) )) )
+        b_root = root[ b ]
+        b_root = np.where( recv[ b_root ] >= 0, b_root + row1 * nx, -1 )
+        b_root[ bad[ b ] ] = -1
+        bound_IDs.append( b + row1 * nx )
+        bound_root.append( b_root )
+
+    #--------------------------------------------------------
+    # Stitch tiles: accumulate area over the network of
+    # exit pixels to get the inflow to each entry pixel.
+    #--------------------------------------------------------
+    exit_IDs   = np.concatenate( exit_IDs )
+    exit_recv  = np.concatenate( exit_recv )
+    exit_A     = np.concatenate( exit_A )
+    exit_bad   = np.concatenate( exit_bad )
+    bound_IDs  = np.concatenate( bound_IDs )
+    bound_root = np.concatenate( bound_root )
+
+    k     = np.searchsorted( bound_IDs, exit_recv )
+    roots = bound_root[ k ]
+    down  = np.where( roots >= 0, np.searchsorted( exit_IDs, roots ), -1 )
+    (order, layers, unresolved) = d8_global.get_topo_layers( down )
+    flow_A   = accumulate( layers, exit_A )
+    flow_bad = accumulate( layers, exit_bad )
+    flow_bad[ unresolved ] += 1
+    inflow_A   = np.bincount( k, flow_A,   minlength=bound_IDs.size )
+    inflow_bad = np.bincount( k, flow_bad, minlength=bound_IDs.size )
+    if not(SILENT):
+        print '    Number of exit pixels =', exit_IDs.size
+
+    #--------------------------------------------------------
+    # Pass 2: Area for each tile, with inflow from others
+    #--------------------------------------------------------
+    for (row1, row2) in tiles:
+        tile_codes = np.asarray( codes[ row1: row2 ] )
+        pID = np.int64( pIDs[ row1: row2 ] )
+        pID[ tile_codes == 0 ] = -1
+        (down, recv) = get_tile_network( pID, row1 * nx )
+        (order, layers, unresolved) = d8_global.get_topo_layers( down )
+
+        i1 = np.searchsorted( bound_IDs, row1 * nx )
+        i2 = np.searchsorted( bound_IDs, row2 * nx )
+        b  = bound_IDs[ i1: i2 ] - (row1 * nx)
+        values = np.repeat( da[ row1: row2 ], nx )
+        values[ b ] += inflow_A[ i1: i2 ]
+        bad = np.zeros( down.size )
+        bad[ unresolved ] = 1
+        bad[ b ] += inflow_bad[ i1: i2 ]
+
+        tile_A = accumulate( layers, values )
+        tile_A[ accumulate( layers, bad ) > 0 ] = 0
+        tile_A[ tile_codes.ravel() == 0 ] = 0
+        A[ row1: row2 ] = tile_A.reshape( row2 - row1, nx )
+
+    for grid in [codes, pIDs, dw, ds, A]:
+        grid.flush()
+
+    if not(SILENT):
+        print 'Finished preprocessing D8 grids.'
+        print '    Run time =', (time.time() - start_time), ' [secs]'
+    if (REPORT):
+        print '    Number of tiles  =', len(tiles)
+        print '    min(A), max(A)   =', A.min(), A.max(), '[' + A_units + ']'
+        print ' '
+
+#   preprocess()
+#-----------------------------------------------------------------------
+def get_d8( rti, LR_PERIODIC=False, TB_PERIODIC=False ):
+
+    #------------------------------------------------------
+    # Note: Returns a d8_global component with just what
+    #       is needed for one tile of D8 codes at a time.
+    #------------------------------------------------------
+    d8 = d8_global.d8_component()
+    d8.rti = rti
+    d8.nx  = rti.ncols
+    d8.ny  = rti.nrows
+    d8.LR_PERIODIC = LR_PERIODIC
+    d8.TB_PERIODIC = TB_PERIODIC
+    d8.LINK_FLATS  = False
+    d8.nodata      = np.float32(-9999)
+    d8.dx, d8.dy, d8.dd = pixels.get_sizes_by_row( rti, METERS=True )
+    d8.get_flow_code_list()
+    d8.get_resolve_array()
+    d8.get_valid_code_map()
+    d8.get_row_col_inc_maps()
+    return d8
+
+#   get_d8()
+#-----------------------------------------------------------------------
+def open_grid( file_name, rti, RTG_type, mode='r' ):
+
+    #--------------------------------------------------------
+    # Note: Returns a memory map of an RTG file, with the
+    #       byte order from the RTI file.  Mode 'w+' creates
+    #       (or overwrites) the file.
+    #--------------------------------------------------------
+    dtype = np.dtype( rti_files.get_numpy_data_type( RTG_type ) )
+    if (rti.byte_order == 'MSB'):
+        dtype = dtype.newbyteorder('>')
+    else:
+        dtype = dtype.newbyteorder('<')
+    return np.memmap( file_name, dtype=dtype, mode=mode,
+                      shape=(rti.nrows, rti.ncols) )
+
+#   open_grid()
+#-----------------------------------------------------------------------
+def get_tile_codes( d8, DEM, row1, row2 ):
+
+    #------------------------------------------------------
+    # Note: Same steps as d8_global.update_flow_grid(),
+    #       but for rows row1 to (row2 - 1).  Returns the
+    #       D8 codes of the tile as UInt8.
+    #------------------------------------------------------
+    z = d8.get_padded_DEM( DEM, row1, row2 )
+    tile_codes = np.zeros( [row2 - row1, d8.nx], dtype='Int16' )
+    d8.update_tile_codes( z, tile_codes )
+
+    if (d8.BREAK_TIES):
+        w = (tile_codes > 0)
+        tile_codes[ w ] = d8.resolve[ tile_codes[ w ] ]
+    tile_codes[ np.logical_or( tile_codes < 0, tile_codes > 128 ) ] = 0
+    tile_codes = d8.valid_code_map[ tile_codes ]
+
+    #-----------------------------------
+    # Set flow grid borders to zero ?
+    #-----------------------------------
+    if not(d8.LR_PERIODIC):
+        tile_codes[:, 0]  = 0
+        tile_codes[:, -1] = 0
+    if not(d8.TB_PERIODIC):
+        if (row1 == 0):
+            tile_codes[0, :]  = 0
+        if (row2 == d8.ny):
+            tile_codes[-1, :] = 0
+
+    return tile_codes
+
+#   get_tile_codes()
+#-----------------------------------------------------------------------
+def get_tile_parent_IDs( d8, tile_codes, row1 ):
+
+    #-----------------------------------------------------------
+    # Note: Returns calendar-style IDs of the pixels that the
+    #       pixels in the tile flow to, or -1 for no flow.
+    #-----------------------------------------------------------
+    (nr, nx) = tile_codes.shape
+    rows = np.arange( row1, row1 + nr ).reshape( nr, 1 )
+    cols = np.arange( nx ).reshape( 1, nx )
+    rows = rows + d8.row_inc_map[ tile_codes ]
+    cols = cols + d8.col_inc_map[ tile_codes ]
+    if (d8.LR_PERIODIC):
+        cols %= nx
+    if (d8.TB_PERIODIC):
+        rows %= d8.ny
+    pID = (rows * nx) + cols
+    pID[ tile_codes == 0 ] = -1
+    return pID
+
+#   get_tile_parent_IDs()
+#-----------------------------------------------------------------------
+def get_tile_dw_ds( d8, tile_codes, row1 ):
+
+    #--------------------------------------------------------------
+    # Note: Same flow widths and lengths as
+    #       d8_global.update_flow_width_grid() (not METHOD2) and
+    #       update_flow_length_grid(), for one tile.
+    #--------------------------------------------------------------
+    nr   = tile_codes.shape[0]
+    rows = np.arange( row1, row1 + nr ).reshape( nr, 1 )
+    return d8.get_dw_ds( tile_codes, rows )
+
+#   get_tile_dw_ds()
+#-----------------------------------------------------------------------
+def get_tile_network( pID, offset ):
+
+    #------------------------------------------------------------
+    # Note: Returns (down, recv) for the pixels of a tile that
+    #       starts with calendar-style ID "offset".  down has
+    #       the index within the tile of the pixel each pixel
+    #       flows to, or -1 if none or outside of the tile.
+    #       recv has the ID of the pixel outside of the tile
+    #       that an exit pixel flows to, or -1.
+    #------------------------------------------------------------
+    pID  = pID.ravel()
+    down = pID - offset
+    out  = np.logical_or( (down < 0), (down >= pID.size) )
+    recv = np.where( out, pID, -1 )
+    down[ out ] = -1
+    return (down, recv)
+
+#   get_tile_network()
+#-----------------------------------------------------------------------
+def accumulate( layers, values ):
+
+    #------------------------------------------------------
+    # Note: Same as d8_global.accumulate(), with layers
+    #       from d8_global.get_topo_layers().  Returns a
+    #       1D, Float64 array.
+    #------------------------------------------------------
+    total = np.array( values, dtype='Float64' ).ravel()
+    for (IDs, pIDs, starts) in layers:
+        total[ pIDs ] += np.add.reduceat( total[ IDs ], starts )
+    return total
+
+#   accumulate()
+#-----------------------------------------------------------------------
@@ -960,9 +960,21 @@ class erosion_component( BMI_base.BMI_component ):
         #---------------------------------------------
         # d8.update() needs a depression-filled DEM
         # and can later get it from a CCA port.
+        #---------------------------------------------
+        # (10/14) Only pixels where the DEM has changed
+        # since the last update (and pixels downstream)
+        # need to be updated.  d8.update_region() does
+        # a full update if there are too many of them.
+        # A is converted below if A_units is "km^2".
         #---------------------------------------------        
-        self.d8.update( self.time, DEM=self.DEM,
+        DEM_last = getattr(self, 'd8_DEM', None)
+        if (DEM_last is None) or ('km' in self.d8.A_units.lower()):
+            changed_IDs = None
+        else:
+            changed_IDs = np.flatnonzero( self.DEM != DEM_last )
+        self.d8.update( self.time, DEM=self.DEM, changed_IDs=changed_IDs,
                         SILENT=SILENT, REPORT=REPORT )
+        self.d8_DEM = self.DEM.copy()
 
         #----------------------------------------
         # Erode model needs A_units to be "m^2"
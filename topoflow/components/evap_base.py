@@ -69,6 +69,8 @@ from topoflow.utils import model_output
 #-----------------------------------------------------------------------
 class evap_component( BMI_base.BMI_component):
 
+    PACKED_OK = True   # (see BMI_base.enable_packed_domain())
+
     #-------------------------------------------------------------------
     def set_constants(self):
 
@@ -342,7 +342,7 @@ class evap_component(evap_base.evap_component):
         # ET is a loss, but returned as positive.
         #------------------------------------------
         ET = (Qet / np.float64(2.5E+9))  # [m/s]
-        self.ET = np.maximum(ET, np.float64(0))
+        self.update_in_place( 'ET', np.maximum(ET, np.float64(0)) )   # (10/14)
     
     #   update_ET_rate()
     #-------------------------------------------------------------------  
@@ -343,7 +343,7 @@ class evap_component( evap_base.evap_component ):
         #-------------------------------------
         ET = (Qet / np.float64(2.5E+9))  #[m/s]  (A loss, but returned as positive.)
         
-        self.ET = np.maximum(ET, np.float64(0))
+        self.update_in_place( 'ET', np.maximum(ET, np.float64(0)) )   # (10/14)
 
         ##########################################
         #  THIS MAY BE COSTLY.  BETTER WAY OR
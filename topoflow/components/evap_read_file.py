@@ -250,7 +250,7 @@ class evap_component( evap_base.evap_component ):
         ET = model_input.read_next(self.ET_unit, self.ET_type, rti,
                                    factor=self.mmph_to_mps)
         if (ET != None):
-            self.ET = ET
+            self.update_in_place( 'ET', ET )   # (10/14)
             print 'min(ET) =', ET.min() * self.mps_to_mmph, ' [mmph]'
             print 'min(ET) =', ET.max() * self.mps_to_mmph, ' [mmph]'
 ##            print 'min(ET) =', ET.min(), ' [mps]'
@@ -32,9 +32,14 @@ import sys
 import logging
 # import getopt
 
-import scipy    # scipy.signal.convolve, scipy.io.loadmat
-from scipy import interpolate
-from scipy import signal
+#--------------------------------------------------------------
+# (10/14) SciPy is imported by the functions that need it, so
+# it is not loaded when this module is imported but the ice
+# component is not used (e.g. is disabled).
+#--------------------------------------------------------------
+# import scipy    # scipy.signal.convolve, scipy.io.loadmat
+# from scipy import interpolate
+# from scipy import signal
 
 # SDP. 10/24/11.  No longer available.  Deprecated?
 # from scipy.io.numpyio import fwrite  # used by print_watch_point()
@@ -351,8 +356,9 @@ def compress_grid( H , Zb , COMPRESS_TOGGLE=False , RESTART_TOGGLE=0,
 #   compress_grid()
 #-------------------------------------------------------------------------------------------------- 
 def filter2d( b , x , shape='same' ):
-   
-    return scipy.signal.convolve( b , x , mode=shape )
+
+    from scipy import signal
+    return signal.convolve( b , x , mode=shape )
 
 #   filter2d()
 #-------------------------------------------------------------------------------------------------- 
@@ -533,6 +539,7 @@ def iceflow( taubX , taubY , HX , HY , xcmpnt , ycmpnt ,
 
         
         #A_ext(ind) = interp3( eHs, eTs, eTm, eA, H_ext(ind), Ts_ext(ind), Tm_ext(ind) ) ;
+        from scipy import interpolate
         try:
             numpy.put( A_ext , ind , interpolate.interp3d( eHs , eTs , eTm )( numpy.take(H_ext,ind) , numpy.take(Ts_ext,ind) , numpy.take(Tm_ext,ind) ) )
         except:
@@ -843,6 +850,7 @@ def mass_balance( Zi, t,
     elif (MASS_BALANCE_TOGGLE == MassBalance.ELA_TIME_SERIES) or \
          (MASS_BALANCE_TOGGLE == MassBalance.D18O_TIME_SERIES):
         # ELA time series
+        from scipy import interpolate
         ELA = interpolate.interp1d( trecord , ELArecord )( t )
         Bxy = gradBz * ( Zi - ELA )
         Bxy = numpy.choose( Bxy > maxBz , (Bxy, maxBz) )
@@ -918,6 +926,7 @@ def mass_conservation( H_ext , UxX , UyY , HX , HY , dZidxX , dZidyY ,
 def load_dem( DEM_file ):
 
     # Assume DEM_file is in MatLab format
+    import scipy.io
     vars = scipy.io.loadmat( DEM_file )
 
     cellsize = numpy.float64(vars['cellsize'])
@@ -944,6 +953,7 @@ def load_dem_var( var_file , val_s ):
 
     # Assume var_file is in MatLab format,
     # & maybe contains DEM as well.
+    import scipy.io
     vars = scipy.io.loadmat( var_file )
 
     if (vars.has_key( val_s )):
@@ -1415,7 +1425,8 @@ def resample_dem( topo, dx, dy, cellsize ):
     x = numpy.arange(nx_New) * dx
     y = numpy.arange(ny_New) * dy
     X,Y = numpy.meshgrid( x , y )
-       
+
+    from scipy import interpolate
     topo     = interpolate.interp2d( XOld , YOld , topo , kind='linear' )( X , Y )
     #topo     = interpolate.interp2d( XOld , YOld , topo, X, Y ) ;
 
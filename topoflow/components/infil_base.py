@@ -78,6 +78,8 @@ from topoflow.utils import model_output
 #-----------------------------------------------------------------------
 class infil_component( BMI_base.BMI_component):
 
+    PACKED_OK = True   # (see BMI_base.enable_packed_domain())
+
     #---------------------------------------------------------
     # Notes: Default settings are average for 'Loam', as
     #        returned by the Get_Soil_Params routine.
@@ -615,7 +617,7 @@ class infil_component( BMI_base.BMI_component):
         # Set groundwater recharge rate to IN ?
         # Save last value of r for next time.
         #----------------------------------------   
-        self.Rg = self.IN
+        self.update_in_place( 'Rg', self.IN )   # (10/14, not self.Rg = self.IN)
         P_rain  = self.P_rain   # (2/3/13, new framework)
         SM      = self.SM       # (2/3/13, new framework)
         #---------------------
@@ -746,7 +748,7 @@ class infil_component( BMI_base.BMI_component):
             # P_total and Ks are both scalars
             #----------------------------------
             if (self.P_total < self.Ks[0]):    
-                self.IN = self.P_total
+                self.update_in_place( 'IN', self.P_total )
         else:    
             #---------------------------------
             # Either P_total or Ks is a grid
@@ -490,7 +490,7 @@ def Green_Ampt_Infil_Rate_v1(self):
     # Ponding time, Tp, is t--ime until (IN lt r).
     #-------------------------------------------
     self.fc = fc  ### (Added on 9/11/14.)
-    self.IN = np.minimum(fc, self.P_total)
+    self.update_in_place( 'IN', np.minimum(fc, self.P_total) )
     
 ##    print 'STEP 2: max(IN) =', fc.max()
     
@@ -692,7 +692,7 @@ def Green_Ampt_Infil_Rate_1D(self, r, r_last, n):
     #------------------------------------------
     # Return infiltration rate at time, t_end
     #------------------------------------------
-    self.IN = np.minimum(f, r)
+    self.update_in_place( 'IN', np.minimum(f, r) )
     ## return np.minimum(f, r)
     
 #  Green_Ampt_Infil_Rate_1D
@@ -852,7 +852,7 @@ def Green_Ampt_Infil_Rate_3D(self, r, r_last, n):
     #-------------------------------------------
     # Return infiltration rates at time, t_end
     #-------------------------------------------
-    self.IN = np.minimum(f, r)
+    self.update_in_place( 'IN', np.minimum(f, r) )
     ## return np.minimum(f, r)
     
 #   Green_Ampt_Infil_Rate_3D
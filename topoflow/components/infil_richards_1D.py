@@ -566,7 +566,8 @@ class infil_component(infil_base.infil_component):
             self.K = np.zeros(self.nz, dtype=dtype) + self.Ki
             self.v = np.zeros(self.nz, dtype=dtype)
             #---------------------------------------------------------
-            self.IN = np.float64(0)   # (infil. rate at surface)
+            self.IN = self.initialize_scalar( 0, dtype=dtype )   # (infil. rate at surface)
+            self.Rg = self.initialize_scalar( 0, dtype=dtype )   # (10/14)
             self.I  = np.float64(0)   # (total infil. depth)
             self.Zw = np.float64(0)   # (wetting front depth)
             #---------------------------------------------------------
@@ -595,6 +596,7 @@ class infil_component(infil_base.infil_component):
             self.v  = np.zeros((self.nz, self.ny, self.nx), dtype=dtype)
             #---------------------------------------------------------------
             self.IN = np.zeros([self.ny, self.nx], dtype=dtype)
+            self.Rg = np.zeros([self.ny, self.nx], dtype=dtype)   # (10/14)
             self.I  = np.zeros([self.ny, self.nx], dtype=dtype)
             self.Zw = np.zeros([self.ny, self.nx], dtype=dtype)
 
@@ -1585,9 +1587,9 @@ class infil_component(infil_base.infil_component):
         # Return flow rate in bottom layer
         #-----------------------------------
         if (self.SINGLE_PROFILE):    
-            self.Rg = self.v[self.nz - 1]
+            self.update_in_place( 'Rg', self.v[self.nz - 1] )
         else:    
-            self.Rg = self.v[self.nz - 1,:,:]
+            self.update_in_place( 'Rg', self.v[self.nz - 1,:,:] )
 
         if (self.DEBUG):
             print 'min(v), max(v) =', self.v.min(), self.v.max()
@@ -1736,10 +1738,10 @@ class infil_component(infil_base.infil_component):
         # Green-Ampt, etc.
         #---------------------------------------------
         if (self.SINGLE_PROFILE):    
-            self.IN = self.v[0]
+            self.update_in_place( 'IN', self.v[0] )
             ## self.IN = self.v[1]
         else:
-            self.IN = self.v[0,:,:]
+            self.update_in_place( 'IN', self.v[0,:,:] )
             ## self.IN = self.v[1,:,:]
             
 
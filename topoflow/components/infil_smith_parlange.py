@@ -495,7 +495,7 @@ def Smith_Parlange_Infil_Rate_v1(self):
     # water infiltrates.  IN cannot exceed P_total.
     # Ponding time, Tp, is time until (IN < P_total).
     #---------------------------------------------------
-    self.IN = np.minimum(IN, self.P_total)
+    self.update_in_place( 'IN', np.minimum(IN, self.P_total) )
     
     #-----------------------------------
     #Is P_total less than Ks anywhere ?
@@ -701,7 +701,7 @@ def Smith_Parlange_Infil_Rate_1D(self, r, r_last, n):
     #----------------------------------------
     #Return infiltration rate at time, t_end
     #----------------------------------------
-    self.IN = np.minimum(f, r)
+    self.update_in_place( 'IN', np.minimum(f, r) )
     ## return np.minimum(f, r)
     
 #  Smith_Parlange_Infil_Rate_1D
@@ -879,7 +879,7 @@ def Smith_Parlange_Infil_Rate_3D(self, r, r_last, n):
     #-------------------------------------------
     # Return infiltration rates at time, t_end
     #-------------------------------------------
-    self.IN = np.minimum(f, r)
+    self.update_in_place( 'IN', np.minimum(f, r) )
     ## return np.minimum(f, r)
     
 #   Smith_Parlange_Infil_Rate_3D
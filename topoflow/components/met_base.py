@@ -103,6 +103,8 @@ from topoflow.utils import rtg_files
 #-----------------------------------------------------------------------
 class met_component( BMI_base.BMI_component ):
 
+    PACKED_OK = True   # (see BMI_base.enable_packed_domain())
+
     #-------------------------------------------------------------------
     _att_map = {
         'model_name':         'TopoFlow_Meteorology',
@@ -1626,16 +1628,11 @@ class met_component( BMI_base.BMI_component ):
         LW_out   = self.em_surf * self.sigma * (T_surf_K)** 4.0
         LW_out   = LW_out + ((1.0 - self.em_surf) * LW_in)
                
-        self.Qn_LW = (LW_in - LW_out)   # [W m-2]
-
-        #--------------------------------------------------------------  
-        # Can't do this yet.  Qn_LW is always initialized grid now
-        # but will often be created above as a scalar. (9/23/14)
         #--------------------------------------------------------------
-#         if (np.rank( self.Qn_LW ) == 0):
-#             self.Qn_LW.fill( Qn_LW )   #### (mutable scalar)
-#         else:
-#             self.Qn_LW[:] = Qn_LW  # [W m-2]
+        # Qn_LW is always initialized as a grid, and is updated in
+        # place even when LW_in and LW_out are scalars. (10/14)
+        #--------------------------------------------------------------
+        self.update_in_place( 'Qn_LW', LW_in - LW_out )   # [W m-2]
         
     #   update_net_longwave_radiation()
     #-------------------------------------------------------------------
@@ -113,6 +113,8 @@ from topoflow.utils import tf_utils
 #-----------------------------------------------------------------------
 class satzone_component( BMI_base.BMI_component ):
 
+    PACKED_OK = True   # (see BMI_base.enable_packed_domain())
+
 
     #-----------------------------------------------------------
     # Notes:  h0_table = init. elevation of water table [m]
@@ -554,6 +556,9 @@ class satzone_component( BMI_base.BMI_component ):
         #--------------------------------------------------      
         self.d8.site_prefix  = self.site_prefix
         self.d8.in_directory = self.in_directory
+        self.d8.PACKED       = self.PACKED   # (10/14)
+        self.d8.domain       = getattr(self, 'domain', None)
+        self.d8.topology_dir = getattr(self, 'topology_dir', None)
         self.d8.initialize( cfg_file=None )
 
     #   initialize_d8_vars()
@@ -955,57 +960,17 @@ class satzone_component( BMI_base.BMI_component ):
         print '   dz_max = ' + str(dz_max)
         ## print ' '
 
-        #-------------------------------------------
-        # Local synonyms  (Any performance hit ??)
-        #-------------------------------------------
-        p1 = self.d8.p1   ;  w1 = self.d8.w1
-        p2 = self.d8.p2   ;  w2 = self.d8.w2
-        p3 = self.d8.p3   ;  w3 = self.d8.w3
-        p4 = self.d8.p4   ;  w4 = self.d8.w4
-        p5 = self.d8.p5   ;  w5 = self.d8.w5
-        p6 = self.d8.p6   ;  w6 = self.d8.w6
-        p7 = self.d8.p7   ;  w7 = self.d8.w7
-        p8 = self.d8.p8   ;  w8 = self.d8.w8
-        
         #-----------------------------------------
         # Add contributions from neighbor pixels
-        #-----------------------------------------
+        #-----------------------------------------------------
+        # (10/14)  One bincount over d8.downstream_index now
+        # replaces eight scatters with d8.p1, d8.w1, etc.
+        # The sum of inflows to a pixel is divided by the
+        # area of that (parent) pixel, as before.
+        #-----------------------------------------------------
         dt = self.dt          ############# CHECK dt #########
-        if (np.size( self.da ) == 1):    
-            factor = (dt / self.da)
-            if (self.d8.p1_OK):    
-                dzw[p1] += (self.Q_gw[w1] * factor)
-            if (self.d8.p2_OK):    
-                dzw[p2] += (self.Q_gw[w2] * factor)
-            if (self.d8.p3_OK):    
-                dzw[p3] += (self.Q_gw[w3] * factor)
-            if (self.d8.p4_OK):    
-                dzw[p4] += (self.Q_gw[w4] * factor)
-            if (self.d8.p5_OK):    
-                dzw[p5] += (self.Q_gw[w5] * factor)
-            if (self.d8.p6_OK):    
-                dzw[p6] += (self.Q_gw[w6] * factor)
-            if (self.d8.p7_OK):    
-                dzw[p7] += (self.Q_gw[w7] * factor)
-            if (self.d8.p8_OK):    
-                dzw[p8] += (self.Q_gw[w8] * factor)
-        else:    
-            if (self.d8.p1_OK):    
-                dzw[p1] += (dt * self.Q_gw[w1] / self.da[p1])
-            if (self.d8.p2_OK):    
-                dzw[p2] += (dt * self.Q_gw[w2] / self.da[p2])
-            if (self.d8.p3_OK):    
-                dzw[p3] += (dt * self.Q_gw[w3] / self.da[p3])
-            if (self.d8.p4_OK):    
-                dzw[p4] += (dt * self.Q_gw[w4] / self.da[p4])
-            if (self.d8.p5_OK):    
-                dzw[p5] += (dt * self.Q_gw[w5] / self.da[p5])
-            if (self.d8.p6_OK):    
-                dzw[p6] += (dt * self.Q_gw[w6] / self.da[p6])
-            if (self.d8.p7_OK):    
-                dzw[p7] += (dt * self.Q_gw[w7] / self.da[p7])
-            if (self.d8.p8_OK):    
-                dzw[p8] += (dt * self.Q_gw[w8] / self.da[p8])
+        Q_in = self.d8.route_to_parents( self.Q_gw )
+        dzw += Q_in * (dt / self.da)
         
         #--------------------------------------------------
         # Find pixels where water table will rise or fall
@@ -63,6 +63,8 @@ from topoflow.utils import model_output
 #-----------------------------------------------------------------------
 class snow_component( BMI_base.BMI_component ):
 
+    PACKED_OK = True   # (see BMI_base.enable_packed_domain())
+
 
     #------------------------------------------------------------
     # Notes: rho_H2O, Cp_snow, rho_air and Cp_air are currently
@@ -379,13 +381,13 @@ class snow_component( BMI_base.BMI_component ):
         #------------------------------------------------------- 
         density_ratio =  (self.rho_H2O / self.rho_snow)  
         SM_max = (density_ratio / self.dt) * self.h_snow 
-        self.SM = np.minimum(self.SM, SM_max)  # [m s-1]
+        self.update_in_place( 'SM', np.minimum(self.SM, SM_max) )  # [m s-1]
 
         #------------------------------------------------------
         # Make sure meltrate is positive, while we're at it ?
         # Is already done by "Energy-Balance" component.
         #------------------------------------------------------
-        self.SM = np.maximum(self.SM, np.float64(0))
+        self.update_in_place( 'SM', np.maximum(self.SM, np.float64(0)) )
    
     #   enforce_max_meltrate()
     #-------------------------------------------------------------------
@@ -302,7 +302,7 @@ class snow_component( snow_base.snow_component ):
         M = (self.c0 / np.float64(8.64E7)) * (T_air - self.T0)   #[m/s]
 
         # This is really an "enforce_min_meltrate()"
-        self.SM = np.maximum(M, np.float64(0))
+        self.update_in_place( 'SM', np.maximum(M, np.float64(0)) )   # (10/14)
    
         #-------------------------------------------------------
         # Note: enforce_max_meltrate() method is always called
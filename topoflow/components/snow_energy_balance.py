@@ -464,7 +464,7 @@ class snow_component( snow_base.snow_component ):
         # So (rho_w * Lf) = 3.34e+8  [J/m^3]
         #------------------------------------------
         M       = (Qm / np.float64(3.34E+8))   #[m/s]
-        self.SM = np.maximum(M, np.float64(0))
+        self.update_in_place( 'SM', np.maximum(M, np.float64(0)) )   # (10/14)
 
         #--------------------------------------------------
         # Update the cold content of the snowpack [J m-2]
@@ -1,7 +1,12 @@
 ## Copyright (c) 2001-2013, Scott D. Peckham
 
+import numpy as np
+
 from topoflow.components import channels_base
+from topoflow.components import channels_diffusive_wave
+from topoflow.components import channels_kinematic_wave
 from topoflow.utils import tf_utils
+from topoflow.utils.tests import test_tf_d8_base
 
 #-----------------------------------------------------------------------
 def test_instantiate():
@@ -55,4 +60,255 @@ def test_instantiate():
     
 #   test_instantiate()
 #-----------------------------------------------------------------------
+def test_geometry_grids(nx=30, ny=20):
+
+    #--------------------------------------------------------
+    # Note: Check that the cached sin, tan, cos, 1/ds and
+    #       width^2 grids are still correct after bankfull
+    #       pixels change width and angle.  No input files.
+    #--------------------------------------------------------
+    c = channels_base.channels_component()
+    c.nx = nx
+    c.ny = ny
+    np.random.seed( 3 )
+    class d8:
+        pass
+    c.d8 = d8
+    c.d8.ds = np.random.random( (ny, nx) ) * 10 + 25
+    c.d8.dw = np.random.random( (ny, nx) ) * 10 + 25
+    c.width = np.random.random( (ny, nx) ) * 3 + 0.5
+    c.angle = np.radians( np.random.random( (ny, nx) ) * 40 )
+    c.scratch = { 'mask2' : np.zeros( (ny, nx), dtype='bool' ) }
+    c.initialize_geometry_grids()
+
+    wb = (np.random.random( (ny, nx) ) > 0.8)
+    n_bankfull = wb.sum()
+    c.update_bankfull_geometry( wb )
+    SAME = (np.allclose( c.sin_angle, np.sin( c.angle ) ) and
+            np.allclose( c.tan_angle, np.tan( c.angle ) ) and
+            np.allclose( c.cos_angle, np.cos( c.angle ) ) and
+            np.allclose( c.ds_inv,    1.0 / c.d8.ds ) and
+            np.allclose( c.width_sq,  c.width ** 2 ))
+    print 'Changed pixels      =', wb.sum(), ' of ', n_bankfull
+    print 'Same geometry grids =', SAME
+    assert SAME
+    c.update_bankfull_geometry( wb )
+    print 'Changed 2nd time    =', wb.sum()
+    print ' '
+    assert (wb.sum() == 0)
+
+#   test_geometry_grids()
+#-----------------------------------------------------------------------
+def test_active_set(nx=60, ny=40, n_steps=200):
+
+    #--------------------------------------------------------
+    # Note: Rain falls on a small block of pixels for a
+    #       while, then stops.  Results in active-set mode
+    #       should be the same as for the full grids, except
+    #       for S_free at dry pixels (not updated).
+    #--------------------------------------------------------
+    for module in [channels_kinematic_wave, channels_diffusive_wave]:
+        comps = []
+        for ACTIVE in [False, True]:
+            c = get_test_channels( module, nx, ny )
+            c.ACTIVE_SET = ACTIVE
+            c.initialize_computed_vars()
+            comps.append( c )
+        (c1, c2) = comps
+        for k in xrange( n_steps ):
+            for c in comps:
+                c.P_rain[:] = 0.0
+                if (k < 30):
+                    c.P_rain[ 5:12, 40:50 ] = 2e-4
+                c.update()
+
+        SAME = True
+        for name in ['Q', 'u', 'd', 'vol', 'f', 'Rh', 'froude', 'width']:
+            SAME = SAME and np.array_equal( getattr(c1, name),
+                                            getattr(c2, name) )
+        wet = np.logical_not( c2.active.inactive )
+        SAME_S_FREE = np.array_equal( c1.S_free[ wet ], c2.S_free[ wet ] )
+        print module.__name__
+        print 'Active pixels       =', c2.active.n_pixels, ' of ', nx * ny
+        print 'Same as full grids  =', SAME
+        print 'Same wet S_free     =', SAME_S_FREE
+        assert SAME and SAME_S_FREE
+    print ' '
+
+#   test_active_set()
+#-----------------------------------------------------------------------
+def test_implicit_solver(nx=60, ny=40, T=900.0):
+
+    #--------------------------------------------------------
+    # Note: Rain falls on a block of pixels for T seconds,
+    #       with no losses.  The implicit solver should be
+    #       stable for a dt that is much too large for the
+    #       explicit one, conserve mass (water stays in the
+    #       noflow pixels), and be close to the explicit
+    #       solution with a small dt.
+    #--------------------------------------------------------
+    vols = []
+    for (IMPLICIT, dt) in [(False, 0.5), (True, 60.0)]:
+        c = get_test_channels( channels_kinematic_wave, nx, ny )
+        c.IMPLICIT = IMPLICIT
+        c.dt = np.float64( dt )
+        c.ET = np.float64( 0 )
+        c.initialize_computed_vars()
+        for k in xrange( int(T / dt) ):
+            c.P_rain[:] = 0.0
+            c.P_rain[ 5:30, 20:60 ] = 2e-5
+            c.update()
+        vols.append( c.vol.copy() )
+    vol_R = (2e-5 * c.da * T) * (25 * 40)
+    err = np.abs( vols[1] - vols[0] ).sum() / vols[0].sum()
+    FINITE   = np.all( np.isfinite( c.vol ) )
+    BALANCED = np.allclose( c.vol.sum(), vol_R )
+    print 'Implicit dt         =', c.dt, ' [secs]'
+    print 'Finite volumes      =', FINITE
+    print 'Mass balance        =', BALANCED
+    print 'Rel. error vs expl. =', err
+    print 'Close to explicit   =', (err < 0.05)
+    print ' '
+    assert FINITE and BALANCED and (err < 0.05)
+
+#   test_implicit_solver()
+#-----------------------------------------------------------------------
+def test_adaptive_substeps(nx=60, ny=40, T=1800.0):
+
+    #--------------------------------------------------------
+    # Note: Diffusive wave with a dt that is too large for
+    #       a fixed step.  With ADAPTIVE_DT, update() takes
+    #       sub-steps, so results should stay finite and be
+    #       close to those for a small fixed dt, in fewer
+    #       steps.  Sub-step counts are in get_profile().
+    #--------------------------------------------------------
+    comps = []
+    for (ADAPTIVE, dt) in [(False, 0.5), (False, 20.0), (True, 20.0)]:
+        c = get_test_channels( channels_diffusive_wave, nx, ny )
+        c.ADAPTIVE_DT = ADAPTIVE
+        c.dt = np.float64( dt )
+        c.initialize_computed_vars()
+        c.enable_profiling()
+        with np.errstate( over='ignore', invalid='ignore' ):
+            for k in xrange( int(T / dt) ):
+                c.P_rain[:] = 0.0
+                if (k * dt < 600):
+                    c.P_rain[ 5:30, 20:60 ] = 2e-4
+                c.update()
+        comps.append( c )
+    (c1, c2, c3) = comps
+    err = np.abs( c3.vol - c1.vol ).sum() / c1.vol.sum()
+    counts = c3.get_profile()[ 'counts' ]
+    FIXED_FINITE    = np.all( np.isfinite( c2.vol ) )
+    ADAPTIVE_FINITE = np.all( np.isfinite( c3.vol ) )
+    print 'Fixed dt, finite    =', FIXED_FINITE
+    print 'Adaptive, finite    =', ADAPTIVE_FINITE
+    print 'Rel. error vs small =', err
+    print 'Close to small dt   =', (err < 0.01)
+    print 'Sub-steps           =', counts['substeps'], ' vs ', \
+          c1.profile_counts['steps'], ' for small dt'
+    print 'Max per step        =', counts['max_substeps_per_step']
+    print ' '
+    assert ADAPTIVE_FINITE and not(FIXED_FINITE)
+    assert (err < 0.01)
+    assert (counts['substeps'] < c1.profile_counts['steps'])
+
+#   test_adaptive_substeps()
+#-----------------------------------------------------------------------
+def test_adaptive_vol_Q(nx=60, ny=40, T=1800.0):
+
+    #--------------------------------------------------------
+    # Note: Rain falls only on the pixels that drain to the
+    #       outlet, with no losses, and the outlet flows to
+    #       a noflow pixel.  All of the water that leaves the
+    #       outlet (vol_Q) is then in that pixel, if vol_Q is
+    #       integrated over the sub-steps with their dt.
+    #--------------------------------------------------------
+    c = get_test_channels( channels_diffusive_wave, nx, ny )
+    c.ADAPTIVE_DT = True
+    c.dt = np.float64( 20 )
+    c.ET = np.float64( 0 )
+    c.initialize_computed_vars()
+    outlet_ID = (c.outlet_ID[0] * nx) + c.outlet_ID[1]
+    basin_IDs = c.d8.upstream_IDs( outlet_ID )
+    parent_ID = c.d8.downstream_index[ outlet_ID ]
+    n_substeps = 0
+    for k in xrange( int(T / c.dt) ):
+        c.P_rain[:] = 0.0
+        if (k * c.dt < 600):
+            c.P_rain.flat[ basin_IDs ] = 2e-4
+        c.update()
+        n_substeps += c.n_substeps
+    vol_out  = c.vol.flat[ parent_ID ]
+    BALANCED = np.allclose( c.vol_Q, vol_out, rtol=1e-10 )
+    print 'Steps, sub-steps    =', int(T / c.dt), ',', n_substeps
+    print 'vol_Q               =', float( c.vol_Q ), ' [m^3]'
+    print 'Volume below outlet =', vol_out, ' [m^3]'
+    print 'vol_Q balances      =', BALANCED
+    print ' '
+    assert (n_substeps > int(T / c.dt))
+    assert BALANCED and (vol_out > 0)
+
+#   test_adaptive_vol_Q()
+#-----------------------------------------------------------------------
+def get_test_channels( module, nx, ny ):
+
+    #--------------------------------------------------------
+    # Note: A channels component with random channel
+    #       geometry on the flow grid of test_tf_d8_base.py,
+    #       that can call update() without input or output
+    #       files.  Call initialize_computed_vars() next.
+    #--------------------------------------------------------
+    c = module.channels_component()
+    c.nx = nx
+    c.ny = ny
+    c.d8 = test_tf_d8_base.get_test_d8( nx, ny, 0 )
+    c.d8.noflow_IDs = np.where( c.d8.flow_grid <= 0 )
+    np.random.seed( 1 )
+    c.d8.ds = np.random.random( (ny, nx) ) * 10 + 25
+    c.d8.dw = np.random.random( (ny, nx) ) * 10 + 25
+    c.KINEMATIC_WAVE = (module is channels_kinematic_wave)
+    c.DIFFUSIVE_WAVE = (module is channels_diffusive_wave)
+    c.DYNAMIC_WAVE   = False
+    c.MANNING     = True
+    c.LAW_OF_WALL = False
+    c.set_constants()
+    c.nval  = np.random.random( (ny, nx) ) * 0.02 + 0.03
+    c.width = np.random.random( (ny, nx) ) * 3 + 0.5
+    c.angle = np.random.random( (ny, nx) ) * 40    # [degrees]
+    c.slope = np.random.random( (ny, nx) ) * 0.05 + 0.01
+    c.sinu  = np.float64(1)
+    c.d0    = np.float64(0)
+    c.da    = np.float64(900)
+    c.dt    = np.float64(1)
+    c.rho_H2O = np.float64(1000)
+    c.P_rain = np.zeros( (ny, nx), dtype='Float64' )
+    c.SM = c.GW = c.IN = c.MR = np.float64(0)
+    c.ET = np.float64(1e-7)
+    c.mode = 'nondriver'
+    c.time_min = np.float64(0)
 
+    #-----------------------------------------------------
+    # The outlet is the pixel with the largest upstream
+    # area that flows to a noflow pixel at the edge.
+    #-----------------------------------------------------
+    c.d8.get_upstream_index()
+    n_up = (c.d8.tour_end - c.d8.tour_start)
+    parent_IDs = c.d8.downstream_index
+    w = (parent_IDs >= 0)
+    w[ w ] = (c.d8.flow_grid.flat[ parent_IDs[ w ] ] == 0)
+    n_up[ np.logical_not( w ) ] = 0
+    outlet_ID  = np.argmax( n_up )
+    c.outlet_ID = (outlet_ID / nx, outlet_ID % nx)
+
+    #---------------------------------
+    # No checks or files for the test
+    #---------------------------------
+    skip = lambda *args: True
+    for name in ['check_flow_depth', 'check_flow_velocity',
+                 'write_output_files', 'update_time']:
+        setattr( c, name, skip )
+    return c
+
+#   get_test_channels()
+#-----------------------------------------------------------------------
@@ -3,6 +3,10 @@
 
 #---------------------------------------------------------------------
 
+import numpy as np
+import time
+
+from topoflow.components import d8_global
 # from topoflow.utils      import tf_utils  # (not used)
 
 #-------------------------------------------
@@ -13,6 +17,12 @@
 #---------------------------------------------------------------------
 #
 #   unit_test()
+#   test_accumulate()    # (10/14)
+#   test_link_flats()    # (10/14)
+#   test_start_new_d8_codes()  # (10/14)
+#   test_update_region()       # (10/14)
+#   test_update_stream_grids() # (10/14)
+#   get_test_d8()
 #
 #---------------------------------------------------------------------
 def unit_test(TREYNOR=False, KY_SUB=False, BEAVER=False,
@@ -101,3 +111,326 @@ def unit_test(TREYNOR=False, KY_SUB=False, BEAVER=False,
 #   unit_test()
 #---------------------------------------------------------------------
 
+def test_accumulate(nx=200, ny=150, PERIODIC=False, RANDOM_CODES=False):
+
+    #---------------------------------------------------------
+    # Note: Compares the area grid from update_area_grid(),
+    #       which uses accumulate(), to the one from the
+    #       original, iterative update_area_grid_OLD().
+    #       Random D8 codes have many flow cycles.
+    #---------------------------------------------------------
+    d8 = get_test_d8( nx, ny, PERIODIC, RANDOM_CODES )
+
+    start = time.time()
+    d8.update_area_grid_OLD()
+    A_old = d8.A.copy()
+    time_old = (time.time() - start)
+
+    start = time.time()
+    d8.update_area_grid()
+    time_new = (time.time() - start)
+
+    print 'PERIODIC, RANDOM_CODES =', PERIODIC, RANDOM_CODES
+    print 'max(A) =', d8.A.max(), ' [m^2]'
+    print 'Number of unresolved pixels =', d8.unresolved_IDs.size
+    SAME_A = np.allclose( d8.A, A_old, rtol=1e-5 )
+    print 'Area grids agree =', SAME_A
+    print 'Run time for OLD =', time_old, ' [secs]'
+    print 'Run time for new =', time_new, ' [secs]'
+
+    #--------------------------------------------------
+    # accumulate() of ones gives the number of pixels
+    # upstream, including the pixel itself
+    #--------------------------------------------------
+    n_up = d8.accumulate( np.ones( (ny, nx), dtype='Int32' ) )
+    n_A  = np.float64( d8.A / d8.da )
+    w    = np.where( d8.A > 0 )
+    SAME_N = np.allclose( n_up[w], n_A[w] )
+    print 'Pixel counts agree =', SAME_N
+    print ' '
+    assert SAME_A and SAME_N
+
+#   test_accumulate()
+#---------------------------------------------------------------------
+def test_link_flats(nx=300, ny=200, PERIODIC=False):
+
+    #---------------------------------------------------------
+    # Note: Builds D8 codes for a terraced DEM with many
+    #       large flats, using each flat_method.  The 'bfs'
+    #       method should give the same codes as the original
+    #       'iterative' method, and 'bfs_gm' should link the
+    #       same flats without creating any flow cycles.
+    #---------------------------------------------------------
+    d8 = get_test_d8( nx, ny, PERIODIC )
+    d8.dx = np.zeros( ny, dtype='Float32' ) + 30
+    d8.dy = d8.dx.copy()
+    d8.dd = np.sqrt( d8.dx**2 + d8.dy**2 )
+    d8.nodata     = -9999.0
+    d8.LINK_FLATS = True
+    d8.BREAK_TIES = True
+    d8.DEBUG      = False
+    
+    #---------------------------
+    # Terraced, noisy DEM
+    #---------------------------
+    np.random.seed( 34 )
+    cols = np.arange( nx, dtype='Float64' )
+    DEM  = np.random.random( (ny, nx) ) * 2 + (cols * 0.02)
+    DEM  = np.floor( DEM )
+    
+    codes = dict()
+    n_cycle_pixels = 0
+    for flat_method in ['iterative', 'bfs', 'bfs_gm']:
+        d8.flat_method = flat_method
+        start = time.time()
+        d8.update_flow_grid( DEM=DEM )
+        run_time = (time.time() - start)
+        codes[ flat_method ] = d8.d8_grid.copy()
+        d8.update_parent_ID_grid()
+        d8.update_area_grid()
+        n_bad = (d8.d8_grid.flat[ d8.unresolved_IDs ] != 0).sum()
+        print 'flat_method =', flat_method
+        print '    Number of linked flat pixels =', d8.total_flats
+        print '    Number of pixels in cycles   =', n_bad
+        print '    Run time =', run_time, ' [secs]'
+        n_cycle_pixels += n_bad
+
+    SAME_CODES  = np.array_equal( codes['iterative'], codes['bfs'] )
+    SAME_LINKED = np.array_equal( codes['bfs'] != 0, codes['bfs_gm'] != 0 )
+    print 'Same codes for iterative and bfs =', SAME_CODES
+    print 'Same pixels linked for bfs_gm    =', SAME_LINKED
+    print ' '
+    assert SAME_CODES and SAME_LINKED
+    assert (n_cycle_pixels == 0)
+
+#   test_link_flats()
+#---------------------------------------------------------------------
+def test_start_new_d8_codes(nx=500, ny=400, PERIODIC=False):
+
+    #---------------------------------------------------------
+    # Note: The padded-DEM version of start_new_d8_codes()
+    #       should give the same codes as the np.roll()
+    #       version, for any number of rows per tile.  The
+    #       terraced DEM has many flats and ties.
+    #---------------------------------------------------------
+    d8 = get_test_d8( nx, ny, PERIODIC )
+    d8.dx = np.zeros( ny, dtype='Float32' ) + 30
+    d8.dy = d8.dx.copy()
+    d8.dd = np.sqrt( d8.dx**2 + d8.dy**2 )
+    d8.nodata = -9999.0
+
+    np.random.seed( 34 )
+    cols = np.arange( nx, dtype='Float64' )
+    DEM  = np.floor( np.random.random( (ny, nx) ) * 2 + (cols * 0.02) )
+    DEM[ 10:20, 30:40 ] = d8.nodata
+    DEM[ 50, 60 ]       = np.nan
+    
+    for LINK_FLATS in [False, True]:
+        d8.LINK_FLATS = LINK_FLATS
+        start = time.time()
+        d8.start_new_d8_codes_OLD( DEM=DEM )
+        old_time = (time.time() - start)
+        codes = d8.d8_grid.copy()
+        for tile_rows in [None, 1, 7, ny]:
+            start = time.time()
+            d8.start_new_d8_codes( DEM=DEM, tile_rows=tile_rows )
+            run_time = (time.time() - start)
+            SAME = np.array_equal( codes, d8.d8_grid )
+            print 'LINK_FLATS =', LINK_FLATS, ', tile_rows =', tile_rows
+            print '    Same codes =', SAME
+            print '    Run times  =', old_time, run_time, ' [secs]'
+            assert SAME
+    print ' '
+
+#   test_start_new_d8_codes()
+#---------------------------------------------------------------------
+def test_update_region(nx=400, ny=300, PERIODIC=False,
+                       n_steps=20, n_changed=50):
+
+    #---------------------------------------------------------
+    # Note: Changes the DEM at a few random pixels in each
+    #       step, as in a landscape evolution model, then
+    #       compares the D8 vars from update_region() to
+    #       those from update_grids() for the whole DEM.
+    #---------------------------------------------------------
+    d8  = get_test_d8( nx, ny, PERIODIC )
+    d8b = get_test_d8( nx, ny, PERIODIC )
+    for d in [d8, d8b]:
+        d.dx = np.zeros( ny, dtype='Float32' ) + 30
+        d.dy = d.dx.copy()
+        d.dd = np.sqrt( d.dx**2 + d.dy**2 )
+        d.dw = np.zeros( (ny, nx), dtype='Float32' )
+        d.ds = np.zeros( (ny, nx), dtype='Float32' )
+        d.nodata     = -9999.0
+        d.LINK_FLATS = False
+        d.BREAK_TIES = True
+        d.DEBUG      = False
+        d.get_row_col_inc_maps()
+    
+    np.random.seed( 34 )
+    cols = np.arange( nx, dtype='Float64' )
+    DEM  = np.random.random( (ny, nx) ) + (cols * 0.05)
+    d8.update_grids( DEM=DEM )
+
+    time_region = 0.0
+    time_full   = 0.0
+    OK = True
+    for step in xrange( n_steps ):
+        IDs = np.random.randint( 0, nx * ny, n_changed )
+        DEM.flat[ IDs ] += np.random.normal( 0.0, 0.5, n_changed )
+        start = time.time()
+        d8.update_region( IDs, DEM=DEM )
+        time_region += (time.time() - start)
+        start = time.time()
+        d8b.update_grids( DEM=DEM )
+        time_full += (time.time() - start)
+        OK = OK and np.array_equal( d8.d8_grid, d8b.d8_grid ) and \
+             np.array_equal( d8.parent_ID_grid, d8b.parent_ID_grid ) and \
+             np.array_equal( d8.parent_IDs, d8b.parent_IDs ) and \
+             np.array_equal( d8.dw, d8b.dw ) and \
+             np.array_equal( d8.ds, d8b.ds ) and \
+             np.allclose( d8.A, d8b.A, rtol=1e-5 )
+
+    print 'PERIODIC =', PERIODIC
+    print 'Same D8 vars as update_grids() =', OK
+    print 'Run time for update_region() =', time_region, ' [secs]'
+    print 'Run time for update_grids()  =', time_full, ' [secs]'
+    print ' '
+    assert OK
+
+#   test_update_region()
+#---------------------------------------------------------------------
+def test_update_stream_grids(nx=200, ny=150, A_min=9000.0):
+
+    #---------------------------------------------------------
+    # Note: Compares the grids from update_stream_grids() to
+    #       ones found with loops over the pixels, in the
+    #       topological order, and by walking down from every
+    #       pixel for flow distance.
+    #---------------------------------------------------------
+    d8 = get_test_d8( nx, ny )
+    d8.ds = np.zeros( (ny, nx), dtype='Float32' ) + 30
+    d8.update_area_grid()
+
+    start = time.time()
+    d8.update_stream_grids( A_min=A_min )
+    run_time = (time.time() - start)
+
+    #-------------------------------
+    # Orders and links, with loops
+    #-------------------------------
+    n_pixels = nx * ny
+    down   = d8.downstream_ID
+    stream = d8.stream_mask.ravel()
+    kids   = [ [] for k in xrange( n_pixels ) ]
+    for ID in np.where( stream )[0]:
+        if (down[ ID ] >= 0):
+            kids[ down[ ID ] ].append( ID )
+    order  = np.zeros( n_pixels, dtype='Int32' )
+    shreve = np.zeros( n_pixels, dtype='Int32' )
+    for ID in d8.topo_order:
+        if not(stream[ ID ]):
+            continue
+        k_orders = [ order[ k ] for k in kids[ ID ] ]
+        if (len(k_orders) == 0):
+            order[ ID ]  = 1
+            shreve[ ID ] = 1
+        else:
+            m = max( k_orders )
+            order[ ID ]  = m + (k_orders.count( m ) >= 2)
+            shreve[ ID ] = sum( [ shreve[ k ] for k in kids[ ID ] ] )
+    #--------------------------------------------
+    # Pixels with one stream child are in the
+    # same link as that child, and no others
+    #--------------------------------------------
+    links = d8.link_IDs.ravel()
+    same  = True
+    for ID in np.where( stream )[0]:
+        if (len( kids[ ID ] ) == 1):
+            same = same and (links[ ID ] == links[ kids[ ID ][0] ])
+        else:
+            same = same and (links[ ID ] not in
+                             [ links[ k ] for k in kids[ ID ] ])
+    lengths = np.bincount( links, minlength=d8.n_links + 1 ) * 30.0
+    lengths[0] = 0
+
+    #-------------------------------
+    # Flow distance, by walking
+    #-------------------------------
+    dist = np.zeros( n_pixels )
+    for ID in d8.topo_order:
+        k = ID
+        while (down[ k ] >= 0):
+            dist[ ID ] += 30
+            k = down[ k ]
+    
+    SAME_ORDER   = np.array_equal( d8.strahler_order.ravel(), order )
+    SAME_SHREVE  = np.array_equal( d8.shreve_order.ravel(), shreve )
+    SAME_LENGTHS = np.allclose( d8.link_lengths, lengths )
+    SAME_DIST    = np.allclose( d8.flow_distance.ravel(), dist )
+    print 'Number of links         =', d8.n_links
+    print 'Same Strahler orders    =', SAME_ORDER
+    print 'Same Shreve magnitudes  =', SAME_SHREVE
+    print 'Same link IDs           =', same
+    print 'Same link lengths       =', SAME_LENGTHS
+    print 'Same flow distances     =', SAME_DIST
+    print 'Run time =', run_time, ' [secs]'
+    print ' '
+    assert SAME_ORDER and SAME_SHREVE and same
+    assert SAME_LENGTHS and SAME_DIST
+
+#   test_update_stream_grids()
+#---------------------------------------------------------------------
+def get_test_d8(nx, ny, PERIODIC=False, RANDOM_CODES=False):
+
+    d8 = d8_global.d8_component()
+    d8.nx = nx
+    d8.ny = ny
+    d8.LR_PERIODIC = PERIODIC
+    d8.TB_PERIODIC = PERIODIC
+    d8.RT3_TEST = False
+    d8.A_units = 'm^2'
+    d8.da      = np.float64( 900 )
+    d8.A       = np.zeros( (ny, nx), dtype='Float32' )
+    d8.get_flow_code_list()
+    d8.get_flow_code_list_opps()
+    d8.get_ID_grid()
+    d8.get_parent_inc_map()
+    d8.get_edge_IDs()
+    d8.get_not_edge_grid()
+    d8.get_resolve_array()
+    d8.get_valid_code_map()
+    class rti_info:
+        n_pixels = nx * ny
+    d8.rti = rti_info()
+
+    #----------------------------------------------------
+    # Steepest-descent codes for a tilted, random DEM,
+    # or just random codes.  Pits get a code of zero.
+    #----------------------------------------------------
+    np.random.seed( 34 )
+    codes = d8.code_list
+    if (RANDOM_CODES):
+        d8_grid = codes[ np.random.randint( 0, 8, (ny, nx) ) ]
+    else:
+        DEM = np.random.random( (ny, nx) ) + np.arange( nx ) * 0.05
+        incs = [(-1,1), (0,1), (1,1), (1,0), (1,-1), (0,-1), (-1,-1), (-1,0)]
+        slopes = np.zeros( (8, ny, nx) )
+        for k in xrange(8):
+            (di, dj) = incs[k]
+            z = np.roll( np.roll( DEM, -di, axis=0 ), -dj, axis=1 )
+            slopes[k] = (DEM - z) / np.sqrt( di**2 + dj**2 )
+        d8_grid = codes[ np.argmax( slopes, axis=0 ) ]
+        d8_grid[ slopes.max( axis=0 ) <= 0 ] = 0
+    d8_grid = np.uint8( d8_grid )
+    if not(PERIODIC):
+        d8_grid[:, 0] = 0
+        d8_grid[:, nx - 1] = 0
+        d8_grid[0, :] = 0
+        d8_grid[ny - 1, :] = 0
+    d8.d8_grid = d8_grid
+    d8.update_parent_ID_grid()
+    return d8
+
+#   get_test_d8()
+#---------------------------------------------------------------------
@@ -0,0 +1,96 @@
+## Copyright (c) 2014, Scott D. Peckham
+## October 2014
+## Unit tests for "d8_tiles.py" in "components" folder.
+
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from topoflow.components import d8_tiles
+from topoflow.utils      import rtg_files
+from topoflow.utils      import rti_files
+
+#-------------------------------------------------------------------------
+#
+# test_preprocess()   # compare to d8_global, for several tile sizes
+# make_test_DEM()
+#
+#-------------------------------------------------------------------------
+def test_preprocess(nx=300, ny=200, PERIODIC=False):
+
+    #-------------------------------------------------------------
+    # Note: The DEM has valleys that wind up and down across
+    #       many tiles, so that flow leaves and re-enters tiles
+    #       many times.  All of the grids from preprocess()
+    #       should be the same as those from d8_global for the
+    #       whole DEM in memory, for any number of tile rows.
+    #-------------------------------------------------------------
+    temp_dir = tempfile.mkdtemp( prefix='d8_tiles_' )
+    try:
+        (DEM_file, rti, DEM) = make_test_DEM( temp_dir, nx, ny )
+
+        #----------------------------------
+        # D8 grids for DEM in memory
+        #----------------------------------
+        d8 = d8_tiles.get_d8( rti, PERIODIC, PERIODIC )
+        d8.BREAK_TIES = True
+        d8.DEBUG      = False
+        d8.RT3_TEST   = False
+        d8.A_units    = 'km^2'
+        d8.da = np.float64( d8.dx[0] * d8.dy[0] )
+        d8.A  = np.zeros( (ny, nx), dtype='Float32' )
+        d8.dw = np.zeros( (ny, nx), dtype='Float32' )
+        d8.ds = np.zeros( (ny, nx), dtype='Float32' )
+        d8.get_ID_grid()
+        d8.get_parent_inc_map()
+        d8.update_flow_grid( DEM=DEM )
+        d8.update_parent_ID_grid()
+        d8.update_flow_width_grid()
+        d8.update_flow_length_grid()
+        d8.update_area_grid()
+
+        prefix = os.path.join( temp_dir, 'Test' )
+        for tile_rows in [1, 7, 64, ny]:
+            d8_tiles.preprocess( DEM_file, rti=rti, tile_rows=tile_rows,
+                                 LR_PERIODIC=PERIODIC, TB_PERIODIC=PERIODIC )
+            codes = rtg_files.read_grid( prefix + '_flow.rtg', rti, 'BYTE' )
+            pIDs  = rtg_files.read_grid( prefix + '_pID.rtg',  rti, 'LONG' )
+            dw    = rtg_files.read_grid( prefix + '_dw.rtg',   rti, 'FLOAT' )
+            ds    = rtg_files.read_grid( prefix + '_ds.rtg',   rti, 'FLOAT' )
+            A     = rtg_files.read_grid( prefix + '_area.rtg', rti, 'FLOAT' )
+            SAME_CODES = np.array_equal( codes, d8.d8_grid )
+            SAME_PIDS  = np.array_equal( pIDs, d8.parent_ID_grid % rti.n_pixels )
+            SAME_DW_DS = np.array_equal( dw, d8.dw ) and np.array_equal( ds, d8.ds )
+            SAME_AREAS = np.allclose( A, d8.A, rtol=1e-6 )
+            print 'PERIODIC, tile_rows =', PERIODIC, tile_rows
+            print '    Same codes      =', SAME_CODES
+            print '    Same parent IDs =', SAME_PIDS
+            print '    Same dw and ds  =', SAME_DW_DS
+            print '    Same areas      =', SAME_AREAS
+            assert SAME_CODES and SAME_PIDS
+            assert SAME_DW_DS and SAME_AREAS
+        print 'max(A) =', d8.A.max(), ' [km^2]'
+        print ' '
+    finally:
+        shutil.rmtree( temp_dir, ignore_errors=True )
+
+#   test_preprocess()
+#-------------------------------------------------------------------------
+def make_test_DEM( directory, nx, ny ):
+
+    np.random.seed( 34 )
+    rows = np.arange( ny, dtype='Float64' ).reshape( ny, 1 )
+    cols = np.arange( nx, dtype='Float64' ).reshape( 1, nx )
+    DEM  = 20 * np.sin( cols / 11.0 ) * np.cos( rows / 17.0 )
+    DEM += (cols * 0.3) + np.random.random( (ny, nx) )
+    DEM  = np.float32( DEM )
+
+    DEM_file = os.path.join( directory, 'Test_DEM.rtg' )
+    rti = rti_files.make_info( DEM_file, nx, ny, 30.0, 30.0 )
+    rti_files.write_info( DEM_file, rti )
+    rtg_files.write_grid( DEM, DEM_file, rti )
+    return (DEM_file, rti, DEM)
+
+#   make_test_DEM()
+#-------------------------------------------------------------------------
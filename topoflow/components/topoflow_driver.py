@@ -93,6 +93,8 @@ from topoflow.utils import tf_utils   # (must come after the "from" line ???)
 #-----------------------------------------------------------------------
 class topoflow_driver( BMI_base.BMI_component ):
 
+    PACKED_OK = True   # (see BMI_base.enable_packed_domain())
+
     #-------------------------------------------------------------------
     # Don't define an __init__() function.
     # We need to inherit the BMI_base.__init__()
@@ -1316,6 +1318,7 @@ class topoflow_driver( BMI_base.BMI_component ):
         TF_Print('vol_GW:          ' + str(vol_GW) + ' [m^3]')
         TF_Print('vol_R:           ' + str(vol_R)  + ' [m^3]')
         TF_Print(' ')
+        self.print_profile_report( comp_name )
         
         #---------------------
         # Write to logfile ?
@@ -15,6 +15,43 @@
 #-----------------------------------------------------------------------      
 ## Copyright (c) 2012-2014, Scott D. Peckham
 ##
+## Oct   2014. Added topology_dir option to run_model(), to save
+##             and reuse D8 variables (see tf_d8_base.py).
+##
+## Oct   2014. Added packed_domain option to run_model(), to
+##             run components on basin pixels only.
+##
+## Oct   2014. Added event_driven option to run_model().  A heap
+##             of next update times replaces the framework dt,
+##             so components can have variable time steps.
+##
+## Oct   2014. Added initialize_unit_conversions().  Units are
+##             checked once and get_required_vars() converts
+##             values in place, only when units differ.
+##
+## Oct   2014. Added save_checkpoint() and load_checkpoint(), and
+##             checkpoint and restart options to run_model().
+##
+## Oct   2014. Added profile option to run_model().  Components
+##             time their methods and a JSON report is saved.
+##
+## Oct   2014. Added run_ensemble(), to run many members in a
+##             process pool, with static grids in shared memory.
+##
+## Oct   2014. Added n_threads option to run_model().  Components
+##             with no data dependency on each other are updated
+##             in parallel, in a thread pool.
+##
+## Oct   2014. Added static_schedule option to run_model().  The
+##             order of component updates is computed once, over
+##             the LCM of the time steps, by initialize_schedule().
+##
+## Oct   2014. Added coupling_method = 'References' to run_model().
+##             Users are bound once to provider arrays by
+##             bind_provided_vars() and check_bound_vars()
+##             enforces the in-place update contract.  A rebind
+##             is an error unless allow_rebind is True.
+##
 ## Apr   2013. Added automatic time interpolation, using new
 ##             time_interpolator class in time_interpolation.py.
 ##
@@ -69,6 +106,7 @@
 #  class framework()
 #
 #      read_repository()
+#      load_repository_index()            ## (10/14)
 #      read_provider_file()
 #      comp_name_valid()
 #      comp_set_complete()
@@ -97,11 +135,25 @@
 #      go()
 #      run_model_old()
 #      run_model()                   # (4/18/13. New way to set refs.)
+#      update_comp()                 # (10/14)
+#      start_profiling()             # (10/14)
+#      write_profile_report()        # (10/14)
+#      save_checkpoint()             # (10/14)
+#      load_checkpoint()             # (10/14)
+#      run_ensemble()                # (10/14)
+#      make_ensemble_template()
 #      run_rc_script()               # Not ready yet.
 #      -------------------------
 #      initialize_time_vars()
 #      convert_time_units()
 #      initialize_framework_dt()
+#      initialize_schedule()         # (10/14)
+#      time_to_fraction()
+#      get_scheduled_ports()
+#      initialize_event_queue()      # (10/14)
+#      get_comp_time()
+#      get_next_event()
+#      push_events()
 #      update_time()
 #
 #      ---------------------------------
@@ -111,21 +163,42 @@
 #      check_var_users_and_providers()
 #      initialize_and_connect_comp_set()  ## (used before 2/18/13)
 #      initialize_comp_set()              ## (2/18/13)
+#      initialize_unit_conversions()      ## (10/14)
 #      get_required_vars()                ## (4/18/13)
 #      set_provided_vars()                ## (2/18/13)
+#      bind_provided_vars()               ## (10/14)
+#      check_bound_vars()                 ## (10/14)
+#      initialize_dependencies()          ## (10/14)
+#      get_update_waves()                 ## (10/14)
+#
+#  run_ensemble_member()      # (function, for process pool)
+#  parse_repository_file()    # (function, 10/14)
 #
 #-----------------------------------------------------------------------
 
+import cPickle
+import fractions
+import glob
+import heapq
+import importlib
+import json
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy
 import os
+import shutil
 # import sys
+import tempfile
 import time
-# import traceback
+import traceback
 # import wx
-import xml.dom.minidom
+# import xml.dom.minidom   # (imported by parse_repository_file())
 
 from topoflow.framework import time_interpolation    # (time_interpolator class)
-# from topoflow.framework import unit_conversion
+from topoflow.framework import unit_conversion
+from topoflow.utils import packed_domain as packed_domains
+from topoflow.utils import shared_grids
+from topoflow.utils import template_files
 # from topoflow.framework import grid_remapping
 
 # import OrderedDict_backport  # (for Python 2.4 to 2.7)
@@ -164,7 +237,7 @@ framework_dir = framework_dir + os.sep
 parent_dir    = parent_dir    + os.sep
 examples_dir  = examples_dir  + os.sep
 
-SILENT = False
+SILENT = True
 if not(SILENT):
 	print ' '
 	print 'Paths for this package:'
@@ -182,7 +255,14 @@ paths = dict()
 paths['framework']        = framework_dir
 paths['examples']         = examples_dir
 paths['framework_parent'] = parent_dir
-    
+
+#----------------------------------------------------------
+# Component repository index, shared by all EMELI objects
+# in this process.  Key is the full path to the XML file,
+# value is ((st_mtime, st_size), comp_records).  (10/14)
+#----------------------------------------------------------
+repository_cache = dict()
+
 #-----------------------------------------------------------------------
 class comp_data():
     
@@ -251,6 +331,15 @@ class framework():
     secs_per_year  = 365 * secs_per_day
     secs_per_month = secs_per_year / 12    #########
 
+    #----------------------------------------------------
+    # Default coupling method. run_model() resets this.
+    # 'Values'     = get_required_vars() in time loop
+    # 'References' = bind_provided_vars() just once
+    #----------------------------------------------------
+    coupling_method = 'Values'
+    allow_rebind    = False   # (see check_bound_vars())
+    PROFILE         = False   # (see run_model())
+
 # 	##################################################################
 # 	# NOTE:  "get_package_paths" will not work as intended on Python
 # 	# versions less than 3.4 if os.chddir() is called between two
@@ -305,16 +394,7 @@ class framework():
         #---------------------------------------------------
         # Read a file that contains static information for
         # all components in the repository.
-        #---------------------------------------------------------
-        # Notes:  It is helpful to have a look at the DOM specs,
-        #         which can be found online at:
-        #         http://www.w3.org/TR/1998/REC-DOM-Level-1-
-        #                19981001/introduction.html
-        #                (see the tree diagram)
-        #         http://www.w3.org/TR/1998/REC-DOM-Level-1-
-        #                19981001/level-one-core.html
-        #                (search for "firstChild")
-        #---------------------------------------------------------
+        #---------------------------------------------------
 
         #---------------------------------------------------------
         # (11/4/13) Now the component repository file is always
@@ -329,35 +409,20 @@ class framework():
         repo_file = 'component_repository.xml'
         comp_repo_file = repo_dir + repo_file
 
-        #----------------------------------------
-        # Make sure comp_repo_file was found
-        #----------------------------------------
-        ########
-    
         if not(SILENT):
             print 'Reading info from comp_repo_file:'
             print '    ' + comp_repo_file
             print ' '
-        
-        #-------------------------------------------
-        # Read all component info from an XML file
-        # into a big string called "doc_string"
-        #-------------------------------------------
-        repo_unit = open( comp_repo_file, 'r' )
-        doc_string = repo_unit.read()
-        dom = xml.dom.minidom.parseString( doc_string )
 
-        #----------------------------------------------
-        # Count all tags in XML file of various types
-        #----------------------------------------------
-        C_elements = dom.firstChild.getElementsByTagName("component") 
-        n_comps    = len(C_elements)
-        if (n_comps == 0):
-            print '########################################'
-            print ' ERROR: Component repository XML file'
-            print '        has no "component" tags.'
-            print '########################################'
-            print ' '
+        #---------------------------------------------------------
+        # (10/14) Parsing the XML file with minidom is the slow
+        # part, so the parsed records are cached in memory and
+        # in a pickle file.  Both are only used if the XML file
+        # has the same modification time and size as when they
+        # were created.
+        #---------------------------------------------------------
+        comp_records = self.load_repository_index( comp_repo_file )
+        if (comp_records is None):
             return
             
         #------------------------------------------------------
@@ -368,106 +433,78 @@ class framework():
         self.comp_info = dict()
         self.repo_list = []      # (for all component names)
         
-        #------------------------------------------------
-        # For each component, get all of its attributes
-        # and store them in a "comp_data" object.
-        #------------------------------------------------
-        for comp in C_elements:
-            nodes = comp.getElementsByTagName("comp_name")
-            comp_name = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("model_name")
-            model_name = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("version")
-            version = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("language")
-            language = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("author")
-            author = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("embed_name")   #######
-            embed_name = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("port_name")
-            port_name = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("class_name")
-            class_name = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("module_name")
-            module_name = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("module_path")
-            module_path = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("gui_xml_file")
-            gui_xml_file = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("help_url")
-            help_url = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("cfg_template")
-            cfg_template = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("var_prefix")
-            var_prefix = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("time_step_type")
-            time_step_type = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("time_units")
-            time_units = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("grid_type")
-            grid_type = nodes[0].firstChild.data.strip()
-            #-----------------------------------------------------
-            nodes = comp.getElementsByTagName("description")
-            description = nodes[0].firstChild.data.strip()
-            #-------------------------------------------------------------
-            nodes = comp.getElementsByTagName("uses_ports")
-            uses_port_list = nodes[0].firstChild.data.strip().split(",")
-
-            #----------------------------------------------------
-            # Without the "str()", get extra "u'" when printing.
-            #-----------------------------------------------------           
-            for k in xrange( len(uses_port_list) ):
-                uses_port_list[k] = str(uses_port_list[k].strip())
-                
-            #----------------------------------------
-            # Store comp data in "comp_data" object
-            # Note: "uses_ports" is a Python list.
-            #----------------------------------------
-            new_comp_data = comp_data(comp_name=comp_name,
-                                      model_name=model_name,
-                                      version=version,
-                                      language=language,
-                                      author=author,
-                                      embed_name=embed_name,
-                                      port_name=port_name,
-                                      class_name=class_name,
-                                      module_name=module_name,
-                                      module_path=module_path,
-                                      gui_xml_file=gui_xml_file,
-                                      help_url=help_url,
-                                      cfg_template=cfg_template,
-                                      var_prefix=var_prefix,
-                                      time_step_type=time_step_type,
-                                      time_units=time_units,
-                                      grid_type=grid_type,
-                                      description=description,
-                                      uses_ports=uses_port_list )
-           
-            #-----------------------------------------------        
-            # Put comp_data in dictionary; key = comp_name
-            #-----------------------------------------------
+        #-----------------------------------------------
+        # Put comp_data in dictionary; key = comp_name
+        #-----------------------------------------------
+        for record in comp_records:
+            new_comp_data = comp_data( **record )
+            comp_name     = record['comp_name']
             self.comp_info[ comp_name ] = new_comp_data
             self.repo_list.append( comp_name )
 
     #   read_repository()
     #-------------------------------------------------------------------
+    def load_repository_index( self, comp_repo_file ):
+
+        #---------------------------------------------------------
+        # Note: Returns a list of dictionaries, one per component,
+        #       with the keyword arguments for comp_data().  The
+        #       cache file is written next to the XML file or, if
+        #       that directory is read-only, in the temp directory.
+        #---------------------------------------------------------
+        stats     = os.stat( comp_repo_file )
+        file_key  = (stats.st_mtime, stats.st_size)
+        if (comp_repo_file in repository_cache):
+            cache_key, comp_records = repository_cache[ comp_repo_file ]
+            if (cache_key == file_key):
+                return comp_records
+
+        cache_files = [ comp_repo_file + '.cache',
+                        os.path.join( tempfile.gettempdir(),
+                                      'topoflow_' + os.path.basename(comp_repo_file) +
+                                      '.cache' ) ]
+        for cache_file in cache_files:
+            try:
+                cache_unit = open( cache_file, 'rb' )
+                cache_data = cPickle.load( cache_unit )
+                cache_unit.close()
+            except Exception:
+                continue
+            if (cache_data.get('path') == comp_repo_file) and \
+               (cache_data.get('key')  == file_key):
+                comp_records = cache_data['records']
+                repository_cache[ comp_repo_file ] = (file_key, comp_records)
+                return comp_records
+
+        comp_records = parse_repository_file( comp_repo_file )
+        if (comp_records is None):
+            return None
+        repository_cache[ comp_repo_file ] = (file_key, comp_records)
+
+        #------------------------------------------------
+        # Write the cache file.  A failure is harmless;
+        # the XML file will just be parsed next time.
+        #------------------------------------------------
+        cache_data = {'path':comp_repo_file, 'key':file_key,
+                      'records':comp_records}
+        for cache_file in cache_files:
+            try:
+                temp_file  = cache_file + '.' + str(os.getpid())
+                cache_unit = open( temp_file, 'wb' )
+                cPickle.dump( cache_data, cache_unit, cPickle.HIGHEST_PROTOCOL )
+                cache_unit.close()
+                os.rename( temp_file, cache_file )   # (atomic on POSIX)
+                break
+            except Exception:
+                try:
+                    os.remove( temp_file )
+                except OSError:
+                    pass
+                
+        return comp_records
+    
+    #   load_repository_index()
+    #-------------------------------------------------------------------
     def read_provider_file(self, SILENT=False):
 
         #-----------------------------------------------------
@@ -713,9 +750,15 @@ class framework():
         # place it in the framework.
         #--------------------------------------------
         ## print '### full_module_name = ', full_module_name
-        cmd = 'from topoflow.components import ' + module_name
-        exec( cmd )
-        exec( 'comp = ' + module_name + '.' + class_name + '()' )
+        ## cmd = 'from topoflow.components import ' + module_name
+        ## exec( cmd )
+        ## exec( 'comp = ' + module_name + '.' + class_name + '()' )
+        #-------------------------------------------------------
+        # (10/14) Only the components named in the provider
+        # file are imported, and each only once per process.
+        #-------------------------------------------------------
+        module = importlib.import_module( full_module_name )
+        comp   = getattr( module, class_name )()
 
         #--------------------------------------------
         # Import the module (no .py extension) and
@@ -1234,7 +1277,10 @@ class framework():
             # latest vars that this component needs from
             # other components.
             #---------------------------------------------
-            self.get_required_vars( port_name, bmi_time )
+            # Bound references are already up to date.
+            #---------------------------------------------
+            if (self.coupling_method != 'References'):
+                self.get_required_vars( port_name, bmi_time )
 
             #-----------------------------------------------
             # This finalize() call will now have access to
@@ -1417,8 +1463,85 @@ class framework():
     #-------------------------------------------------------------------
     def run_model( self, driver_port_name='hydro_model',
                    cfg_directory=None, cfg_prefix=None,
-                   time_interp_method='Linear'):
+                   time_interp_method='Linear',
+                   coupling_method='Values',
+                   static_schedule=False, n_threads=1,
+                   profile=False, checkpoint_file=None,
+                   checkpoint_interval=None, restart_file=None,
+                   event_driven=False, packed_domain=False,
+                   topology_dir=None, allow_rebind=False):
         ## (rename to run_comp_set ????)
+
+        #-----------------------------------------------------------
+        # Notes: coupling_method can be 'Values' or 'References'.
+        #
+        #        'Values' calls get_required_vars() before every
+        #        component update, which gets time-interpolated
+        #        values from the time_interpolator and then calls
+        #        set_values() on the user.
+        #
+        #        'References' resolves every provider/user pair
+        #        just once (see bind_provided_vars()) so that each
+        #        user holds a reference to the provider's ndarray.
+        #        No values are copied in the time loop.  This
+        #        requires providers to update shared vars in place,
+        #        which is checked by check_bound_vars().  Users then
+        #        always see the provider's latest values, so time
+        #        interpolation is not available ('None' is used).
+        #        A provider that rebinds a shared var stops the run
+        #        with an error, unless allow_rebind is True.  Then
+        #        a warning is printed and all of its users rebound.
+        #
+        #        If static_schedule is True, the order of component
+        #        updates is computed once by initialize_schedule(),
+        #        if possible, and then replayed in the time loop.
+        #        Otherwise (the default), the time of every component
+        #        is checked on every framework time step.
+        #
+        #        If n_threads > 1, the components that are due for
+        #        an update on a time step are run in "waves" in a
+        #        pool of threads.  Components in a wave have no
+        #        data dependency on each other; see the notes for
+        #        initialize_dependencies().  This only helps if
+        #        their updates spend most of their time in NumPy
+        #        (which releases the GIL), so grids must be large.
+        #
+        #        If profile is True, every component records the
+        #        time spent in initialize(), update(), finalize()
+        #        and its update_*() methods, and the bytes moved by
+        #        get_values() and set_values().  The framework also
+        #        records the time spent coupling each component.
+        #        A report is printed and saved in a JSON file.
+        #        See write_profile_report().
+        #
+        #        If event_driven is True, the framework clock jumps
+        #        to the next time when a component is due, using a
+        #        heap of their next update times (see the notes for
+        #        initialize_event_queue()).  This is best when time
+        #        steps are very different or variable (adaptive),
+        #        e.g. for GC2D or Erode.  static_schedule is then
+        #        not used.
+        #
+        #        If checkpoint_file is given, the full state of the
+        #        run is saved in it every checkpoint_interval (in
+        #        framework time units, i.e. seconds) and at the end.
+        #        If restart_file is given, the run starts from the
+        #        state saved in it.  See save_checkpoint() and
+        #        load_checkpoint().
+        #
+        #        If packed_domain is True, components that support
+        #        it only store and update the pixels of the basin
+        #        in "<site_prefix>_basin.rtm" (and the pixels they
+        #        flow to), as 1D "packed" grids.  Output grids are
+        #        unpacked to the full grid.  See the notes in
+        #        utils/packed_domain.py.
+        #
+        #        If topology_dir is a directory, the D8 variables
+        #        of components that embed a D8 component (channels
+        #        and satzone) are saved there in ".npz" files and
+        #        read back by later runs, unless a CFG file sets
+        #        its own "topology_dir".  See utils/tf_d8_base.py.
+        #-----------------------------------------------------------
         
         #-------------------
         # Default settings
@@ -1431,6 +1554,17 @@ class framework():
         if (cfg_directory == None):
             print 'ERROR: The "cfg_directory" argument is required.'
             return
+        if (coupling_method not in ['Values', 'References']):
+            print 'ERROR: coupling_method must be "Values" or "References".'
+            return
+        self.coupling_method = coupling_method
+        self.allow_rebind    = allow_rebind
+        BY_REFERENCE = (coupling_method == 'References')
+        if (BY_REFERENCE) and (time_interp_method != 'None'):
+            print 'NOTE: coupling_method = "References" does not'
+            print '      support time interpolation.  Using "None".'
+            print ' '
+            time_interp_method = 'None'
         
         #--------------------------------------------------
         # (11/4/13) Expand things like ".." and "~", then
@@ -1479,6 +1613,30 @@ class framework():
         for comp_name in self.comp_set_list:
             self.instantiate( comp_name, SILENT=False )
         ### self.instantiate_all()   ### Later; change it first.
+
+        #----------------------------------------------
+        # Turn on profiling before initialize() calls
+        #----------------------------------------------
+        self.PROFILE = profile
+        if (profile):
+            self.start_profiling()
+
+        #--------------------------------------------------
+        # Turn on packed domains before initialize() calls
+        #--------------------------------------------------
+        if (packed_domain):
+            packed_domains.clear_domains()
+            for port_name in self.provider_list:
+                self.comp_set[ port_name ].enable_packed_domain()
+
+        #-----------------------------------------------------
+        # Set the directory for saved D8 variables before
+        # initialize() calls.  (A CFG file setting overrides
+        # this one, since it is read in initialize().)
+        #-----------------------------------------------------
+        if (topology_dir is not None):
+            for port_name in self.provider_list:
+                self.comp_set[ port_name ].topology_dir = topology_dir
        
         #---------------------------------------------
         # Try to automatically connect every user to
@@ -1537,7 +1695,63 @@ class framework():
         # and by get_required_vars() in run_model().
         #---------------------------------------------------------
         self.time_interpolator = time_interpolator
-        
+
+        #----------------------------------------------
+        # Check units of all shared vars, just once.
+        #----------------------------------------------
+        self.initialize_unit_conversions()
+
+        #-------------------------------------------------
+        # Bind users to provider arrays, just once.
+        # Must come after time_interpolator.initialize()
+        # since that calls bmi.update() on every comp.
+        #-------------------------------------------------
+        if (BY_REFERENCE):
+            self.bind_provided_vars()
+
+        #------------------------------------------------
+        # Precompute the periodic update schedule, if
+        # all component time steps are fixed.
+        #------------------------------------------------
+        SCHEDULED = False
+        if (static_schedule) and not(event_driven):
+            SCHEDULED = self.initialize_schedule()
+
+        #------------------------------------------------
+        # Start a thread pool for parallel updates, and
+        # find which components depend on each other.
+        #------------------------------------------------
+        POOL = None
+        if (n_threads > 1):
+            self.initialize_dependencies()
+            POOL = ThreadPool( n_threads )
+            print 'Using', n_threads, 'threads for component updates.'
+            print ' '
+        def update( port_name ):
+            self.update_comp( port_name, (SCHEDULED or event_driven),
+                              BY_REFERENCE )
+
+        #-------------------------------------------------
+        # Restart from a checkpoint?  Must come after the
+        # schedule, which starts from time_index = 0.
+        #-------------------------------------------------
+        if (restart_file is not None):
+            OK = self.load_checkpoint( restart_file )
+            if not(OK):
+                return
+        if (checkpoint_file is not None) and (checkpoint_interval is not None):
+            next_checkpoint = self.time + checkpoint_interval
+        else:
+            next_checkpoint = None
+
+        #-----------------------------------------------
+        # Event-driven clock (after any restart, since
+        # it starts from the current component times)
+        #-----------------------------------------------
+        if (event_driven):
+            self.initialize_event_queue()
+            (event_time, port_names) = self.get_next_event()
+            
         while not(self.DONE):
 
             # try:
@@ -1553,67 +1767,562 @@ class framework():
             #     port_name     -> provider_name
             #     provider_list -> provider_list
             #----------------------------------------------------
+            # With a static schedule, only loop over the
+            # components that are due for an update.
+            #----------------------------------------------------
+            # With the event-driven clock, port_names are
+            # the components that are due at event_time.
+            #----------------------------------------------------
+            if (event_driven):
+                pass
+            elif (SCHEDULED):
+                port_names = self.get_scheduled_ports()
+            else:
+                port_names = self.provider_list
+            
             ## for bmi in self.comp_set:
-            for port_name in self.provider_list:
-                bmi = self.comp_set[ port_name ]
-
-                #-----------------------------------------------------
-                # Get current time of component with this port_name.
-                # Convert units to framework time units, if needed.
-                #-----------------------------------------------------
-                bmi_time_units = bmi.get_time_units()
-                bmi_time       = bmi.get_current_time()
-                bmi_time = self.convert_time_units( bmi_time, bmi_time_units )
-
-                #------------------------------------
-                # Is it time to call bmi.update() ?
-                #------------------------------------
-                if (self.time > bmi_time):
-                    #---------------------------------------------
-                    # Use get_values()/set_values() calls to get
-                    # latest vars that this component needs from
-                    # other components.
-                    #---------------------------------------------
-                    self.get_required_vars( port_name, bmi_time )
-                    
-                    bmi.update( -1.0 )
-                    
-                    #--------------------------------------------------
-                    # Update time interpolation vars for every
-                    # long_var_name that is provided by this provider.
-                    # Interpolation methods = 'None', 'Linear', etc.
-                    #--------------------------------------------------
-                    time_interpolator.update2( port_name )
-        
-                #------------------------------------------------
-                # (2/18/13) Use get_values()/set_values() calls
-                # here to set latest vars from this component
-                # into all user components that need it.
-                #------------------------------------------------
-                # This also calls service components as needed.
-                #------------------------------------------------
-                # self.set_provided_vars( port_name )
+            if (POOL is None):
+                for port_name in port_names:
+                    update( port_name )
+            else:
+                for wave in self.get_update_waves( port_names ):
+                    if (len(wave) == 1):
+                        update( wave[0] )
+                    else:
+                        POOL.map( update, wave )
      
             #--------------------
             # Are we done yet ?
             #--------------------
             self.DONE = (driver.DONE or self.DONE)    ####
-            self.update_time()
+            if (event_driven):
+                self.push_events( port_names, event_time )
+                (event_time, port_names) = self.get_next_event()
+                if (event_time is None):
+                    print 'NOTE: No component times can advance.'
+                    print ' '
+                    self.DONE = True
+                else:
+                    self.update_time( event_time - self.time )
+            else:
+                self.update_time()
             ## print 'time =', self.time
+
+            if (next_checkpoint is not None) and \
+               (self.time >= next_checkpoint) and not(self.DONE):
+                self.save_checkpoint( checkpoint_file )
+                while (next_checkpoint <= self.time):
+                    next_checkpoint += checkpoint_interval
                 
 ##            except:
 ##                print 'ERROR in run_model() method at:'
 ##                print '   time_index =', self.time_index
 ##                self.status = 'failed'
 ##                self.DONE = True
-                
+
+        if (POOL is not None):
+            POOL.close()
+            POOL.join()
+
+        #---------------------------------------------
+        # Save the final state, e.g. after a spin-up
+        #---------------------------------------------
+        if (checkpoint_file is not None):
+            self.save_checkpoint( checkpoint_file )
+            
         #-------------------------
         # Finalize the model run
         #-------------------------
         self.finalize_all()
+        if (profile):
+            self.write_profile_report()
             
     #   run_model()
     #-------------------------------------------------------------------
+    def update_comp( self, port_name, SCHEDULED=False,
+                     BY_REFERENCE=False ):
+
+        #-----------------------------------------------------------
+        # Note: This is called by run_model() for each component
+        #       in provider_list (or in the static schedule) on
+        #       every framework time step, possibly in a thread.
+        #-----------------------------------------------------------
+        bmi = self.comp_set[ port_name ]
+
+        #-----------------------------------------------------
+        # Get current time of component with this port_name.
+        # Convert units to framework time units, if needed.
+        #-----------------------------------------------------
+        # Not needed for scheduled updates with References.
+        #-----------------------------------------------------
+        if not(SCHEDULED and BY_REFERENCE):
+            bmi_time_units = bmi.get_time_units()
+            bmi_time       = bmi.get_current_time()
+            bmi_time = self.convert_time_units( bmi_time, bmi_time_units )
+
+        #------------------------------------
+        # Is it time to call bmi.update() ?
+        #------------------------------------
+        if not(SCHEDULED) and not(self.time > bmi_time):
+            return
+        if (self.PROFILE):
+            stats = self.coupling_profile[ port_name ]
+            start_time = time.time()
+        
+        #---------------------------------------------
+        # Use get_values()/set_values() calls to get
+        # latest vars that this component needs from
+        # other components.
+        #---------------------------------------------
+        if not(BY_REFERENCE):
+            self.get_required_vars( port_name, bmi_time )
+        if (self.PROFILE):
+            update_time = time.time()
+            stats[ 'get_required_vars' ] += (update_time - start_time)
+        
+        bmi.update( -1.0 )
+        if (self.PROFILE):
+            start_time = time.time()
+            stats[ 'update' ] += (start_time - update_time)
+        
+        #--------------------------------------------------
+        # Update time interpolation vars for every
+        # long_var_name that is provided by this provider.
+        # Interpolation methods = 'None', 'Linear', etc.
+        #--------------------------------------------------
+        # With bound references, just check that this
+        # provider updated its shared vars in place.
+        #--------------------------------------------------
+        if (BY_REFERENCE):
+            self.check_bound_vars( port_name )
+        else:
+            self.time_interpolator.update2( port_name )
+        if (self.PROFILE):
+            stats[ 'update_coupling' ] += (time.time() - start_time)
+            stats[ 'calls' ] += 1
+
+        #------------------------------------------------
+        # (2/18/13) Use get_values()/set_values() calls
+        # here to set latest vars from this component
+        # into all user components that need it.
+        #------------------------------------------------
+        # This also calls service components as needed.
+        #------------------------------------------------
+        # self.set_provided_vars( port_name )
+            
+    #   update_comp()
+    #-------------------------------------------------------------------
+    def start_profiling( self ):
+
+        #----------------------------------------------------------
+        # Note: Turns on profiling in every component in comp_set
+        #       (see BMI_base.enable_profiling()) and sets up the
+        #       framework's own timers for coupling, in seconds.
+        #----------------------------------------------------------
+        self.coupling_profile = dict()
+        for port_name in self.provider_list:
+            self.comp_set[ port_name ].enable_profiling()
+            self.coupling_profile[ port_name ] = {
+                'calls': 0, 'get_required_vars': 0.0,
+                'update': 0.0, 'update_coupling': 0.0 }
+        self.profile_start_time = time.time()
+            
+    #   start_profiling()
+    #-------------------------------------------------------------------
+    def write_profile_report( self, json_file=None, SILENT=False ):
+
+        #----------------------------------------------------------
+        # Notes: Saves the profiling data for all components in
+        #        a JSON file and prints a summary, with one line
+        #        per component, sorted by total time.  Default
+        #        file is "<case_prefix>_profile.json" in the
+        #        driver's output directory.
+        #
+        #        "update" is the time spent in bmi.update() calls
+        #        from the time loop.  "coupling" is the time the
+        #        framework spent getting and setting its vars
+        #        (get_required_vars()) and updating the time
+        #        interpolator (or checking bound references).
+        #----------------------------------------------------------
+        components = dict()
+        for port_name in self.provider_list:
+            bmi = self.comp_set[ port_name ]
+            info = bmi.get_profile()
+            if (info is None):
+                info = dict()
+            info[ 'comp_name' ] = bmi.get_attribute( 'comp_name' )
+            info[ 'coupling' ]  = self.coupling_profile[ port_name ]
+            components[ port_name ] = info
+
+        report = { 'cfg_directory':   self.cfg_directory,
+                   'cfg_prefix':      self.cfg_prefix,
+                   'coupling_method': self.coupling_method,
+                   'n_time_steps':    int( self.time_index ),
+                   'run_time':        time.time() - self.profile_start_time,
+                   'components':      components }
+
+        if (json_file == None):
+            driver = self.comp_set[ self.provider_list[0] ]
+            for bmi in self.comp_set.values():
+                if (getattr( bmi, 'mode', None ) == 'driver'):
+                    driver = bmi
+            out_directory = getattr( driver, 'out_directory', None )
+            case_prefix   = getattr( driver, 'case_prefix', None )
+            if (out_directory == None) or (case_prefix == None):
+                out_directory = self.cfg_directory + os.sep
+                case_prefix   = self.cfg_prefix
+            json_file = out_directory + case_prefix + '_profile.json'
+        json_unit = open( json_file, 'w' )
+        json.dump( report, json_unit, indent=2, sort_keys=True )
+        json_unit.close()
+        
+        if (SILENT):
+            return report
+
+        #--------------------------------------------
+        # Print a summary table for all components
+        #--------------------------------------------
+        def total_time( port_name ):
+            coupling = components[ port_name ][ 'coupling' ]
+            return (coupling['get_required_vars'] + coupling['update'] +
+                    coupling['update_coupling'])
+        port_names = list( self.provider_list )
+        port_names.sort( key=lambda name: -total_time(name) )
+        print 'Profile summary (time in seconds):'
+        print '    ' + 'port_name'.ljust(16) + 'updates'.rjust(10) + \
+              'update'.rjust(12) + 'coupling'.rjust(12) + 'MB moved'.rjust(12)
+        for port_name in port_names:
+            info = components[ port_name ]
+            coupling = info[ 'coupling' ]
+            n_bytes  = info.get( 'bytes_get', 0 ) + info.get( 'bytes_set', 0 )
+            print '    ' + port_name.ljust(16) + \
+                  str(coupling['calls']).rjust(10) + \
+                  ('%.4f' % coupling['update']).rjust(12) + \
+                  ('%.4f' % (coupling['get_required_vars'] +
+                            coupling['update_coupling'])).rjust(12) + \
+                  ('%.3f' % (n_bytes / 1e6)).rjust(12)
+        print 'Total run time =', ('%.4f' % report['run_time'])
+        print 'Profile report saved to:'
+        print '    ' + json_file
+        print ' '
+        return report
+    
+    #   write_profile_report()
+    #-------------------------------------------------------------------
+    def save_checkpoint( self, checkpoint_file, SILENT=False ):
+
+        #-----------------------------------------------------------
+        # Notes: Saves the full state of a coupled model run in a
+        #        single binary file (a pickled dictionary), so that
+        #        it can be restarted later with load_checkpoint():
+        #
+        #          - the framework clock (time, time_index, DONE)
+        #          - the state of every component in comp_set
+        #            (see BMI_base.get_state()), including its
+        #            clock, its grids, the positions of its input
+        #            files and the names and positions of its
+        #            output files
+        #          - both "slots" of every time interpolation var
+        #
+        #        Call this between two framework time steps, e.g.
+        #        with run_model( checkpoint_file=... ).  The file
+        #        is written to a temporary file first and then
+        #        renamed, so an existing checkpoint is never left
+        #        half written if the run fails.
+        #-----------------------------------------------------------
+        checkpoint_file = os.path.realpath( os.path.expanduser( checkpoint_file ) )
+        
+        framework_state = { 'time':       self.time,
+                            'time_index': self.time_index,
+                            'time_sec':   getattr( self, 'time_sec', self.time ),
+                            'time_min':   getattr( self, 'time_min', None ),
+                            'DONE':       self.DONE }
+        comp_states = dict()
+        for port_name in self.provider_list:
+            comp_states[ port_name ] = self.comp_set[ port_name ].get_state()
+        interp_state = dict()
+        if (getattr( self, 'time_interpolator', None ) is not None):
+            interp_state = self.time_interpolator.get_state()
+            
+        checkpoint = { 'version':          1,
+                       'cfg_prefix':       self.cfg_prefix,
+                       'provider_list':    list( self.provider_list ),
+                       'framework':        framework_state,
+                       'components':       comp_states,
+                       'time_interp_vars': interp_state }
+
+        temp_file = checkpoint_file + '.tmp'
+        checkpoint_unit = open( temp_file, 'wb' )
+        cPickle.dump( checkpoint, checkpoint_unit, cPickle.HIGHEST_PROTOCOL )
+        checkpoint_unit.close()
+        os.rename( temp_file, checkpoint_file )
+
+        if not(SILENT):
+            print 'Saved checkpoint at time =', self.time, '[' + self.time_units + ']'
+            print '    ' + checkpoint_file
+            print ' '
+            
+    #   save_checkpoint()
+    #-------------------------------------------------------------------
+    def load_checkpoint( self, checkpoint_file, RESUME_OUTPUT=True,
+                         SILENT=False ):
+
+        #-----------------------------------------------------------
+        # Notes: Restores a state saved by save_checkpoint().  The
+        #        same comp_set must have been instantiated and
+        #        initialized first, e.g. with run_model( restart_
+        #        file=... ), which calls this just before the time
+        #        loop.  Settings in the CFG files (other than file
+        #        names for time-varying input) may differ from the
+        #        run that saved the checkpoint, so one "spin-up" run
+        #        can be used to start many scenarios.
+        #
+        #        If RESUME_OUTPUT is True, output files of the saved
+        #        run are reopened (if they still exist in the same
+        #        output directory) and the new run continues writing
+        #        to them, as after a failure.  Otherwise, or if the
+        #        out_directory has changed, new files are written.
+        #-----------------------------------------------------------
+        checkpoint_file = os.path.realpath( os.path.expanduser( checkpoint_file ) )
+        checkpoint_unit = open( checkpoint_file, 'rb' )
+        checkpoint = cPickle.load( checkpoint_unit )
+        checkpoint_unit.close()
+
+        #---------------------------------------------
+        # Check that components match the saved ones
+        #---------------------------------------------
+        saved_ports = set( checkpoint['components'].keys() )
+        if (saved_ports != set( self.provider_list )):
+            print 'ERROR: Components in checkpoint file do not match'
+            print '       the components in this comp_set:'
+            print '       ' + checkpoint_file
+            print ' '
+            return False
+            
+        framework_state = checkpoint['framework']
+        self.time       = framework_state['time']
+        self.time_index = framework_state['time_index']
+        self.time_sec   = framework_state['time_sec']
+        if (framework_state['time_min'] is not None):
+            self.time_min = framework_state['time_min']
+        self.DONE       = framework_state['DONE']
+
+        for port_name in self.provider_list:
+            state = checkpoint['components'][ port_name ]
+            self.comp_set[ port_name ].set_state( state, RESUME_OUTPUT )
+        if (getattr( self, 'time_interpolator', None ) is not None):
+            self.time_interpolator.set_state( checkpoint['time_interp_vars'] )
+
+        #-------------------------------------------------
+        # Users got copies of their input vars, so bind
+        # them to the provider arrays again, if needed.
+        #-------------------------------------------------
+        if (self.coupling_method == 'References'):
+            self.bind_provided_vars()
+
+        if not(SILENT):
+            print 'Loaded checkpoint at time =', self.time, '[' + self.time_units + ']'
+            print '    ' + checkpoint_file
+            print ' '
+        return True
+    
+    #   load_checkpoint()
+    #-------------------------------------------------------------------
+    def run_ensemble( self, cfg_directory=None, cfg_prefix=None,
+                      param_sets=None, n_workers=None,
+                      ens_directory=None,
+                      driver_port_name='hydro_model',
+                      time_interp_method='Linear',
+                      SHARE_GRIDS=True ):
+
+        #-----------------------------------------------------------
+        # Notes: Runs one model (given by a provider_file and a
+        #        set of CFG files, as for run_model()) for every
+        #        "member" in param_sets, in a pool of n_workers
+        #        processes.  Default is one per CPU.
+        #
+        #        param_sets is a list of dictionaries, one per
+        #        member, that map placeholders in the CFG files to
+        #        values, e.g. {'${nval}': 0.03}.  Each member gets
+        #        its own directory in ens_directory, with CFG files
+        #        made by template_files.replace().  Its output
+        #        directory is set to this directory and its input
+        #        directory is set to the original one.  Output
+        #        printed by a member is saved in a log file there.
+        #
+        #        If SHARE_GRIDS is True, the static input grids
+        #        (RTG files) named in the CFG files are loaded
+        #        into shared memory just once, and every member
+        #        maps them from there.  See shared_grids.py.
+        #
+        #        Returns a list with a dictionary of results for
+        #        each member.
+        #-----------------------------------------------------------
+        if (cfg_prefix == None):
+            print 'ERROR: The "cfg_prefix" argument is required.'
+            return
+        if (cfg_directory == None):
+            print 'ERROR: The "cfg_directory" argument is required.'
+            return
+        if (param_sets == None):
+            param_sets = [ dict() ]
+        if (n_workers == None):
+            n_workers = multiprocessing.cpu_count()
+        n_workers = max( 1, min( n_workers, len(param_sets) ) )
+            
+        cfg_directory = os.path.realpath( cfg_directory )
+        if (ens_directory == None):
+            ens_directory = os.path.join( cfg_directory,
+                                          cfg_prefix + '_ensemble' )
+        ens_directory = os.path.realpath( os.path.expanduser( ens_directory ) )
+        if not(os.path.exists( ens_directory )):
+            os.makedirs( ens_directory )
+        provider_file = os.path.join( cfg_directory,
+                                      cfg_prefix + '_providers.txt' )
+        cfg_files = glob.glob( os.path.join( cfg_directory,
+                                             cfg_prefix + '_*.cfg' ) )
+        cfg_files.sort()
+        if not(os.path.exists( provider_file )):
+            print 'ERROR: Could not find provider_file:'
+            print '       ' + provider_file
+            return
+        
+        #-----------------------------------------------
+        # Make a template for each CFG file, and find
+        # static grid files that members can share.
+        #-----------------------------------------------
+        template_dir = os.path.join( ens_directory, 'templates' )
+        if not(os.path.exists( template_dir )):
+            os.makedirs( template_dir )
+        templates  = []
+        grid_files = []
+        for cfg_file in cfg_files:
+            template = os.path.join( template_dir,
+                                     os.path.basename( cfg_file ) + '.in' )
+            grid_files += self.make_ensemble_template( cfg_file, template )
+            templates.append( template )
+
+        file_map = dict()
+        if (SHARE_GRIDS):
+            file_map = shared_grids.load( grid_files )
+                
+        #-----------------------------------------
+        # Make a directory and CFG files for
+        # each member, with its own parameters.
+        #-----------------------------------------
+        print 'Preparing', len(param_sets), 'ensemble members in:'
+        print '    ' + ens_directory
+        print ' '
+        member_args = []
+        for k in xrange( len(param_sets) ):
+            member_dir = os.path.join( ens_directory, 'member_' + str(k).zfill(4) )
+            if not(os.path.exists( member_dir )):
+                os.makedirs( member_dir )
+            dictionary = dict( param_sets[k] )
+            dictionary[ '${out_directory}' ] = member_dir + os.sep
+            for template in templates:
+                new_cfg_file = os.path.join( member_dir,
+                                             os.path.basename( template )[:-3] )
+                template_files.replace( template, new_cfg_file,
+                                        dictionary, SILENT=True )
+            shutil.copy( provider_file, member_dir )
+            member_args.append( (k, member_dir, cfg_prefix,
+                                 driver_port_name, time_interp_method,
+                                 file_map) )
+
+        #----------------------------------
+        # Run the members in a process pool
+        #----------------------------------
+        print 'Running ensemble with', n_workers, 'worker processes...'
+        print ' '
+        start_time = time.time()
+        #-------------------------------------------------------
+        # Use a new process for each member, even if there is
+        # just one worker, since some components may leave
+        # state behind in the modules (and in this process).
+        #-------------------------------------------------------
+        pool = multiprocessing.Pool( n_workers, maxtasksperchild=1 )
+        results = pool.map( run_ensemble_member, member_args,
+                            chunksize=1 )
+        pool.close()
+        pool.join()
+        if (SHARE_GRIDS):
+            shared_grids.clear()
+
+        #------------------
+        # Print a summary
+        #------------------
+        n_failed = 0
+        for result in results:
+            if (result['status'] != 'finished'):
+                n_failed += 1
+                print 'Member', result['member'], 'failed.  See log file in:'
+                print '    ' + result['cfg_directory']
+        print 'Finished ensemble of', len(results), 'members with',
+        print n_failed, 'failures.'
+        print 'Run time =', (time.time() - start_time), '[seconds]'
+        print ' '
+        return results
+    
+    #   run_ensemble()
+    #-------------------------------------------------------------------
+    def make_ensemble_template( self, cfg_file, template ):
+
+        #------------------------------------------------------
+        # Notes: Copies cfg_file to the template file, except
+        #        that "in_directory" is set to the full path of
+        #        the original input directory, and the value of
+        #        "out_directory" is set to "${out_directory}".
+        #        Any other placeholders are kept.
+        #
+        #        Returns a list of the RTG files named in the
+        #        CFG file that do not depend on placeholders.
+        #------------------------------------------------------
+        cfg_directory = os.path.dirname( os.path.realpath( cfg_file ) )
+        cfg_unit = open( cfg_file, 'r' )
+        lines = cfg_unit.readlines()
+        cfg_unit.close()
+
+        #------------------------------------------------
+        # Get values needed to resolve file names, the
+        # same way as BMI_base.read_config_file() does.
+        #------------------------------------------------
+        values = dict()
+        for line in lines:
+            words = line.split('|')
+            if (line[0] != '#') and (len(words) >= 4):
+                values[ words[0].strip() ] = words[1].strip()
+        in_directory = values.get( 'in_directory', '.' )
+        if (in_directory[0] == '.'):
+            in_directory = cfg_directory + os.sep
+        in_directory = os.path.expanduser( in_directory )
+        site_prefix  = values.get( 'site_prefix', '' )
+        case_prefix  = values.get( 'case_prefix', '' )
+        
+        grid_files    = []
+        template_unit = open( template, 'w' )
+        for line in lines:
+            words = line.split('|')
+            if (line[0] != '#') and (len(words) >= 4):
+                key   = words[0].strip()
+                value = words[1].strip()
+                if (key == 'in_directory'):
+                    words[1] = ' ' + in_directory + ' '
+                    line = '|'.join( words )
+                elif (key == 'out_directory'):
+                    words[1] = ' ${out_directory} '
+                    line = '|'.join( words )
+                elif (value.endswith('.rtg')) and ('${' not in value):
+                    value = value.replace( '[site_prefix]', site_prefix )
+                    value = value.replace( '[case_prefix]', case_prefix )
+                    grid_files.append( in_directory + value )
+            template_unit.write( line )
+        template_unit.close()
+
+        return grid_files
+    
+    #   make_ensemble_template()
+    #-------------------------------------------------------------------
     def run_rc_script( self ):
 
         #----------------------------------------------------------
@@ -1772,6 +2481,262 @@ class framework():
         
     #   initialize_framework_dt()
     #-------------------------------------------------------------------
+    def initialize_schedule( self, max_ticks=1000000, SILENT=False ):
+
+        #---------------------------------------------------------
+        # Notes: The time loop in run_model() checks the time of
+        #        every component on every framework time step
+        #        (or "tick") to decide whether to call update().
+        #        When all time steps are fixed, the answer only
+        #        depends on the tick index, and the pattern
+        #        repeats after every "hyperperiod", the least
+        #        common multiple of all component time steps.
+        #        So it can be computed just once.
+        #
+        #        A component at time t_c (a multiple of its dt)
+        #        is updated at tick k (time k*self.dt) when
+        #        k*self.dt > t_c.  Since self.dt <= dt, it never
+        #        falls behind, so before tick k its time is:
+        #           max(t0, ceil((k-1)*self.dt/dt) * dt).
+        #        Times are converted to integers (via fractions)
+        #        so the schedule doesn't drift like a sum of
+        #        floating-point time steps can.
+        #
+        #        self.schedule[k] is a tuple of port names, in
+        #        the order of provider_list.  Ticks past the end
+        #        of the list wrap around to the start of the
+        #        periodic part (see get_scheduled_ports()).
+        #
+        #        self.schedule is set to None (and run_model()
+        #        uses the dynamic loop) if any time step is not
+        #        "fixed", or the times are not commensurate, or
+        #        if the schedule would have over max_ticks.
+        #
+        #        Disabled components don't advance their time,
+        #        so the dynamic loop calls their update() on
+        #        every tick (and it returns right away).  They
+        #        are scheduled the same way here, and their time
+        #        steps are not used for the hyperperiod.
+        #---------------------------------------------------------
+        self.schedule = None
+        
+        #-----------------------------------------------
+        # Get time steps and current times in seconds,
+        # as exact fractions.  The framework time step
+        # (self.dt) is the smallest of the time steps.
+        #-----------------------------------------------
+        n_comps = len( self.provider_list )
+        dt_list = []
+        t0_list = []
+        enabled = []
+        for port_name in self.provider_list:
+            bmi = self.comp_set[ port_name ]
+            DISABLED = (getattr( bmi, 'comp_status', None ) == 'Disabled')
+            try:
+                dt_type = bmi.get_attribute( 'time_step_type' )
+            except:
+                dt_type = None
+            if (dt_type != 'fixed') and not(DISABLED):
+                if not(SILENT):
+                    print 'NOTE: Time step of ' + port_name + ' is not fixed.'
+                    print '      Static schedule will not be used.'
+                    print ' '
+                return False
+            units = bmi.get_time_units()
+            dt = self.convert_time_units( bmi.get_time_step(), units )
+            t0 = self.convert_time_units( bmi.get_current_time(), units )
+            dt_list.append( self.time_to_fraction( dt ) )
+            t0_list.append( self.time_to_fraction( t0 ) )
+            enabled.append( not(DISABLED) )
+        tick = self.time_to_fraction( self.dt )
+
+        OK = (tick is not None) and (tick > 0)
+        for j in xrange( n_comps ):
+            dt = dt_list[ j ]
+            t0 = t0_list[ j ]
+            if (t0 is None) or (t0 < 0):
+                OK = False
+            elif not(enabled[j]):
+                pass     # (dt is not used)
+            elif (dt is None) or (dt <= 0):
+                OK = False
+            elif ((t0 / dt).denominator != 1):
+                OK = False   # (t0 is not a multiple of dt)
+        if not(OK):
+            if not(SILENT):
+                print 'NOTE: Component times are not commensurate.'
+                print '      Static schedule will not be used.'
+                print ' '
+            return False
+
+        #--------------------------------------------
+        # Convert all times to integers, then get
+        # the hyperperiod as LCM of the time steps.
+        #--------------------------------------------
+        times = [ tick ] + t0_list + \
+                [ dt for (dt, ON) in zip(dt_list, enabled) if ON ]
+        denom = 1
+        for t in times:
+            denom = (denom * t.denominator) // fractions.gcd( denom, t.denominator )
+        tick    = int( tick * denom )
+        t0_ints = [ int(t0 * denom) for t0 in t0_list ]
+        period  = tick
+        for j in xrange( n_comps ):
+            if (enabled[j]):
+                dt = int( dt_list[j] * denom )
+                period = (period * dt) // fractions.gcd( period, dt )
+        n_ticks = period // tick
+        
+        #-------------------------------------------------
+        # Ticks up to k_start are a transient, while all
+        # comps "catch up" to their initial times.
+        #-------------------------------------------------
+        k_start = max( [-(-t0 // tick) for t0 in t0_ints] ) + 1
+        n_total = k_start + n_ticks
+        if (n_total > max_ticks) or \
+           ((n_total * tick) > numpy.iinfo('int64').max // 2):
+            if not(SILENT):
+                print 'NOTE: Static schedule would have', n_total, 'ticks.'
+                print '      Static schedule will not be used.'
+                print ' '
+            return False
+
+        #----------------------------------------------
+        # Get a bit mask of the comps to update at
+        # each tick, and then a tuple of names for
+        # each distinct mask.  (Tuples are shared.)
+        #----------------------------------------------
+        k      = numpy.arange( n_total, dtype='int64' )
+        t_prev = (k - 1) * tick
+        masks  = numpy.zeros( n_total, dtype='int64' )
+        for j in xrange( n_comps ):
+            if (enabled[j]):
+                dt = int( dt_list[j] * denom )
+                t_comp = numpy.maximum( t0_ints[j], -(-t_prev // dt) * dt )
+            else:
+                t_comp = t0_ints[j]    # (time doesn't change)
+            READY = (k * tick > t_comp)
+            READY[0] = (0 > t0_ints[j])
+            masks[ READY ] += (1 << j)
+        names = dict()
+        for mask in numpy.unique( masks ):
+            names[ mask ] = tuple( [ self.provider_list[j] for j in
+                                     xrange( n_comps )
+                                     if (mask & (1 << j)) ] )
+        self.schedule = [ names[ mask ] for mask in masks ]
+        self.schedule_start  = k_start
+        self.schedule_period = n_ticks
+        
+        if not(SILENT):
+            print 'Static coupling schedule:'
+            print '    hyperperiod    =', float(fractions.Fraction(period, denom)), '[seconds]'
+            print '    ticks / period =', n_ticks
+            print '    updates/period =', int( sum( [ len(names[mask]) for mask
+                                                     in masks[k_start:] ] ) )
+            print ' '
+        return True
+            
+    #   initialize_schedule()
+    #-------------------------------------------------------------------
+    def time_to_fraction( self, time, max_denom=1000000 ):
+
+        #--------------------------------------------------------
+        # Note: Returns an exact fraction that is equal to the
+        #       floating-point time to within roundoff, such as
+        #       3153600 for 0.1 years (in seconds), or None.
+        #--------------------------------------------------------
+        time = float( time )
+        frac = fractions.Fraction( time ).limit_denominator( max_denom )
+        if (abs(float(frac) - time) > 1e-9 * max(1.0, abs(time))):
+            return None
+        return frac
+    
+    #   time_to_fraction()
+    #-------------------------------------------------------------------
+    def get_scheduled_ports( self ):
+
+        #------------------------------------------------------
+        # Note: Returns the tuple of port names to update at
+        #       the current framework time step (time_index).
+        #------------------------------------------------------
+        k = self.time_index
+        if (k >= len(self.schedule)):
+            k0 = self.schedule_start
+            k  = k0 + ((k - k0) % self.schedule_period)
+        return self.schedule[ k ]
+    
+    #   get_scheduled_ports()
+    #-------------------------------------------------------------------
+    def initialize_event_queue( self ):
+
+        #---------------------------------------------------------
+        # Notes: For the event-driven clock in run_model().  The
+        #        queue is a heap of (time, k, port_name), where
+        #        "time" is a component's current time (in seconds)
+        #        and k is its index in provider_list.  A component
+        #        is due for an update at its current time, i.e.
+        #        the end of its last time step, so the heap gives
+        #        the next one to update without any ticks.  Ties
+        #        are broken by provider_list order, as before.
+        #
+        #        The time of a component is read again after each
+        #        update, so time steps can change during a run.
+        #        If it did not advance (e.g. the component is
+        #        disabled), the component is dropped from the
+        #        queue.  For fixed, commensurate time steps the
+        #        updates are the same as for the tick loop.
+        #---------------------------------------------------------
+        self.event_queue = []
+        self.event_index = dict()
+        for k in xrange( len(self.provider_list) ):
+            port_name = self.provider_list[ k ]
+            self.event_index[ port_name ] = k
+            heapq.heappush( self.event_queue,
+                            (self.get_comp_time( port_name ), k, port_name) )
+    
+    #   initialize_event_queue()
+    #-------------------------------------------------------------------
+    def get_comp_time( self, port_name ):
+
+        bmi = self.comp_set[ port_name ]
+        return self.convert_time_units( bmi.get_current_time(),
+                                        bmi.get_time_units() )
+    
+    #   get_comp_time()
+    #-------------------------------------------------------------------
+    def get_next_event( self ):
+
+        #-------------------------------------------------------
+        # Note: Returns the next event time and the components
+        #       that are due then, in provider_list order, and
+        #       removes them from the queue.  Times that differ
+        #       only by roundoff are treated as the same time.
+        #       Returns (None, []) if the queue is empty.
+        #-------------------------------------------------------
+        queue = self.event_queue
+        if (len(queue) == 0):
+            return (None, [])
+        event_time = queue[0][0]
+        tolerance  = 1e-9 * max( 1.0, abs(event_time) )
+        due = []
+        while (len(queue) > 0) and (queue[0][0] - event_time <= tolerance):
+            due.append( heapq.heappop( queue )[1:] )
+        due.sort()
+        return (event_time, [ port_name for (k, port_name) in due ])
+    
+    #   get_next_event()
+    #-------------------------------------------------------------------
+    def push_events( self, port_names, event_time ):
+
+        for port_name in port_names:
+            comp_time = self.get_comp_time( port_name )
+            if (comp_time > event_time):
+                heapq.heappush( self.event_queue,
+                                (comp_time, self.event_index[ port_name ],
+                                 port_name) )
+
+    #   push_events()
+    #-------------------------------------------------------------------
     def update_time(self, dt=-1):
 
         #-------------------------------------------------
@@ -2103,6 +3068,70 @@ class framework():
     
     #   initialize_comp_set()
     #-------------------------------------------------------------------
+    def initialize_unit_conversions( self, SILENT=False ):
+
+        #----------------------------------------------------------
+        # Notes: Builds a "plan" for get_required_vars(), once,
+        #        after the comp_set is connected.  For each user,
+        #        it is a list of (long_var_name, provider_name,
+        #        conversion) tuples, where conversion is None if
+        #        the provider and user have the same units, and is
+        #        otherwise a unit_conversion object with a scale,
+        #        an offset and a buffer for the converted values.
+        #
+        #        Units that are unknown or incompatible are noted
+        #        and values are passed without conversion, as
+        #        before.  With coupling_method = 'References',
+        #        users get the provider's arrays, so values
+        #        cannot be converted.
+        #----------------------------------------------------------
+        BY_REFERENCE = (self.coupling_method == 'References')
+        self.required_vars = dict()
+        
+        for user_name in self.provider_list:
+            bmi  = self.comp_set[ user_name ]
+            plan = []
+            for long_var_name in bmi.get_input_var_names():
+                #-----------------------------------------------------
+                # Note: "check_var_users_and_providers()" made sure
+                # there is only one provider for each long_var_name.
+                #-----------------------------------------------------
+                provider_list = self.var_providers.get( long_var_name )
+                if (provider_list is None):
+                    continue
+                provider_name  = provider_list[0]
+                provider_bmi   = self.comp_set[ provider_name ]
+                user_units     = bmi.get_var_units( long_var_name )
+                provider_units = provider_bmi.get_var_units( long_var_name )
+                scale_offset   = unit_conversion.get_scale_and_offset(
+                                          provider_units, user_units )
+                conversion     = None
+                if (scale_offset is None):
+                    if not(SILENT):
+                        print 'NOTE: Cannot convert units of variable:'
+                        print '      ' + long_var_name
+                        print '      from ' + provider_name + ' [' + provider_units + ']' + \
+                              ' to ' + user_name + ' [' + user_units + '].'
+                        print ' '
+                elif (scale_offset != (1.0, 0.0)):
+                    if (BY_REFERENCE):
+                        if not(SILENT):
+                            print 'NOTE: Units of variable: ' + long_var_name
+                            print '      are not converted with references.'
+                            print ' '
+                    else:
+                        conversion = unit_conversion.unit_conversion( *scale_offset )
+                        if not(SILENT):
+                            print 'Converting units of variable:'
+                            print '    ' + long_var_name
+                            print '    from [' + provider_units + '] to [' + user_units + ']' + \
+                                  ' for ' + user_name + '.'
+                            print ' '
+                plan.append( (long_var_name, provider_name, conversion) )
+            self.required_vars[ user_name ] = plan
+            
+    #   initialize_unit_conversions()
+    #-------------------------------------------------------------------
     def get_required_vars( self, user_name, bmi_time ):    
 
         #----------------------------------------------------------
@@ -2111,30 +3140,15 @@ class framework():
         #        neeeds and gets/sets the required variables.
         #        It is called just *before* a component update().
         #----------------------------------------------------------
+        # Note:  (10/14) Providers and unit conversions are found
+        #        just once by initialize_unit_conversions().
+        #----------------------------------------------------------
+        if not(hasattr( self, 'required_vars' )):
+            self.initialize_unit_conversions( SILENT=True )
         bmi = self.comp_set[ user_name ]  # (or pass bmi)
         
-        input_var_names = bmi.get_input_var_names()
-        
-        for long_var_name in input_var_names:
-            #-----------------------------------------------------
-            # Note: "check_var_users_and_providers()" made sure
-            # there is only one provider for each long_var_name.
-            #-----------------------------------------------------
-            provider_list = self.var_providers[ long_var_name ]
-            provider_name = provider_list[0]
-            provider_bmi  = self.comp_set[ provider_name ]
-            
-            #---------------------------------------------
-            # Get a reference to long_var_name from the
-            # component with provider_name (a port_name)
-            #---------------------------------------------
-            # values = self.get_values( long_var_name, provider_name )
-
-            #------------------------------------
-            # Break the reference for testing ?
-            #------------------------------------
-            # values = numpy.float64( values )
-            
+        for (long_var_name, provider_name, conversion) in \
+                            self.required_vars[ user_name ]:
             #------------------------------------------------
             # Call Time Interpolator to get values that are
             # time interpolated to user's current time.
@@ -2148,29 +3162,14 @@ class framework():
             #--------------------------------------------------
             values = self.time_interpolator.get_values( long_var_name,
                                                         provider_name,
-                                                        bmi_time )
-            #-----------------------------------------
-            # Call Unit Converter to convert from
-            # provider's units to this user's units.
-            #---------------------------------------------------
-            # The unit_converter should have an initialize()
-            # method that gets and stores (in a dictionary),
-            # all of the factors and offsets that will be
-            # needed during the (composite) model run.
-            # Its "convert" method will then use these, but
-            # only when values change.
-            #---------------------------------------------------
-            # Better to pass bmi and provider_bmi and make the
-            #   calls to their get_var_units() in convert()?
-            #---------------------------------------------------
-            # new_values = a(units, new_units)*values +
-            #              b(units, new_units)
-            #---------------------------------------------------           
-            user_units     = bmi.get_var_units( long_var_name )
-            provider_units = provider_bmi.get_var_units( long_var_name )
-            # values = self.unit_converter.convert( values,
-            #                                       provider_units,
-            #                                       user_units )
+                                                        bmi_time,
+                                                        user_name )
+            #-------------------------------------------------
+            # Convert from provider's units to user's units,
+            # in place, in a buffer owned by "conversion".
+            #-------------------------------------------------
+            if (conversion is not None):
+                values = conversion.convert( values )
 
             #-------------------------------------------
             # Call Regridder to regrid values from the
@@ -2183,7 +3182,7 @@ class framework():
             # Embed a reference to long_var_name from the
             # provider into the (BMI level of) user component.
             #---------------------------------------------------
-            self.set_values( long_var_name, values, user_name )
+            bmi.set_values( long_var_name, values )
 
             #------------------        
             # Optional report
@@ -2285,6 +3284,281 @@ class framework():
 ##        print (provider_name + ' time ='), comp_time
             
     #   set_provided_vars()
-    #-------------------------------------------------------------------              
+    #-------------------------------------------------------------------
+    def bind_provided_vars( self, REPORT=False ):
+
+        #----------------------------------------------------------
+        # Note:  This routine resolves every provider/user pair
+        #        just once and embeds a reference to the
+        #        provider's ndarray into each user component.
+        #        It is used by run_model() when coupling_method
+        #        is 'References', in place of get_required_vars().
+        #----------------------------------------------------------
+        # Note:  self.bound_vars is a dictionary that takes a
+        #        provider_name key and returns a dictionary that
+        #        maps each long_var_name that is actually used by
+        #        another component to the bound ndarray.
+        #        check_bound_vars() uses it after each update.
+        #----------------------------------------------------------
+        self.bound_vars   = dict()
+        self.rebound_vars = []    # (names that broke the contract)
+        
+        for provider_name in self.provider_list:
+            provider_bmi = self.comp_set[ provider_name ]
+            refs = dict()
+            for long_var_name in self.vars_provided[ provider_name ]:
+                #------------------------------------------------------
+                # Note: check_var_users_and_providers() made sure
+                # there is only one provider for each long_var_name.
+                #------------------------------------------------------
+                if (self.var_providers[ long_var_name ][0] != provider_name):
+                    continue
+                values = provider_bmi.get_values( long_var_name )
+                refs[ long_var_name ] = values
+                for user_name in self.var_users[ long_var_name ]:
+                    self.set_values( long_var_name, values, user_name )
+                    if (REPORT):
+                        print 'Bound user: ' + user_name
+                        print '    to provider: ' + provider_name
+                        print '    for the variable: ' + long_var_name
+            self.bound_vars[ provider_name ] = refs
+            
+    #   bind_provided_vars()
+    #-------------------------------------------------------------------
+    def check_bound_vars( self, provider_name ):
+
+        #----------------------------------------------------------
+        # Note:  With coupling_method = 'References', a provider
+        #        must update its shared vars "in place", as in
+        #        "self.Q[:] = ..." or "self.Q_outlet.fill(...)",
+        #        so that the references held by users stay valid.
+        #        This is called just after a provider's update().
+        #        If the provider has rebound a shared var to a new
+        #        object, its users would silently keep the old
+        #        values, so this raises a RuntimeError.
+        #
+        #        If self.allow_rebind is True (see run_model()),
+        #        we print a warning (once per var) instead and
+        #        then rebind all of its users to the new object.
+        #        Providers should call update_in_place() in
+        #        BMI_base.py to update shared vars.
+        #----------------------------------------------------------
+        provider_bmi = self.comp_set[ provider_name ]
+        refs = self.bound_vars[ provider_name ]
+
+        for long_var_name in refs:
+            values = provider_bmi.get_values( long_var_name )
+            if (values is refs[ long_var_name ]):
+                continue
+
+            if not(self.allow_rebind):
+                print '############################################'
+                print ' ERROR: Provider did not update a bound'
+                print '        variable in place.'
+                print '    provider: ' + provider_name
+                print '    variable: ' + long_var_name
+                print '############################################'
+                print ' '
+                msg = provider_name + ' rebound ' + long_var_name
+                raise RuntimeError( msg )
+            
+            if (long_var_name not in self.rebound_vars):
+                self.rebound_vars.append( long_var_name )
+                print '############################################'
+                print ' WARNING: Provider did not update a bound'
+                print '          variable in place.  Rebinding.'
+                print '    provider: ' + provider_name
+                print '    variable: ' + long_var_name
+                print '############################################'
+                print ' '
+            refs[ long_var_name ] = values
+            for user_name in self.var_users[ long_var_name ]:
+                self.set_values( long_var_name, values, user_name )
+                
+    #   check_bound_vars()
+    #-------------------------------------------------------------------
+    def initialize_dependencies( self ):
+
+        #----------------------------------------------------------
+        # Notes: Two components depend on each other if one of
+        #        them provides a variable that the other uses.
+        #        This uses var_providers and var_users, so must
+        #        come after find_var_users_and_providers().
+        #
+        #        When both are due for an update in the same time
+        #        step, they must still be updated in the order of
+        #        provider_list.  The user may need the provider's
+        #        new values, and the provider must not change any
+        #        values (or time interpolation data) while the
+        #        user is reading them.  All other pairs can be
+        #        updated at the same time.
+        #
+        #        self.comp_links[ port_name ] is the set of all
+        #        port_names that port_name depends on (or that
+        #        depend on it).  Update waves for each distinct
+        #        list of port_names are saved in self.waves.
+        #----------------------------------------------------------
+        self.comp_links = dict()
+        for port_name in self.provider_list:
+            self.comp_links[ port_name ] = set()
+            
+        for long_var_name in self.var_users:
+            if (long_var_name not in self.var_providers):
+                continue
+            for provider_name in self.var_providers[ long_var_name ]:
+                for user_name in self.var_users[ long_var_name ]:
+                    if (user_name == provider_name):
+                        continue
+                    self.comp_links[ provider_name ].add( user_name )
+                    self.comp_links[ user_name ].add( provider_name )
+
+        self.waves = dict()
+        
+    #   initialize_dependencies()
+    #-------------------------------------------------------------------
+    def get_update_waves( self, port_names ):
+
+        #----------------------------------------------------------
+        # Notes: Returns a list of "waves" (lists of port_names)
+        #        such that the components in each wave can be
+        #        updated in parallel, and every component comes
+        #        after all of the components before it in
+        #        port_names that it depends on.  Each component
+        #        is put in the earliest wave possible.
+        #----------------------------------------------------------
+        key = tuple( port_names )
+        if (key in self.waves):
+            return self.waves[ key ]
+        
+        level = dict()
+        waves = []
+        for k in xrange( len(key) ):
+            port_name = key[ k ]
+            links = self.comp_links[ port_name ]
+            prev  = [ level[ name ] for name in key[:k] if (name in links) ]
+            if (len(prev) == 0):
+                n = 0
+            else:
+                n = max( prev ) + 1
+            level[ port_name ] = n
+            if (n == len(waves)):
+                waves.append( [] )
+            waves[ n ].append( port_name )
+
+        self.waves[ key ] = waves
+        return waves
+    
+    #   get_update_waves()
+    #-------------------------------------------------------------------
+#-----------------------------------------------------------------------
+def run_ensemble_member( args ):
+
+    #-------------------------------------------------------------
+    # Note: This runs one member of an ensemble in a worker
+    #       process, for framework.run_ensemble().  It must be
+    #       a function (not a method) so that it can be pickled.
+    #-------------------------------------------------------------
+    (k, member_dir, cfg_prefix, driver_port_name,
+     time_interp_method, file_map) = args
+    shared_grids.attach( file_map )
+
+    log_file   = os.path.join( member_dir, cfg_prefix + '_log.txt' )
+    stdout     = sys.stdout
+    sys.stdout = open( log_file, 'w' )
+    start_time = time.time()
+    error      = ''
+    try:
+        f = framework()
+        f.run_model( driver_port_name=driver_port_name,
+                     cfg_directory=member_dir,
+                     cfg_prefix=cfg_prefix,
+                     time_interp_method=time_interp_method )
+        if (getattr( f, 'DONE', False )):
+            status = 'finished'
+        else:
+            status = 'failed'
+    except:
+        status = 'failed'
+        error  = traceback.format_exc()
+        print error
+    sys.stdout.close()
+    sys.stdout = stdout
+    
+    return { 'member': k, 'cfg_directory': member_dir,
+             'status': status, 'error': error,
+             'run_time': (time.time() - start_time) }
 
+#   run_ensemble_member()
+#-----------------------------------------------------------------------
+def parse_repository_file( comp_repo_file ):
+
+    #---------------------------------------------------------
+    # Notes:  It is helpful to have a look at the DOM specs,
+    #         which can be found online at:
+    #         http://www.w3.org/TR/1998/REC-DOM-Level-1-
+    #                19981001/introduction.html
+    #                (see the tree diagram)
+    #         http://www.w3.org/TR/1998/REC-DOM-Level-1-
+    #                19981001/level-one-core.html
+    #                (search for "firstChild")
+    #---------------------------------------------------------
+    #         Returns a list with a dictionary of comp_data()
+    #         keyword arguments for each component, or None.
+    #         See load_repository_index().  (10/14)
+    #---------------------------------------------------------
+    import xml.dom.minidom
     
+    #-------------------------------------------
+    # Read all component info from an XML file
+    # into a big string called "doc_string"
+    #-------------------------------------------
+    repo_unit = open( comp_repo_file, 'r' )
+    doc_string = repo_unit.read()
+    repo_unit.close()
+    dom = xml.dom.minidom.parseString( doc_string )
+
+    #----------------------------------------------
+    # Count all tags in XML file of various types
+    #----------------------------------------------
+    C_elements = dom.firstChild.getElementsByTagName("component") 
+    n_comps    = len(C_elements)
+    if (n_comps == 0):
+        print '########################################'
+        print ' ERROR: Component repository XML file'
+        print '        has no "component" tags.'
+        print '########################################'
+        print ' '
+        return None
+
+    #------------------------------------------------
+    # For each component, get all of its attributes
+    # and store them in a dictionary.
+    #------------------------------------------------
+    tag_names = ['comp_name', 'model_name', 'version', 'language',
+                 'author', 'embed_name', 'port_name', 'class_name',
+                 'module_name', 'module_path', 'gui_xml_file',
+                 'help_url', 'cfg_template', 'var_prefix',
+                 'time_step_type', 'time_units', 'grid_type',
+                 'description']
+    comp_records = []
+    for comp in C_elements:
+        record = dict()
+        for tag_name in tag_names:
+            nodes = comp.getElementsByTagName( tag_name )
+            record[ tag_name ] = nodes[0].firstChild.data.strip()
+        #-------------------------------------------------------------
+        nodes = comp.getElementsByTagName("uses_ports")
+        uses_port_list = nodes[0].firstChild.data.strip().split(",")
+
+        #----------------------------------------------------
+        # Without the "str()", get extra "u'" when printing.
+        #----------------------------------------------------
+        for k in xrange( len(uses_port_list) ):
+            uses_port_list[k] = str(uses_port_list[k].strip())
+        record['uses_ports'] = uses_port_list
+        comp_records.append( record )
+
+    return comp_records
+
+#   parse_repository_file()
+#-----------------------------------------------------------------------
@@ -6,18 +6,27 @@
 
 import numpy as np
 import os
+import shutil
 import tempfile
 # See:  http://docs.python.org/2/library/tempfile.html
 
 from topoflow.framework import emeli
+from topoflow.framework import time_interpolation
+from topoflow.utils import packed_domain
+from topoflow.utils import BMI_base
 ## from topoflow.utils import tf_utils
 
 #-----------------------------------------------------------------------
 #
 #  topoflow_test()    # Use framework to run TopoFlow.
+#  ensemble_test()    # Run an ensemble of TopoFlow models.
+#  checkpoint_test()  # Restart TopoFlow from a checkpoint.
+#  packed_domain_test()  # Packed vs. full grid, at the outlet.
 #  erode_test()
 #
 #  ref_test()         # For passing references between components.
+#  test_time_interp_data()  # Linear interpolation, as (a * t) + b.
+#  test_bound_vars()  # Shared vars must be updated in place.
 #
 #  framework_test1()  # Test some basic framework functions.
 #  framework_test2()
@@ -27,7 +36,11 @@ from topoflow.framework import emeli
 #-----------------------------------------------------------------------
 def topoflow_test( driver_port_name='hydro_model',
                    cfg_prefix=None, cfg_directory=None,
-                   time_interp_method='Linear'):
+                   time_interp_method='Linear',
+                   coupling_method='Values',
+                   static_schedule=False, n_threads=1,
+                   profile=False, event_driven=False,
+                   packed_domain=False):
 
     #-----------------------------------------------------
     # Note: The "driver_port_name" defaults to using a
@@ -70,10 +83,117 @@ def topoflow_test( driver_port_name='hydro_model',
     f.run_model( driver_port_name=driver_port_name,
                  cfg_prefix=cfg_prefix,
                  cfg_directory=cfg_directory,
-                 time_interp_method=time_interp_method )
+                 time_interp_method=time_interp_method,
+                 coupling_method=coupling_method,
+                 static_schedule=static_schedule,
+                 n_threads=n_threads,
+                 profile=profile,
+                 event_driven=event_driven,
+                 packed_domain=packed_domain )
 
 #   topoflow_test()
 #-----------------------------------------------------------------------
+def ensemble_test( n_members=4, n_workers=2, ens_directory=None ):
+
+    #--------------------------------------------------------
+    # Note: The Treynor CFG files have no placeholders, so
+    #       all members are the same and should give the
+    #       same results as topoflow_test().
+    #--------------------------------------------------------
+    f = emeli.framework()
+    examples_dir  = emeli.paths['examples']
+    cfg_prefix    = 'June_20_67'
+    cfg_directory = examples_dir + 'Treynor_Iowa/'
+    if (ens_directory == None):
+        ens_directory = '~/TopoFlow_Tests/Ensemble'
+        
+    param_sets = [ dict() for k in xrange(n_members) ]
+    results = f.run_ensemble( cfg_directory=cfg_directory,
+                              cfg_prefix=cfg_prefix,
+                              param_sets=param_sets,
+                              n_workers=n_workers,
+                              ens_directory=ens_directory )
+    for result in results:
+        print 'member, status, run_time =', result['member'], \
+              result['status'], result['run_time']
+    
+#   ensemble_test()
+#-----------------------------------------------------------------------
+def checkpoint_test( checkpoint_interval=1800.0, checkpoint_dir=None ):
+
+    #--------------------------------------------------------
+    # Note: Runs TopoFlow and saves a checkpoint every
+    #       checkpoint_interval seconds.  A copy of the first
+    #       one is kept, and the run is then restarted from
+    #       it.  Both runs should print the same final report
+    #       and the restarted run should continue writing to
+    #       the output files of the first run.
+    #--------------------------------------------------------
+    examples_dir  = emeli.paths['examples']
+    cfg_prefix    = 'June_20_67'
+    cfg_directory = examples_dir + 'Treynor_Iowa/'
+    if (checkpoint_dir == None):
+        checkpoint_dir = tempfile.gettempdir()
+    checkpoint_file = os.path.join( checkpoint_dir, cfg_prefix + '_checkpoint.pkl' )
+    first_file      = os.path.join( checkpoint_dir, cfg_prefix + '_checkpoint_1.pkl' )
+    if (os.path.exists( first_file )):
+        os.remove( first_file )
+        
+    class framework( emeli.framework ):
+        def save_checkpoint( self, checkpoint_file, SILENT=False ):
+            emeli.framework.save_checkpoint( self, checkpoint_file, SILENT )
+            if not(os.path.exists( first_file )):
+                shutil.copyfile( checkpoint_file, first_file )
+        
+    f = framework()
+    f.run_model( cfg_prefix=cfg_prefix,
+                 cfg_directory=cfg_directory,
+                 checkpoint_file=checkpoint_file,
+                 checkpoint_interval=checkpoint_interval )
+
+    f2 = emeli.framework()
+    f2.run_model( cfg_prefix=cfg_prefix,
+                  cfg_directory=cfg_directory,
+                  restart_file=first_file )
+    
+#   checkpoint_test()
+#-----------------------------------------------------------------------
+def packed_domain_test():
+
+    #--------------------------------------------------------
+    # Note: This is a full model run, so it is not collected
+    #       by pytest.  See test_get_domain() in
+    #       utils/tests/test_packed_domain.py.
+    #
+    #       The Treynor outlet is not in the basin RTM file,
+    #       but the packed domain includes it and the pixels
+    #       that drain to it, so the discharge at the outlet
+    #       should be the same as for the full grid.
+    #--------------------------------------------------------
+    examples_dir  = emeli.paths['examples']
+    cfg_prefix    = 'June_20_67'
+    cfg_directory = examples_dir + 'Treynor_Iowa/'
+
+    results = []
+    for PACKED in [False, True]:
+        packed_domain.clear_domains()
+        f = emeli.framework()
+        f.run_model( cfg_prefix=cfg_prefix,
+                     cfg_directory=cfg_directory,
+                     packed_domain=PACKED )
+        driver   = f.comp_set[ 'hydro_model' ]
+        channels = f.comp_set[ 'channels' ]
+        results.append( (driver.time_index, driver.Q_peak,
+                         channels.Q[ channels.outlet_ID ]) )
+    packed_domain.clear_domains()
+
+    print 'Full grid (n_steps, Q_peak, Q_outlet)   =', results[0]
+    print 'Packed domain (n_steps, Q_peak, Q_outlet) =', results[1]
+    assert results[0][0] == results[1][0]
+    assert np.allclose( results[0][1:], results[1][1:], rtol=1e-12 )
+
+#   packed_domain_test()
+#-----------------------------------------------------------------------
 def erode_test( cfg_prefix=None, cfg_directory=None,
                 time_interp_method='Linear'):
          
@@ -214,6 +334,153 @@ def ref_test():
     
 #   ref_test()
 #-----------------------------------------------------------------------
+def test_time_interp_data():
+
+    #--------------------------------------------------------
+    # Note: Compares time_interp_data to the formulas that
+    #       it replaced (new arrays in every update).  A var
+    #       is only interpolated if every value changed.  A
+    #       provider array that is updated in place is
+    #       interpolated the same way (v2 is a copy).
+    #--------------------------------------------------------
+    np.random.seed( 3 )
+    t = np.float64( 0 )
+    P = np.random.random( (4, 5) )
+    data = time_interp_data_for( P, t )
+    for k in xrange( 4 ):
+        P_last = P.copy()
+        P = np.random.random( (4, 5) )   # (new array)
+        if (k == 2):
+            P[0, 0] = P_last[0, 0]       # (one value unchanged)
+        t_last = t
+        t = t + np.float64( 60 )
+        data.update( P, t )
+        time = t_last + np.float64( 15 )
+        values = data.get_values( time, 'user1' )
+        if (k == 2):
+            assert np.array_equal( values, P )
+        else:
+            a = (P - P_last) / (t - t_last)
+            b = P - (a * t)
+            assert np.array_equal( values, (a * time) + b )
+        assert (data.get_values( time, 'user1' ) is values)
+        assert np.array_equal( data.get_values( time ), values )
+
+    #---------------------------------
+    # Provider that updates in place
+    #---------------------------------
+    t = np.float64( 0 )
+    P = np.random.random( (4, 5) )
+    data = time_interp_data_for( P, t )
+    for k in xrange( 3 ):
+        P_last = P.copy()
+        P[:] = np.random.random( (4, 5) )
+        t_last = t
+        t = t + np.float64( 60 )
+        data.update( P, t )
+        a = (P - P_last) / (t - t_last)
+        b = P - (a * t)
+        values = data.get_values( t - 30, 'user1' )
+        assert np.array_equal( values, (a * (t - 30)) + b )
+        assert np.array_equal( data.get_values( t, 'user1' ), P )
+
+    #----------------------------------------------------
+    # At t2, v2 is returned with no interpolation, in
+    # the same buffer, and not as the provider's array.
+    # After 100 days, (a * t2) + b is not exactly v2.
+    #----------------------------------------------------
+    t1 = np.float64( 100 * 86400 )
+    t2 = t1 + np.float64( 60 )
+    P1 = np.random.random( (4, 5) )
+    P2 = np.random.random( (4, 5) )
+    data = time_interp_data_for( P1, t1 )
+    data.update( P2, t2 )
+    assert not(np.array_equal( (data.a * t2) + data.b, P2 ))
+    values = data.get_values( t1 + 30, 'user1' )
+    assert (data.get_values( t2, 'user1' ) is values)
+    assert np.array_equal( values, P2 )
+    new_values = data.get_values( t2 )
+    assert np.array_equal( new_values, P2 )
+    assert (new_values is not data.v2)
+    values[:] = 0
+    assert np.array_equal( data.v2, P2 )
+
+#   test_time_interp_data()
+#-----------------------------------------------------------------------
+def time_interp_data_for( v1, t1 ):
+
+    return time_interpolation.time_interp_data( v1=v1, t1=t1,
+                                                long_var_name='P' )
+
+#   time_interp_data_for()
+#-----------------------------------------------------------------------
+class bound_vars_comp( BMI_base.BMI_component ):
+
+    def get_var_name(self, long_var_name):
+
+        name_map = {
+            'land_surface_water__runoff_volume_flux':'R',
+            'atmosphere_water__precipitation_leq-volume_flux':'P' }
+
+        return name_map[ long_var_name ]
+
+#   bound_vars_comp
+#-----------------------------------------------------------------------
+def test_bound_vars():
+
+    #--------------------------------------------------------
+    # Note: With coupling_method = 'References', users are
+    #       bound once to the provider's arrays.  A grid and
+    #       a 0D "mutable scalar" that are set with
+    #       update_in_place() stay bound, and check_bound_vars()
+    #       raises an error if a provider rebinds one, unless
+    #       allow_rebind is True.
+    #--------------------------------------------------------
+    R_name = 'land_surface_water__runoff_volume_flux'
+    P_name = 'atmosphere_water__precipitation_leq-volume_flux'
+    provider = bound_vars_comp()
+    user     = bound_vars_comp()
+    provider.R = np.zeros( (4, 5), dtype='float64' )
+    provider.P = provider.initialize_scalar( 0.0, 'float64' )
+    
+    f = emeli.framework()
+    f.provider_list = [ 'provider', 'user' ]
+    f.comp_set      = { 'provider':provider, 'user':user }
+    f.vars_provided = { 'provider':[ R_name, P_name ], 'user':[] }
+    f.var_providers = { R_name:[ 'provider' ], P_name:[ 'provider' ] }
+    f.var_users     = { R_name:[ 'user' ], P_name:[ 'user' ] }
+    f.bind_provided_vars()
+    assert (user.R is provider.R)
+    assert (user.P is provider.P)
+
+    R = np.random.random( (4, 5) )
+    provider.update_in_place( 'R', R )
+    provider.update_in_place( 'P', 2.0 )
+    f.check_bound_vars( 'provider' )
+    assert (user.R is provider.R)
+    assert (user.P is provider.P)
+    assert np.array_equal( user.R, R )
+    assert (user.P == 2.0)
+
+    #-----------------------------------------
+    # A grid can't be copied into a 0D var,
+    # so this rebinds P (as in "P = R").
+    #-----------------------------------------
+    provider.update_in_place( 'P', R )
+    try:
+        f.check_bound_vars( 'provider' )
+        REBIND_ERROR = False
+    except RuntimeError:
+        REBIND_ERROR = True
+    assert REBIND_ERROR
+
+    f.allow_rebind = True
+    f.check_bound_vars( 'provider' )
+    assert (user.P is provider.P)
+    assert (f.rebound_vars == [ P_name ])
+
+#   test_bound_vars()
+#-----------------------------------------------------------------------
 #-----------------------------------------------------------------------
 def framework_test1():
 
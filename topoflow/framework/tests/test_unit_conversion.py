@@ -0,0 +1,55 @@
+## Copyright (c) 2014, Scott D. Peckham
+## October 2014
+## Unit tests for "unit_conversion.py" in "framework" folder.
+
+import numpy as np
+from topoflow.framework import unit_conversion
+
+#-------------------------------------------------------------------------
+#
+# test1()   # scale and offset for some unit pairs
+# test2()   # in-place conversion with a unit_conversion object
+#
+#-------------------------------------------------------------------------
+def test1():
+
+    pairs = [ ('m s-1',   'm s-1',     (1.0, 0.0)),
+              ('m s-1',   'mm/hr',     (3.6e6, 0.0)),
+              ('mm day-1','m s-1',     (1e-3 / 86400, 0.0)),
+              ('deg_C',   'K',         (1.0, 273.15)),
+              ('mbar',    'Pa',        (100.0, 0.0)),
+              ('W m-2',   'J m-2 s-1', (1.0, 0.0)),
+              ('m',       's',         None),
+              ('m3',      'm3 s-1',    None),
+              ('furlong', 'm',         None) ]
+
+    for (from_units, to_units, answer) in pairs:
+        result = unit_conversion.get_scale_and_offset( from_units, to_units )
+        if (answer is None):
+            OK = (result is None)
+        else:
+            OK = (result is not None) and np.allclose( result, answer )
+        print 'from [' + from_units + '] to [' + to_units + '] =', result, OK
+        assert OK
+    print ' '
+
+#   test1()
+#-------------------------------------------------------------------------
+def test2():
+
+    scale, offset = unit_conversion.get_scale_and_offset( 'deg_C', 'K' )
+    conversion = unit_conversion.unit_conversion( scale, offset )
+    T_air = np.array([ -10.0, 0.0, 25.0 ])
+    T1 = conversion.convert( T_air )
+    T2 = conversion.convert( T_air + 1 )
+    SAME_BUFFER = (T1 is T2)
+    SAME_CODES  = (conversion.convert( np.array([1, 2, 4]) ) == [1, 2, 4]).all()
+    print 'T [K]   =', T2
+    print 'same buffer =', SAME_BUFFER
+    print 'D8 codes are not converted =', SAME_CODES
+    print ' '
+    assert np.allclose( T2, T_air + 274.15 )
+    assert SAME_BUFFER and SAME_CODES
+
+#   test2()
+#-------------------------------------------------------------------------
@@ -2,6 +2,16 @@
 #-------------------------------------------------------------------     
 # Copyright (c) 2013, Scott D. Peckham
 #
+# Oct 2014. Preallocated buffers in time_interp_data, which
+#           now does the interpolation in get_values().
+#           Each user component gets its own output buffer.
+#           Same values as before, except at t2, where
+#           get_values() returns v2 with no interpolation.
+#           get_state() and set_state() for checkpoints.
+#           v2 is a copy of the provider's values, so that
+#           providers that update vars in place (as needed
+#           for coupling_method = 'References') are still
+#           interpolated.
 # Apr 2013. New time interpolator class from/for framework3.py.
 #
 #-------------------------------------------------------------------
@@ -9,6 +19,11 @@
 #  class time_interp_data()
 #      __init__()
 #      update()
+#      update_params()
+#      get_values()
+#      set_state()
+#
+#  get_buffer()
 #
 #  class time_interpolator()
 #      __init__()
@@ -17,6 +32,8 @@
 #      update_all()
 #      get_values()
 #      convert_time_units()
+#      get_state()
+#      set_state()
 #
 #-------------------------------------------------------------------
 import numpy as np
@@ -33,6 +50,18 @@ class time_interp_data():
     #       order to perform time interpolation by a method
     #       other than "Linear" (or a new class?).
     #--------------------------------------------------------
+    # Note: (10/14) The interpolation parameters, a and b,
+    #       are computed in buffers that are allocated once
+    #       and then reused, and each user component gets
+    #       its own output buffer for get_values().  Values
+    #       are the same as before, v = (a * time) + b.
+    #
+    #       Users hold a reference to their buffer between
+    #       updates, so buffers are not shared.  Otherwise a
+    #       request for another time by another user would
+    #       change the values (even during an update when
+    #       components are run in parallel).
+    #--------------------------------------------------------
     def __init__( self, v1=None, t1=None, long_var_name=None ):
                  ## interp_method='Linear'):
             
@@ -40,7 +69,12 @@ class time_interp_data():
         # Save (v1,t1) to (v2,t2) because update()
         # first sets (v1,t1) from old (v2,t2).
         #-------------------------------------------
-        self.v2 = v1
+        # (10/14) v2 is a copy, not the provider's
+        # array.  Otherwise, if the provider updates
+        # it in place, v1 = v2 after update() and
+        # there is never any interpolation.
+        #-------------------------------------------
+        self.v2 = v1.copy()
         self.t2 = t1
         self.long_var_name = long_var_name
         ## self.interp_method = interp_method
@@ -51,6 +85,14 @@ class time_interp_data():
         self.v1 = v1.copy()
         self.t1 = t1.copy()
 
+        #---------------------------------------
+        # Buffers for update() and get_values()
+        #---------------------------------------
+        self.dv_buffer = None
+        self.a_buffer  = None
+        self.b_buffer  = None
+        self.buffers   = dict()   # (user_name -> values)
+        
         #--------------
         # For testing
         #--------------
@@ -76,48 +118,61 @@ class time_interp_data():
         # Update the "start values" (old end values)
         # (in-place, if possible)
         # Note: try/except is slightly faster.
-        # Note: Need to use "copy()" as shown.
+        # Note: v1 and v2 are never the same array,
+        #       so copy() isn't needed for in-place.
         #---------------------------------------------
         self.t1 = self.t2.copy()
         try:
-            self.v1[:] = self.v2.copy()
+            self.v1[:] = self.v2
         except:
             self.v1 = self.v2.copy()
-        #-----------------------------------           
-##        if (np.rank( self.v1 ) > 0):
-##            self.v1[:] = self.v2.copy()
-##        else:
-##            self.v1 = self.v2.copy()
             
         #--------------------------
         # Update the "end values"
         # (in-place, if possible)
-        # Note: Need to use "copy()" as shown.
         #---------------------------------------------
         self.t2 = t2
         try:
-            self.v2[:] = v2.copy()  ## NEED THIS!
+            self.v2[:] = v2
         except:
             self.v2 = v2.copy()     ## NEED THIS!
-        #-----------------------------------  
-##        if (np.rank( self.v2 ) > 0):
-##            self.v2[:] = v2
-##        else:
-##            self.v2 = v2
-        
+
+        self.update_params( v2, t2 )
+
+        #--------------
+        # For testing
+        #--------------
+##        if (self.long_var_name == 'atmosphere_water__precipitation_leq-volume_flux'):
+##            print '(P1,P2, t1,t2) =', self.v1, self.v2, self.t1, self.t2
+            
+    #   update()
+    #----------------------------------------------------------
+    def update_params( self, v2, t2 ):
+
         #---------------------------------------------
         # Update the interpolation parameters, a & b
-        # They are used in get_values2().
+        # They are used in get_values().
         #---------------------------------------------
-        # This would also work:
-        #    v1_ne_v2 = (v2 - self.v1) != 0
-        #    if np.any( v1_ne_v2 ) and (t2 != self.t1):
-        #----------------------------------------------------       
-        dv = np.abs(v2 - self.v1)
-        dv_min = dv.min()
-        if (dv_min != 0) and (t2 != self.t1):
-            self.a = (v2 - self.v1) / (t2 - self.t1)
-            self.b = v2 - (self.a * t2)
+        # Note: Same as:
+        #    dv = np.abs(v2 - self.v1)
+        #    if (dv.min() != 0) and (t2 != self.t1):
+        #        self.a = (v2 - self.v1) / (t2 - self.t1)
+        #        self.b = v2 - (self.a * t2)
+        # but with no new arrays.  So if any value
+        # is unchanged, there is no interpolation.
+        #----------------------------------------------------
+        dv = get_buffer( self.dv_buffer, v2, self.v1 )
+        np.subtract( v2, self.v1, dv )
+        self.dv_buffer = dv
+        if np.all( dv ) and (t2 != self.t1):
+            dt = (t2 - self.t1)
+            self.a = get_buffer( self.a_buffer, dv, dt )
+            np.divide( dv, dt, self.a )
+            self.a_buffer = self.a
+            self.b = get_buffer( self.b_buffer, v2, self.a )
+            np.multiply( self.a, t2, self.b )
+            np.subtract( v2, self.b, self.b )
+            self.b_buffer = self.b
         else:
             #------------------------------------------
             # Variables that don't vary in time will
@@ -131,18 +186,73 @@ class time_interp_data():
             #------------------------------------------
             self.a  = np.float64(0)
             self.b  = v2
-
-        #--------------
-        # For testing
-        #--------------
-##        if (self.long_var_name == 'atmosphere_water__precipitation_leq-volume_flux'):
-##            print '(P1,P2, t1,t2) =', self.v1, self.v2, self.t1, self.t2
             
-    #   update()
+    #   update_params()
+    #----------------------------------------------------------
+    def get_values( self, time, user_name=None ):
+
+        #---------------------------------------------------
+        # Note: Returns (a * time) + b, in the output buffer
+        #       of user_name.  Without a user_name, a new
+        #       array is returned.  At time = t2 (e.g. when
+        #       the user's time step is the same as the
+        #       provider's), v2 is returned as is, with no
+        #       interpolation.  (If a provider sets a grid v2
+        #       to a scalar, b has the shape of the scalar.)
+        #---------------------------------------------------
+        AT_T2 = ((time == self.t2) and
+                 (np.shape( self.b ) == np.shape( self.v2 )))
+        if (user_name is None):
+            if (AT_T2):
+                return self.v2.copy()
+            return (self.a * time) + self.b
+
+        values = get_buffer( self.buffers.get( user_name ),
+                             self.a, time, self.b )
+        self.buffers[ user_name ] = values
+        if (AT_T2):
+            np.copyto( values, self.v2 )
+        else:
+            np.multiply( self.a, time, values )
+            values += self.b
+        return values
+    
+    #   get_values()
+    #----------------------------------------------------------
+    def set_state( self, v1, v2, t1, t2 ):
+
+        #--------------------------------------------------
+        # Note: Restores (v1,t1) and (v2,t2), e.g. from a
+        #       saved checkpoint, and recomputes a and b,
+        #       as update() left them.
+        #--------------------------------------------------
+        self.v1 = np.array( v1, copy=True )
+        self.t1 = np.array( t1, copy=True )
+        self.t2 = np.array( t2, copy=True )
+        self.v2 = np.array( v2, copy=True )
+        self.update_params( self.v2, self.t2 )
+        
+    #   set_state()
     #----------------------------------------------------------
 
 #     time_interp_data() (class)
 #-----------------------------------------------------------------------
+def get_buffer( buffer, *args ):
+
+    #-----------------------------------------------------
+    # Note: Returns "buffer" if it has the shape and the
+    #       data type of the result of numpy operations
+    #       on args, or else a new array for it.
+    #-----------------------------------------------------
+    shape = np.broadcast( *args ).shape
+    dtype = np.result_type( *args )
+    if (buffer is not None) and (buffer.shape == shape) and \
+       (buffer.dtype == dtype):
+        return buffer
+    return np.empty( shape, dtype=dtype )
+
+#   get_buffer()
+#-----------------------------------------------------------------------
 #-----------------------------------------------------------------------
 class time_interpolator():
 
@@ -576,7 +686,8 @@ class time_interpolator():
 
     #   update_all()
     #-------------------------------------------------------------------        
-    def get_values( self, long_var_name, port_name, time ):
+    def get_values( self, long_var_name, port_name, time,
+                    user_name=None ):
 
         #-------------------------------------------------------
         # Note: This method returns a NumPy "ndarray" object
@@ -652,13 +763,13 @@ class time_interpolator():
                 print '#######################################'
                 print ' '
 
-            value = (i_vars.a * time) + i_vars.b
+            value = i_vars.get_values( time, user_name )
 
             #--------------
             # For testing
             #--------------
 ##            if (long_var_name == 'atmosphere_water__precipitation_leq-volume_flux'):
-##                print '(time, P, a, b) =', time, value, i_vars.a, i_vars.b
+##                print '(time, P) =', time, value
 
             return value
             
@@ -692,7 +803,7 @@ class time_interpolator():
         elif (in_units in ['days', 'd']):
             time = in_time * self.secs_per_day
         elif (in_units in ['hours', 'h']):
-            time = in_time * secs_per_hour
+            time = in_time * self.secs_per_hour
         elif (in_units in ['minutes','m']):     ### month?
             time = in_time * self.secs_per_min
         else:
@@ -703,3 +814,36 @@ class time_interpolator():
     
     #   convert_time_units()
     #-------------------------------------------------------------------
+    def get_state( self ):
+
+        #------------------------------------------------------
+        # Note: Returns copies of the two "slots" and their
+        #       times for every long_var_name, for a
+        #       checkpoint.  See save_checkpoint() in emeli.py.
+        #------------------------------------------------------
+        state = dict()
+        if (self.time_interp_vars is None):
+            return state
+        for long_var_name, data in self.time_interp_vars.iteritems():
+            state[ long_var_name ] = ( data.v1.copy(), data.v2.copy(),
+                                       np.float64( data.t1 ),
+                                       np.float64( data.t2 ) )
+        return state
+
+    #   get_state()
+    #-------------------------------------------------------------------
+    def set_state( self, state ):
+
+        #------------------------------------------------------
+        # Note: Call this after the providers' states have
+        #       been restored.
+        #------------------------------------------------------
+        if (self.time_interp_vars is None):
+            return
+        for long_var_name, (v1, v2, t1, t2) in state.iteritems():
+            data = self.time_interp_vars.get( long_var_name )
+            if (data is not None):
+                data.set_state( v1, v2, t1, t2 )
+
+    #   set_state()
+    #-------------------------------------------------------------------
@@ -0,0 +1,198 @@
+#-------------------------------------------------------------------
+# Copyright (c) 2014, Scott D. Peckham
+#
+# Oct 2014. Created, for the conversion plan that is built by
+#           initialize_unit_conversions() in emeli.py.
+#
+#-------------------------------------------------------------------
+#
+#  get_scale_and_offset()
+#  parse_units()
+#
+#  class unit_conversion()
+#      __init__()
+#      convert()
+#
+#-------------------------------------------------------------------
+import fractions
+import re
+import numpy as np
+
+#-------------------------------------------------------------------
+# Notes: Units are given as strings like "m s-1", "m3 s-1",
+#        "W m-2", "kg m-3", "mbar" or "deg_C", as in the
+#        _var_units_map of each TopoFlow component.  Strings
+#        like "m/s", "mm/hr" or "m^3/s" are also accepted.
+#
+#        Each base unit has a scale factor to SI units and a
+#        dimension, as powers of (m, s, kg, K).  Only units
+#        with a single temperature term (e.g. "deg_C") can
+#        have an offset.
+#-------------------------------------------------------------------
+SECS_PER_YEAR = 365.0 * 24 * 3600   # (same as framework)
+
+#------------------------------------------------------
+# name -> (scale, offset, (m, s, kg, K) dimensions)
+#------------------------------------------------------
+base_units = {
+    'm':       (1.0,    0.0, (1, 0, 0, 0)),
+    'mm':      (1e-3,   0.0, (1, 0, 0, 0)),
+    'cm':      (1e-2,   0.0, (1, 0, 0, 0)),
+    'km':      (1e3,    0.0, (1, 0, 0, 0)),
+    #---------------------------------------
+    's':       (1.0,    0.0, (0, 1, 0, 0)),
+    'sec':     (1.0,    0.0, (0, 1, 0, 0)),
+    'seconds': (1.0,    0.0, (0, 1, 0, 0)),
+    'min':     (60.0,   0.0, (0, 1, 0, 0)),
+    'minutes': (60.0,   0.0, (0, 1, 0, 0)),
+    'h':       (3600.0, 0.0, (0, 1, 0, 0)),
+    'hr':      (3600.0, 0.0, (0, 1, 0, 0)),
+    'hours':   (3600.0, 0.0, (0, 1, 0, 0)),
+    'd':       (86400.0, 0.0, (0, 1, 0, 0)),
+    'day':     (86400.0, 0.0, (0, 1, 0, 0)),
+    'days':    (86400.0, 0.0, (0, 1, 0, 0)),
+    'yr':      (SECS_PER_YEAR, 0.0, (0, 1, 0, 0)),
+    'years':   (SECS_PER_YEAR, 0.0, (0, 1, 0, 0)),
+    #---------------------------------------
+    'kg':      (1.0,    0.0, (0, 0, 1, 0)),
+    'g':       (1e-3,   0.0, (0, 0, 1, 0)),
+    #---------------------------------------
+    'K':       (1.0,    0.0,    (0, 0, 0, 1)),
+    'deg_C':   (1.0,    273.15, (0, 0, 0, 1)),
+    'deg_F':   (5.0/9,  (273.15 - 32 * 5.0/9), (0, 0, 0, 1)),
+    #---------------------------------------
+    'L':       (1e-3,   0.0, (3, 0, 0, 0)),
+    'N':       (1.0,    0.0, (1, -2, 1, 0)),
+    'J':       (1.0,    0.0, (2, -2, 1, 0)),
+    'W':       (1.0,    0.0, (2, -3, 1, 0)),
+    'Pa':      (1.0,    0.0, (-1, -2, 1, 0)),
+    'mbar':    (100.0,  0.0, (-1, -2, 1, 0)),
+    'bar':     (1e5,    0.0, (-1, -2, 1, 0)),
+    #---------------------------------------
+    '1':       (1.0,    0.0, (0, 0, 0, 0)),
+    'none':    (1.0,    0.0, (0, 0, 0, 0)),
+    'radians': (1.0,    0.0, (0, 0, 0, 0)),
+    'degrees': (np.pi / 180, 0.0, (0, 0, 0, 0)) }
+
+unit_pattern = re.compile( r'^([A-Za-z_]+)\^?(-?\d+(/\d+)?)?$' )
+
+#-------------------------------------------------------------------
+def parse_units( units ):
+
+    #---------------------------------------------------------
+    # Note: Returns (scale, offset, dimensions) for a units
+    #       string, or None if it contains an unknown unit.
+    #---------------------------------------------------------
+    units = units.strip()
+    if (units in base_units):
+        return base_units[ units ]
+
+    #--------------------------------------------
+    # Terms after "/" have negative exponents
+    #--------------------------------------------
+    parts = units.replace('*', ' ').split('/')
+    terms = []
+    for k in xrange( len(parts) ):
+        sign = 1
+        if (k > 0):
+            sign = -1
+        for term in parts[k].split():
+            terms.append( (term, sign) )
+    if (len(terms) == 0):
+        return None
+
+    scale = 1.0
+    dims  = np.zeros( 4, dtype='float64' )
+    for (term, sign) in terms:
+        match = unit_pattern.match( term )
+        if (match is None):
+            return None
+        name, power = match.group(1), match.group(2)
+        if (name not in base_units):
+            return None
+        if (power is None):
+            power = 1
+        power = sign * float( fractions.Fraction( power ) )
+        (base_scale, base_offset, base_dims) = base_units[ name ]
+        if (base_offset != 0):
+            return None    # (e.g. deg_C in a compound unit)
+        scale *= (base_scale ** power)
+        dims  += (power * np.array( base_dims ))
+
+    return (scale, 0.0, tuple(dims))
+
+#   parse_units()
+#-------------------------------------------------------------------
+def get_scale_and_offset( from_units, to_units ):
+
+    #-------------------------------------------------------
+    # Note: Returns (scale, offset) such that:
+    #           to_value = scale * from_value + offset,
+    #       (1.0, 0.0) if units are the same, or None if
+    #       either is unknown or if they are incompatible.
+    #-------------------------------------------------------
+    if (from_units.strip() == to_units.strip()):
+        return (1.0, 0.0)
+
+    from_info = parse_units( from_units )
+    to_info   = parse_units( to_units )
+    if (from_info is None) or (to_info is None):
+        return None
+    (s1, b1, dims1) = from_info
+    (s2, b2, dims2) = to_info
+    if not(np.allclose( dims1, dims2 )):
+        return None
+
+    #-----------------------------------------
+    # SI value = s1 * from_value + b1
+    # to_value = (SI value - b2) / s2
+    #-----------------------------------------
+    scale  = (s1 / s2)
+    offset = (b1 - b2) / s2
+    if (abs(scale - 1) < 1e-12):
+        scale = 1.0
+    if (abs(offset) < 1e-12):
+        offset = 0.0
+    return (scale, offset)
+
+#   get_scale_and_offset()
+#-------------------------------------------------------------------
+class unit_conversion():
+
+    #--------------------------------------------------------
+    # Note: One instance is created for each (provider,
+    #       user, long_var_name) that needs a conversion.
+    #       The converted values are written in place into
+    #       a buffer that is owned by this object, so no
+    #       new arrays are created in the time loop.
+    #--------------------------------------------------------
+    def __init__( self, scale=1.0, offset=0.0 ):
+
+        self.scale  = np.float64( scale )
+        self.offset = np.float64( offset )
+        self.buffer = None
+
+    #   __init__()
+    #----------------------------------------------------------
+    def convert( self, values ):
+
+        values = np.asarray( values )
+        if not(np.issubdtype( values.dtype, np.floating )):
+            return values     # (e.g. D8 codes; not converted)
+
+        buffer = self.buffer
+        if (buffer is None) or (buffer.shape != values.shape) or \
+           (buffer.dtype != values.dtype):
+            buffer = np.empty( values.shape, dtype=values.dtype )
+            self.buffer = buffer
+
+        np.multiply( values, self.scale, out=buffer )
+        if (self.offset != 0):
+            buffer += self.offset
+        return buffer
+
+    #   convert()
+    #----------------------------------------------------------
+
+#     unit_conversion() (class)
+#-------------------------------------------------------------------
@@ -4,6 +4,11 @@
 #      
 #  Copyright (c) 2009-2014, Scott D. Peckham
 #
+#  Oct 2014. Opt-in profiling of initialize(), update(), finalize(),
+#            update_*() methods and get/set_values() bytes.
+#            get_state() and set_state() for checkpoints.
+#            Opt-in packed domain (basin pixels only).
+#
 #  Sep 2014. New initialize_basin_vars(), using outlets.py.
 #            Removed obsolete functions.
 #
@@ -107,6 +112,17 @@
 #      Convenience methods (not BMI)
 #      -------------------------------
 #      print_final_report()          # (6/30/10)
+#      -------------------------
+#      enable_profiling()            # (10/14)
+#      profile_method()
+#      get_profile()
+#      print_profile_report()
+#
+#      get_state()                   # (10/14, for checkpoints)
+#      set_state()
+#
+#      enable_packed_domain()        # (10/14)
+#      -------------------------
 #      print_traceback()             # (10/10/10)
 #      -------------------------
 #      read_config_file()            # (5/17/10, 5/9/11)
@@ -119,12 +135,14 @@
 #      check_directories()
 #      -------------------------
 #      initialize_scalar()           # (2/5/13, for ref passing)
+#      update_in_place()             # (10/14, for ref passing)
 #      is_scalar()
 #      is_vector()
 #      is_grid()
 #
 #-----------------------------------------------------------------------
 
+import inspect
 import numpy as np
 import os
 import sys
@@ -140,7 +158,10 @@ import traceback        # (10/10/10)
    
 ## import cfg_files as cfg   # (not used)
 
+import model_input      ## (10/14, for checkpoints)
+import model_output
 import outlets          ## (9/19/14)
+import packed_domain    ## (10/14)
 import pixels
 import rti_files
 
@@ -162,6 +183,13 @@ def unit_test():
 #-----------------------------------------------------------------------
 class BMI_component:
 
+    #-------------------------------------------------------
+    # Components that can run on a packed domain set
+    # PACKED_OK to True.  See enable_packed_domain().
+    #-------------------------------------------------------
+    PACKED_OK = False
+    PACKED    = False
+    
     def __init__(self):
 
         ######################################################
@@ -358,6 +386,37 @@ class BMI_component:
         # print '##### in_directory   =', self.in_directory
         # print '##### grid_info_file =', self.grid_info_file
         
+        #----------------------------------------------
+        # Use grid info for the pixels in the basin ?
+        # (See enable_packed_domain().)  (10/14)
+        #----------------------------------------------
+        if (self.PACKED):
+            #------------------------------------------------
+            # A component that embeds another one (e.g. the
+            # D8 component of channels_base) passes on its
+            # domain, so both use the same pixels.
+            #------------------------------------------------
+            domain = getattr(self, 'domain', None)
+            if (domain is None):
+                #--------------------------------------------
+                # Same outlet file as read_outlet_file()
+                #--------------------------------------------
+                outlet_file = None
+                if (hasattr(self, 'pixel_file')):
+                    outlet_file = self.in_directory + self.pixel_file
+                elif (getattr(self, 'case_prefix', None) is not None):
+                    outlet_file = (self.in_directory + self.case_prefix +
+                                   '_outlets.txt')
+                domain = packed_domain.get_domain( info,
+                             self.in_directory + self.site_prefix + '_basin.rtm',
+                             self.in_directory + self.site_prefix + '_flow.rtg',
+                             outlet_file )
+            self.domain = domain
+            if (domain is not None):
+                info = domain.get_info()
+            else:
+                self.PACKED = False
+
         #----------------------
         # Convenient synonyms
         #-----------------------------------------------------
@@ -1297,6 +1356,7 @@ class BMI_component:
 
         if (mode == 'nondriver'):
             print comp_name + ': Finished.'
+            self.print_profile_report( comp_name )
             return
 
         if not(hasattr( self, 'in_directory' )):
@@ -1337,13 +1397,268 @@ class BMI_component:
         print ' '
         print 'Finished. (' + self.case_prefix + ')'
         print ' '
+        self.print_profile_report( comp_name )
 
         ## finish_str = ': Finished. (' + self.case_prefix + ')'
         ## print finish_str
         ## print comp_name + finish_str
         
     #   print_final_report()
-    #-------------------------------------------------------------------    
+    #-------------------------------------------------------------------
+    # Profiling methods (not BMI)
+    #-------------------------------------------------------------------
+    def enable_profiling(self):
+
+        #--------------------------------------------------------------
+        # Notes: This replaces (for this instance only) initialize(),
+        #        update(), finalize(), every "update_*()" method (e.g.
+        #        update_flow_depth() in channels_base.py), get_values()
+        #        and set_values() with wrappers that record the number
+        #        of calls and the total wall time, in self.profile.
+        #        Bytes moved by get_values() and set_values() are
+        #        saved in self.profile_bytes.
+        #
+        #        Times are inclusive, so the time of update() includes
+        #        that of the update_*() methods it calls.
+        #
+        #        Call this before initialize().  It is opt-in, since
+        #        the wrappers add a small cost to every call.  See
+        #        run_model() in framework/emeli.py (profile=True).
+        #--------------------------------------------------------------
+        if (getattr(self, 'PROFILE', False)):
+            return   # (already enabled)
+        self.PROFILE       = True
+        self.profile       = dict()   # (method name -> [calls, secs])
+        self.profile_bytes = {'get_values': 0, 'set_values': 0}
+
+        for name in dir(self):
+            if (name in ['initialize', 'update', 'finalize']) or \
+               (name.startswith('update_')):
+                if (inspect.ismethod( getattr(self, name) )):
+                    self.profile_method( name )
+        self.profile_method( 'get_values', 'get_values' )
+        self.profile_method( 'set_values', 'set_values' )
+        
+    #   enable_profiling()
+    #-------------------------------------------------------------------
+    def profile_method(self, name, bytes_key=None):
+
+        #------------------------------------------------------
+        # Note: If bytes_key is 'get_values', the size of the
+        #       returned values is counted.  If 'set_values',
+        #       the size of the values argument is counted.
+        #------------------------------------------------------
+        method = getattr(self, name)
+        stats  = self.profile.setdefault( name, [0, 0.0] )
+        counts = self.profile_bytes
+
+        def timed_method(*args, **kwargs):
+            start_time = time.time()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                stats[0] += 1
+                stats[1] += (time.time() - start_time)
+            if (bytes_key == 'get_values'):
+                counts[ bytes_key ] += np.asarray( result ).nbytes
+            elif (bytes_key == 'set_values'):
+                counts[ bytes_key ] += np.asarray( args[1] ).nbytes
+            return result
+
+        setattr(self, name, timed_method)
+        
+    #   profile_method()
+    #-------------------------------------------------------------------
+    def get_profile(self):
+
+        #------------------------------------------------------
+        # Note: Returns a dictionary with the profiling data,
+        #       that can be saved in a JSON file.  Components
+        #       may also count things of their own (e.g. time
+        #       sub-steps in channels_base.py) in a dictionary
+        #       called "profile_counts", which is included as
+        #       "counts".  (10/14)
+        #------------------------------------------------------
+        if not(getattr(self, 'PROFILE', False)):
+            return None
+        methods = dict()
+        for name in self.profile:
+            (n_calls, secs) = self.profile[ name ]
+            if (n_calls > 0):
+                methods[ name ] = {'calls': n_calls, 'time': secs}
+        profile = {'methods': methods,
+                   'bytes_get': int( self.profile_bytes['get_values'] ),
+                   'bytes_set': int( self.profile_bytes['set_values'] )}
+        counts = getattr(self, 'profile_counts', None)
+        if (counts is not None):
+            profile['counts'] = dict( (name, int( counts[name] ))
+                                      for name in counts )
+        return profile
+    
+    #   get_profile()
+    #-------------------------------------------------------------------
+    def print_profile_report(self, comp_name='BMI component'):
+
+        profile = self.get_profile()
+        if (profile is None):
+            return
+        methods = profile['methods']
+        names = methods.keys()
+        names.sort( key=lambda name: -methods[name]['time'] )
+        
+        print 'Profile for ' + comp_name + ':'
+        print '    ' + 'method'.ljust(34) + 'calls'.rjust(10) + \
+              'time [s]'.rjust(12) + 'mean [ms]'.rjust(12)
+        for name in names:
+            n_calls = methods[ name ]['calls']
+            secs    = methods[ name ]['time']
+            print '    ' + name.ljust(34) + str(n_calls).rjust(10) + \
+                  ('%.4f' % secs).rjust(12) + \
+                  ('%.4f' % (1000 * secs / n_calls)).rjust(12)
+        print '    bytes from get_values() = ' + str(profile['bytes_get'])
+        print '    bytes to set_values()   = ' + str(profile['bytes_set'])
+        counts = profile.get('counts', dict())
+        for name in sorted( counts ):
+            print '    ' + name.ljust(24) + '= ' + str(counts[ name ])
+        print ' '
+        
+    #   print_profile_report()
+    #-------------------------------------------------------------------
+    # Checkpoint methods (not BMI)
+    #-------------------------------------------------------------------
+    def get_state(self):
+
+        #--------------------------------------------------------------
+        # Notes: Returns a dictionary with copies of all of the state
+        #        variables of this component, the positions of its
+        #        open input files and the names and positions of its
+        #        output files.  This is used by save_checkpoint() in
+        #        framework/emeli.py, and can be pickled.
+        #
+        #        State variables are all attributes that are ndarrays,
+        #        numbers or booleans, or lists or tuples of these.
+        #        That includes the clock (e.g. time, time_index, DONE)
+        #        and all grids (e.g. Q, u, d, vol in channels_base.py).
+        #        Settings that were read from the CFG file are not
+        #        included (but vars read from input files are), so
+        #        a run that is restarted from a saved state can use
+        #        new settings (e.g. for a scenario).
+        #--------------------------------------------------------------
+        SKIP = set( getattr(self, 'cfg_var_names', []) )
+        SKIP.update( ['DEBUG', 'SKIP_ERRORS', 'SILENT', 'REPORT', 'PROFILE',
+                      'PACKED',
+                      'start_time', 'last_print_time'] )   # (wall clock)
+
+        def is_state( value ):
+            if isinstance( value, np.ndarray ):
+                return (value.dtype != np.object_)
+            if isinstance( value, (bool, int, long, float, np.generic) ):
+                return True
+            if isinstance( value, (list, tuple) ) and (len(value) > 0):
+                for item in value:
+                    if not(is_state( item )):
+                        return False
+                return True
+            return False
+
+        def copy( value ):
+            if isinstance( value, np.ndarray ):
+                return value.copy()
+            if isinstance( value, list ):
+                return [ copy( item ) for item in value ]
+            if isinstance( value, tuple ):
+                return tuple( [ copy( item ) for item in value ] )
+            return value
+
+        state_vars = dict()
+        for var_name, value in self.__dict__.iteritems():
+            if (var_name not in SKIP) and is_state( value ):
+                state_vars[ var_name ] = copy( value )
+
+        return {'vars':         state_vars,
+                'input_files':  model_input.get_file_positions( self ),
+                'output_files': model_output.get_file_positions( self ) }
+    
+    #   get_state()
+    #-------------------------------------------------------------------
+    def set_state(self, state, RESUME_OUTPUT=True):
+
+        #--------------------------------------------------------------
+        # Notes: Restores a state returned by get_state().  Call this
+        #        after initialize().  Arrays are copied in place when
+        #        the shape is unchanged, so that references to them
+        #        held by other components (or by the framework) are
+        #        still valid.  Anything else is replaced.
+        #
+        #        Input vars are always replaced, since they may be
+        #        references to a provider's arrays.  The framework
+        #        must set them again if it passes references.
+        #
+        #        Input files are moved to the saved positions.  If
+        #        RESUME_OUTPUT is True, the saved output files are
+        #        reopened (if they still exist), so that the new run
+        #        continues writing to them.  Otherwise, the new
+        #        output files from initialize() are used.
+        #--------------------------------------------------------------
+        input_var_names = set()
+        for long_var_name in self.get_input_var_names():
+            try:
+                input_var_names.add( self.get_var_name( long_var_name ) )
+            except:
+                pass
+            
+        for var_name, value in state['vars'].iteritems():
+            old_value = getattr( self, var_name, None )
+            if (var_name in input_var_names):
+                setattr( self, var_name, value )
+            elif isinstance( old_value, np.ndarray ) and \
+               isinstance( value, (np.ndarray, np.generic, bool, int,
+                                   long, float) ) and \
+               (old_value.flags.writeable) and \
+               (np.shape( value ) == old_value.shape):
+                np.copyto( old_value, value, casting='unsafe' )
+            else:
+                setattr( self, var_name, value )
+
+        model_input.set_file_positions( self, state['input_files'] )
+        if (RESUME_OUTPUT):
+            model_output.resume_files( self, state['output_files'] )
+            
+    #   set_state()
+    #-------------------------------------------------------------------
+    # Packed domain method (not BMI)
+    #-------------------------------------------------------------------
+    def enable_packed_domain(self):
+
+        #--------------------------------------------------------------
+        # Notes: Call this before initialize().  read_grid_info()
+        #        will then give this component grid info for a
+        #        "packed" grid with nrows = 1 and ncols = number of
+        #        pixels in the basin (from the "_basin.rtm" file),
+        #        so all of its grids have shape (1, n), and BMI
+        #        get_grid_shape() returns [n, 1, 0].  Input grids
+        #        are packed as they are read and output grids are
+        #        unpacked as they are written.  See packed_domain.py
+        #        and run_model() in framework/emeli.py.
+        #
+        #        Components that use the neighbors of a pixel other
+        #        than its D8 parent (e.g. ice) need the full grid;
+        #        they keep PACKED_OK = False.  If such a component
+        #        is Enabled, its grids won't match the others.
+        #
+        #        Returns True if the component can be packed.
+        #--------------------------------------------------------------
+        if not(self.PACKED_OK):
+            print 'WARNING: Packed domain not supported by component:'
+            print '         ' + str(self.__class__.__module__)
+            print ' '
+            return False
+        self.PACKED = True
+        self.domain = None    # (set by read_grid_info())
+        return True
+    
+    #   enable_packed_domain()
+    #-------------------------------------------------------------------
     def print_traceback(self, caller_name='TopoFlow'):
 
         print '################################################'
@@ -1400,6 +1715,7 @@ class BMI_component:
         #-----------------------------
         cfg_unit = open( self.cfg_file, 'r' )
         last_var_name = ''
+        self.cfg_var_names = []   # (not saved by get_state(), 10/14)
 
         #-----------------------------------------
         # Save user input into component's state
@@ -1468,6 +1784,13 @@ class BMI_component:
                         READ_FILENAME = True
                         ## var_type = 'string'
 
+                #-----------------------------------------------
+                # Vars read from files later are state, but
+                # settings are not saved by get_state().
+                #-----------------------------------------------
+                if not(READ_FILENAME):
+                    self.cfg_var_names.append( var_base )
+
                 #-----------------------------------           
                 # Read a value of type "var_type"
                 #-----------------------------------
@@ -1894,6 +2217,30 @@ class BMI_component:
         
     #   initialize_scalar()
     #-------------------------------------------------------------------
+    def update_in_place(self, var_name, values):
+
+        #--------------------------------------------------------
+        # Notes: Sets self.<var_name> to values "in place", so
+        #        that components with a reference to it see the
+        #        new values (see coupling_method = 'References'
+        #        in framework/emeli.py).  This works for grids
+        #        and for 0D "mutable scalars" (see above).
+        #
+        #        If values can't be copied into the var (e.g. a
+        #        scalar var and a grid of values), the var is set
+        #        to a copy of values, which breaks references.
+        #        A copy is used so that two vars never share an
+        #        array (e.g. infil's IN and Rg).  (10/14)
+        #--------------------------------------------------------
+        var = getattr( self, var_name, None )
+        if isinstance( var, np.ndarray ) and var.flags.writeable and \
+           (np.broadcast( var, values ).shape == var.shape):
+            np.copyto( var, values )
+        else:
+            setattr( self, var_name, np.array( values ) )
+        
+    #   update_in_place()
+    #-------------------------------------------------------------------
     # These are for convenience;  not part of BMI.
     #-------------------------------------------------------------------
     def is_scalar(self, var_name):
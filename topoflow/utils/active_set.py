@@ -0,0 +1,234 @@
+
+## Copyright (c) 2014, Scott D. Peckham
+## October 2014
+## Active set: run channel flow updates on wet pixels only.
+
+#-----------------------------------------------------------------------
+#
+#  get_wet_grid()
+#
+#  class active_d8
+#      __init__()
+#      route_to_parents()
+#
+#  class active_set
+#      __init__()
+#      get_frontier_wet()
+#      gather()
+#      scatter()
+#
+#-----------------------------------------------------------------------
+# Notes: At the start of a storm and during recessions, most of the
+#        pixels in a channels component are dry (vol = u = 0), and
+#        every update() step leaves them dry, unless they get water
+#        from rain (R > 0) or from a D8 child.  (Losses, R < 0, at
+#        a dry pixel don't change it, since vol is clipped at 0 in
+#        update_flow_volume().)  The "active set" is the set of
+#        wet pixels, plus the pixels that they flow to, and the
+#        pixels that those flow to.  In this
+#        mode (see channels_base.update_active_set()), the update
+#        methods run on 1D grids of the active pixels, and the
+#        results are then put back into the full grids.
+
+#        Pixels on the "edge" of the set (active, but their parent
+#        is not) stay dry for one step, since their children were
+#        dry at the start of the step, so their free-surface slope
+#        doesn't need their parent's depth.  The set is only
+#        rebuilt when it has to grow, i.e. when a pixel outside
+#        the set gets rain (R > 0), or when an edge pixel or one
+#        of its children gets wet (the "frontier").  It then drops
+#        pixels that have become dry again.
+
+#        An active_d8 has the few D8 attributes that are used by
+#        the channel update methods (ds, dw, noflow_IDs,
+#        parent_ID_grid and route_to_parents()), in terms of the
+#        1D index of the active pixels.
+#-----------------------------------------------------------------------
+
+import numpy as np
+
+#-----------------------------------------------------------------------
+def get_wet_grid( vol, u, R, wet=None ):
+
+    #--------------------------------------------------------
+    # Note: Returns a boolean grid, True where a pixel has
+    #       water (vol > 0), velocity (u != 0) or gets rain
+    #       (R > 0).  Other pixels stay dry if their D8
+    #       children are dry.
+    #--------------------------------------------------------
+    if (wet is None):
+        wet = np.zeros( np.shape( vol ), dtype='bool' )
+    np.greater( vol, 0, wet )
+    wet |= (u != 0)
+    wet |= (R > 0)
+    return wet
+
+#   get_wet_grid()
+#-----------------------------------------------------------------------
+class active_d8():
+
+    def __init__( self, d8, IDs, index ):
+
+        #----------------------------------------------------------
+        # Notes: d8    = the component's (full grid) d8 object
+        #        IDs   = calendar-style IDs of the active pixels,
+        #                sorted
+        #        index = active index of each pixel (-1 if not
+        #                active), as a 1D array
+        #
+        #        Active pixels whose parent is not active ("edge"
+        #        pixels) are given themselves as parent in
+        #        parent_ID_grid, which is used for the free-surface
+        #        slope.  They and their parents are dry, so
+        #        delta_d = 0, as it is in the full grid.  They
+        #        don't route flow to any pixel.
+        #----------------------------------------------------------
+        n_full = index.size
+        n = IDs.size
+        self.ds = np.take( d8.ds, IDs )
+        self.dw = np.take( d8.dw, IDs )
+
+        noflow = np.zeros( np.shape( d8.ds ), dtype='bool' )
+        noflow[ d8.noflow_IDs ] = True
+        self.noflow_IDs = np.int32( np.where( np.take( noflow, IDs ) )[0] )
+
+        k = np.arange( n, dtype='Int32' )
+        pIDs = np.clip( d8.parent_ID_grid.ravel()[ IDs ], 0, n_full - 1 )
+        pk = index[ pIDs ]
+        self.parent_ID_grid = np.where( pk >= 0, pk, k ).astype( 'Int32' )
+
+        #---------------------------------------------------
+        # Links to active parents, sorted by parent, with
+        # children in ID order (as in d8.child_IDs), so
+        # sums are the same as for the full grid.
+        #---------------------------------------------------
+        down = d8.downstream_index[ IDs ]
+        pk   = index[ np.maximum( down, 0 ) ]
+        routed = np.logical_and( down >= 0, pk >= 0 )
+        edge   = np.logical_and( down >= 0, pk < 0 )
+        children = k[ routed ]
+        parents  = pk[ routed ]
+
+        #--------------------------------------------
+        # Frontier = edge pixels and their children
+        #--------------------------------------------
+        frontier = edge.copy()
+        frontier[ children[ edge[ parents ] ] ] = True
+        self.frontier = np.int32( np.where( frontier )[0] )
+        order    = np.argsort( parents, kind='mergesort' )
+        self.child_IDs = children[ order ]
+        parents  = parents[ order ]
+        if (parents.size > 0):
+            first = np.ones( parents.size, dtype='bool' )
+            first[1:] = (parents[1:] != parents[:-1])
+            self.route_starts = np.int32( np.where( first )[0] )
+        else:
+            self.route_starts = np.zeros( 0, dtype='Int32' )
+        self.route_parent_IDs = parents[ self.route_starts ]
+        self.route_values = np.zeros( self.child_IDs.size, dtype='Float64' )
+        self.route_sums   = np.zeros( self.route_starts.size, dtype='Float64' )
+        self.route_old    = np.zeros( self.route_starts.size, dtype='Float64' )
+
+    #   __init__()
+    #-------------------------------------------------------------------
+    def route_to_parents( self, values, out ):
+
+        #------------------------------------------------------
+        # Note: Adds "values" from every active pixel to its
+        #       active parent, in "out", as in the "FAST" part
+        #       of tf_d8_base.route_to_parents().
+        #------------------------------------------------------
+        if (self.route_sums.size == 0):
+            return out
+        np.take( values, self.child_IDs, out=self.route_values )
+        np.add.reduceat( self.route_values, self.route_starts,
+                         out=self.route_sums )
+        np.take( out, self.route_parent_IDs, out=self.route_old )
+        self.route_old += self.route_sums
+        np.put( out, self.route_parent_IDs, self.route_old )
+        return out
+
+    #   route_to_parents()
+    #-------------------------------------------------------------------
+
+#     active_d8() (class)
+#-----------------------------------------------------------------------
+class active_set():
+
+    def __init__( self, wet, d8 ):
+
+        #----------------------------------------------------------
+        # Notes: wet = boolean grid from get_wet_grid()
+        #        d8  = the component's (full grid) d8 object
+        #
+        #        "inactive" is a boolean grid, True for pixels
+        #        that are not in the set.
+        #----------------------------------------------------------
+        wet_IDs = np.where( wet.ravel() )[0]
+        p1 = d8.downstream_index[ wet_IDs ]
+        p1 = p1[ p1 >= 0 ]
+        p2 = d8.downstream_index[ p1 ]
+        p2 = p2[ p2 >= 0 ]
+        self.IDs = np.int32( np.union1d( wet_IDs, np.union1d( p1, p2 ) ) )
+        self.n_pixels = self.IDs.size
+
+        n_full = wet.size
+        self.index = np.zeros( n_full, dtype='Int32' ) - 1
+        self.index[ self.IDs ] = np.arange( self.n_pixels, dtype='Int32' )
+        self.inactive = np.ones( wet.shape, dtype='bool' )
+        self.inactive.ravel()[ self.IDs ] = False
+
+        self.d8 = active_d8( d8, self.IDs, self.index )
+        self.grids = dict()
+        self.GROW  = False   # (see get_frontier_wet())
+
+    #   __init__()
+    #-------------------------------------------------------------------
+    def get_frontier_wet( self, vol, u ):
+
+        #------------------------------------------------------
+        # Note: vol and u are active (1D) grids.  Returns True
+        #       if a frontier pixel now has water or velocity,
+        #       so the set must grow downstream.
+        #------------------------------------------------------
+        k = self.d8.frontier
+        if (k.size == 0):
+            return False
+        return (np.any( np.take( vol, k ) > 0 ) or
+                np.any( np.take( u, k ) != 0 ))
+
+    #   get_frontier_wet()
+    #-------------------------------------------------------------------
+    def gather( self, name, grid ):
+
+        #------------------------------------------------------
+        # Note: Returns the active pixels of a full grid as a
+        #       1D grid that is reused for "name".  Scalars are
+        #       returned as is.
+        #------------------------------------------------------
+        if (np.size( grid ) == 1):
+            return grid
+        values = self.grids.get( name )
+        if (values is None):
+            values = np.zeros( self.n_pixels, dtype=np.asarray( grid ).dtype )
+            self.grids[ name ] = values
+        np.take( grid, self.IDs, out=values )
+        return values
+
+    #   gather()
+    #-------------------------------------------------------------------
+    def scatter( self, values, grid ):
+
+        #------------------------------------------------------
+        # Note: Puts the values of a 1D grid from gather()
+        #       back into the full grid, in place.
+        #------------------------------------------------------
+        if (np.size( grid ) == 1):
+            return
+        np.put( grid, self.IDs, values )
+
+    #   scatter()
+    #-------------------------------------------------------------------
+
+#     active_set() (class)
+#-----------------------------------------------------------------------
@@ -4,6 +4,9 @@
 ## April 29, 2009
 ## May 2010, Changed var_types from {0,1,2,3} to
 #            {'Scalar', 'Time_Series', 'Grid'}, etc.
+## Oct 2014, read_grid() maps grids from shared memory, if loaded.
+## Oct 2014, get_file_positions() and set_file_positions().
+## Oct 2014, read_grid() packs grids for a packed domain.
 #-------------------------------------------------------------------
 
 #  open_file()
@@ -11,6 +14,9 @@
 #  read_scalar()
 #  read_grid()
 #  close_file()
+#
+#  get_file_positions()   # (for checkpoints, 10/14)
+#  set_file_positions()
 
 #-------------------------------------------------------------------
 from numpy import *
@@ -18,6 +24,8 @@ import numpy
 
 import os.path
 
+import shared_grids
+
 #-------------------------------------------------------------------
 def open_file(var_type, input_file):
 
@@ -257,6 +265,18 @@ def read_grid(file_unit, rti, dtype='Float32'):
     # Note:  Grids are read from binary files.
     #        Return "None" if end of file.
     #-------------------------------------------
+
+    #-------------------------------------------------
+    # For a packed domain (see packed_domain.py),
+    # read the full grid and then pack it.  (10/14)
+    #-------------------------------------------------
+    domain = getattr(rti, 'domain', None)
+    if (domain is not None):
+        grid = read_grid(file_unit, domain.full_rti, dtype)
+        if (grid is None):
+            return grid
+        return domain.pack(grid)
+    
     file_size = os.path.getsize(file_unit.name)
     file_pos  = file_unit.tell()
     END_OF_FILE = (file_pos == file_size)
@@ -264,6 +284,19 @@ def read_grid(file_unit, rti, dtype='Float32'):
         grid = None
         return grid
     
+    #---------------------------------------------------
+    # Map the grid from shared memory if it was loaded
+    # there by shared_grids.load(), and move the file
+    # position as if it had been read.  (10/14)
+    #---------------------------------------------------
+    grid = shared_grids.get_grid(file_unit.name, dtype,
+                                 (rti.nrows, rti.ncols), file_pos)
+    if (grid is not None):
+        file_unit.seek(grid.nbytes, 1)
+        if (rti.SWAP_ENDIAN):
+            grid = grid.byteswap()   # (not in place)
+        return grid
+    
     grid = fromfile(file_unit, count=rti.n_pixels, dtype=dtype)
     grid = reshape(grid, (rti.nrows, rti.ncols))
     if (rti.SWAP_ENDIAN):
@@ -284,6 +317,60 @@ def close_file(file_unit):
 
 #   close_file()
 #-------------------------------------------------------------------
+def get_file_positions(self):
 
+    #--------------------------------------------------------
+    # Notes:  Returns the name and current position of each
+    #         input file that is open in the component
+    #         "self", as a dictionary.  Lists of file units
+    #         (e.g. one per soil layer) are also included.
+    #         See BMI_base.get_state().
+    #--------------------------------------------------------
+    def position( unit ):
+        if isinstance( unit, file ) and not(unit.closed) and \
+           ('r' in unit.mode) and ('+' not in unit.mode):
+            return (unit.name, unit.tell())
+        return None
+
+    positions = dict()
+    for var_name, value in self.__dict__.iteritems():
+        if isinstance( value, list ):
+            pos_list = [ position( unit ) for unit in value ]
+            if (pos_list.count( None ) < len(pos_list)):
+                positions[ var_name ] = pos_list
+        else:
+            pos = position( value )
+            if (pos is not None):
+                positions[ var_name ] = pos
 
+    return positions
+
+#   get_file_positions()
+#-------------------------------------------------------------------
+def set_file_positions(self, positions):
 
+    #--------------------------------------------------------
+    # Notes:  Moves each input file of the component "self"
+    #         to a position saved by get_file_positions(),
+    #         so the next call to read_next() will read the
+    #         same record as before.  Files that have been
+    #         replaced by a file with another name are left
+    #         where they are.
+    #--------------------------------------------------------
+    def set_position( unit, pos ):
+        if (pos is None) or not(isinstance( unit, file )):
+            return
+        if (unit.closed) or (unit.name != pos[0]):
+            return
+        unit.seek( pos[1] )
+
+    for var_name, pos in positions.iteritems():
+        value = getattr( self, var_name, None )
+        if isinstance( value, list ):
+            for k in xrange( min( len(value), len(pos) ) ):
+                set_position( value[k], pos[k] )
+        else:
+            set_position( value, pos )
+
+#   set_file_positions()
+#-------------------------------------------------------------------
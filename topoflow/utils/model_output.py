@@ -1,6 +1,7 @@
 
 # Copyright (c) 2001-2013, Scott D. Peckham
 #
+# Oct 2014      Output for packed domains is for the full grid.
 # Jan 2012      Fixed "print," bug and fixed "dtype" support.
 # June 2010     Reorganized & streamlined with "exec", etc.
 # October 2009  routines to allow more output file formats)
@@ -31,9 +32,17 @@
 #      add_cube()
 #      close_cs_file()
 #
+#      get_file_positions()   # (for checkpoints, 10/14)
+#      resume_files()
+#
+#      get_full_info()        # (for packed domains, 10/14)
+#      get_full_IDs()
+#      unpack_grid()
+#
 #-------------------------------------------------------------------
 
 import numpy
+import os
 import sys
 
 import file_utils
@@ -115,6 +124,13 @@ def open_new_gs_file(self, file_name, info=None,
                      time_units='minutes',
                      nx=None, ny=None, dx=None, dy=None):
 
+    #-------------------------------------------------
+    # Output files for a packed domain are for the
+    # full grid (see packed_domain.py).  (10/14)
+    #-------------------------------------------------
+    grid_info = get_full_info( self.rti )
+    info      = get_full_info( info )
+    
     #---------------------------
     # Was grid info provided ?
     #---------------------------
@@ -173,7 +189,7 @@ def open_new_gs_file(self, file_name, info=None,
               gs_file_str + ", '.nc')" )
         exec( ncgs_unit_str + "=" + "ncgs_files.ncgs_file()" )
         exec( ncgs_unit_str + ".open_new_file(" + ncgs_file_str +
-              ", self.rti, var_name, long_name, units_name, " +
+              ", grid_info, var_name, long_name, units_name, " +
               "dtype=dtype, " +
               "time_units=time_units)" )
         MAKE_RTS = False
@@ -212,7 +228,7 @@ def open_new_gs_file(self, file_name, info=None,
                   gs_file_str + ", '.rts')" )
             exec( rts_unit_str + " = rts_files.rts_file()" )
             exec( rts_unit_str + ".open_new_file(" + rts_file_str +
-                  ", self.rti, var_name, " +
+                  ", grid_info, var_name, " +
                   "dtype=dtype, " +
                   "MAKE_BOV=True)" )
         except:
@@ -234,6 +250,8 @@ def add_grid(self, var, var_name, time=None, SILENT=True):
 ##    ncgs_unit_str = "self." + var_name + "_ncgs_unit"
 ##    exec( ncgs_unit_str + ".add_grid( var, var_name, time )")
 
+    var = unpack_grid( self, var )   # (10/14)
+
     #--------------------------------
     # Add the grid to a netCDF file
     #--------------------------------
@@ -285,8 +303,7 @@ def open_new_ts_file(self, file_name, IDs, ####
     var_names   = []
     long_names  = []
     units_names = []
-    rows        = IDs[0]
-    cols        = IDs[1]
+    rows, cols  = get_full_IDs( self, IDs )   # (10/14)
     for k in xrange(n_IDs):
         #----------------------------------------
         # Construct var_name of form:  Q[24,32]
@@ -433,8 +450,7 @@ def open_new_ps_file(self, file_name, IDs, ####
     var_names   = []
     long_names  = []
     units_names = []
-    rows        = IDs[0]
-    cols        = IDs[1]
+    rows, cols  = get_full_IDs( self, IDs )   # (10/14)
     for k in xrange(n_IDs):
         #----------------------------------------
         # Construct var_name of form:  Q[24,32]
@@ -566,6 +582,13 @@ def open_new_cs_file(self, file_name, info=None,
                      time_units='minutes',
                      nx=None, ny=None, dx=None, dy=None):
 
+    #-------------------------------------------------
+    # Output files for a packed domain are for the
+    # full grid (see packed_domain.py).  (10/14)
+    #-------------------------------------------------
+    grid_info = get_full_info( self.rti )
+    info      = get_full_info( info )
+    
     #---------------------------
     # Was grid info provided ?
     #---------------------------
@@ -599,7 +622,7 @@ def open_new_cs_file(self, file_name, info=None,
               cs_file_str + ", '.nc')" )
         exec( nccs_unit_str + "=" + "nccs_files.nccs_file()" )
         exec( nccs_unit_str + ".open_new_file(" + nccs_file_str +
-              ", self.rti, var_name, long_name, units_name, " +
+              ", grid_info, var_name, long_name, units_name, " +
               "dtype=dtype, " +  ## (11/5/13)
               "time_units=time_units)" )
         MAKE_RT3 = False
@@ -650,6 +673,8 @@ def add_cube(self, var, var_name, time=None):
 ##    nccs_unit_str = "self." + var_name + "_nccs_unit"
 ##    exec( nccs_unit_str + ".add_cube( var, var_name, time )")
     
+    var = unpack_grid( self, var )   # (10/14)
+    
     ## if (USE_NC):
     try:
         nccs_unit_str = "self." + var_name + "_nccs_unit"
@@ -686,4 +711,159 @@ def close_cs_file(self, var_name):
     
 #   close_cs_file()
 #-------------------------------------------------------------------
+def get_file_positions(self):
+
+    #--------------------------------------------------------
+    # Notes:  Returns the file name and the position of each
+    #         output file that is open in the component
+    #         "self", as a dictionary.  Output files are
+    #         objects from ncgs_files, ncts_files, rts_files,
+    #         text_ts_files, etc., saved in attributes with
+    #         names like "Q_ncgs_unit".  All pending output
+    #         is written to disk first.
+    #         See BMI_base.get_state().
+    #--------------------------------------------------------
+    unit_names = ['ncgs_unit', 'ncts_unit', 'ncps_unit', 'nccs_unit',
+                  'rts_unit', 'ts_unit']
+    positions  = dict()
+    for var_name, unit in self.__dict__.iteritems():
+        if not(var_name.endswith('_unit')) or \
+           not(hasattr( unit, 'file_name' )):
+            continue
+        for unit_name in unit_names:
+            file_unit = getattr( unit, unit_name, None )
+            if (file_unit is not None) and (file_unit is not False):
+                break
+        else:
+            continue
+
+        try:
+            if isinstance( file_unit, file ):
+                if (file_unit.closed):
+                    continue
+                file_unit.flush()
+                position = file_unit.tell()
+            else:
+                file_unit.sync()      # (netCDF file)
+                position = None
+        except:
+            continue     # (file was closed)
+        
+        positions[ var_name ] = { 'file_name':  unit.file_name,
+                                  'unit_name':  unit_name,
+                                  'time_index': getattr( unit, 'time_index', None ),
+                                  'position':   position }
+
+    return positions
+
+#   get_file_positions()
+#-------------------------------------------------------------------
+def resume_files(self, positions):
 
+    #--------------------------------------------------------
+    # Notes:  Reopens the output files that were saved by
+    #         get_file_positions() so that a restarted model
+    #         run continues to write to them.  The new (and
+    #         still empty) files that were opened by the
+    #         component's initialize() are deleted.
+    #
+    #         Only files in the same output directory are
+    #         reopened.  Records written after the checkpoint
+    #         are overwritten.  Binary and text files are also
+    #         truncated; netCDF files cannot be shortened.
+    #--------------------------------------------------------
+    for var_name, saved in positions.iteritems():
+        unit = getattr( self, var_name, None )
+        if (unit is None) or not(hasattr( unit, 'file_name' )):
+            continue
+        old_file = saved['file_name']
+        new_file = unit.file_name
+        if (new_file == old_file) or not(os.path.exists( old_file )):
+            continue
+        if (os.path.dirname( new_file ) != os.path.dirname( old_file )):
+            continue   # (new output directory, e.g. for a scenario)
+        unit_name = saved['unit_name']
+        file_unit = getattr( unit, unit_name, None )
+        if (file_unit is None) or (file_unit is False):
+            continue
+
+        #-------------------------------
+        # Close and remove the new file
+        #-------------------------------
+        file_unit.close()
+        if (os.path.exists( new_file )):
+            os.remove( new_file )
+        if (unit_name == 'rts_unit'):
+            for extension in ['.rti', '.bov']:
+                aux_file = file_utils.replace_extension( new_file, extension )
+                if (os.path.exists( aux_file )):
+                    os.remove( aux_file )
+
+        #-------------------------
+        # Reopen the saved file
+        #-------------------------
+        if isinstance( file_unit, file ):
+            if ('b' in file_unit.mode):
+                file_unit = open( old_file, 'r+b' )
+            else:
+                file_unit = open( old_file, 'r+' )
+            file_unit.seek( saved['position'] )
+            file_unit.truncate()
+        else:
+            nc = unit.import_netCDF4()
+            file_unit = nc.Dataset( old_file, mode='a' )
+        setattr( unit, unit_name, file_unit )
+        unit.file_name = old_file
+        if (saved['time_index'] is not None):
+            unit.time_index = saved['time_index']
+
+        #-------------------------------------
+        # Update the file name in "self" too,
+        # e.g. self.Q_ncgs_file
+        #-------------------------------------
+        file_str = var_name[:-len('_unit')] + '_file'
+        if (getattr( self, file_str, None ) == new_file):
+            setattr( self, file_str, old_file )
+
+#   resume_files()
+#-------------------------------------------------------------------
+def get_full_info( info ):
+
+    #-----------------------------------------------------
+    # Note: Returns grid info for the full grid if info
+    #       is for a packed domain (see packed_domain.py).
+    #-----------------------------------------------------
+    domain = getattr( info, 'domain', None )
+    if (domain is None):
+        return info
+    return domain.full_rti
+
+#   get_full_info()
+#-------------------------------------------------------------------
+def get_full_IDs( self, IDs ):
+
+    #-------------------------------------------------------
+    # Note: Returns (rows, cols) in the full grid, so that
+    #       names like "Q_24_32" are the same for a packed
+    #       domain (see packed_domain.py).
+    #-------------------------------------------------------
+    domain = getattr( getattr(self, 'rti', None), 'domain', None )
+    if (domain is None):
+        return (IDs[0], IDs[1])
+    return domain.unpack_IDs( IDs )
+
+#   get_full_IDs()
+#-------------------------------------------------------------------
+def unpack_grid( self, var ):
+
+    #---------------------------------------------------------
+    # Note: Grids (and cubes) for a packed domain are saved
+    #       as full grids, with zeros outside of the domain.
+    #---------------------------------------------------------
+    domain = getattr( getattr(self, 'rti', None), 'domain', None )
+    if (domain is None):
+        return var
+    return domain.unpack( var )
+
+#   unpack_grid()
+#-------------------------------------------------------------------
@@ -12,6 +12,8 @@
 # read_outlet_file()
 # check_outlet_IDs()
 # read_main_basin_IDs()
+# get_basin_IDs()         # (10/14)
+# get_basin_sums()        # (10/14)
 # 
 #-----------------------------------------------------------------------
 
@@ -122,19 +124,36 @@ def read_outlet_file( self ):
 	# then using int32() here converts vector with one
 	# element to a scalar and produces an error.
 	#-----------------------------------------------------
+    #------------------------------------------------
+    # Rows and cols are for the full grid, even for
+    # a packed domain (see packed_domain.py). (10/14)
+    #------------------------------------------------
+    domain = getattr(self.rti, 'domain', None)
+    rti    = self.rti
+    if (domain is not None):
+        rti = domain.full_rti
     ## self.outlet_IDs = int32(self.outlet_rows * self.nx) + int32(self.outlet_cols)
-    outlet_IDs = (outlet_rows * self.nx) + outlet_cols
+    outlet_IDs = (outlet_rows * rti.ncols) + outlet_cols
     outlet_ID  = outlet_IDs[0]
     ## print 'outlet_ID =', outlet_ID
 
 	#------------------------------------------
 	# Are all the outlet IDs inside the DEM ?
 	#------------------------------------------
-    OK = check_outlet_IDs( outlet_IDs, self.rti.n_pixels )
+    OK = check_outlet_IDs( outlet_IDs, rti.n_pixels )
     if not(OK):
         print 'ERROR: Some outlet_IDs lie outside of DEM.'
         print ' '
         return
+
+    if (domain is not None):
+        outlet_rows = outlet_rows[:n_outlets]
+        outlet_cols = outlet_cols[:n_outlets]
+        (outlet_rows, outlet_cols) = domain.pack_IDs( (outlet_rows, outlet_cols) )
+        if (outlet_cols.min() < 0):
+            print 'ERROR: Some outlet_IDs lie outside of packed domain.'
+            print ' '
+            return
 		
 	#-------------------------------------------
 	# Save IDs as a tuple of row indices and
@@ -182,6 +201,15 @@ def read_main_basin_IDs( self ):
 	self.basin_RTM_file = (self.in_directory +
 						   self.site_prefix + '_basin.rtm')
 	
+	#------------------------------------------------
+	# Without an RTM file, get the basin pixels from
+	# the upstream index of the D8 component (10/14)
+	#------------------------------------------------
+	if not(os.path.exists(self.basin_RTM_file)) and \
+	   hasattr(getattr(self, 'd8', None), 'tour_IDs'):
+		self.basin_IDs = get_basin_IDs( self, self.d8 )
+		return
+
 	#----------------------------------
 	# Read basin pixels from RTM_file
 	#----------------------------------
@@ -209,6 +237,9 @@ def read_main_basin_IDs( self ):
 	# Save IDs as a 1D array of long-integer,
 	# calendar-style indices
 	#------------------------------------------
+	domain = getattr(self.rti, 'domain', None)
+	if (domain is not None):
+		basin_IDs = domain.index[ basin_IDs ]   # (packed IDs, 10/14)
 	self.basin_IDs = basin_IDs    # (use Q.flat[basin_IDs])
 
 	#-------------------------------------------
@@ -219,4 +250,29 @@ def read_main_basin_IDs( self ):
 	### self.basin_IDs = (basin_IDs / nx, basin_IDs % nx)
 
 #   read_main_basin_IDs()
-#-------------------------------------------------------------------
\ No newline at end of file
+#-------------------------------------------------------------------
+def get_basin_IDs( self, d8, k=0 ):
+
+	#----------------------------------------------------------
+	# Note: Returns calendar-style IDs of all grid cells that
+	#       drain to outlet k, from the upstream index of a
+	#       tf_d8_base.d8_component, without a grid traversal.
+	#----------------------------------------------------------
+	ID = (self.outlet_IDs[0][k] * self.nx) + self.outlet_IDs[1][k]
+	return d8.upstream_IDs( ID )
+
+#   get_basin_IDs()
+#-------------------------------------------------------------------
+def get_basin_sums( self, d8, values ):
+
+	#----------------------------------------------------------
+	# Note: Returns the sum of "values" (a grid) over the
+	#       basin of every outlet, e.g. basin areas with
+	#       values = da, or rain volumes with values = P * da.
+	#       This is cheap even for hundreds of outlets.
+	#----------------------------------------------------------
+	IDs = (self.outlet_IDs[0] * self.nx) + self.outlet_IDs[1]
+	return d8.upstream_sums( values, IDs )
+
+#   get_basin_sums()
+#-------------------------------------------------------------------
@@ -0,0 +1,335 @@
+## Copyright (c) 2014, Scott D. Peckham
+## October 2014
+## Packed domain: run components on the pixels of one basin only.
+
+#-----------------------------------------------------------------------
+#
+#  get_domain()
+#  get_domain_key()
+#  clear_domains()
+#  get_outlet_IDs()
+#
+#  class packed_info
+#
+#  class packed_domain
+#      __init__()
+#      get_info()
+#      pack()
+#      unpack()
+#      pack_IDs()
+#      unpack_IDs()
+#
+#-----------------------------------------------------------------------
+# Notes: Every component allocates and updates grids with the full
+#        (ny, nx) shape of the DEM, although for most basins only
+#        20-40% of the pixels drain to the outlet.  In "packed"
+#        mode (see BMI_base.enable_packed_domain() and run_model()
+#        in framework/emeli.py) a component's grid info (self.rti)
+#        describes a grid with nrows = 1 and ncols = n, where n is
+#        the number of pixels in the basin (from the basin RTM
+#        file).  Since components allocate their grids with shape
+#        (self.ny, self.nx), all of their grids then have shape
+#        (1, n), and code that works pixel by pixel is unchanged.
+
+#        The packed grid info has a "domain" attribute, which is
+#        used (via self.rti) to:
+#           pack grids as they are read from RTG/RTS files
+#              (model_input.read_grid(), rtg_files.read_grid()),
+#           unpack grids as they are written to output files
+#              (model_output.add_grid() and add_cube()),
+#           map (row, col) IDs of outlets to packed IDs
+#              (outlets.read_outlet_file()), and
+#           get packed D8 parent IDs (tf_d8_base.py).
+
+#        The monitored pixels (outlets) in the outlet file, and
+#        all pixels that drain to them, are added to the basin,
+#        since the basin in the RTM file may not include them.
+#        They keep their D8 flow codes.  Pixels outside of the
+#        basin that basin pixels flow to (usually just the ones
+#        below the outlets) are included in the domain, with a
+#        flow code of 0, so every parent ID is in the domain.
+#        Results at the basin pixels are the same as in the
+#        full grid, but sums over all pixels (e.g. vol_P) are
+#        now just for the basin.
+
+#        Only fixed-length pixels (pixel_geom = 1) are supported,
+#        since then pixel sizes do not depend on the row.
+#-----------------------------------------------------------------------
+
+import numpy as np
+import os.path
+
+import outlets
+import rtg_files
+
+domains = dict()   # (see get_domain_key() -> packed_domain)
+
+#-----------------------------------------------------------------------
+def get_domain( rti, basin_RTM_file, flow_file, outlet_file=None,
+                SILENT=True ):
+
+    #--------------------------------------------------------
+    # Note: Returns the packed_domain for the pixels in the
+    #       RTM file, the pixels that drain to the outlets in
+    #       outlet_file, and the pixels they flow to, or None
+    #       if the grid can't be packed.  Domains are shared
+    #       by all components in the process that use the
+    #       same files and grid.  See clear_domains().
+    #--------------------------------------------------------
+    key = get_domain_key( rti, basin_RTM_file, flow_file, outlet_file )
+    if (key in domains):
+        return domains[ key ]
+
+    if (rti.pixel_geom != 1):
+        print 'WARNING: Packed domain needs fixed-length pixels.'
+        print '         Using the full grid.'
+        print ' '
+        return None
+    for file_name in [basin_RTM_file, flow_file]:
+        if not(os.path.exists( file_name )):
+            print 'WARNING: Packed domain needs the file:'
+            print '         ' + file_name
+            print '         Using the full grid.'
+            print ' '
+            return None
+
+    #----------------------------------------
+    # Read basin pixel IDs from RTM file
+    # (as in outlets.read_main_basin_IDs())
+    #----------------------------------------
+    basin_IDs = np.fromfile( basin_RTM_file, dtype='Int32' )
+    if (rti.SWAP_ENDIAN):
+        basin_IDs.byteswap( True )
+    w = np.logical_and( basin_IDs >= 0, basin_IDs < rti.n_pixels )
+    basin_IDs = np.unique( basin_IDs[ w ] )
+
+    #----------------------------------------
+    # Parent ID of every pixel in the full
+    # grid (parent_ID = ID + incs[code]), or
+    # -1 for invalid codes and off the grid
+    #----------------------------------------
+    nx = rti.ncols
+    codes = rtg_files.read_grid( flow_file, rti, RTG_type='BYTE' )
+    inc_map = np.zeros( 256, dtype='Int32' )
+    inc_map[ [1, 2, 4, 8, 16, 32, 64, 128] ] = [-nx + 1, 1, nx + 1, nx,
+                                                 nx - 1, -1, -nx - 1, -nx]
+    incs = inc_map[ np.uint8( codes.ravel() ) ]
+    parent_IDs = np.arange( rti.n_pixels, dtype='Int32' ) + incs
+    w = np.logical_or( incs == 0, np.logical_or( parent_IDs < 0,
+                                      parent_IDs >= rti.n_pixels ) )
+    parent_IDs[ w ] = -1
+
+    #-----------------------------------------
+    # Add the outlets and all pixels that
+    # drain to them (one layer per pass)
+    #-----------------------------------------
+    outlet_IDs = get_outlet_IDs( rti, outlet_file )
+    if (outlet_IDs.size > 0):
+        up = np.zeros( rti.n_pixels, dtype='bool' )
+        up[ outlet_IDs ] = True
+        w  = (parent_IDs >= 0)
+        while (True):
+            new = np.logical_and( w, np.logical_not( up ) )
+            new[ new ] = up[ parent_IDs[ new ] ]
+            if not(new.any()):
+                break
+            up[ new ] = True
+        basin_IDs = np.union1d( basin_IDs, np.where( up )[0] )
+
+    #-------------------------------------
+    # Add pixels that basin pixels flow to
+    #-------------------------------------
+    pIDs = parent_IDs[ basin_IDs ]
+    IDs  = np.union1d( basin_IDs, pIDs[ pIDs >= 0 ] )
+    halo = np.logical_not( np.in1d( IDs, basin_IDs ) )
+
+    domain = packed_domain( rti, IDs, halo )
+    domains[ key ] = domain
+    if not(SILENT):
+        print 'Packed domain: ' + str(IDs.size) + ' of ' + \
+              str(rti.n_pixels) + ' pixels.'
+    return domain
+
+#   get_domain()
+#-----------------------------------------------------------------------
+def get_domain_key( rti, basin_RTM_file, flow_file, outlet_file ):
+
+    #--------------------------------------------------------
+    # Note: Every input that defines a domain: the grid
+    #       shape, and the names and modification times of
+    #       the basin, flow and outlet files.
+    #--------------------------------------------------------
+    key = [ rti.ncols, rti.nrows ]
+    for file_name in [basin_RTM_file, flow_file, outlet_file]:
+        if (file_name is not None) and os.path.exists( file_name ):
+            key += [ os.path.realpath( file_name ),
+                     os.path.getmtime( file_name ) ]
+        else:
+            key += [ file_name, None ]
+    return tuple( key )
+
+#   get_domain_key()
+#-----------------------------------------------------------------------
+def clear_domains():
+
+    #--------------------------------------------------------
+    # Note: Called by run_model() in framework/emeli.py at
+    #       the start of a run, so a run never uses a domain
+    #       left over from an earlier run.
+    #--------------------------------------------------------
+    domains.clear()
+
+#   clear_domains()
+#-----------------------------------------------------------------------
+def get_outlet_IDs( rti, outlet_file ):
+
+    #--------------------------------------------------------
+    # Note: Returns calendar-style IDs in the full grid of
+    #       the monitored pixels in outlet_file, as read by
+    #       outlets.read_outlet_file(), which expects a
+    #       TopoFlow BMI object.  A missing file gives none.
+    #--------------------------------------------------------
+    if (outlet_file is None) or not(os.path.exists( outlet_file )):
+        return np.zeros( 0, dtype='Int32' )
+    comp = packed_info()
+    comp.in_directory = ''
+    comp.pixel_file   = outlet_file
+    comp.rti          = rti
+    comp.nx           = rti.ncols
+    comp.ny           = rti.nrows
+    outlets.read_outlet_file( comp )
+    if not(hasattr( comp, 'outlet_IDs' )):
+        return np.zeros( 0, dtype='Int32' )
+    (rows, cols) = comp.outlet_IDs
+    return np.int32( (rows[:comp.n_outlets] * rti.ncols) +
+                     cols[:comp.n_outlets] )
+
+#   get_outlet_IDs()
+#-----------------------------------------------------------------------
+class packed_info():
+    pass
+
+#-----------------------------------------------------------------------
+class packed_domain():
+
+    def __init__( self, rti, IDs, halo=None ):
+
+        #----------------------------------------------------------
+        # Notes: rti  = grid info for the full grid
+        #        IDs  = calendar-style IDs of the domain pixels
+        #               in the full grid, sorted
+        #        halo = True for pixels that are not in the basin
+        #               (these get a flow code of 0)
+        #----------------------------------------------------------
+        self.full_rti = rti
+        self.nx  = rti.ncols
+        self.ny  = rti.nrows
+        self.IDs = np.int32( IDs )
+        self.n_pixels = self.IDs.size
+        if (halo is None):
+            halo = np.zeros( self.n_pixels, dtype='bool' )
+        self.halo = halo
+
+        #------------------------------------------
+        # Packed ID of each pixel (-1 if outside)
+        #------------------------------------------
+        self.index = np.zeros( rti.n_pixels, dtype='Int32' ) - 1
+        self.index[ self.IDs ] = np.arange( self.n_pixels, dtype='Int32' )
+
+        #------------------------------------------------
+        # Pixels on the edges of the full grid, or in
+        # the halo, as packed "numpy.where" style IDs
+        #------------------------------------------------
+        rows = self.IDs / self.nx
+        cols = self.IDs % self.nx
+        edge = np.logical_or( np.logical_or( rows == 0, rows == self.ny - 1 ),
+                              np.logical_or( cols == 0, cols == self.nx - 1 ) )
+        k = np.where( np.logical_or( edge, halo ) )[0]
+        self.edge_IDs = (np.zeros( k.size, dtype='Int32' ), np.int32( k ))
+        k = np.where( np.logical_not( edge ) )[0]
+        self.interior_IDs = (np.zeros( k.size, dtype='Int32' ), np.int32( k ))
+
+    #   __init__()
+    #-------------------------------------------------------------------
+    def get_info( self ):
+
+        #-------------------------------------------------------
+        # Note: Returns grid info for the packed (1, n) grid,
+        #       with a "domain" attribute.  rti_files.read_info()
+        #       returns a class (not an instance), so its
+        #       attributes are copied into a new object.
+        #-------------------------------------------------------
+        info = packed_info()
+        for name in dir( self.full_rti ):
+            if not(name.startswith('__')):
+                setattr( info, name, getattr( self.full_rti, name ) )
+        info.ncols     = self.n_pixels
+        info.nrows     = 1
+        info.n_pixels  = self.n_pixels
+        info.grid_size = info.bpe * self.n_pixels
+        info.domain    = self
+        return info
+
+    #   get_info()
+    #-------------------------------------------------------------------
+    def pack( self, grid ):
+
+        #-------------------------------------------------------
+        # Note: Returns the domain pixels of a full grid (or
+        #       of each grid in a stack) as a (1, n) grid.
+        #       Scalars and packed grids are returned as is.
+        #-------------------------------------------------------
+        grid = np.asarray( grid )
+        if (grid.shape[-2:] != (self.ny, self.nx)):
+            return grid
+        lead = grid.shape[:-2]
+        grid = grid.reshape( lead + (self.nx * self.ny,) )
+        return grid[..., self.IDs].reshape( lead + (1, self.n_pixels) )
+
+    #   pack()
+    #-------------------------------------------------------------------
+    def unpack( self, values, fill=0 ):
+
+        #-------------------------------------------------------
+        # Note: Returns a full grid (or stack of grids) with
+        #       the packed values and "fill" elsewhere.
+        #       Scalars are returned as is.
+        #-------------------------------------------------------
+        values = np.asarray( values )
+        if (values.shape[-2:] != (1, self.n_pixels)):
+            return values
+        lead = values.shape[:-2]
+        grid = np.empty( lead + (self.nx * self.ny,), dtype=values.dtype )
+        grid.fill( fill )
+        grid[..., self.IDs] = values.reshape( lead + (self.n_pixels,) )
+        return grid.reshape( lead + (self.ny, self.nx) )
+
+    #   unpack()
+    #-------------------------------------------------------------------
+    def pack_IDs( self, IDs ):
+
+        #--------------------------------------------------------
+        # Note: Maps (rows, cols) in the full grid to packed
+        #       (rows, cols), "numpy.where" style.  Packed
+        #       cols are -1 for pixels outside of the domain.
+        #--------------------------------------------------------
+        k = self.index[ (np.asarray( IDs[0] ) * self.nx) +
+                        np.asarray( IDs[1] ) ]
+        return (np.zeros( k.shape, dtype='Int32' ), k)
+
+    #   pack_IDs()
+    #-------------------------------------------------------------------
+    def unpack_IDs( self, IDs ):
+
+        #--------------------------------------------------------
+        # Note: Maps packed (rows, cols) to (rows, cols) in the
+        #       full grid, e.g. for names like "Q_24_32".
+        #--------------------------------------------------------
+        full_IDs = self.IDs[ IDs[1] ]
+        return (full_IDs / self.nx, full_IDs % self.nx)
+
+    #   unpack_IDs()
+    #-------------------------------------------------------------------
+
+#     packed_domain() (class)
+#-----------------------------------------------------------------------
@@ -18,6 +18,7 @@
 import numpy
 import bov_files
 import rti_files
+import shared_grids
 
 #-------------------------------------------------------------------
 #
@@ -433,19 +434,37 @@ def read_grid( RTG_file, rti, RTG_type='FLOAT',
     #----------------------------------------------------------
     if not(SILENT):    
         print 'Reading grid values...'
+
+    #-------------------------------------------------
+    # For a packed domain (see packed_domain.py),
+    # read the full grid and then pack it.  (10/14)
+    #-------------------------------------------------
+    domain = getattr( rti, 'domain', None )
+    if (domain is not None):
+        grid = read_grid( RTG_file, domain.full_rti, RTG_type,
+                          REPORT=REPORT, SILENT=SILENT )
+        return domain.pack( grid )
         
-    #-------------------
-    # Read in the grid
-    #-------------------
-    file_unit = open( RTG_file, 'rb' )
+    #-----------------------------------------------
+    # Map the grid from shared memory, if it was
+    # loaded there (e.g. for an ensemble run), or
+    # else read in the grid.  (10/14)
+    #-----------------------------------------------
     dtype = rti_files.get_numpy_data_type( RTG_type )
-    grid  = numpy.fromfile( file_unit, count=rti.n_pixels,
-                            dtype=dtype )
-    grid  = grid.reshape( rti.nrows, rti.ncols )
-
-    if (rti.SWAP_ENDIAN):
-        grid.byteswap( True )
-    file_unit.close()
+    grid  = shared_grids.get_grid( RTG_file, dtype,
+                                   (rti.nrows, rti.ncols) )
+    if (grid is not None):
+        if (rti.SWAP_ENDIAN):
+            grid = grid.byteswap()   # (not in place)
+    else:
+        file_unit = open( RTG_file, 'rb' )
+        grid  = numpy.fromfile( file_unit, count=rti.n_pixels,
+                                dtype=dtype )
+        grid  = grid.reshape( rti.nrows, rti.ncols )
+
+        if (rti.SWAP_ENDIAN):
+            grid.byteswap( True )
+        file_unit.close()
     
     if not(SILENT):    
         print 'Finished reading grid from:'
@@ -468,6 +487,14 @@ def write_grid( grid, RTG_file, rti, RTG_type='FLOAT',
 
     if not(SILENT):    
         print 'Writing grid values...'
+
+    #-----------------------------------------
+    # Unpack grid for a packed domain (10/14)
+    #-----------------------------------------
+    domain = getattr( rti, 'domain', None )
+    if (domain is not None):
+        grid = domain.unpack( grid )
+        rti  = domain.full_rti
         
     #---------------------------------
     # Convert to specified data type
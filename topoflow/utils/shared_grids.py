@@ -0,0 +1,104 @@
+## Copyright (c) 2014, Scott D. Peckham
+## October 2014
+## Static input grids (e.g. DEM, D8 flow codes, chan-n, chan-w)
+## that are loaded just once into shared memory and then mapped
+## (not read) by many processes, such as the members of an
+## ensemble.  See run_ensemble() in framework/emeli.py.
+
+import os
+import shutil
+import tempfile
+import numpy
+
+#-------------------------------------------------------------------------
+#
+#   load()
+#   attach()
+#   get_grid()
+#   clear()
+#
+#-------------------------------------------------------------------------
+# Notes: Each input file is copied once into a directory in
+#        /dev/shm (a RAM disk, if available).  Readers like
+#        rtg_files.read_grid() and model_input.read_grid() call
+#        get_grid() first, which returns a copy-on-write memory
+#        map of the shared copy, or None if the file was not
+#        loaded.  All processes share the same physical pages
+#        and a process that changes a grid in place (e.g. to
+#        fill pits in a DEM) only changes its own private copy.
+#
+#        Processes created by fork inherit "shared_files".
+#        Others must call attach() with the dictionary that
+#        load() returns.
+#-------------------------------------------------------------------------
+shared_files     = dict()   # (real path of input file -> shared copy)
+shared_directory = None
+
+#-------------------------------------------------------------------------
+def load( file_names, SILENT=True ):
+
+    global shared_directory
+
+    if (shared_directory is None):
+        shm_dir = '/dev/shm'
+        if not(os.path.isdir( shm_dir )):
+            shm_dir = None   # (use default temp directory)
+        shared_directory = tempfile.mkdtemp( prefix='topoflow_', dir=shm_dir )
+
+    for file_name in file_names:
+        path = os.path.realpath( os.path.expanduser( file_name ) )
+        if (path in shared_files) or not(os.path.isfile( path )):
+            continue
+        shared_file = os.path.join( shared_directory,
+                                    str(len(shared_files)) + '_' +
+                                    os.path.basename( path ) )
+        shutil.copyfile( path, shared_file )
+        shared_files[ path ] = shared_file
+        if not(SILENT):
+            print 'Loaded into shared memory: ' + path
+
+    return dict( shared_files )
+
+#   load()
+#-------------------------------------------------------------------------
+def attach( file_map ):
+
+    shared_files.update( file_map )
+
+#   attach()
+#-------------------------------------------------------------------------
+def get_grid( file_name, dtype, shape, offset=0 ):
+
+    #---------------------------------------------------------
+    # Note: Returns None if the file was not loaded or if it
+    #       does not contain a full grid at this offset, so
+    #       that callers can just read the file instead.
+    #---------------------------------------------------------
+    if (len(shared_files) == 0):
+        return None
+    path = os.path.realpath( os.path.expanduser( file_name ) )
+    if (path not in shared_files):
+        return None
+    shared_file = shared_files[ path ]
+
+    dtype  = numpy.dtype( dtype )
+    nbytes = dtype.itemsize * int( numpy.prod( shape ) )
+    if ((offset + nbytes) > os.path.getsize( shared_file )):
+        return None
+    grid = numpy.memmap( shared_file, dtype=dtype, mode='c',
+                         offset=offset, shape=tuple(shape) )
+    return grid.view( numpy.ndarray )
+
+#   get_grid()
+#-------------------------------------------------------------------------
+def clear():
+
+    global shared_directory
+
+    if (shared_directory is not None):
+        shutil.rmtree( shared_directory, ignore_errors=True )
+    shared_files.clear()
+    shared_directory = None
+
+#   clear()
+#-------------------------------------------------------------------------
@@ -40,7 +40,7 @@ def get_replacements( var_names=None, values=None, method='RE'):
 #   get_replacements()
 #-------------------------------------------------------------------------
 def replace( cfg_template_file, new_cfg_file, dictionary=None,
-             method='RE'):
+             method='RE', SILENT=False):
 
     #---------------------------------------------------------
     # Note: Rename this to "make_cfg_file" ??
@@ -72,7 +72,7 @@ def replace( cfg_template_file, new_cfg_file, dictionary=None,
     # Open the new_cfg_file to write
     #---------------------------------
     result = glob.glob( new_cfg_file )
-    if (len(result) > 0):
+    if (len(result) > 0) and not(SILENT):
         print 'WARNING: There is already a CFG file called:'
         print '     ' + new_cfg_file
         # print '       Are you sure you want to overwrite it?'
@@ -86,9 +86,9 @@ def replace( cfg_template_file, new_cfg_file, dictionary=None,
     #--------------------------------------------------
     if (RE_METHOD):
         pattern = re.compile('\$\{[^\}]+\}')
-        print 'Using RE method...'
+        if not(SILENT): print 'Using RE method...'
     else:
-        print 'Using STRING method...'
+        if not(SILENT): print 'Using STRING method...'
 
     #---------------------------------------------------------
     # Scan template_file, make replacements & write CFG file
@@ -126,8 +126,9 @@ def replace( cfg_template_file, new_cfg_file, dictionary=None,
     #------------------
     template_unit.close()
     cfg_unit.close()
-    print 'Finished creating new CFG file.'
-    print ' '
+    if not(SILENT):
+        print 'Finished creating new CFG file.'
+        print ' '
     
 #   replace()
 #-------------------------------------------------------------------------
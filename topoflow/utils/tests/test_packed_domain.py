@@ -0,0 +1,215 @@
+
+## Copyright (c) 2014, Scott D. Peckham
+## October 2014
+## Unit tests for "packed_domain.py" in "utils" folder.
+
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from topoflow.utils import packed_domain
+from topoflow.utils import tf_d8_base
+from topoflow.utils.tests import test_tf_d8_base
+
+#-------------------------------------------------------------------------
+#
+# test_packed_domain()   # compare packed D8 parents to full grid
+# test_get_domain()      # outlet not in basin file, as for Treynor
+# test_domain_cache()    # one cached domain per set of inputs
+# get_test_info()
+# write_test_files()
+#
+#-------------------------------------------------------------------------
+def test_packed_domain(nx=60, ny=40):
+
+    #------------------------------------------------------------
+    # Note: The domain is the largest basin in the test flow
+    #       grid of test_tf_d8_base.py, plus the pixel that its
+    #       outlet flows to.  Packed parent IDs should be the
+    #       packed IDs of the full-grid parents.
+    #------------------------------------------------------------
+    full = test_tf_d8_base.get_test_d8( nx, ny, n_cycles=0 )
+    full.get_upstream_index()
+    n_up = (full.tour_end - full.tour_start)
+    n_up[ full.downstream_index < 0 ] = 0
+    outlet_ID = np.argmax( n_up )
+    basin_IDs = np.sort( full.upstream_IDs( outlet_ID ) )
+    parent_ID = full.downstream_index[ outlet_ID ]
+    IDs  = np.union1d( basin_IDs, [parent_ID] )
+    halo = np.logical_not( np.in1d( IDs, basin_IDs ) )
+
+    domain = packed_domain.packed_domain( get_test_info( nx, ny ),
+                                          IDs, halo )
+    info = domain.get_info()
+
+    d8 = tf_d8_base.d8_component()
+    d8.rti = info
+    d8.nx  = info.ncols
+    d8.ny  = info.nrows
+    d8.flow_grid = domain.pack( full.flow_grid )
+    d8.flow_grid[0, domain.halo] = 0
+    d8.get_flow_code_list()
+    d8.get_parent_inc_map()
+    d8.get_parent_ID_grid()
+
+    pIDs = d8.parent_ID_grid[0, np.logical_not( domain.halo )]
+    full_pIDs = full.parent_ID_grid.flat[ basin_IDs ]
+    SAME_PIDS = np.array_equal( domain.IDs[ pIDs ], full_pIDs )
+    print 'Packed pixels       =', domain.n_pixels, ' of ', nx * ny
+    print 'Same parent IDs     =', SAME_PIDS
+
+    #-------------------------------------
+    # Round trips for grids and for IDs
+    #-------------------------------------
+    grid = np.random.random( (ny, nx) )
+    back = domain.unpack( domain.pack( grid ) )
+    SAME_GRID = np.array_equal( back.flat[ IDs ], grid.flat[ IDs ] )
+    rows = IDs / nx
+    cols = IDs % nx
+    (r, c) = domain.unpack_IDs( domain.pack_IDs( (rows, cols) ) )
+    SAME_IDS = (np.array_equal( r, rows ) and np.array_equal( c, cols ))
+    print 'Same unpacked grid  =', SAME_GRID
+    print 'Same unpacked IDs   =', SAME_IDS
+    print ' '
+    assert SAME_PIDS and SAME_GRID and SAME_IDS
+
+#   test_packed_domain()
+#-------------------------------------------------------------------------
+def test_get_domain(nx=60, ny=40):
+
+    #------------------------------------------------------------
+    # Note: As for the Treynor example, the basin RTM file has
+    #       the pixels upstream of the outlet but not the outlet.
+    #       The domain should have the outlet, all pixels that
+    #       drain to it, and (as halo) the pixel it flows to.
+    #------------------------------------------------------------
+    full = test_tf_d8_base.get_test_d8( nx, ny, n_cycles=0 )
+    full.get_upstream_index()
+    info = get_test_info( nx, ny )
+    n_up = (full.tour_end - full.tour_start)
+    n_up[ full.downstream_index < 0 ] = 0
+    outlet_ID = np.argmax( n_up )
+    outlet    = [outlet_ID % nx, outlet_ID / nx]
+    parent_ID = full.downstream_index[ outlet_ID ]
+    up_IDs    = np.sort( full.upstream_IDs( outlet_ID ) )
+
+    test_dir = tempfile.mkdtemp()
+    try:
+        (basin_file, flow_file, outlet_file) = write_test_files(
+            test_dir, full, info, outlet, 'outlets.txt' )
+        np.int32( up_IDs[ up_IDs != outlet_ID ] ).tofile( basin_file )
+        packed_domain.clear_domains()
+        domain = packed_domain.get_domain( info, basin_file, flow_file,
+                                           outlet_file )
+    finally:
+        packed_domain.clear_domains()
+        shutil.rmtree( test_dir )
+
+    SAME_IDS  = np.array_equal( domain.IDs,
+                                np.union1d( up_IDs, [parent_ID] ) )
+    SAME_HALO = np.array_equal( domain.IDs[ domain.halo ], [parent_ID] )
+    print 'Packed pixels       =', domain.n_pixels, ' of ', nx * ny
+    print 'Same domain IDs     =', SAME_IDS
+    print 'Same halo IDs       =', SAME_HALO
+    print ' '
+    assert SAME_IDS and SAME_HALO
+
+#   test_get_domain()
+#-------------------------------------------------------------------------
+def test_domain_cache(nx=60, ny=40):
+
+    #------------------------------------------------------------
+    # Note: get_domain() should only reuse a domain if all of
+    #       its inputs are the same, including the outlet file
+    #       and the file modification times.
+    #------------------------------------------------------------
+    full = test_tf_d8_base.get_test_d8( nx, ny, n_cycles=0 )
+    full.get_upstream_index()
+    info = get_test_info( nx, ny )
+    test_dir = tempfile.mkdtemp()
+    try:
+        (basin_file, flow_file, outlet_file1) = write_test_files(
+            test_dir, full, info, [nx/2, ny/2], 'outlets1.txt' )
+        outlet_file2 = write_test_files(
+            test_dir, full, info, [nx - 1, ny/3], 'outlets2.txt' )[2]
+
+        packed_domain.clear_domains()
+        d1 = packed_domain.get_domain( info, basin_file, flow_file,
+                                       outlet_file1 )
+        SAME_INPUTS = (packed_domain.get_domain( info, basin_file,
+                           flow_file, outlet_file1 ) is d1)
+        d2 = packed_domain.get_domain( info, basin_file, flow_file,
+                                       outlet_file2 )
+        NEW_OUTLETS = ((d2 is not d1) and
+                       not(np.array_equal( d2.IDs, d1.IDs )))
+
+        #---------------------------------------
+        # A changed file gives a new domain
+        #---------------------------------------
+        mtime = os.path.getmtime( outlet_file1 )
+        os.utime( outlet_file1, (mtime + 10, mtime + 10) )
+        d3 = packed_domain.get_domain( info, basin_file, flow_file,
+                                       outlet_file1 )
+        NEW_MTIME = (d3 is not d1)
+
+        packed_domain.clear_domains()
+        d4 = packed_domain.get_domain( info, basin_file, flow_file,
+                                       outlet_file1 )
+        CLEARED = (d4 is not d3)
+    finally:
+        packed_domain.clear_domains()
+        shutil.rmtree( test_dir )
+
+    print 'Same inputs, same domain    =', SAME_INPUTS
+    print 'New outlet file, new domain =', NEW_OUTLETS
+    print 'New file time, new domain   =', NEW_MTIME
+    print 'New domain after clearing   =', CLEARED
+    print ' '
+    assert SAME_INPUTS and NEW_OUTLETS and NEW_MTIME and CLEARED
+
+#   test_domain_cache()
+#-------------------------------------------------------------------------
+def get_test_info( nx, ny ):
+
+    class info:
+        pass
+    info.ncols      = nx
+    info.nrows      = ny
+    info.n_pixels   = nx * ny
+    info.bpe        = 4
+    info.grid_size  = info.bpe * info.n_pixels
+    info.pixel_geom = 1
+    info.SWAP_ENDIAN = False
+    return info
+
+#   get_test_info()
+#-------------------------------------------------------------------------
+def write_test_files( test_dir, d8, info, outlet, outlet_name ):
+
+    #------------------------------------------------------------
+    # Note: Writes the flow grid of a test D8 component, a basin
+    #       RTM file with the pixels that drain to the outlet
+    #       (col, row), and an outlet file for that outlet, as
+    #       read by outlets.read_outlet_file().
+    #------------------------------------------------------------
+    (col, row) = outlet
+    outlet_ID  = (row * info.ncols) + col
+    basin_IDs  = np.int32( np.sort( d8.upstream_IDs( outlet_ID ) ) )
+
+    flow_file   = os.path.join( test_dir, 'test_flow.rtg' )
+    basin_file  = os.path.join( test_dir, 'test_basin.rtm' )
+    outlet_file = os.path.join( test_dir, outlet_name )
+    np.uint8( d8.flow_grid ).tofile( flow_file )
+    basin_IDs.tofile( basin_file )
+
+    unit = open( outlet_file, 'w' )
+    for k in xrange( 6 ):
+        unit.write( '#\n' )
+    unit.write( '%d  %d  1.0  1.0\n' % (col, row) )
+    unit.close()
+    return (basin_file, flow_file, outlet_file)
+
+#   write_test_files()
+#-------------------------------------------------------------------------
+
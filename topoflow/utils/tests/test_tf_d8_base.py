@@ -0,0 +1,267 @@
+## Copyright (c) 2014, Scott D. Peckham
+## October 2014
+## Unit tests for "tf_d8_base.py" in "utils" folder.
+
+import numpy as np
+import os
+import shutil
+import tempfile
+import time
+
+from topoflow.utils import tf_d8_base
+
+#-------------------------------------------------------------------------
+#
+# test_upstream_index()   # compare to walking down from every pixel
+# test_route_to_parents() # compare in-place sums to a loop
+# test_invalid_codes()    # no parent for codes not in code_list
+# test_topology_files()   # ".npz" cache hit, and a new key for new codes
+# get_test_d8()
+#
+#-------------------------------------------------------------------------
+def test_upstream_index(nx=60, ny=40, n_cycles=5):
+
+    #------------------------------------------------------------
+    # Note: The flow grid drains to the left and bottom edges,
+    #       with random codes, and a few 2-pixel flow cycles.
+    #       "Upstream" is checked against the list of pixels
+    #       found by following the flow down from every pixel.
+    #       Pixels in a cycle only have themselves upstream,
+    #       and the walk from a pixel stops at a cycle.
+    #------------------------------------------------------------
+    d8 = get_test_d8( nx, ny, n_cycles )
+    n_pixels = nx * ny
+    down = d8.downstream_index.tolist()
+
+    start_time = time.time()
+    d8.get_upstream_index()
+    run_time = (time.time() - start_time)
+
+    #--------------------------------------------
+    # Pixels downstream of each pixel, by walk
+    # (stop at edges, or when a cycle repeats)
+    #--------------------------------------------
+    cycle = np.zeros( n_pixels, dtype='bool' )
+    below = []
+    for ID in xrange( n_pixels ):
+        path = [ID]
+        seen = set( path )
+        k = down[ ID ]
+        while (k >= 0) and (k not in seen):
+            path.append( k )
+            seen.add( k )
+            k = down[ k ]
+        if (k >= 0):
+            cycle[ path[ path.index(k): ] ] = True
+        below.append( path )
+
+    above = [ [ID] for ID in xrange( n_pixels ) ]
+    for k in xrange( n_pixels ):
+        if (cycle[ k ]):
+            continue
+        for ID in below[k][1:]:
+            if (cycle[ ID ]):
+                break
+            above[ ID ].append( k )
+    OK = True
+    for ID in xrange( n_pixels ):
+        OK = OK and (sorted( d8.upstream_IDs( ID ).tolist() ) ==
+                     sorted( above[ ID ] ))
+
+    SAME_TOUR = np.array_equal( d8.tour_IDs[ d8.tour_start ],
+                                np.arange( n_pixels ) )
+    print 'Run time for index  =', run_time, ' [secs]'
+    print 'Number of cycle pixels =', cycle.sum()
+    print 'Same upstream IDs   =', OK
+    print 'Same tour positions =', SAME_TOUR
+    assert OK and SAME_TOUR
+
+    #----------------------------------------
+    # is_upstream(), upstream_mask() and
+    # upstream_sums() for "gauges" in bulk
+    #----------------------------------------
+    np.random.seed( 7 )
+    a = np.random.randint( 0, n_pixels, 500 )
+    b = np.random.randint( 0, n_pixels, 500 )
+    same = [ (a[k] in above[ b[k] ]) for k in xrange( a.size ) ]
+    SAME_IS_UP = np.array_equal( d8.is_upstream( a, b ), same )
+    mask = d8.upstream_mask( b[0] )
+    SAME_MASK  = np.array_equal( np.where( mask.ravel() )[0],
+                                 np.sort( d8.upstream_IDs( b[0] ) ) )
+    values = np.random.random( (ny, nx) )
+    sums = [ values.flat[ d8.upstream_IDs( k ) ].sum() for k in b ]
+    SAME_SUMS  = np.allclose( d8.upstream_sums( values, b ), sums )
+    print 'Same is_upstream()  =', SAME_IS_UP
+    print 'Same upstream_mask() =', SAME_MASK
+    print 'Same upstream_sums() =', SAME_SUMS
+    print 'Largest basin size  =', \
+          (d8.tour_end - d8.tour_start).max(), ' [pixels]'
+    print ' '
+    assert SAME_IS_UP and SAME_MASK and SAME_SUMS
+
+#   test_upstream_index()
+#-------------------------------------------------------------------------
+def test_route_to_parents(nx=60, ny=40, n_cycles=5):
+
+    #------------------------------------------------------------
+    # Note: With "out", route_to_parents() uses work arrays in
+    #       the d8 object.  Compare to adding each pixel's value
+    #       to its parent, one pixel at a time, and check that
+    #       a second call reuses the same work arrays.
+    #------------------------------------------------------------
+    d8 = get_test_d8( nx, ny, n_cycles )
+    np.random.seed( 11 )
+    values = np.random.random( (ny, nx) )
+    start  = np.random.random( (ny, nx) )
+
+    sums = start.copy()
+    down = d8.downstream_index
+    for ID in xrange( nx * ny ):
+        if (down[ ID ] >= 0):
+            sums.flat[ down[ ID ] ] += values.flat[ ID ]
+
+    out = start.copy()
+    d8.route_to_parents( values, out )
+    work = d8.route_sums
+    SAME_IN_PLACE = np.allclose( out, sums )
+    SAME_NEW_GRID = np.allclose( start + d8.route_to_parents( values ), sums )
+    out = start.copy()
+    d8.route_to_parents( values, out )
+    SAME_WORK = ((d8.route_sums is work) and np.allclose( out, sums ))
+    print 'Same in-place sums  =', SAME_IN_PLACE
+    print 'Same new-grid sums  =', SAME_NEW_GRID
+    print 'Same work arrays    =', SAME_WORK
+    print ' '
+    assert SAME_IN_PLACE and SAME_NEW_GRID and SAME_WORK
+
+#   test_route_to_parents()
+#-------------------------------------------------------------------------
+def test_invalid_codes(nx=60, ny=40, n_cycles=5):
+
+    #------------------------------------------------------------
+    # Note: Pixels with codes that are not D8 codes (e.g. 3 or
+    #       100) must not get a parent, and they must not
+    #       become their own parent.
+    #------------------------------------------------------------
+    d8 = get_test_d8( nx, ny, n_cycles )
+    d8.flow_grid[ 5, 10 ] = 3
+    d8.flow_grid[ 6, 20 ] = 100
+    d8.get_parent_ID_grid()
+    d8.get_downstream_index()
+    down = d8.downstream_index
+    IDs  = np.arange( nx * ny )
+    print 'Invalid codes have no parent =', \
+          np.all( down[ [5*nx + 10, 6*nx + 20] ] == -1 )
+    print ' '
+    assert np.all( down[ [5*nx + 10, 6*nx + 20] ] == -1 )
+    assert not np.any( down == IDs )
+
+#   test_invalid_codes()
+#-------------------------------------------------------------------------
+def test_topology_files():
+
+    #------------------------------------------------------------
+    # Note: With "topology_dir" set, the D8 variables for the
+    #       Treynor flow grid are saved to a ".npz" file there,
+    #       and a new d8_component reads them back.  Changing
+    #       one flow code must give a new key, so the file is
+    #       not used.  Nothing is written to in_directory.
+    #------------------------------------------------------------
+    examples_dir = os.path.join( os.path.dirname( tf_d8_base.__file__ ),
+                                 '..', 'examples', 'Treynor_Iowa' )
+    in_directory = os.path.realpath( examples_dir ) + os.sep
+    in_files     = sorted( os.listdir( in_directory ) )
+    topo_dir     = tempfile.mkdtemp()
+    try:
+        tf_d8_base.clear_topology()
+        d8  = get_treynor_d8( in_directory, topology_dir=topo_dir )
+        key = d8.get_topology_key()
+        topo_files = d8.get_topology_files( key )
+        SAVED = os.path.exists( topo_files[0] )
+
+        tf_d8_base.clear_topology()
+        d8b = get_treynor_d8( in_directory, LOAD=True,
+                              topology_dir=topo_dir )
+        LOADED = d8b.load_topology()
+        SAME   = np.array_equal( d8b.downstream_index, d8.downstream_index )
+
+        flow_grid = d8b.flow_grid.copy()
+        flow_grid[ 10, 10 ] = (1 if (flow_grid[ 10, 10 ] != 1) else 2)
+        d8b.flow_grid = flow_grid
+        tf_d8_base.clear_topology()
+        NEW_KEY  = (d8b.get_topology_key() != key)
+        RELOADED = d8b.load_topology()
+    finally:
+        tf_d8_base.clear_topology()
+        shutil.rmtree( topo_dir )
+
+    print 'Saved topology file  =', SAVED
+    print 'Loaded topology file =', LOADED, SAME
+    print 'New key for new code =', NEW_KEY, not(RELOADED)
+    print ' '
+    assert SAVED and LOADED and SAME
+    assert NEW_KEY and not(RELOADED)
+    assert (sorted( os.listdir( in_directory ) ) == in_files)
+
+    #----------------------------------------
+    # Without topology_dir, nothing is saved
+    #----------------------------------------
+    d8 = get_treynor_d8( in_directory )
+    assert (d8.get_topology_files( key ) == [])
+    tf_d8_base.clear_topology()
+    assert (len( tf_d8_base.shared_topology ) == 0)
+
+#   test_topology_files()
+#-------------------------------------------------------------------------
+def get_test_d8( nx, ny, n_cycles ):
+
+    #--------------------------------------------------------------
+    # Note: Codes 8, 16 and 32 (S, SW and W) always lead to the
+    #       left or bottom edge.  A few pairs of pixels that flow
+    #       to each other (E and W) make flow cycles.
+    #--------------------------------------------------------------
+    np.random.seed( 34 )
+    codes = np.array([ 8, 16, 32 ], dtype='UInt8')
+    flow_grid = codes[ np.random.randint( 0, 3, (ny, nx) ) ]
+    flow_grid[:, 0]  = 0
+    flow_grid[-1, :] = 0
+    for k in xrange( n_cycles ):
+        row = np.random.randint( 0, ny - 1 )
+        col = np.random.randint( 1, nx - 1 )
+        flow_grid[ row, col ]     = 2
+        flow_grid[ row, col + 1 ] = 32
+
+    d8 = tf_d8_base.d8_component()
+    d8.nx = nx
+    d8.ny = ny
+    d8.flow_grid = flow_grid
+    d8.get_flow_code_list()
+    d8.get_parent_inc_map()
+    d8.get_parent_ID_grid()
+    d8.get_downstream_index()
+    return d8
+
+#   get_test_d8()
+#-------------------------------------------------------------------------
+def get_treynor_d8( in_directory, LOAD=False, topology_dir=None ):
+
+    #--------------------------------------------------------
+    # Note: Set up as in channels_base.initialize_d8_vars().
+    #       If LOAD is True, only the grid info and the flow
+    #       grid are read, for load_topology().
+    #--------------------------------------------------------
+    d8 = tf_d8_base.d8_component()
+    d8.site_prefix  = 'Treynor'
+    d8.in_directory = in_directory
+    d8.topology_dir = topology_dir
+    if (LOAD):
+        d8.cfg_file = in_directory + 'Treynor_d8.cfg'
+        d8.initialize_config_vars()
+        d8.read_grid_info()
+        d8.read_flow_grid()
+    else:
+        d8.initialize( cfg_file=None, SILENT=True )
+    return d8
+
+#   get_treynor_d8()
+#-------------------------------------------------------------------------
@@ -18,6 +18,7 @@
 from numpy import *
 import numpy
 
+import hashlib
 import os, os.path
 
 import BMI_base
@@ -32,6 +33,7 @@ from tf_utils import TF_Print
 #---------------------------------------------------------------------
 #
 #   unit_test()
+#   clear_topology()             # (10/14)
 #
 #   class d8_base
 #     
@@ -47,12 +49,63 @@ from tf_utils import TF_Print
 #       get_parent_IDs()         # (needed for gradients)
 #       get_parent_IDs2()        # (not working or needed yet)
 #       get_non_parent_IDs()     # (not working or needed yet)
-#       get_flow_from_IDs()
-#       get_flow_to_IDs()
+#       get_flow_from_IDs()      # (not called by initialize())
+#       get_flow_to_IDs()        # (not called by initialize())
 #       get_edge_IDs()
 #       get_noflow_IDs() 
+#       get_downstream_index()   # (10/14)
+#       route_to_parents()       # (10/14)
+#       get_route_work_arrays()  # (10/14)
+#       get_upstream_index()     # (10/14)
+#       upstream_IDs()           # (10/14)
+#       upstream_mask()          # (10/14)
+#       is_upstream()            # (10/14)
+#       upstream_sums()          # (10/14)
 #       get_flow_width_grid()
 #       get_flow_length_grid()
+#----------------------------------
+#       get_topology_key()       # (10/14)
+#       get_topology_files()     # (10/14)
+#       load_topology()          # (10/14)
+#       save_topology()          # (10/14)
+#       freeze_topology()        # (10/14)
+#       set_topology()           # (10/14)
+
+#-----------------------------------------------------------------------
+# Notes: The D8 variables computed by initialize() depend only on
+#        the flow grid and the grid info, and several components
+#        (e.g. channels and satzone) each embed a d8_component for
+#        the same site.  These variables are computed once per
+#        process, saved in "shared_topology" and shared (as
+#        read-only arrays) by all d8_components with the same
+#        key.  Each component still has its own d8_component, so
+#        rebinding an attribute (e.g. channels_base sets d8.ds to
+#        sinu * d8.ds) does not affect the others.
+#
+#        If a d8_component's "topology_dir" is set to a directory,
+#        the variables are also saved there in a compressed ".npz"
+#        file, so that later runs can skip computing them.  The
+#        channels and satzone components set it from the optional
+#        "topology_dir" key in their CFG file, or from the
+#        topology_dir argument of run_model() in emeli.py.  By
+#        default, nothing is written to disk.  clear_topology()
+#        frees the shared variables.
+#
+#        The D8 components in "components/d8_base.py" (used by
+#        Erode and smooth_DEM) don't use this.  They compute D8
+#        flow codes from a DEM that changes every time step, so
+#        the key (and the contributing area, A) would change
+#        every time, and nothing would be reused.  (10/14)
+#-----------------------------------------------------------------------
+shared_topology  = dict()   # (key -> dictionary of D8 arrays)
+topology_version = 4
+
+topology_array_names = ['flow_grid', 'parent_ID_grid', 'dw', 'ds',
+                        'code_list', 'code_opps', 'inc_map',
+                        'downstream_index', 'routed_IDs', 'routed_parent_IDs',
+                        'child_offsets', 'child_IDs',
+                        'tour_IDs', 'tour_start', 'tour_end']
+topology_tuple_names = ['parent_IDs', 'edge_IDs', 'noflow_IDs']
 
 #-----------------------------------------------------------------------
 def unit_test():
@@ -81,8 +134,22 @@ def unit_test():
     
 #   unit_test()
 #---------------------------------------------------------------------
+def clear_topology():
+
+    #----------------------------------------------------------
+    # Note: Components that were initialized before this call
+    #       keep their D8 variables.  New ones compute them
+    #       again, or read them from a ".npz" file.
+    #----------------------------------------------------------
+    shared_topology.clear()
+
+#   clear_topology()
+#---------------------------------------------------------------------
 class d8_component(BMI_base.BMI_component):
 
+    PACKED_OK    = True   # (see BMI_base.enable_packed_domain())
+    topology_dir = None   # (directory for ".npz" files, or None)
+    
     #-------------------------------------------------------------------
     def get_attribute(self, att_name):
 
@@ -171,6 +238,16 @@ class d8_component(BMI_base.BMI_component):
         self.read_grid_info()
         
         self.read_flow_grid()
+
+        #-------------------------------------------------
+        # Share D8 topology with other components that
+        # use the same flow grid, or load it from the
+        # ".npz" file saved by an earlier run, if any.
+        # See "topology_dir" above.  (10/14)
+        #-------------------------------------------------
+        if (self.load_topology( SILENT=SILENT )):
+            self.status = 'initialized'
+            return
         
         self.get_flow_code_list()
         self.get_flow_code_list_opps()
@@ -179,15 +256,21 @@ class d8_component(BMI_base.BMI_component):
         self.get_parent_ID_grid()
 
         self.get_parent_IDs()  # (needed for gradients)
-        
-        self.get_flow_from_IDs()
-        self.get_flow_to_IDs()
+
+        #-----------------------------------------------------
+        # get_downstream_index() replaces the w1..w8 and
+        # p1..p8 tuples from get_flow_from_IDs() and from
+        # get_flow_to_IDs(), so they aren't computed (10/14)
+        #-----------------------------------------------------
         self.get_edge_IDs()
         self.get_noflow_IDs()
+        self.get_downstream_index()   # (10/14)
+        self.get_upstream_index()     # (10/14)
         
         self.get_flow_width_grid()
         self.get_flow_length_grid()
 
+        self.save_topology( SILENT=SILENT )
         self.status = 'initialized'
         
     #   initialize()
@@ -203,6 +286,14 @@ class d8_component(BMI_base.BMI_component):
         self.flow_grid = rtg_files.read_grid(code_file, self.rti,
                                              RTG_type='BYTE')
 
+        #-------------------------------------------------
+        # For a packed domain, pixels outside the basin
+        # that basin pixels flow to have no flow (10/14)
+        #-------------------------------------------------
+        domain = getattr(getattr(self, 'rti', None), 'domain', None)
+        if (domain is not None):
+            self.flow_grid[0, domain.halo] = 0
+
     #   read_flow_grid()
     #---------------------------------------------------------------------
     def get_flow_code_list(self, ARC=False):
@@ -262,7 +353,22 @@ class d8_component(BMI_base.BMI_component):
         #-----------------------------------------------------
         print 'Finding parent pixel IDs...'
 
-        self.parent_ID_grid = ID_grid + self.inc_map[self.flow_grid]
+        domain = getattr(getattr(self, 'rti', None), 'domain', None)
+        if (domain is None):
+            self.parent_ID_grid = ID_grid + self.inc_map[self.flow_grid]
+            return
+        
+        #-------------------------------------------------
+        # For a packed domain (see packed_domain.py), get
+        # parent IDs in the full grid, then packed IDs.
+        #-------------------------------------------------
+        nx = domain.nx
+        incs = int32(array([-nx + 1, 1, nx + 1, nx, nx - 1,
+                            -1, -nx - 1, -nx]))
+        MAP = zeros([129], dtype='Int32')
+        MAP[self.code_list] = incs
+        pIDs = domain.IDs + MAP[self.flow_grid[0]]
+        self.parent_ID_grid = domain.index[ pIDs ].reshape(ID_grid.shape)
 
     #   get_parent_ID_grid()
     #---------------------------------------------------------------------
@@ -531,13 +637,23 @@ class d8_component(BMI_base.BMI_component):
     #-------------------------------------------------------------------
     def get_edge_IDs(self):
 
+        print 'Finding edge pixel IDs...'
+
+        #--------------------------------------------------
+        # For a packed domain, these are the pixels on
+        # the edges of the full grid and those outside
+        # of the basin (see packed_domain.py).  (10/14)
+        #--------------------------------------------------
+        domain = getattr(getattr(self, 'rti', None), 'domain', None)
+        if (domain is not None):
+            self.edge_IDs = domain.edge_IDs
+            return
+        
         #---------------------------
         # Get flow grid dimensions
         #---------------------------
         nx = self.rti.ncols
         ny = self.rti.nrows
-        
-        print 'Finding edge pixel IDs...'
 
         #-------------------------
         # Get IDs of edge pixels
@@ -586,6 +702,258 @@ class d8_component(BMI_base.BMI_component):
 
     #   get_noflow_IDs()
     #-------------------------------------------------------------------
+    def get_downstream_index(self):
+
+        #-------------------------------------------------------------
+        # Notes: A compact version of the flow network (10/14):
+
+        #        downstream_index  = 1D, calendar-style ID of the
+        #                            parent of each pixel, or -1
+        #                            where the flow code is not
+        #                            in code_list (e.g. 0 or nodata).
+        #        routed_IDs        = IDs of pixels that have a parent
+        #        routed_parent_IDs = IDs of their parents
+        #        child_offsets     = children of pixel k are:
+        #        child_IDs           child_IDs[ child_offsets[k]:
+        #                                       child_offsets[k+1] ]
+
+        #        The last two are the "compressed sparse row" (CSR)
+        #        form of the upstream links.  All are Int32.  They
+        #        replace the w1..w8 and p1..p8 tuples, which are
+        #        only computed if get_flow_from_IDs() and then
+        #        get_flow_to_IDs() are called.
+        #-------------------------------------------------------------
+        n_pixels = self.nx * self.ny
+        down = int32( self.parent_ID_grid.ravel() % n_pixels )
+        VALID = in1d( self.flow_grid.ravel(), self.code_list )
+        down[ logical_not( VALID ) ] = -1
+        self.downstream_index = down
+
+        self.routed_IDs = int32( where( down >= 0 )[0] )
+        self.routed_parent_IDs = down[ self.routed_IDs ]
+
+        #----------------------------------
+        # Upstream links, sorted by parent
+        #----------------------------------
+        order = argsort( self.routed_parent_IDs, kind='mergesort' )
+        self.child_IDs = self.routed_IDs[ order ]
+        n_children = bincount( self.routed_parent_IDs, minlength=n_pixels )
+        self.child_offsets = zeros( n_pixels + 1, dtype='Int32' )
+        self.child_offsets[1:] = cumsum( n_children )
+
+    #   get_downstream_index()
+    #-------------------------------------------------------------------
+    def route_to_parents(self, values, out=None):
+
+        #------------------------------------------------------------
+        # Notes: Adds "values" (a grid) from every pixel to its D8
+        #        parent pixel.  The sums are added to "out" in place,
+        #        or to a new grid of zeros, which is returned.  This
+        #        replaces eight scatters like:
+        #            out[ d8.p1 ] += values[ d8.w1 ], etc.
+        #        Pixels with several children get the sum of all.
+        #
+        #        When "out" is given, the sums are computed with
+        #        np.add.reduceat() over child_IDs, in work arrays
+        #        that are only allocated once, so repeated calls
+        #        (e.g. once per time step) don't allocate.  The
+        #        sums match bincount() up to roundoff.  (10/14)
+        #------------------------------------------------------------
+        values = asarray( values )
+        FAST = (out is not None) and out.flags.c_contiguous and \
+               (out.dtype == float64) and (values.dtype == float64) and \
+               (values.shape == out.shape)
+        if not(FAST):
+            inflow = bincount( self.routed_parent_IDs,
+                               weights=values.ravel()[ self.routed_IDs ],
+                               minlength=self.downstream_index.size )
+            inflow = inflow.reshape( self.flow_grid.shape )
+            if (out is None):
+                return inflow
+            out += inflow
+            return out
+
+        if (getattr(self, 'route_sums', None) is None):
+            self.get_route_work_arrays()
+        if (self.route_sums.size == 0):
+            return out
+
+        out_1D = out.reshape( -1 )   # (a view)
+        take( values.reshape( -1 ), self.child_IDs,
+              out=self.route_values, mode='clip' )
+        add.reduceat( self.route_values, self.route_starts,
+                      out=self.route_sums )
+        take( out_1D, self.route_parent_IDs,
+              out=self.route_old, mode='clip' )
+        self.route_old += self.route_sums
+        put( out_1D, self.route_parent_IDs, self.route_old, mode='clip' )
+        return out
+
+    #   route_to_parents()
+    #-------------------------------------------------------------------
+    def get_route_work_arrays(self):
+
+        #------------------------------------------------------------
+        # Notes: For route_to_parents().  route_parent_IDs are the
+        #        pixels with children, and route_starts are the
+        #        start of each one's children in child_IDs.  The
+        #        others are work arrays.  These are set for each
+        #        component's d8 object (they are not in the shared
+        #        topology), so components can't overwrite each
+        #        other's work arrays.  (10/14)
+        #------------------------------------------------------------
+        n_children = diff( self.child_offsets )
+        self.route_parent_IDs = int32( where( n_children > 0 )[0] )
+        self.route_starts = self.child_offsets[ self.route_parent_IDs ]
+        self.route_values = zeros( self.child_IDs.size, dtype='Float64' )
+        self.route_sums   = zeros( self.route_parent_IDs.size, dtype='Float64' )
+        self.route_old    = zeros( self.route_parent_IDs.size, dtype='Float64' )
+
+    #   get_route_work_arrays()
+    #-------------------------------------------------------------------
+    def get_upstream_index(self):
+
+        #-------------------------------------------------------------
+        # Notes: A "nested interval" index of the flow network, from
+        #        a depth-first (preorder) walk of the D8 tree (10/14):
+
+        #        tour_IDs   = 1D, pixel IDs in walk order.  Every
+        #                     pixel comes before all pixels that
+        #                     flow into it, and those come next.
+        #        tour_start = 1D, position of each pixel in tour_IDs
+        #        tour_end   = 1D, tour_start + number of pixels
+        #                     upstream of it (including itself)
+
+        #        So the pixels that drain to pixel k are:
+        #            tour_IDs[ tour_start[k]: tour_end[k] ]
+        #        and a drains to b if:
+        #            tour_start[b] <= tour_start[a] < tour_end[b].
+        #        All are Int32.
+
+        #        The walk is built without recursion.  Subtree sizes
+        #        are summed from the leaves down (in "layers" where
+        #        all children are done), then each pixel is placed
+        #        after its parent and after the subtrees of its
+        #        earlier siblings (in child_IDs order).
+
+        #        Pixels in a flow cycle (or downstream of one) have
+        #        no outlet; they are put at the end of the walk and
+        #        only have themselves upstream.  Pixels that flow
+        #        into them are walked as if they were outlets.
+        #-------------------------------------------------------------
+        down     = self.downstream_index
+        n_pixels = down.size
+        n_left   = diff( self.child_offsets )   # (children not done)
+        size     = ones( n_pixels, dtype='Int64' )
+        DONE     = zeros( n_pixels, dtype='bool' )
+
+        #-----------------------------------
+        # Subtree sizes, from leaves down
+        #-----------------------------------
+        layers   = []
+        frontier = where( n_left == 0 )[0]
+        while (frontier.size != 0):
+            layers.append( frontier )
+            DONE[ frontier ] = True
+            IDs = frontier[ down[ frontier ] >= 0 ]
+            (pIDs, k, counts) = unique( down[ IDs ], return_inverse=True,
+                                        return_counts=True )
+            size[ pIDs ] += int64( bincount( k, weights=size[ IDs ] ) )
+            n_left[ pIDs ] -= counts
+            frontier = pIDs[ n_left[ pIDs ] == 0 ]
+        size[ ~DONE ] = 1
+
+        #---------------------------------------------
+        # Offset of each child after its parent, in
+        # child_IDs order: 1 + sizes of its earlier
+        # siblings.  (Only used for DONE pixels.)
+        #---------------------------------------------
+        child_IDs = self.child_IDs
+        sizes  = size[ child_IDs ]
+        totals = concatenate(( [0], cumsum( sizes ) ))
+        first  = self.child_offsets[ down[ child_IDs ] ]
+        offset = zeros( n_pixels, dtype='Int64' )
+        offset[ child_IDs ] = 1 + totals[:-1] - totals[ first ]
+
+        #--------------------------------------------
+        # Outlets one after another, then pixels in
+        # flow cycles, then walk from outlets up
+        #--------------------------------------------
+        start = zeros( n_pixels, dtype='Int64' )
+        ROOT  = logical_or( down < 0, ~DONE[ down ] )
+        roots = where( logical_and( DONE, ROOT ) )[0]
+        start[ roots ] = cumsum( size[ roots ] ) - size[ roots ]
+        cycle_IDs = where( ~DONE )[0]
+        start[ cycle_IDs ] = (n_pixels - cycle_IDs.size) + \
+                             arange( cycle_IDs.size )
+        for IDs in reversed( layers ):
+            IDs = IDs[ ~ROOT[ IDs ] ]
+            start[ IDs ] = start[ down[ IDs ] ] + offset[ IDs ]
+
+        self.tour_IDs = zeros( n_pixels, dtype='Int32' )
+        self.tour_IDs[ start ] = arange( n_pixels, dtype='Int32' )
+        self.tour_start = int32( start )
+        self.tour_end   = int32( start + size )
+
+    #   get_upstream_index()
+    #-------------------------------------------------------------------
+    def upstream_IDs(self, ID):
+
+        #----------------------------------------------------------
+        # Note: Returns calendar-style IDs of all pixels that
+        #       drain to pixel ID (including ID), as a view into
+        #       tour_IDs (read-only when shared), without a grid
+        #       traversal.  Use Q.flat[ IDs ] to get values.
+        #----------------------------------------------------------
+        return self.tour_IDs[ self.tour_start[ ID ]: self.tour_end[ ID ] ]
+
+    #   upstream_IDs()
+    #-------------------------------------------------------------------
+    def upstream_mask(self, ID):
+
+        #--------------------------------------------------------
+        # Note: Returns a boolean grid that is True for pixels
+        #       that drain to pixel ID (e.g. a basin mask).
+        #--------------------------------------------------------
+        mask = zeros( self.flow_grid.shape, dtype='bool' )
+        mask.flat[ self.upstream_IDs( ID ) ] = True
+        return mask
+
+    #   upstream_mask()
+    #-------------------------------------------------------------------
+    def is_upstream(self, a, b):
+
+        #-----------------------------------------------------------
+        # Note: True if pixel a drains to pixel b (or a == b).
+        #       a and b can be IDs or arrays of IDs, as for
+        #       "which gauges are upstream of this gauge".
+        #-----------------------------------------------------------
+        s = self.tour_start[ a ]
+        return logical_and( self.tour_start[ b ] <= s,
+                            s < self.tour_end[ b ] )
+
+    #   is_upstream()
+    #-------------------------------------------------------------------
+    def upstream_sums(self, values, IDs):
+
+        #-----------------------------------------------------------
+        # Notes: Returns the sum of "values" (a grid) over the
+        #        pixels that drain to each pixel in IDs, e.g.
+        #        basin areas (values = da) or basin rainfall
+        #        volumes.  One cumsum in walk order is shared by
+        #        all IDs, so this is cheap for many outlets.
+        #        Divide by upstream_sums(ones, IDs) for means.
+        #-----------------------------------------------------------
+        values = asarray( values, dtype='Float64' )
+        if (values.size == 1):
+            values = values + zeros( self.tour_IDs.size )
+        totals = concatenate(( [0.0],
+                               cumsum( values.ravel()[ self.tour_IDs ] ) ))
+        return totals[ self.tour_end[ IDs ] ] - \
+               totals[ self.tour_start[ IDs ] ]
+
+    #   upstream_sums()
+    #-------------------------------------------------------------------
     def get_flow_width_grid(self, DOUBLE=False, METHOD2=False):
 
         #-------------------------------------------------------------
@@ -764,6 +1132,147 @@ class d8_component(BMI_base.BMI_component):
 
     #   get_flow_length_grid()
     #-------------------------------------------------------------------
+    def get_topology_key(self):
+
+        #-----------------------------------------------------------
+        # Note: Key is (site_prefix, content hash, LR_PERIODIC,
+        #       TB_PERIODIC).  The hash covers the flow codes and
+        #       the grid info that dw and ds depend on.
+        #-----------------------------------------------------------
+        rti = self.rti
+        grid_info = (rti.ncols, rti.nrows, rti.xres, rti.yres,
+                     rti.pixel_geom, rti.y_south_edge, rti.y_north_edge)
+        
+        md5 = hashlib.md5()
+        md5.update( str(topology_version) + repr(grid_info) )
+        md5.update( str(self.flow_grid.dtype) )
+        md5.update( numpy.ascontiguousarray(self.flow_grid).data )
 
+        LR_PERIODIC = bool( getattr(self, 'LR_PERIODIC', False) )
+        TB_PERIODIC = bool( getattr(self, 'TB_PERIODIC', False) )
+        return (self.site_prefix, md5.hexdigest(), LR_PERIODIC, TB_PERIODIC)
 
+    #   get_topology_key()
+    #-------------------------------------------------------------------
+    def get_topology_files(self, key):
+
+        #-----------------------------------------------------
+        # Note: Files are in "topology_dir", and their names
+        #       include the key's hash, so a changed flow grid
+        #       (or a packed one) gets a new file.  Returns an
+        #       empty list if "topology_dir" is not set.
+        #-----------------------------------------------------
+        if not(self.topology_dir):
+            return []
+        filename = (self.site_prefix + '_' + key[1][:12] +
+                    '_d8_topology.npz')
+        return [ os.path.join( self.topology_dir, filename ) ]
+
+    #   get_topology_files()
+    #-------------------------------------------------------------------
+    def load_topology(self, SILENT=True):
+
+        #------------------------------------------------
+        # Note: Returns True if the D8 variables were
+        #       found (in memory or in a file) and set.
+        #------------------------------------------------
+        key = self.get_topology_key()
+        if (key in shared_topology):
+            self.set_topology( shared_topology[ key ] )
+            if not(SILENT):
+                print 'Using shared D8 topology for: ' + self.site_prefix
+            return True
+        
+        for topo_file in self.get_topology_files( key ):
+            try:
+                npz_data = numpy.load( topo_file )
+                data = dict( npz_data.items() )
+                npz_data.close()
+            except Exception:
+                continue
+            if ('key' not in data) or \
+               (tuple( data['key'].tolist() ) != (key[0], key[1], str(key[2]), str(key[3]))):
+                continue
+            topology = dict()
+            for name in topology_array_names:
+                topology[ name ] = data[ name ]
+            for name in topology_tuple_names:
+                if ((name + '_rows') in data):
+                    topology[ name ] = (data[ name + '_rows' ],
+                                        data[ name + '_cols' ])
+                else:
+                    topology[ name ] = None
+            shared_topology[ key ] = self.freeze_topology( topology )
+            self.set_topology( shared_topology[ key ] )
+            if not(SILENT):
+                print 'Read D8 topology from: ' + topo_file
+            return True
+                
+        return False
 
+    #   load_topology()
+    #-------------------------------------------------------------------
+    def save_topology(self, SILENT=True):
+
+        key = self.get_topology_key()
+        topology = dict()
+        for name in (topology_array_names + topology_tuple_names):
+            topology[ name ] = getattr( self, name )
+        shared_topology[ key ] = self.freeze_topology( topology )
+        self.set_topology( shared_topology[ key ] )
+
+        #------------------------------------------------
+        # Write the ".npz" file.  A failure is harmless;
+        # the variables will just be computed next time.
+        #------------------------------------------------
+        data = {'key': numpy.array([ key[0], key[1], str(key[2]), str(key[3]) ])}
+        for name in topology_array_names:
+            data[ name ] = topology[ name ]
+        for name in topology_tuple_names:
+            if (topology[ name ] is not None):
+                data[ name + '_rows' ] = topology[ name ][0]
+                data[ name + '_cols' ] = topology[ name ][1]
+                
+        for topo_file in self.get_topology_files( key ):
+            temp_file = topo_file + '.' + str(os.getpid())
+            try:
+                file_unit = open( temp_file, 'wb' )
+                numpy.savez_compressed( file_unit, **data )
+                file_unit.close()
+                os.rename( temp_file, topo_file )   # (atomic on POSIX)
+                if not(SILENT):
+                    print 'Saved D8 topology to: ' + topo_file
+                break
+            except Exception:
+                try:
+                    os.remove( temp_file )
+                except OSError:
+                    pass
+
+    #   save_topology()
+    #-------------------------------------------------------------------
+    def freeze_topology(self, topology):
+
+        #--------------------------------------------------
+        # Note: Shared arrays are made read-only, so that
+        #       one component can't change them for all.
+        #--------------------------------------------------
+        for value in topology.values():
+            if (value is None):
+                continue
+            if not(isinstance( value, tuple )):
+                value = (value,)
+            for array in value:
+                array.setflags( write=False )
+        return topology
+    
+    #   freeze_topology()
+    #-------------------------------------------------------------------
+    def set_topology(self, topology):
+
+        for (name, value) in topology.items():
+            setattr( self, name, value )
+        self.route_sums = None   # (see route_to_parents())
+
+    #   set_topology()
+    #-------------------------------------------------------------------